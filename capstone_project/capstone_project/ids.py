@@ -0,0 +1,95 @@
+"""
+Cấp ID cho các model tự quản lý khóa chính (id = models.IntegerField(primary_key=True)),
+thay cho kiểu MAX(id) + 1 trong save() (thêm một truy vấn mỗi lần insert, các request đồng thời
+có thể lấy trùng ID, và không dùng được với bulk_create).
+
+Mỗi bảng có một Postgres sequence `<bảng>_id_alloc_seq` với INCREMENT BY 50 (hi-lo):
+một lần nextval() trả về v thì tiến trình được dùng riêng các ID [v, v + 50). Các ID trong khối
+được cấp từ bộ nhớ (không truy vấn), hết khối mới gọi nextval() lần nữa. nextval() không bao giờ trả về
+cùng một giá trị cho hai phiên nên các tiến trình / luồng không bao giờ trùng ID và không phải chờ nhau.
+ID không liên tục (khối dùng dở bị bỏ khi tiến trình khởi động lại) - không ảnh hưởng gì.
+
+    instance.id = next_id(Profile)                    # trong save()
+    ids = allocate_ids(ProfileMatchSuggestion, 300)   # cho bulk_create: 1 truy vấn cho cả lô
+
+Sequence được tạo và khởi tạo từ MAX(id) hiện tại bởi migration của từng app (`*_id_alloc_sequences`,
+SQL viết thẳng trong migration); model mới cần sequence thì thêm migration tương tự.
+Database không phải Postgres (vd: sqlite khi thử nghiệm): quay về MAX(id) + 1.
+"""
+import os
+import threading
+
+from django.db import connection
+
+_lock = threading.Lock()
+_blocks = {}       # bảng -> [ID kế tiếp, ID cuối khối (không gồm)]
+_increments = {}   # bảng -> increment_by của sequence
+
+
+def _reset_after_fork():
+    # Tiến trình con (gunicorn --preload, multiprocessing) thừa hưởng khối đang dùng dở của tiến trình cha:
+    # dùng tiếp sẽ cấp trùng ID với cha và các con khác, nên bỏ đi và lấy khối mới. Khóa cũng có thể đang bị
+    # một luồng của cha giữ đúng lúc fork.
+    global _lock
+    _lock = threading.Lock()
+    _blocks.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def sequence_name(table):
+    return f"{table}_id_alloc_seq"
+
+
+def _increment(cursor, table):
+    if table not in _increments:
+        cursor.execute("SELECT increment_by FROM pg_sequences WHERE sequencename = %s", [sequence_name(table)])
+        row = cursor.fetchone()
+        if row is None:
+            raise RuntimeError(f"Chưa có sequence {sequence_name(table)} - hãy chạy migrate.")
+        _increments[table] = int(row[0])
+    return _increments[table]
+
+
+def _max_id_fallback(model, count):
+    last = model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    return list(range(last + 1, last + 1 + count))
+
+
+def allocate_ids(model, count):
+    """Danh sách `count` ID mới (tăng dần, có thể không liên tục) cho `model`."""
+    if count <= 0:
+        return []
+    if connection.vendor != 'postgresql':
+        return _max_id_fallback(model, count)
+
+    table = model._meta.db_table
+    ids = []
+    with _lock:
+        block = _blocks.get(table)
+        if block is not None:
+            take = min(count, block[1] - block[0])
+            ids.extend(range(block[0], block[0] + take))
+            block[0] += take
+        missing = count - len(ids)
+        if missing > 0:
+            with connection.cursor() as cursor:
+                increment = _increment(cursor, table)
+                n_blocks = -(-missing // increment)
+                cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [sequence_name(table), n_blocks])
+                starts = sorted(row[0] for row in cursor.fetchall())
+            for start in starts:
+                take = min(missing, increment)
+                ids.extend(range(start, start + take))
+                missing -= take
+                # Phần còn lại của khối cuối được giữ cho lần cấp sau
+                _blocks[table] = [start + take, start + increment]
+    return ids
+
+
+def next_id(model):
+    """Một ID mới cho `model` (thường không tốn truy vấn nào)."""
+    return allocate_ids(model, 1)[0]
+
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
     'vector_search',
     'recently_missing',
     'comments',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -89,17 +90,37 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'capstone_project.wsgi.application'
 
+# Có thể trỏ sang Postgres cục bộ (vd container pgvector/pgvector) bằng biến môi trường DB_*
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': 'postgres',
-        'USER': 'postgres.kbtzkglpwdzzymbetvjw',
-        'PASSWORD': 'alibaba1235@',
-        'HOST': 'aws-0-ap-southeast-1.pooler.supabase.com',
-        'PORT': 6543,
+        'NAME': os.getenv('DB_NAME', 'postgres'),
+        'USER': os.getenv('DB_USER', 'postgres.kbtzkglpwdzzymbetvjw'),
+        'PASSWORD': os.getenv('DB_PASSWORD', 'alibaba1235@'),
+        'HOST': os.getenv('DB_HOST', 'aws-0-ap-southeast-1.pooler.supabase.com'),
+        'PORT': int(os.getenv('DB_PORT', '6543')),
     }
 }
 
+# Cache dùng chung giữa các worker gunicorn / job worker (danh sách tìm kiếm đã xếp hạng cho phân trang,
+# kết quả kiểm duyệt). LocMemCache mặc định là riêng từng tiến trình: trang 2 rơi vào worker khác sẽ không
+# thấy danh sách của trang 1. REDIS_URL nếu có, không thì bảng cache trong Postgres
+# (tạo bằng `python manage.py createcachetable`, xem Procfile).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.getenv('CACHE_TABLE', 'django_cache'),
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
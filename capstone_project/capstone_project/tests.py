@@ -0,0 +1,97 @@
+import os
+from itertools import count
+from unittest import mock
+
+from django.test import TestCase
+
+from accounts.models import User
+from profiles.models import Profile
+from . import ids
+
+
+class _FakeCursor:
+    """Giả lập pg_sequences / nextval() của một sequence INCREMENT BY `increment`."""
+
+    def __init__(self, increment, starts):
+        self.increment = increment
+        self.starts = starts
+        self.queries = []
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self.queries.append(sql)
+        if "pg_sequences" in sql:
+            self._rows = [(self.increment,)]
+        else:
+            self._rows = [(next(self.starts),) for _ in range(params[1])]
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return self._rows
+
+
+class AllocateIdsTests(TestCase):
+    def setUp(self):
+        self.cursor = _FakeCursor(50, count(1000, 50))
+        fake_connection = mock.Mock(vendor='postgresql')
+        fake_connection.cursor.return_value = self.cursor
+        for patcher in (mock.patch.object(ids, "connection", fake_connection),
+                        mock.patch.dict(ids._blocks, clear=True),
+                        mock.patch.dict(ids._increments, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _nextval_calls(self):
+        return sum("nextval" in sql for sql in self.cursor.queries)
+
+    def test_ids_come_from_one_block(self):
+        self.assertEqual([ids.next_id(Profile) for _ in range(3)], [1000, 1001, 1002])
+        self.assertEqual(self._nextval_calls(), 1)
+
+    def test_large_request_takes_several_blocks_in_one_query(self):
+        self.assertEqual(ids.allocate_ids(Profile, 120), list(range(1000, 1120)))
+        self.assertEqual(self._nextval_calls(), 1)
+        # Phần còn lại của khối cuối (1120..1149) dùng tiếp, sau đó mới lấy khối mới
+        self.assertEqual(ids.allocate_ids(Profile, 35), list(range(1120, 1150)) + list(range(1150, 1155)))
+        self.assertEqual(self._nextval_calls(), 2)
+
+    def test_blocks_are_per_table(self):
+        ids.next_id(Profile)
+        self.assertEqual(ids.next_id(User), 1050)
+
+    def test_forked_child_drops_parent_block(self):
+        if not hasattr(os, "fork"):
+            self.skipTest("os.fork không có trên nền tảng này")
+        ids.next_id(Profile)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            os.write(write_fd, str(ids._blocks.get(Profile._meta.db_table)).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            child_block = pipe.read()
+        os.waitpid(pid, 0)
+        self.assertEqual(child_block, "None")
+        self.assertEqual(ids.next_id(Profile), 1001)
+
+    def test_zero_count(self):
+        self.assertEqual(ids.allocate_ids(Profile, 0), [])
+        self.assertEqual(self.cursor.queries, [])
+
+
+class AllocateIdsFallbackTests(TestCase):
+    def test_non_postgres_uses_max_id(self):
+        user = User.objects.create(username="owner", email="owner@example.com")
+        profile = Profile.objects.create(user=user, title="Hồ sơ", description="Tìm người thân")
+        self.assertEqual(ids.allocate_ids(Profile, 3), [profile.id + 1, profile.id + 2, profile.id + 3])
+        self.assertEqual(Profile.objects.create(user=user, title="Hồ sơ 2", description="...").id, profile.id + 1)
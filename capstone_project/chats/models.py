@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from capstone_project.ids import next_id
 from profiles.models import Profile
 from recently_missing.models import RecentlyMissingReport
 
@@ -32,8 +33,7 @@ class ChatSession(models.Model):
     
     def save(self, *args, **kwargs):
         if self.id is None:
-            last = ChatSession.objects.order_by('-id').first()
-            self.id = 1 if last is None else last.id + 1
+            self.id = next_id(ChatSession)
         super().save(*args, **kwargs)
 
 class ChatParticipant(models.Model):
@@ -54,8 +54,7 @@ class ChatParticipant(models.Model):
     
     def save(self, *args, **kwargs):
         if self.id is None:
-            last = ChatParticipant.objects.order_by('-id').first()
-            self.id = 1 if last is None else last.id + 1
+            self.id = next_id(ChatParticipant)
         super().save(*args, **kwargs)
 
 class Message(models.Model):
@@ -78,7 +77,6 @@ class Message(models.Model):
     
     def save(self, *args, **kwargs):
         if self.id is None:
-            last = Message.objects.order_by('-id').first()
-            self.id = 1 if last is None else last.id + 1
+            self.id = next_id(Message)
         super().save(*args, **kwargs)
 
@@ -5,7 +5,7 @@ from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q, Max, Prefetch
 from .models import ChatSession, Message, ChatParticipant
 from .serializers import ChatSessionSerializer, MessageSerializer
-from notifications.models import Notification
+from notifications.utils import create_notifications_bulk, NOTIFICATION_DEDUPE_SECONDS
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view
 
@@ -86,14 +86,14 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
                 'entity_title': entity_title
             }
         
-        for participant in other_participants:
-            Notification.objects.create(
-                user=participant.user,
-                type='message',
-                content=f"Tin nhắn mới từ {request.user.get_full_name() or request.user.username}{entity_info}",
-                related_entity_id=session.id,
-                additional_data=additional_data
-            )
+        # Một lần ghi cho mọi người nhận; tin nhắn liên tiếp trong cùng phiên không tạo thêm thông báo
+        # khi người nhận còn thông báo chưa đọc của phiên đó
+        notification_content = f"Tin nhắn mới từ {request.user.get_full_name() or request.user.username}{entity_info}"
+        create_notifications_bulk(
+            [(participant.user, 'message', notification_content, additional_data, session.id)
+             for participant in other_participants.select_related('user')],
+            dedupe_seconds=NOTIFICATION_DEDUPE_SECONDS,
+        )
         
         serializer = MessageSerializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -0,0 +1,20 @@
+import json
+import os
+
+# Số tác vụ một worker chạy song song (luồng)
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+# Giới hạn số tác vụ cùng loại đang chạy trên TẤT CẢ worker (để không vượt quota Gemini),
+# vd: JOB_TASK_CONCURRENCY='{"profiles.enrich": 2}'. Tác vụ không có trong danh sách: không giới hạn.
+JOB_TASK_CONCURRENCY = json.loads(os.getenv(
+    "JOB_TASK_CONCURRENCY", '{"profiles.enrich": 2, "profiles.index": 4, "profiles.match": 2}'
+))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Thử lại sau JOB_RETRY_BASE_DELAY * 2^(lần thử - 1) giây
+JOB_RETRY_BASE_DELAY = int(os.getenv("JOB_RETRY_BASE_DELAY", "10"))
+# Tác vụ 'running' quá lâu (worker chết giữa chừng) được đưa lại hàng đợi
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", "900"))
+# Tác vụ đang chạy được gia hạn locked_at sau mỗi khoảng này (giây), nên chỉ tác vụ của worker đã chết
+# mới bị coi là treo, dù chạy lâu hơn JOB_LOCK_TIMEOUT
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", str(max(JOB_LOCK_TIMEOUT // 3, 1))))
+# Chu kỳ kiểm tra hàng đợi khi không có việc (giây)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
@@ -0,0 +1,38 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from jobs.config import JOB_WORKER_CONCURRENCY, JOB_POLL_INTERVAL
+from jobs.utils import run_worker
+
+
+class Command(BaseCommand):
+    help = "Chạy worker xử lý tác vụ nền (BackgroundJob)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY,
+                            help="Số tác vụ chạy song song trong worker này")
+        parser.add_argument("--tasks", nargs="*", default=None,
+                            help="Chỉ nhận các loại tác vụ này (mặc định: tất cả)")
+        parser.add_argument("--once", action="store_true",
+                            help="Chạy hết các tác vụ đang đến hạn rồi thoát")
+        parser.add_argument("--poll-interval", type=float, default=JOB_POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            # Dừng nhận việc mới, chờ các tác vụ đang chạy xong rồi thoát
+            print("Nhận tín hiệu dừng, chờ các tác vụ đang chạy hoàn tất...")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        run_worker(
+            concurrency=options["concurrency"],
+            tasks=options["tasks"] or None,
+            once=options["once"],
+            poll_interval=options["poll_interval"],
+            stop_event=stop_event,
+        )
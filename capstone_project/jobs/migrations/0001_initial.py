@@ -0,0 +1,44 @@
+# Generated by Django 5.2.2 on 2026-10-19 18:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=100, verbose_name='Task name')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Payload')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20, verbose_name='Status')),
+                ('priority', models.IntegerField(default=0, verbose_name='Priority')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Attempts')),
+                ('max_attempts', models.IntegerField(default=3, verbose_name='Max attempts')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Run at')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=255, verbose_name='Worker')),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last error')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='Result')),
+                ('related_entity_id', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='background_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_at'], name='jobs_status_run_at_idx')],
+            },
+        ),
+    ]
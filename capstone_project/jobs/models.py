@@ -0,0 +1,46 @@
+from django.db import models
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class BackgroundJob(models.Model):
+    """
+    Một tác vụ nền lưu trong Postgres (xem jobs/utils.py).
+    Worker (`python manage.py run_jobs`) nhận việc bằng SELECT ... FOR UPDATE SKIP LOCKED,
+    lỗi thì thử lại với thời gian chờ tăng dần cho đến max_attempts.
+    """
+    STATUS_CHOICES = (
+        ('queued', _('Queued')),        # Chờ tới run_at để chạy (lần đầu hoặc thử lại)
+        ('running', _('Running')),      # Đang được một worker xử lý
+        ('succeeded', _('Succeeded')),
+        ('failed', _('Failed')),        # Hết số lần thử
+    )
+
+    task = models.CharField(_("Task name"), max_length=100)
+    payload = models.JSONField(_("Payload"), default=dict, blank=True)
+    status = models.CharField(_("Status"), max_length=20, choices=STATUS_CHOICES, default='queued')
+    priority = models.IntegerField(_("Priority"), default=0)
+    attempts = models.IntegerField(_("Attempts"), default=0)
+    max_attempts = models.IntegerField(_("Max attempts"), default=3)
+    run_at = models.DateTimeField(_("Run at"), default=timezone.now)
+    locked_by = models.CharField(_("Worker"), max_length=255, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(_("Last error"), blank=True, default='')
+    result = models.JSONField(_("Result"), null=True, blank=True)
+    # Người dùng / đối tượng liên quan, để báo trạng thái (vd: hồ sơ đang được xử lý)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='background_jobs')
+    related_entity_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='jobs_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.id} ({self.status})"
@@ -0,0 +1,12 @@
+from rest_framework import serializers
+from .models import BackgroundJob
+
+
+class BackgroundJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BackgroundJob
+        fields = [
+            'id', 'task', 'status', 'attempts', 'max_attempts', 'run_at', 'last_error', 'result',
+            'related_entity_id', 'created_at', 'updated_at', 'finished_at',
+        ]
+        read_only_fields = fields
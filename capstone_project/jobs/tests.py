@@ -0,0 +1,100 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from . import utils
+from .models import BackgroundJob
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.failures = []
+        patcher = mock.patch.dict(utils._registry, {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        utils.register_task("test.ok")(lambda job, value: self.calls.append(value) or {"value": value})
+        utils.register_task("test.error", max_attempts=2,
+                            on_failure=lambda job, error: self.failures.append(error))(self._raise)
+        patcher = mock.patch.object(utils, "JOB_TASK_CONCURRENCY", {"test.ok": 1})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _raise(job):
+        raise ValueError("hỏng")
+
+    def test_claim_marks_running_and_skips_future_jobs(self):
+        due = utils.enqueue("test.error")
+        utils.enqueue("test.error", delay=60)
+        claimed = utils.claim_jobs("w1", limit=5)
+        self.assertEqual([job.id for job in claimed], [due.id])
+        due.refresh_from_db()
+        self.assertEqual((due.status, due.locked_by, due.attempts), ('running', "w1", 1))
+        self.assertEqual(utils.claim_jobs("w2", limit=5), [])
+
+    def test_claim_respects_task_concurrency(self):
+        utils.enqueue("test.ok", {"value": 1})
+        utils.enqueue("test.ok", {"value": 2})
+        self.assertEqual(len(utils.claim_jobs("w1", limit=5)), 1)
+        self.assertEqual(utils.claim_jobs("w2", limit=5), [])
+
+    def test_success_stores_result(self):
+        job = utils.enqueue("test.ok", {"value": 7})
+        self.assertTrue(utils.run_job(utils.claim_jobs("w1")[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ('succeeded', {"value": 7}))
+
+    def test_error_retries_with_backoff_then_fails(self):
+        job = utils.enqueue("test.error")
+        self.assertFalse(utils.run_job(utils.claim_jobs("w1")[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('queued', 1, ''))
+        self.assertIn("ValueError: hỏng", job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=utils.JOB_RETRY_BASE_DELAY - 5))
+
+        BackgroundJob.objects.filter(id=job.id).update(run_at=timezone.now())
+        utils.run_job(utils.claim_jobs("w1")[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(len(self.failures), 1)
+
+    def test_requeue_stale_jobs(self):
+        stale = utils.enqueue("test.ok", {"value": 1})
+        exhausted = utils.enqueue("test.error")
+        for job in (stale, exhausted):
+            BackgroundJob.objects.filter(id=job.id).update(
+                status='running', locked_by="dead", locked_at=timezone.now() - timedelta(seconds=1000),
+                attempts=1 if job is stale else 2,
+            )
+        self.assertEqual(utils.requeue_stale_jobs(lock_timeout=900), 1)
+        stale.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by), ('queued', ''))
+        self.assertEqual(exhausted.status, 'failed')
+        self.assertEqual(len(self.failures), 1)
+
+    def test_heartbeat_keeps_long_job_from_being_requeued(self):
+        job = utils.enqueue("test.ok", {"value": 1})
+        claimed = utils.claim_jobs("w1")[0]
+        BackgroundJob.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(seconds=1000))
+        stop_event = mock.Mock()
+        stop_event.wait.side_effect = [False, True]
+        utils._heartbeat(claimed, stop_event, interval=0)
+        self.assertEqual(utils.requeue_stale_jobs(lock_timeout=900), 0)
+
+    def test_requeued_run_does_not_overwrite_new_attempt(self):
+        job = utils.enqueue("test.ok", {"value": 1})
+        first = utils.claim_jobs("w1")[0]
+        BackgroundJob.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(seconds=1000))
+        utils.requeue_stale_jobs(lock_timeout=900)
+        second = utils.claim_jobs("w2")[0]
+
+        self.assertFalse(utils.run_job(first))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.attempts), ('running', "w2", 2))
+        self.assertTrue(utils.run_job(second))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import BackgroundJobViewSet
+
+router = DefaultRouter()
+router.register(r'', BackgroundJobViewSet, basename='background-job')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
@@ -0,0 +1,280 @@
+"""
+Hàng đợi tác vụ nền trên Postgres (bảng BackgroundJob), thay cho việc xử lý mọi thứ trong request.
+
+    from jobs.utils import register_task, enqueue
+
+    @register_task("profiles.index", on_failure=...)
+    def index_profile_task(job, profile_id):      # payload được truyền dưới dạng keyword
+        ...
+
+    enqueue("profiles.index", {"profile_id": profile.id}, user=profile.user, related_entity_id=profile.id)
+
+- Tác vụ đăng ký trong <app>/tasks.py (JobsConfig.ready tự nạp).
+- Worker: `python manage.py run_jobs` (Procfile: worker). Nhận việc bằng SELECT ... FOR UPDATE SKIP LOCKED
+  nên nhiều worker chạy song song không lấy trùng việc.
+- Giới hạn số tác vụ cùng loại đang chạy trên toàn hệ thống: JOB_TASK_CONCURRENCY.
+- Lỗi (exception) -> thử lại sau JOB_RETRY_BASE_DELAY * 2^(lần thử - 1) giây; hết max_attempts -> 'failed'
+  và gọi on_failure(job, error) nếu có.
+- Worker chết giữa chừng: tác vụ 'running' không được gia hạn (heartbeat, mỗi JOB_HEARTBEAT_INTERVAL giây)
+  quá JOB_LOCK_TIMEOUT giây được đưa lại hàng đợi. Kết quả của lần chạy đã bị đưa lại (so theo `attempts`)
+  không ghi đè trạng thái của lần chạy mới.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+
+from django.db import connection, close_old_connections, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .config import (
+    JOB_WORKER_CONCURRENCY,
+    JOB_TASK_CONCURRENCY,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BASE_DELAY,
+    JOB_LOCK_TIMEOUT,
+    JOB_HEARTBEAT_INTERVAL,
+    JOB_POLL_INTERVAL,
+)
+from .models import BackgroundJob
+
+_registry = {}
+
+# Khóa advisory để các worker lần lượt nhận việc khi có giới hạn theo loại tác vụ (đếm 'running' chính xác)
+_CLAIM_LOCK_ID = 727001
+
+
+def register_task(name, max_attempts=None, on_failure=None):
+    """Đăng ký hàm xử lý cho tác vụ `name`. Hàm nhận (job, **payload); giá trị trả về (JSON) lưu vào job.result."""
+    def decorator(func):
+        _registry[name] = {
+            "func": func,
+            "max_attempts": max_attempts or JOB_MAX_ATTEMPTS,
+            "on_failure": on_failure,
+        }
+        return func
+    return decorator
+
+
+def registered_tasks():
+    return sorted(_registry)
+
+
+def enqueue(task, payload=None, user=None, related_entity_id=None, delay=0, priority=0, max_attempts=None):
+    """Thêm một tác vụ vào hàng đợi (một câu INSERT). Trả về BackgroundJob."""
+    if max_attempts is None:
+        max_attempts = _registry[task]["max_attempts"] if task in _registry else JOB_MAX_ATTEMPTS
+    return BackgroundJob.objects.create(
+        task=task,
+        payload=payload or {},
+        user=user,
+        related_entity_id=str(related_entity_id) if related_entity_id is not None else None,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        priority=priority,
+        max_attempts=max_attempts,
+    )
+
+
+def claim_jobs(worker_id, limit=1, tasks=None):
+    """Nhận tối đa `limit` tác vụ đến hạn (đánh dấu 'running'), tôn trọng JOB_TASK_CONCURRENCY."""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    limits = {task: n for task, n in JOB_TASK_CONCURRENCY.items() if not tasks or task in tasks}
+    with transaction.atomic():
+        running = {}
+        if limits:
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", [_CLAIM_LOCK_ID])
+            running = dict(
+                BackgroundJob.objects.filter(status='running', task__in=list(limits))
+                .values_list('task').annotate(n=Count('id'))
+            )
+
+        queryset = BackgroundJob.objects.select_for_update(skip_locked=True).filter(status='queued', run_at__lte=now)
+        if tasks:
+            queryset = queryset.filter(task__in=tasks)
+        full = [task for task, n in limits.items() if running.get(task, 0) >= n]
+        if full:
+            queryset = queryset.exclude(task__in=full)
+
+        claimed = []
+        for job in queryset.order_by('-priority', 'run_at', 'id')[:limit]:
+            if job.task in limits:
+                if running.get(job.task, 0) >= limits[job.task]:
+                    continue
+                running[job.task] = running.get(job.task, 0) + 1
+            claimed.append(job)
+
+        if claimed:
+            BackgroundJob.objects.filter(id__in=[job.id for job in claimed]).update(
+                status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1, updated_at=now,
+            )
+            for job in claimed:
+                job.status, job.locked_by, job.locked_at = 'running', worker_id, now
+                job.attempts += 1
+    return claimed
+
+
+def _jsonable(result):
+    if result is None:
+        return None
+    try:
+        json.dumps(result)
+        return result
+    except (TypeError, ValueError):
+        return str(result)
+
+
+def _current_attempt(job):
+    """Bản ghi của đúng lần chạy này: chưa bị requeue_stale_jobs đưa lại và worker khác nhận lại."""
+    return BackgroundJob.objects.filter(id=job.id, status='running', attempts=job.attempts)
+
+
+def _superseded(job):
+    print(f"Tác vụ {job.task} #{job.id} (lần {job.attempts}) đã được đưa lại hàng đợi, bỏ qua kết quả.")
+    return False
+
+
+def _fail(job, spec, error):
+    """Hết số lần thử: đánh dấu 'failed' và gọi on_failure (nếu có)."""
+    updated = _current_attempt(job).update(
+        status='failed', last_error=error, finished_at=timezone.now(), updated_at=timezone.now(),
+    )
+    if not updated:
+        _superseded(job)
+        return
+    job.status = 'failed'
+    print(f"❌ Tác vụ {job.task} #{job.id} thất bại sau {job.attempts} lần thử: {error}")
+    on_failure = (spec or {}).get("on_failure")
+    if on_failure:
+        try:
+            on_failure(job, error)
+        except Exception as e:
+            print(f"Lỗi khi xử lý thất bại của tác vụ {job.task} #{job.id}: {e}")
+
+
+def _heartbeat(job, stop_event, interval=JOB_HEARTBEAT_INTERVAL):
+    """Luồng phụ: gia hạn locked_at khi tác vụ còn chạy để requeue_stale_jobs không chạy lại nó lần nữa."""
+    try:
+        while not stop_event.wait(interval):
+            if not _current_attempt(job).update(locked_at=timezone.now()):
+                break
+    except Exception as e:
+        print(f"Lỗi khi gia hạn tác vụ {job.task} #{job.id}: {e}")
+    finally:
+        connection.close()
+
+
+def run_job(job):
+    """Chạy một tác vụ đã nhận. Trả về True nếu thành công."""
+    spec = _registry.get(job.task)
+    if spec is None:
+        _fail(job, None, f"Chưa đăng ký tác vụ '{job.task}'")
+        return False
+
+    started = time.perf_counter()
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job, stop_heartbeat), daemon=True,
+                                 name=f"job-heartbeat-{job.id}")
+    heartbeat.start()
+    try:
+        result = spec["func"](job, **(job.payload or {}))
+    except Exception as e:
+        stop_heartbeat.set()
+        heartbeat.join()
+        error = f"{type(e).__name__}: {e}"
+        if job.attempts < job.max_attempts:
+            delay = JOB_RETRY_BASE_DELAY * (2 ** (job.attempts - 1))
+            updated = _current_attempt(job).update(
+                status='queued', last_error=error, locked_by='', locked_at=None,
+                run_at=timezone.now() + timedelta(seconds=delay), updated_at=timezone.now(),
+            )
+            if not updated:
+                return _superseded(job)
+            job.status = 'queued'
+            print(f"⚠️  Tác vụ {job.task} #{job.id} lỗi ({error}). Thử lại sau {delay}s "
+                  f"(lần {job.attempts}/{job.max_attempts})")
+        else:
+            _fail(job, spec, error)
+        return False
+
+    stop_heartbeat.set()
+    heartbeat.join()
+    updated = _current_attempt(job).update(
+        status='succeeded', result=_jsonable(result), last_error='', finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        return _superseded(job)
+    job.status = 'succeeded'
+    print(f"✅ Tác vụ {job.task} #{job.id} xong trong {time.perf_counter() - started:.2f}s")
+    return True
+
+
+def requeue_stale_jobs(lock_timeout=JOB_LOCK_TIMEOUT):
+    """Đưa tác vụ 'running' quá lâu (worker đã chết) trở lại hàng đợi, hoặc 'failed' nếu hết số lần thử."""
+    cutoff = timezone.now() - timedelta(seconds=lock_timeout)
+    stale = BackgroundJob.objects.filter(status='running', locked_at__lt=cutoff)
+    for job in stale.filter(attempts__gte=F('max_attempts')):
+        _fail(job, _registry.get(job.task), f"Worker {job.locked_by} không hoàn thành trong {lock_timeout}s")
+    requeued = stale.update(status='queued', locked_by='', locked_at=None, run_at=timezone.now(),
+                            updated_at=timezone.now())
+    if requeued:
+        print(f"Đã đưa lại {requeued} tác vụ bị treo vào hàng đợi.")
+    return requeued
+
+
+def _run_in_thread(job):
+    close_old_connections()
+    try:
+        run_job(job)
+    except Exception as e:
+        print(f"Lỗi không mong đợi khi chạy tác vụ {job.task} #{job.id}: {e}")
+    finally:
+        # Mỗi luồng có kết nối riêng; đóng lại để không giữ kết nối tới pooler
+        connection.close()
+
+
+def run_worker(concurrency=JOB_WORKER_CONCURRENCY, tasks=None, once=False, poll_interval=JOB_POLL_INTERVAL,
+               stop_event=None):
+    """
+    Vòng lặp worker: nhận việc khi còn luồng trống, chạy song song tối đa `concurrency` tác vụ.
+    once=True: chạy hết các tác vụ đang đến hạn rồi dừng. stop_event: dừng nhận việc mới (SIGTERM).
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stop_event = stop_event or threading.Event()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job")
+    inflight = set()
+    last_stale_check = 0.0
+    print(f"Worker {worker_id} bắt đầu (song song: {concurrency}, tác vụ: {', '.join(tasks or registered_tasks())})")
+    try:
+        while not stop_event.is_set():
+            inflight = {future for future in inflight if not future.done()}
+            jobs = []
+            try:
+                if time.monotonic() - last_stale_check > 60:
+                    requeue_stale_jobs()
+                    last_stale_check = time.monotonic()
+                jobs = claim_jobs(worker_id, concurrency - len(inflight), tasks)
+            except Exception as e:
+                print(f"Lỗi khi nhận tác vụ từ hàng đợi: {e}")
+                connection.close()
+            for job in jobs:
+                inflight.add(executor.submit(_run_in_thread, job))
+
+            if once and not jobs and not inflight:
+                break
+            if not jobs:
+                if inflight:
+                    wait(inflight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    stop_event.wait(poll_interval)
+    finally:
+        executor.shutdown(wait=True)
+        print(f"Worker {worker_id} đã dừng.")
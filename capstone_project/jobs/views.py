@@ -0,0 +1,22 @@
+from rest_framework import viewsets, permissions
+from .models import BackgroundJob
+from .serializers import BackgroundJobSerializer
+
+
+class BackgroundJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Trạng thái tác vụ nền của người dùng (admin xem được tất cả).
+    Lọc: ?task=profiles.index&related_entity_id=123&status=failed
+    """
+    serializer_class = BackgroundJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = BackgroundJob.objects.all()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        for field in ('task', 'related_entity_id', 'status'):
+            value = self.request.query_params.get(field)
+            if value:
+                queryset = queryset.filter(**{field: value})
+        return queryset
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from capstone_project.ids import next_id
 
 class Notification(models.Model):
     """Notifications for users"""
@@ -20,6 +21,5 @@ class Notification(models.Model):
     
     def save(self, *args, **kwargs):
         if self.id is None:
-            last = Notification.objects.order_by('-id').first()
-            self.id = 1 if last is None else last.id + 1
+            self.id = next_id(Notification)
         super().save(*args, **kwargs)
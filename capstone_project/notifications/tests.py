@@ -1,3 +1,54 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from .models import Notification
+from .utils import create_notifications_bulk
+
+
+class CreateNotificationsBulkTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice", email="alice@example.com")
+        self.bob = User.objects.create(username="bob", email="bob@example.com")
+
+    def test_accepts_tuples_and_dicts(self):
+        created = create_notifications_bulk([
+            (self.alice, 'new_match', "Có hồ sơ phù hợp", {'score': 0.9}, 12),
+            (self.bob, 'new_match', "Có hồ sơ phù hợp", None),
+            dict(user=self.alice, notification_type='profile_created', content="Đã tạo hồ sơ",
+                 related_entity_id=5),
+            (None, 'new_match', "Không có người nhận", None),
+        ])
+        self.assertEqual(len(created), 3)
+        self.assertEqual(len({n.id for n in created}), 3)
+        first = Notification.objects.get(user=self.alice, type='new_match')
+        self.assertEqual((first.related_entity_id, first.additional_data), ("12", {'score': 0.9}))
+        self.assertEqual(Notification.objects.get(user=self.bob).additional_data, {})
+
+    def test_collapses_duplicates_within_batch(self):
+        created = create_notifications_bulk([
+            (self.alice, 'new_match', "1", None, 7),
+            (self.alice, 'new_match', "2", None, 7),
+            (self.bob, 'new_match', "3", None, 7),
+            (self.alice, 'new_match', "không có đối tượng", None),
+            (self.alice, 'new_match', "không có đối tượng", None),
+        ], dedupe_seconds=300)
+        self.assertEqual([n.content for n in created], ["1", "3", "không có đối tượng", "không có đối tượng"])
+
+    def test_skips_recent_unread_duplicates_only(self):
+        create_notifications_bulk([(self.alice, 'new_match', "cũ", None, 7)])
+        self.assertEqual(create_notifications_bulk([(self.alice, 'new_match', "mới", None, 7)], dedupe_seconds=300), [])
+
+        Notification.objects.update(is_read=True)
+        self.assertEqual(len(create_notifications_bulk([(self.alice, 'new_match', "mới", None, 7)],
+                                                       dedupe_seconds=300)), 1)
+
+        Notification.objects.update(created_at=timezone.now() - timedelta(seconds=600))
+        self.assertEqual(len(create_notifications_bulk([(self.alice, 'new_match', "mới hơn", None, 7)],
+                                                       dedupe_seconds=300)), 1)
 
-# Create your tests here.
+    def test_no_dedupe_by_default(self):
+        create_notifications_bulk([(self.alice, 'new_match', "cũ", None, 7)])
+        self.assertEqual(len(create_notifications_bulk([(self.alice, 'new_match', "mới", None, 7)])), 1)
@@ -26,6 +26,100 @@ def create_notification(user, notification_type, content, related_entity_id=None
     )
     return notification
 
+# Cửa sổ gộp thông báo trùng (giây) cho create_notifications_bulk(..., dedupe_seconds=NOTIFICATION_DEDUPE_SECONDS):
+# người dùng còn thông báo chưa đọc cùng loại, cùng đối tượng trong khoảng này thì không tạo thêm
+NOTIFICATION_DEDUPE_SECONDS = int(os.getenv("NOTIFICATION_DEDUPE_SECONDS", "300"))
+
+def _notification_item(item):
+    """Chuẩn hóa một phần tử đầu vào (dict hoặc tuple) về dict."""
+    if isinstance(item, dict):
+        return item
+    user, notification_type, content, *rest = item
+    return dict(
+        user=user,
+        notification_type=notification_type,
+        content=content,
+        additional_data=rest[0] if len(rest) > 0 else None,
+        related_entity_id=rest[1] if len(rest) > 1 else None,
+    )
+
+def _dedupe_key(item):
+    related_entity_id = item.get('related_entity_id')
+    return (
+        getattr(item['user'], 'pk', item['user']),
+        item['notification_type'],
+        str(related_entity_id) if related_entity_id else None,
+    )
+
+def _collapse_duplicates(notifications, dedupe_seconds):
+    """
+    Bỏ các thông báo trùng (cùng người nhận, loại, related_entity_id): trong cùng lô và với thông báo
+    chưa đọc đã có trong `dedupe_seconds` giây gần nhất (1 truy vấn). Thông báo không có
+    related_entity_id luôn được giữ.
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+
+    keys = {_dedupe_key(item) for item in notifications if item.get('related_entity_id')}
+    existing = set()
+    if keys:
+        existing = set(Notification.objects.filter(
+            user_id__in={key[0] for key in keys},
+            type__in={key[1] for key in keys},
+            related_entity_id__in={key[2] for key in keys},
+            is_read=False,
+            created_at__gte=timezone.now() - timedelta(seconds=dedupe_seconds),
+        ).values_list('user_id', 'type', 'related_entity_id'))
+
+    kept = []
+    for item in notifications:
+        key = _dedupe_key(item)
+        if key[2] is not None:
+            if key in existing:
+                continue
+            existing.add(key)
+        kept.append(item)
+    return kept
+
+def create_notifications_bulk(notifications, dedupe_seconds=None):
+    """
+    Tạo nhiều thông báo bằng một lần bulk_create (ID được cấp theo khối).
+
+    Args:
+        notifications: list các phần tử, mỗi phần tử là
+            - dict với các khóa giống tham số của create_notification
+              (user, notification_type, content, related_entity_id, additional_data), hoặc
+            - tuple (user, notification_type, content, additional_data[, related_entity_id])
+        dedupe_seconds: nếu > 0, gộp thông báo trùng (cùng người nhận, loại, related_entity_id) trong lô
+            và bỏ qua những thông báo mà người nhận còn một bản chưa đọc tạo trong `dedupe_seconds`
+            giây gần nhất (thường truyền NOTIFICATION_DEDUPE_SECONDS). None/0: không gộp.
+    Trả về list Notification đã tạo.
+    """
+    from django.db import transaction
+    from capstone_project.ids import allocate_ids
+
+    notifications = [_notification_item(item) for item in notifications or []]
+    notifications = [item for item in notifications if item.get('user') is not None]
+    if dedupe_seconds and notifications:
+        notifications = _collapse_duplicates(notifications, dedupe_seconds)
+    if not notifications:
+        return []
+    with transaction.atomic():
+        ids = allocate_ids(Notification, len(notifications))
+        objects = [
+            Notification(
+                id=notification_id,
+                user=item['user'],
+                type=item['notification_type'],
+                content=item['content'],
+                related_entity_id=str(item['related_entity_id']) if item.get('related_entity_id') else None,
+                is_read=False,
+                additional_data=item.get('additional_data') or {},
+            )
+            for notification_id, item in zip(ids, notifications)
+        ]
+        return Notification.objects.bulk_create(objects)
+
 def mark_notification_as_read(notification_id):
     """
     Đánh dấu thông báo đã đọc
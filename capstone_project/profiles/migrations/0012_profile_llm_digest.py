@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-19 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0011_alter_profileimage_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='llm_digest',
+            field=models.TextField(blank=True, editable=False, null=True, verbose_name='LLM digest'),
+        ),
+    ]
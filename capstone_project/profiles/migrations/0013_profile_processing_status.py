@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-19 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0012_profile_llm_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=20, verbose_name='Processing status'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0013_profile_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='search_keywords',
+            field=models.JSONField(blank=True, default=list, verbose_name='Search keywords'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Sequence cấp ID theo khối (capstone_project/ids.py), khởi tạo từ MAX(id) hiện tại
+
+from django.db import migrations
+
+TABLES = ('profiles_profile', 'profiles_profileimage', 'profiles_profilematchsuggestion',)
+
+# Migration phải cố định: SQL được viết thẳng ở đây thay vì gọi code trong capstone_project.ids
+# (code đó có thể đổi về sau). INCREMENT BY 50 = số ID mỗi khối; khởi tạo từ MAX(id) + 1000 để các
+# tiến trình còn chạy code cũ (MAX(id) + 1) trong lúc triển khai không đụng ID với sequence.
+# Database không phải Postgres (vd: sqlite khi thử nghiệm): bỏ qua.
+
+
+def create_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS "{table}_id_alloc_seq" INCREMENT BY 50 MINVALUE 1')
+        schema_editor.execute(
+            f"SELECT setval('{table}_id_alloc_seq', COALESCE((SELECT MAX(id) FROM \"{table}\"), 0) + 1000, false)"
+        )
+
+
+def drop_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS "{table}_id_alloc_seq"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0014_profile_search_keywords'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequences, drop_sequences),
+    ]
@@ -0,0 +1,41 @@
+# Một gợi ý cho mỗi cặp hồ sơ bất kể chiều (LEAST/GREATEST); xóa các cặp ngược chiều đã lưu trùng trước đó,
+# giữ lại dòng đã được chấp nhận/từ chối (nếu có), không thì dòng cũ nhất
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def remove_reverse_duplicates(apps, schema_editor):
+    ProfileMatchSuggestion = apps.get_model('profiles', 'ProfileMatchSuggestion')
+    kept, duplicates = {}, []
+    pairs = ProfileMatchSuggestion.objects.order_by('id').values_list('id', 'profile1_id', 'profile2_id', 'match_status')
+    for suggestion_id, profile1_id, profile2_id, match_status in pairs.iterator():
+        pair = (min(profile1_id, profile2_id), max(profile1_id, profile2_id))
+        if pair not in kept:
+            kept[pair] = (suggestion_id, match_status)
+        elif kept[pair][1] == 'pending' and match_status != 'pending':
+            duplicates.append(kept[pair][0])
+            kept[pair] = (suggestion_id, match_status)
+        else:
+            duplicates.append(suggestion_id)
+    for start in range(0, len(duplicates), 1000):
+        ProfileMatchSuggestion.objects.filter(id__in=duplicates[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0015_id_alloc_sequences'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_reverse_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='profilematchsuggestion',
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.comparison.Least('profile1', 'profile2'),
+                django.db.models.functions.comparison.Greatest('profile1', 'profile2'),
+                name='profiles_match_unordered_pair_uniq',
+            ),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.db.models.functions import Greatest, Least
 from django.utils.translation import gettext_lazy as _
+from capstone_project.ids import next_id
 
 class Profile(models.Model):
     id = models.IntegerField(primary_key=True)
@@ -10,6 +12,12 @@ class Profile(models.Model):
         ('found', _('Found')),
         ('closed', _('Closed')),
     )
+    PROCESSING_STATUS_CHOICES = (
+        ('pending', _('Pending')),
+        ('processing', _('Processing')),
+        ('ready', _('Ready')),
+        ('failed', _('Failed')),
+    )
     
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='profiles')
     title = models.CharField(_("Title"), max_length=255)
@@ -21,6 +29,13 @@ class Profile(models.Model):
     siblings = models.TextField(_("Siblings"), null=True, blank=True, help_text=_("List of siblings as plain text"))  # Changed from JSONField to TextField
     description = models.TextField(_("Detailed description"))
     status = models.CharField(_("Status"), max_length=20, choices=STATUS_CHOICES, default='active')
+    # Trạng thái xử lý nền sau khi tạo (trích xuất, embedding, tìm hồ sơ phù hợp - xem profiles/tasks.py)
+    processing_status = models.CharField(_("Processing status"), max_length=20,
+                                         choices=PROCESSING_STATUS_CHOICES, default='ready')
+    # Từ khóa tìm kiếm trích xuất cùng lúc với các field (profiles.services.extract_profile_info), dùng lại khi ghép hồ sơ
+    search_keywords = models.JSONField(_("Search keywords"), default=list, blank=True)
+    # Bản tóm tắt gọn cho bước xác minh bằng LLM (vector_search.profile_digest), tính lại mỗi lần lưu
+    llm_digest = models.TextField(_("LLM digest"), null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -29,8 +44,13 @@ class Profile(models.Model):
     
     def save(self, *args, **kwargs):
         if self.id is None:
-            last = Profile.objects.order_by('-id').first()
-            self.id = 1 if last is None else last.id + 1
+            self.id = next_id(Profile)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'description' in update_fields:
+            from vector_search.profile_digest import build_profile_digest
+            self.llm_digest = build_profile_digest(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = list(update_fields) + ['llm_digest']
         super().save(*args, **kwargs)
 
 class ProfileImage(models.Model):
@@ -45,8 +65,7 @@ class ProfileImage(models.Model):
         return f"Image for {self.profile.title}"
     def save(self, *args, **kwargs):
         if self.id is None:
-            last = ProfileImage.objects.order_by('-id').first()
-            self.id = 1 if last is None else last.id + 1
+            self.id = next_id(ProfileImage)
         super().save(*args, **kwargs)
 
 class ProfileMatchSuggestion(models.Model):
@@ -65,11 +84,15 @@ class ProfileMatchSuggestion(models.Model):
 
     class Meta:
         unique_together = ('profile1', 'profile2')
+        constraints = [
+            # Một cặp hồ sơ chỉ có một gợi ý bất kể chiều: hai tác vụ ghép chạy cùng lúc không thể lưu cả A->B và B->A
+            models.UniqueConstraint(Least('profile1', 'profile2'), Greatest('profile1', 'profile2'),
+                                    name='profiles_match_unordered_pair_uniq'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.id is None:
-            last = ProfileMatchSuggestion.objects.order_by('-id').first()
-            self.id = 1 if last is None else last.id + 1
+            self.id = next_id(ProfileMatchSuggestion)
         super().save(*args, **kwargs)
 
     def __str__(self):
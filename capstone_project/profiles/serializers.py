@@ -16,7 +16,7 @@ class ProfileSerializer(serializers.ModelSerializer):
                   'username',       
                   'title', 'full_name', 'born_year', 'losing_year', 
                   'name_of_father', 'name_of_mother', 'siblings', 'description', 
-                  'status', 'created_at', 'is_owner', 'images', 'match_count']
+                  'status', 'processing_status', 'created_at', 'is_owner', 'images', 'match_count']
     
     def get_username(self, obj):
         """Lấy username an toàn"""
@@ -70,9 +70,9 @@ class ProfileCreateSerializer(serializers.ModelSerializer):
             'id',
             'full_name', 'siblings', 'title',
             'name_of_father', 'name_of_mother', 'born_year', 'losing_year',
-            'description', 'status', 'images'
+            'description', 'status', 'processing_status', 'images'
         ]
-        read_only_fields = ['id', 'title']
+        read_only_fields = ['id', 'title', 'processing_status']
     
     def create(self, validated_data):
         images_data = validated_data.pop('images', [])
@@ -0,0 +1,385 @@
+"""
+Các bước xử lý hồ sơ sau khi tạo, chạy nền trong worker (profiles/tasks.py) thay vì trong request POST:
+
+    enrich_profile  -> LLM trích xuất thông tin, tạo mô tả đầy đủ
+    index_profile   -> embedding + ghi Qdrant/ChromaDB, chỉ mục cục bộ, pgvector, chỉ mục dự phòng
+    match_profile   -> tìm hồ sơ tương tự, lưu ProfileMatchSuggestion, gửi thông báo
+"""
+import json
+import random
+import re
+
+from django.db import transaction
+from django.db.models import Q
+
+from capstone_project.ids import allocate_ids
+
+from notifications.utils import create_notification, create_notifications_bulk
+from vector_search.config import USE_QDRANT, USE_PGVECTOR
+from vector_search.db_utils import fetch_profiles_from_db
+from vector_search.embedding import initialize_vector_db, get_embedding
+from vector_search.fallback_encoder import index_profile_fallback
+from vector_search.indexing import upsert_profile_vector, profile_embedding_text
+from vector_search.local_index import add_to_local_index
+from vector_search.pgvector_store import upsert_profile_embedding
+from vector_search.search import search_combined_chroma, search_similar_to_profile
+from .models import Profile, ProfileMatchSuggestion
+
+# Các field được LLM trích xuất từ mô tả
+EXTRACTED_FIELDS = ['full_name', 'siblings', 'name_of_father', 'name_of_mother', 'born_year', 'losing_year', 'title']
+PROVISIONAL_TITLE_LENGTH = 100
+
+
+def provisional_title(description):
+    """Tiêu đề tạm (đầu mô tả) cho tới khi LLM trích xuất xong tiêu đề thật."""
+    text = " ".join(str(description or "").split())
+    if len(text) <= PROVISIONAL_TITLE_LENGTH:
+        return text or "Hồ sơ đang được xử lý"
+    return text[:PROVISIONAL_TITLE_LENGTH].rsplit(" ", 1)[0] + "..."
+
+
+def set_processing_status(profile_id, processing_status):
+    # update() để không chạy lại Profile.save (tính lại llm_digest)
+    Profile.objects.filter(id=profile_id).update(processing_status=processing_status)
+
+
+# Schema JSON mode của Gemini: một lần gọi trả về cả các field của hồ sơ lẫn từ khóa tìm kiếm
+PROFILE_EXTRACTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "title": {"type": "STRING"},
+        "full_name": {"type": "STRING"},
+        "siblings": {"type": "STRING"},
+        "name_of_father": {"type": "STRING"},
+        "name_of_mother": {"type": "STRING"},
+        "born_year": {"type": "STRING"},
+        "losing_year": {"type": "STRING"},
+        "search_keywords": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": EXTRACTED_FIELDS + ["search_keywords"],
+    "propertyOrdering": ["title", "full_name", "siblings", "name_of_father", "name_of_mother",
+                         "born_year", "losing_year", "search_keywords"],
+}
+
+PROFILE_EXTRACTION_PROMPT = """
+Hãy trích xuất các thông tin sau từ đoạn văn bản dưới đây:
+- title: Tiêu đề của hồ sơ (Theo định dạng là ai đang tìm kiếm ai, hoặc gia đình đang tìm kiếm ai, ...)
+- full_name: Họ và tên đầy đủ của người bị thất lạc
+- siblings: Tên các anh chị em (nếu có), phân cách bằng dấu phẩy
+- name_of_father: Tên của cha (nếu có)
+- name_of_mother: Tên của mẹ (nếu có)
+- born_year: Năm sinh (nếu có hoặc có thể suy luận từ mô tả)
+- losing_year: Năm thất lạc (nếu có hoặc có thể suy luận từ mô tả)
+- search_keywords: Các từ khóa quan trọng dùng để tìm hồ sơ liên quan: tên riêng (cả tên đầy đủ và tên gọi,
+  ví dụ: Lê Thị Hạnh => Lê Thị Hạnh, Hạnh), địa danh, năm, nghề nghiệp, đặc điểm nhận dạng, hoàn cảnh thất lạc,
+  kèm các từ liên quan sinh ra từ từ khóa chính (ví dụ: chiến tranh => xung đột, chạy giặc, vượt biên, di cư).
+  Bỏ qua các từ quá phổ thông như: gia đình, anh, em, tìm kiếm, thất lạc, mất tích, mất liên lạc, không rõ quê quán.
+
+Mô tả: {description}
+
+Nếu không tìm thấy thông tin nào, hãy để trống giá trị tương ứng.
+"""
+
+
+def extract_profile_info(description):
+    """
+    Sử dụng LLM để trích xuất thông tin từ mô tả của 1 hồ sơ tìm kiếm người thất lạc.
+    Một lần gọi Gemini ở JSON mode (PROFILE_EXTRACTION_SCHEMA) trả về các field của hồ sơ và search_keywords
+    (gộp thêm từ khóa trích cục bộ). Trả về {} nếu lỗi.
+    """
+    from vector_search.config import GEMINI_API_KEYS, GEMINI_EXTRACTION_MODEL
+    from vector_search.keyword_extractor import extract_keywords_local, merge_keywords
+    from vector_search.llm_utils import call_gemini_rest
+
+    if not GEMINI_API_KEYS:
+        print("Lỗi: GEMINI_API_KEYS chưa được cấu hình trong config.py")
+        return {}
+
+    prompt = PROFILE_EXTRACTION_PROMPT.format(description=description)
+    start = random.randrange(len(GEMINI_API_KEYS))
+    for i in range(len(GEMINI_API_KEYS)):
+        api_key = GEMINI_API_KEYS[(start + i) % len(GEMINI_API_KEYS)]
+        generated_text = call_gemini_rest(prompt, api_key, GEMINI_EXTRACTION_MODEL, "profile_extract",
+                                          temperature=0.3, max_output_tokens=1024,
+                                          response_schema=PROFILE_EXTRACTION_SCHEMA)
+        if generated_text is None:
+            continue
+        try:
+            extracted_data = json.loads(generated_text)
+        except json.JSONDecodeError:
+            # Phòng khi model bọc JSON trong văn bản
+            json_match = re.search(r'({[\s\S]*})', generated_text)
+            try:
+                extracted_data = json.loads(json_match.group(1)) if json_match else None
+            except json.JSONDecodeError:
+                extracted_data = None
+        if not isinstance(extracted_data, dict):
+            print(f"Không thể phân tích JSON từ phản hồi LLM: {generated_text}")
+            return {}
+
+        result = {field: str(extracted_data.get(field) or "").strip() for field in EXTRACTED_FIELDS}
+        result["search_keywords"] = merge_keywords(extracted_data.get("search_keywords") or [],
+                                                   extract_keywords_local(description))
+        return result
+    return {}
+
+
+def generate_full_description(description, extracted_info):
+    """
+    Tạo mô tả đầy đủ từ tiêu đề, mô tả gốc và thông tin đã trích xuất
+    """
+    title = extracted_info.get('title', '')
+    full_name = extracted_info.get('full_name', '')
+    siblings = extracted_info.get('siblings', '')
+    name_of_father = extracted_info.get('name_of_father', '')
+    name_of_mother = extracted_info.get('name_of_mother', '')
+    born_year = extracted_info.get('born_year', '')
+    losing_year = extracted_info.get('losing_year', '')
+
+    # Tạo phần thông tin cơ bản
+    basic_info = []
+    if born_year:
+        basic_info.append(f"Năm sinh của người bị thất lạc là {born_year}")
+    if losing_year:
+        basic_info.append(f"thời gian thất lạc là vào {losing_year}")
+    if name_of_father:
+        basic_info.append(f"tên cha người bị thất lạc: {name_of_father}")
+    if name_of_mother:
+        basic_info.append(f"tên mẹ người bị thất lạc: {name_of_mother}")
+    if siblings:
+        basic_info.append(f"tên các anh chị em: {siblings}")
+
+    # Kết hợp thành mô tả đầy đủ
+    full_description = description
+
+    # Thêm phần thông tin cơ bản nếu có
+    if basic_info:
+        basic_info_text = "Thông tin cơ bản: " + "; ".join(basic_info) + "."
+        if not full_description.endswith('.'):
+            full_description += '.'
+        full_description += " " + basic_info_text
+
+    return full_description
+
+
+def enrich_profile(profile, description):
+    """
+    Trích xuất thông tin từ mô tả gốc `description` (LLM) và cập nhật hồ sơ.
+    Trả về dict đã trích xuất ({} nếu LLM lỗi, hồ sơ giữ nguyên).
+    """
+    create_notification(
+        user=profile.user,
+        notification_type='profile_creating',
+        content=f'Đang trích xuất thông tin từ mô tả...',
+        additional_data={
+            'text': f'Đang trích xuất thông tin hồ sơ từ mô tả {description}',
+        }
+    )
+    extracted_info = extract_profile_info(description)
+    if not extracted_info:
+        return {}
+
+    # Giữ giá trị người dùng đã nhập nếu LLM không trích xuất được field đó
+    for field in EXTRACTED_FIELDS:
+        value = extracted_info.get(field, "")
+        if value:
+            setattr(profile, field, value)
+    # Luôn tạo từ mô tả gốc (không phải profile.description) để chạy lại khi thử lại không bị lặp phần bổ sung
+    profile.description = generate_full_description(description, extracted_info)
+    # Từ khóa lưu lại để bước tìm hồ sơ phù hợp dùng lại, không gọi Gemini trích từ khóa lần nữa
+    profile.search_keywords = extracted_info.get('search_keywords') or []
+    profile.save(update_fields=EXTRACTED_FIELDS + ['description', 'search_keywords', 'updated_at'])
+
+    create_notification(
+        user=profile.user,
+        notification_type='profile_creating',
+        content=f'Hồ sơ đã được tạo thành công.',
+        additional_data={
+            'text': f'Hồ sơ đã được tạo thành công với mô tả đầy đủ: {profile.description}',
+        }
+    )
+    return extracted_info
+
+
+def index_profile(profile):
+    """Embedding hồ sơ và ghi vào các kho vector. Trả về embedding (None nếu Gemini lỗi)."""
+    detail_text = profile_embedding_text(profile)
+
+    embedding = get_embedding(
+        detail_text,
+        task_type="RETRIEVAL_DOCUMENT"
+    )
+    # Vector dự phòng (tính cục bộ) luôn được ghi, để hồ sơ vẫn tìm thấy khi Gemini hết quota
+    index_profile_fallback(profile.id, detail_text)
+
+    if not embedding:
+        # Vector Gemini sẽ được bổ sung bởi: python -m vector_search.reconcile --targets qdrant
+        print(f"Could not create embedding for profile {profile.id}. Chỉ có trong chỉ mục dự phòng.")
+        return None
+
+    try:
+        if USE_QDRANT:
+            # Thêm vào Qdrant (dense + sparse nếu bật hybrid)
+            if upsert_profile_vector(profile, embedding, text=detail_text):
+                create_notification(
+                    user=profile.user,
+                    notification_type='profile_creating',
+                    content=f'Hồ sơ {profile.title} đã được lưu vào Qdrant thành công.',
+                    additional_data={
+                        'text': f'Hồ sơ {profile.title} đã được lưu vào Qdrant thành công với mô tả đầy đủ',
+                    }
+                )
+        else:
+            # Fallback: Thêm vào ChromaDB (nếu không dùng Qdrant)
+            collection = initialize_vector_db()
+            metadata = {
+                "Tiêu đề": profile.title or "",
+                "Họ và tên": profile.full_name or "",
+                "Năm sinh": getattr(profile, "born_year", "") or "",
+                "Năm thất lạc": getattr(profile, "losing_year", "") or "",
+                "id": profile.id if profile.id is not None else "",
+            }
+            collection.upsert(
+                ids=[str(profile.id)],
+                embeddings=[embedding],
+                metadatas=[metadata]
+            )
+            print(f"Profile {profile.id} embedded and upserted into ChromaDB.")
+
+            create_notification(
+                user=profile.user,
+                notification_type='profile_creating',
+                content=f'Hồ sơ {profile.title} đã được lưu vào ChromaDB thành công.',
+                additional_data={
+                    'text': f'Hồ sơ {profile.title} đã được lưu vào ChromaDB thành công với mô tả đầy đủ',
+                }
+            )
+    except Exception as e:
+        vector_db_name = "Qdrant" if USE_QDRANT else "ChromaDB"
+        print(f"Error upserting profile {profile.id} into {vector_db_name}: {e}")
+
+    # Đồng bộ chỉ mục vector cục bộ (nếu đã được build)
+    add_to_local_index(profile.id, embedding)
+    # Lưu embedding vào Postgres (xóa hồ sơ tự xóa embedding nhờ ON DELETE CASCADE)
+    if USE_PGVECTOR:
+        upsert_profile_embedding(profile.id, embedding)
+    return embedding
+
+
+def save_match_suggestions(profile, similar_profiles):
+    """
+    Lưu ProfileMatchSuggestion(profile1=profile, profile2=similar) cho các cặp chưa có (xét cả hai chiều)
+    với số truy vấn cố định: 1 truy vấn cặp đã tồn tại, cấp khối ID, 1 bulk insert (ignore_conflicts nếu
+    tác vụ khác vừa ghi cùng cặp theo chiều bất kỳ - ràng buộc profiles_match_unordered_pair_uniq),
+    1 truy vấn đọc lại các dòng đã ghi.
+    Trả về list (similar, suggestion_id) của các gợi ý mới tạo.
+    """
+    candidates = {similar.id: similar for similar in similar_profiles if similar.id != profile.id}
+    if not candidates:
+        return []
+    existing = set()
+    for profile1_id, profile2_id in ProfileMatchSuggestion.objects.filter(
+        Q(profile1=profile, profile2_id__in=list(candidates)) |
+        Q(profile2=profile, profile1_id__in=list(candidates))
+    ).values_list('profile1_id', 'profile2_id'):
+        existing.add(profile2_id if profile1_id == profile.id else profile1_id)
+    new_profiles = [similar for similar_id, similar in candidates.items() if similar_id not in existing]
+    if not new_profiles:
+        return []
+
+    with transaction.atomic():
+        ids = allocate_ids(ProfileMatchSuggestion, len(new_profiles))
+        ProfileMatchSuggestion.objects.bulk_create(
+            [ProfileMatchSuggestion(id=suggestion_id, profile1=profile, profile2=similar)
+             for suggestion_id, similar in zip(ids, new_profiles)],
+            ignore_conflicts=True,
+        )
+    # Dòng bị bỏ qua do xung đột không có trong kết quả -> không gửi thông báo trùng
+    created = dict(ProfileMatchSuggestion.objects.filter(id__in=ids).values_list('profile2_id', 'id'))
+    return [(similar, created[similar.id]) for similar in new_profiles if similar.id in created]
+
+
+def match_profile(profile):
+    """
+    Tìm các hồ sơ tương tự hồ sơ vừa tạo, lưu ProfileMatchSuggestion và gửi thông báo
+    cho người tạo và chủ các hồ sơ phù hợp. Trả về list Profile tương tự.
+    """
+    detail_text = profile_embedding_text(profile)
+
+    # Tìm theo vector đã lưu của hồ sơ (không embed lại) và từ khóa đã trích xuất lúc tạo;
+    # chỉ nạp các hồ sơ ứng viên từ DB, kết quả là ID hồ sơ
+    id_list = search_similar_to_profile(profile, top_n_final=100, user=profile.user)
+    if id_list is None:
+        # Hồ sơ chưa có vector nào (chưa lập chỉ mục được): tìm theo mô tả trên toàn bộ hồ sơ như trước
+        df = fetch_profiles_from_db()
+        if df.empty:
+            raise RuntimeError("No profiles found in database.")
+        create_notification(
+            user=profile.user,
+            notification_type='profile_creating',
+            content=f'Đang tải toàn bộ hồ sơ từ cơ sở dữ liệu...',
+            additional_data={
+                'text': f'Đang tải toàn bộ hồ sơ từ cơ sở dữ liệu...',
+            }
+        )
+        id_list = search_combined_chroma(
+            df, initialize_vector_db(), detail_text, top_n_final=100, return_json=True, user=profile.user,
+            keywords=profile.search_keywords or None,
+        ) or []
+        match_ids = []
+        for idx in id_list:
+            # idx may be string or int, ensure correct type for DataFrame lookup
+            try:
+                profile_row = df.loc[int(idx)] if int(idx) in df.index else df[df['id'] == int(idx)].iloc[0]
+                match_ids.append(int(profile_row.get('id')))
+            except Exception:
+                continue
+    else:
+        match_ids = [int(idx) for idx in id_list]
+    match_ids = [match_id for match_id in match_ids if match_id != profile.id]
+    print("Hồ sơ tương tự (trong quá trình tạo):", match_ids)
+
+    # Lấy các đối tượng Profile tương ứng
+    similar_profiles = list(Profile.objects.filter(id__in=match_ids).select_related('user'))
+
+    # Thông báo cho người tạo hồ sơ mới
+    if similar_profiles:
+        # Danh sách thông tin của các hồ sơ khớp để hiển thị trong thông báo
+        match_info = [{"id": p.id, "title": p.title} for p in similar_profiles]
+        notifications = [dict(
+            user=profile.user,
+            notification_type='profile_created_with_matches',
+            content=f'Hồ sơ "{profile.title}" đã được tạo thành công với {len(similar_profiles)} gợi ý phù hợp.',
+            related_entity_id=profile.id,
+            additional_data={
+                'matching_profiles': match_info,
+                'profile_id': profile.id
+            }
+        )]
+    else:
+        # Thông báo khi không có hồ sơ phù hợp
+        notifications = [dict(
+            user=profile.user,
+            notification_type='profile_created',
+            content=f'Hồ sơ "{profile.title}" đã được tạo thành công.',
+            related_entity_id=profile.id
+        )]
+
+    # Lưu các cặp gợi ý mới và thông báo cho chủ sở hữu của hồ sơ phù hợp
+    for similar, suggestion_id in save_match_suggestions(profile, similar_profiles):
+        if similar.user:
+            notifications.append(dict(
+                user=similar.user,
+                notification_type='new_match',
+                content=f'Có hồ sơ mới "{profile.title}" phù hợp với hồ sơ "{similar.title}" của bạn.',
+                related_entity_id=profile.id,
+                additional_data={
+                    'matching_profile_id': profile.id,
+                    'matching_profile_title': profile.title,
+                    'your_profile_id': similar.id,
+                    'your_profile_title': similar.title,
+                    'suggestion_id': suggestion_id
+                }
+            ))
+    create_notifications_bulk(notifications)
+    return similar_profiles
@@ -0,0 +1,90 @@
+"""
+Chuỗi tác vụ nền sau khi tạo hồ sơ (xem jobs/utils.py, profiles/services.py):
+
+    profiles.enrich -> profiles.index -> profiles.match
+
+Mỗi bước thành công mới xếp bước sau vào hàng đợi; hồ sơ bị xóa giữa chừng thì bỏ qua.
+Profile.processing_status: pending -> processing -> ready | failed.
+"""
+from jobs.models import BackgroundJob
+from jobs.utils import register_task, enqueue
+from notifications.utils import create_notification
+from .models import Profile
+from . import services
+
+
+def start_profile_pipeline(profile, description):
+    """Xếp bước đầu tiên cho hồ sơ vừa lưu. `description`: mô tả gốc người dùng nhập."""
+    return enqueue("profiles.enrich", {"profile_id": profile.id, "description": description},
+                   user=profile.user, related_entity_id=profile.id)
+
+
+def _get_profile(profile_id):
+    profile = Profile.objects.select_related('user').filter(id=profile_id).first()
+    if profile is None:
+        print(f"Hồ sơ {profile_id} không còn tồn tại, bỏ qua tác vụ.")
+    return profile
+
+
+def _next_step(task, profile):
+    # Bước sau đã chờ sẵn trong hàng đợi (bước này chạy lại sau khi bị coi là treo): không xếp thêm,
+    # bước đang chờ sẽ đọc dữ liệu mới nhất khi chạy
+    if BackgroundJob.objects.filter(task=task, related_entity_id=str(profile.id), status='queued').exists():
+        return
+    enqueue(task, {"profile_id": profile.id}, user=profile.user, related_entity_id=profile.id)
+
+
+def _pipeline_failed(job, error):
+    profile_id = (job.payload or {}).get("profile_id")
+    services.set_processing_status(profile_id, 'failed')
+    profile = _get_profile(profile_id)
+    if profile is not None:
+        create_notification(
+            user=profile.user,
+            notification_type='profile_creating_failed',
+            content=f'Hồ sơ "{profile.title}" đã được lưu nhưng chưa thể hoàn tất xử lý (lập chỉ mục, tìm hồ sơ phù hợp).',
+            related_entity_id=profile.id,
+            additional_data={'text': error, 'task': job.task},
+        )
+
+
+def _enrich_failed(job, error):
+    # LLM lỗi hẳn: vẫn tiếp tục embedding với mô tả gốc để hồ sơ tìm kiếm được
+    profile = _get_profile((job.payload or {}).get("profile_id"))
+    if profile is not None:
+        _next_step("profiles.index", profile)
+
+
+@register_task("profiles.enrich", on_failure=_enrich_failed)
+def enrich_profile_task(job, profile_id, description=""):
+    profile = _get_profile(profile_id)
+    if profile is None:
+        return {"skipped": True}
+    services.set_processing_status(profile_id, 'processing')
+    extracted_info = services.enrich_profile(profile, description or profile.description)
+    if not extracted_info:
+        raise RuntimeError("Không trích xuất được thông tin hồ sơ từ LLM")
+    _next_step("profiles.index", profile)
+    return {"extracted_fields": sorted(field for field, value in extracted_info.items() if value)}
+
+
+@register_task("profiles.index", on_failure=_pipeline_failed)
+def index_profile_task(job, profile_id):
+    profile = _get_profile(profile_id)
+    if profile is None:
+        return {"skipped": True}
+    services.set_processing_status(profile_id, 'processing')
+    embedding = services.index_profile(profile)
+    # Không có embedding Gemini: hồ sơ vẫn có trong chỉ mục dự phòng, reconcile sẽ bổ sung sau
+    _next_step("profiles.match", profile)
+    return {"embedded": embedding is not None}
+
+
+@register_task("profiles.match", on_failure=_pipeline_failed)
+def match_profile_task(job, profile_id):
+    profile = _get_profile(profile_id)
+    if profile is None:
+        return {"skipped": True}
+    similar_profiles = services.match_profile(profile)
+    services.set_processing_status(profile_id, 'ready')
+    return {"matches": [similar.id for similar in similar_profiles]}
@@ -0,0 +1,134 @@
+import json
+from unittest import mock
+
+from django.db import IntegrityError, transaction
+from django.test import SimpleTestCase, TestCase
+
+from accounts.models import User
+from jobs.models import BackgroundJob
+from . import tasks
+from .models import Profile, ProfileMatchSuggestion
+from .services import extract_profile_info, provisional_title, save_match_suggestions
+
+
+class SaveMatchSuggestionsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="owner", email="owner@example.com")
+        self.a, self.b, self.c = [
+            Profile.objects.create(user=self.user, title=f"Hồ sơ {name}", description=f"Tìm người thân {name}")
+            for name in "abc"
+        ]
+
+    def test_creates_new_pairs_once(self):
+        created = save_match_suggestions(self.a, [self.b, self.c, self.a])
+        self.assertEqual(sorted(similar.id for similar, _ in created), [self.b.id, self.c.id])
+        self.assertEqual(save_match_suggestions(self.a, [self.b, self.c]), [])
+
+    def test_reverse_pair_is_not_created(self):
+        save_match_suggestions(self.a, [self.b])
+        self.assertEqual(save_match_suggestions(self.b, [self.a, self.c])[0][0], self.c)
+        self.assertEqual(ProfileMatchSuggestion.objects.count(), 2)
+
+    def test_reverse_pair_conflicts_in_database(self):
+        # Hai tác vụ ghép chạy cùng lúc: cả hai đều chưa thấy cặp của nhau khi kiểm tra
+        ProfileMatchSuggestion.objects.create(profile1=self.a, profile2=self.b)
+        ProfileMatchSuggestion.objects.bulk_create(
+            [ProfileMatchSuggestion(id=999, profile1=self.b, profile2=self.a)], ignore_conflicts=True)
+        self.assertEqual(ProfileMatchSuggestion.objects.count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProfileMatchSuggestion.objects.create(profile1=self.b, profile2=self.a)
+
+
+class SuggestionListingTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice", email="alice@example.com")
+        self.bob = User.objects.create(username="bob", email="bob@example.com")
+        self.a = Profile.objects.create(user=self.alice, title="Hồ sơ của Alice", description="Tìm người thân")
+        self.b = Profile.objects.create(user=self.bob, title="Hồ sơ của Bob", description="Tìm người thân")
+        # Hồ sơ của Bob được tạo sau và ghép với hồ sơ của Alice: chỉ có một dòng b -> a
+        self.suggestion = ProfileMatchSuggestion.objects.create(profile1=self.b, profile2=self.a,
+                                                                match_status='accepted')
+
+    def _get(self, action, user, **kwargs):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from .views import ProfileViewSet
+
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=user)
+        return ProfileViewSet.as_view({'get': action})(request, **kwargs).data
+
+    def test_suggested_profiles_lists_both_sides(self):
+        self.assertEqual([p['id'] for p in self._get('suggested_profiles', self.alice, pk=self.a.id)], [self.b.id])
+        self.assertEqual([p['id'] for p in self._get('suggested_profiles', self.bob, pk=self.b.id)], [self.a.id])
+
+    def test_all_suggested_profiles_uses_owner_side_as_source(self):
+        for user, own, other in ((self.alice, self.a, self.b), (self.bob, self.b, self.a)):
+            with self.subTest(user=user.username):
+                data = self._get('all_suggested_profiles', user)
+                results = data['results'] if isinstance(data, dict) else data
+                self.assertEqual([p['id'] for p in results], [other.id])
+                self.assertEqual(results[0]['suggested_from_profile']['id'], own.id)
+                self.assertEqual(results[0]['suggestion_info']['match_status'], 'accepted')
+
+
+class RemoveReverseDuplicatesTests(SimpleTestCase):
+    def _run(self, rows):
+        import importlib
+
+        migration = importlib.import_module("profiles.migrations.0016_profilematchsuggestion_unordered_pair")
+        model = mock.Mock()
+        model.objects.order_by.return_value.values_list.return_value.iterator.return_value = iter(rows)
+        apps = mock.Mock()
+        apps.get_model.return_value = model
+        migration.remove_reverse_duplicates(apps, None)
+        return sorted(i for c in model.objects.filter.call_args_list for i in c.kwargs['id__in'])
+
+    def test_keeps_decided_suggestion_over_pending(self):
+        self.assertEqual(self._run([(1, 10, 20, 'pending'), (2, 20, 10, 'accepted'), (3, 10, 30, 'pending')]), [1])
+        self.assertEqual(self._run([(1, 10, 20, 'rejected'), (2, 20, 10, 'pending')]), [2])
+
+    def test_keeps_oldest_when_statuses_tie(self):
+        self.assertEqual(self._run([(1, 10, 20, 'pending'), (2, 20, 10, 'pending')]), [2])
+        self.assertEqual(self._run([(1, 10, 20, 'accepted'), (2, 20, 10, 'rejected')]), [2])
+
+
+class PipelineStepTests(TestCase):
+    def test_next_step_is_not_queued_twice(self):
+        user = User.objects.create(username="owner", email="owner@example.com")
+        profile = Profile.objects.create(user=user, title="Hồ sơ", description="Tìm người thân")
+        tasks._next_step("profiles.match", profile)
+        tasks._next_step("profiles.match", profile)
+        self.assertEqual(BackgroundJob.objects.filter(task="profiles.match").count(), 1)
+
+
+class ExtractProfileInfoTests(SimpleTestCase):
+    DESCRIPTION = "Tôi tìm mẹ Lê Thị Hạnh, quê Nghệ An, thất lạc năm 1975."
+    RESPONSE = {"title": "Con tìm mẹ", "full_name": "Lê Thị Hạnh", "siblings": None, "name_of_father": "",
+                "name_of_mother": "", "born_year": 1950, "losing_year": "1975", "search_keywords": ["Hạnh"]}
+
+    def _extract(self, *responses):
+        with mock.patch("vector_search.config.GEMINI_API_KEYS", ["k1", "k2"]), \
+                mock.patch("vector_search.llm_utils.call_gemini_rest", side_effect=responses) as call:
+            return extract_profile_info(self.DESCRIPTION), call
+
+    def test_single_call_returns_fields_and_keywords(self):
+        result, call = self._extract(json.dumps(self.RESPONSE))
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual((result["full_name"], result["siblings"], result["born_year"]), ("Lê Thị Hạnh", "", "1950"))
+        self.assertEqual(result["search_keywords"][0], "Hạnh")
+        self.assertIn("Nghệ An", result["search_keywords"])
+
+    def test_json_wrapped_in_text_and_key_rotation(self):
+        result, call = self._extract(None, "Kết quả:\n" + json.dumps(self.RESPONSE) + "\nHết.")
+        self.assertEqual(call.call_count, 2)
+        self.assertEqual(result["title"], "Con tìm mẹ")
+
+    def test_unparseable_or_failed_response(self):
+        self.assertEqual(self._extract("không phải JSON")[0], {})
+        self.assertEqual(self._extract(None, None)[0], {})
+
+    def test_provisional_title(self):
+        self.assertEqual(provisional_title("  Tìm   mẹ  "), "Tìm mẹ")
+        self.assertEqual(provisional_title(""), "Hồ sơ đang được xử lý")
+        title = provisional_title("Tìm mẹ " * 40)
+        self.assertTrue(title.endswith("...") and len(title) <= 103)
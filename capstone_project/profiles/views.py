@@ -8,14 +8,21 @@ from notifications.utils import create_notification
 import json
 import requests
 from django.conf import settings
-from vector_search.gem_vectorDB import get_embedding, initialize_vector_db, CHROMA_COLLECTION_NAME, DETAIL_COLUMN_NAME
+from vector_search.gem_vectorDB import initialize_vector_db, CHROMA_COLLECTION_NAME, DETAIL_COLUMN_NAME
 from vector_search.db_utils import find_similar_profiles
 from vector_search.views_api import ProfileSearchAPIView
-from vector_search.db_utils import fetch_profiles_from_db
 from vector_search.embedding import initialize_vector_db
-from vector_search.search import search_combined_chroma
 from vector_search.qdrant_helper import get_qdrant_client, get_qdrant_collection
-from vector_search.config import USE_QDRANT, QDRANT_COLLECTION_NAME
+from vector_search.local_index import delete_from_local_index
+from vector_search.fallback_encoder import delete_profile_fallback
+from vector_search.indexing import delete_profile_vector
+from vector_search.query_filters import filter_from_request
+from vector_search.config import USE_QDRANT, QDRANT_COLLECTION_NAME, CONTENT_MODERATION_ENABLED
+from vector_search.moderation import moderate_text
+from jobs.models import BackgroundJob
+from jobs.serializers import BackgroundJobSerializer
+from .services import extract_profile_info, generate_full_description, provisional_title
+from .tasks import start_profile_pipeline
 from qdrant_client.models import PointStruct
 from qdrant_client.http import models as qdrant_models
 from rest_framework.permissions import AllowAny
@@ -24,8 +31,6 @@ from django_filters.rest_framework import DjangoFilterBackend
 import django_filters
 from datetime import datetime
 from django.db.models import Q, Count, F
-from queue_list.queue import add_user_to_queue, remove_user_from_queue, is_user_turn
-import time
 
 # Define pagination class for ProfileViewSet
 class ProfilePagination(PageNumberPagination):
@@ -119,659 +124,80 @@ class ProfileViewSet(viewsets.ModelViewSet):
 
     def moderate_content(self, description):
         """
-        Sử dụng Gemini API để kiểm duyệt nội dung, phát hiện nội dung không phù hợp
-        như bạo lực, kích động, phân biệt chủng tộc, v.v. Những nội dung không có ý nghĩa là đăng tin tìm kiếm người thất lạc cũng được coi là không phù hợp.
-        
+        Kiểm duyệt mô tả hồ sơ (moderation.moderate_text): phát hiện nội dung không phù hợp như bạo lực, kích động,
+        phân biệt chủng tộc, quảng cáo... hoặc không có ý nghĩa là đăng tin tìm kiếm người thất lạc.
+        Chỉ nội dung tầng cục bộ đánh giá cần xem xét mới được gửi sang Gemini.
+
         Trả về:
         - is_appropriate: True nếu nội dung phù hợp, False nếu không
         - feedback: Phản hồi chi tiết về vấn đề (nếu có)
         """
-        try:
-            # Import các thư viện cần thiết từ vector_search
-            from vector_search.config import PRIMARY_GOOGLE_API_KEY
-            import json
-            import requests
-            import time
-            
-            # Kiểm tra API key
-            if not PRIMARY_GOOGLE_API_KEY:
-                print("Lỗi: PRIMARY_GOOGLE_API_KEY chưa được cấu hình trong config.py")
-                return True, ""  # Mặc định cho phép nếu không có API key
-                
-            # Cấu hình API endpoint và headers
-            api_endpoint = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-            headers = {
-                "Content-Type": "application/json",
-                "x-goog-api-key": PRIMARY_GOOGLE_API_KEY,
-            }
-            
-            # Tạo prompt để kiểm duyệt nội dung
-            prompt = f"""
-            Tưởng tượng bạn là một nhà kiểm duyệt các nội dung tìm kiếm cho một chương trình tìm kiếm người thất lạc.
-            Hãy kiểm duyệt nội dung truy vấn tìm kiếm dưới đây và xác định xem nó có phù hợp để sử dụng trong hệ thống tìm kiếm người thất lạc hay không.
-            
-            Nội dung cần kiểm duyệt:
-            {description}
-            
-            Hãy kiểm tra các tiêu chí sau:
-            1. Không chứa nội dung bạo lực, phân biệt chủng tộc, tôn giáo, giới tính
-            2. Không chứa ngôn từ xúc phạm, thô tục
-            3. Không chứa thông tin cá nhân nhạy cảm không liên quan đến việc tìm kiếm người thất lạc
-            4. Không chứa nội dung quảng cáo, spam
-            5. Không chứa nội dung lừa đảo, giả mạo
-            
-            Trả về kết quả dưới dạng JSON với các trường sau:
-            {{
-                "is_appropriate": true/false,
-                "feedback": "Lý do tại sao nội dung (không) phù hợp"
-            }}
-            * Lưu ý: Không nên quá khắt khe trong nội dung kiểm duyệt. Nội dùng tìm kiếm khá là đa dạng nên không phải lúc nào xuất
-            hiện những từ ngữ liên quan đến tiêu chuẩn là bị cho là không phù hợp. Hãy phân tích nội dung thật kỹ để tránh đưa ra những kết luận quá 
-            khắt khe khiến cho việc xử lý tìm kiếm cho người dùng gặp thất bại.
-            Ví dụ: 
-            + Tìm kiếm con lai thì là nội dung bình thường, không phải là nội dung kì thị - phân biệt
-            + Những hồ sơ nào có liên quan đến đặc điểm nhận dạng trên cơ thể cũng là nội dung bình thường, không phải là nội dung thô tục, khiêu dâm, ...
-            """
-            
-            # Cấu hình payload
-            payload = {
-                "contents": [{"parts": [{"text": prompt}]}],
-                "generationConfig": {
-                    "temperature": 0.2,
-                    "maxOutputTokens": 1024,
-                },
-            }
-            
-            # Gọi API với cơ chế retry
-            from vector_search.config import MAX_RETRIES_LLM, INITIAL_RETRY_DELAY_LLM
-            
-            for attempt in range(MAX_RETRIES_LLM):
-                try:
-                    response = requests.post(api_endpoint, headers=headers, json=payload, timeout=60)
-                    
-                    # Xử lý các mã lỗi
-                    if response.status_code == 429:
-                        error_type = "Rate Limit (429)"
-                    elif response.status_code >= 500:
-                        error_type = f"Server Error ({response.status_code})"
-                        try:
-                            error_detail = response.json().get('error', {}).get('message', response.text)
-                            print(f"  Server error detail: {error_detail}")
-                        except json.JSONDecodeError:
-                            print(f"  Server error response (non-JSON): {response.text}")
-                    elif response.status_code != 200:
-                        error_type = f"HTTP Error {response.status_code}"
-                        error_detail = "Unknown error"
-                        try:
-                            error_json = response.json().get('error', {})
-                            error_detail = error_json.get('message', response.text)
-                            if "API key not valid" in error_detail:
-                                print(f"Lỗi API Key không hợp lệ (Key: ...{PRIMARY_GOOGLE_API_KEY[-4:]}). Ngừng thử lại.")
-                                return True, ""  # Mặc định cho phép nếu có lỗi API key
-                        except json.JSONDecodeError:
-                            error_detail = response.text
-                        print(f"Lỗi không thể thử lại ({error_type}) khi gọi Gemini API: {error_detail}")
-                        return True, ""  # Mặc định cho phép nếu có lỗi không thể thử lại
-                    
-                    # Xử lý lỗi có thể thử lại
-                    if response.status_code == 429 or response.status_code >= 500:
-                        if attempt < MAX_RETRIES_LLM - 1:
-                            wait_time = INITIAL_RETRY_DELAY_LLM * (2 ** attempt)
-                            print(f"Lỗi '{error_type}'. Thử lại sau {wait_time} giây... (Lần {attempt+1}/{MAX_RETRIES_LLM})")
-                            time.sleep(wait_time)
-                            continue
-                        else:
-                            print(f"Không thể kiểm duyệt nội dung sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}'.")
-                            return True, ""  # Mặc định cho phép nếu không thể kiểm duyệt
-                    
-                    # Xử lý phản hồi thành công
-                    if response.status_code == 200:
-                        response_data = response.json()
-                        
-                        # Kiểm tra xem có bị block do safety settings không
-                        if response_data.get('promptFeedback', {}).get('blockReason'):
-                            block_reason = response_data['promptFeedback']['blockReason']
-                            print(f"Cảnh báo: Yêu cầu bị chặn do safety settings: {block_reason}")
-                            return False, f"Nội dung không phù hợp: {block_reason}"  # Không cho phép nếu bị block
-                        
-                        # Trích xuất text từ phản hồi
-                        try:
-                            generated_text = response_data['candidates'][0]['content']['parts'][0]['text']
-                            
-                            if generated_text:
-                                # Tìm và trích xuất phần JSON từ phản hồi
-                                try:
-                                    # Tìm chuỗi JSON trong phản hồi
-                                    import re
-                                    json_match = re.search(r'({[\s\S]*})', generated_text)
-                                    if json_match:
-                                        json_str = json_match.group(1)
-                                        moderation_result = json.loads(json_str)
-                                        return moderation_result.get('is_appropriate', True), moderation_result.get('feedback', "")
-                                    else:
-                                        print("Không tìm thấy chuỗi JSON trong phản hồi của LLM")
-                                        return True, ""  # Mặc định cho phép nếu không tìm thấy JSON
-                                except json.JSONDecodeError as e:
-                                    print(f"Không thể phân tích JSON từ phản hồi LLM: {e}")
-                                    print(f"Phản hồi gốc: {generated_text}")
-                                    return True, ""  # Mặc định cho phép nếu không phân tích được JSON
-                            else:
-                                print("Gemini API trả về phản hồi thành công nhưng text rỗng.")
-                                return True, ""  # Mặc định cho phép nếu text rỗng
-                        except (KeyError, IndexError, TypeError) as e:
-                            print(f"Lỗi khi phân tích response thành công từ Gemini API: {e}")
-                            print(f"Response data: {response_data}")
-                            return True, ""  # Mặc định cho phép nếu có lỗi phân tích
-                
-                except requests.exceptions.RequestException as e:
-                    # Xử lý lỗi mạng
-                    error_type = f"Network Error ({type(e).__name__})"
-                    if attempt < MAX_RETRIES_LLM - 1:
-                        wait_time = INITIAL_RETRY_DELAY_LLM * (2 ** attempt)
-                        print(f"Lỗi '{error_type}'. Thử lại sau {wait_time} giây... (Lần {attempt+1}/{MAX_RETRIES_LLM})")
-                        time.sleep(wait_time)
-                    else:
-                        print(f"Không thể kiểm duyệt nội dung sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}'.")
-                        return True, ""  # Mặc định cho phép nếu có lỗi mạng
-            
-            return True, ""  # Mặc định cho phép nếu vòng lặp kết thúc mà không thành công
-                
-        except Exception as e:
-            print(f"Lỗi khi kiểm duyệt nội dung: {str(e)}")
-            return True, ""  # Mặc định cho phép nếu có lỗi không xác định
+        return moderate_text(description, kind="profile")
+
 
-    
     def extract_profile_info(self, description):
         """
-        Sử dụng LLM để trích xuất thông tin từ mô tả của 1 hồ sơ tìm kiếm người thất lạc
+        Sử dụng LLM để trích xuất thông tin từ mô tả của 1 hồ sơ tìm kiếm người thất lạc (profiles.services)
         """
-        prompt = f"""
-        Hãy trích xuất các thông tin sau từ đoạn văn bản dưới đây:
-        - Họ và tên đầy đủ của người bị thất lạc
-        - Tên các anh chị em (nếu có)
-        - Tên của cha (nếu có)
-        - Tên của mẹ (nếu có)
-        - Năm sinh (nếu có hoặc có thể suy luận từ mô tả)
-        - Năm thất lạc (nếu có hoặc có thể suy luận từ mô tả)
-        - Tiêu đề của hồ sơ (Theo định dạng là ai đang tìm kiếm ai, hoặc gia đình đang tìm kiếm ai, ...)
-
-        Mô tả: {description}
+        return extract_profile_info(description)
 
-        Trả về kết quả dưới dạng JSON với các trường sau:
-        {{
-            "title": "Tiêu đề của hồ sơ",
-            "full_name": "Tên đầy đủ của người bị thất lạc",
-            "siblings": "Tên các anh chị em, phân cách bằng dấu phẩy",
-            "name_of_father": "Tên của cha",
-            "name_of_mother": "Tên của mẹ",
-            "born_year": "Năm sinh",
-            "losing_year": "Năm thất lạc"
-        }}
-
-        Nếu không tìm thấy thông tin nào, hãy để trống giá trị tương ứng.
-        """
-        
-        try:
-            # Import các thư viện cần thiết từ vector_search
-            from vector_search.config import PRIMARY_GOOGLE_API_KEY
-            import json
-            import requests
-            import time
-            
-            # Kiểm tra API key
-            if not PRIMARY_GOOGLE_API_KEY:
-                print("Lỗi: PRIMARY_GOOGLE_API_KEY chưa được cấu hình trong config.py")
-                return {}
-                
-            # Cấu hình API endpoint và headers
-            api_endpoint = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-            headers = {
-                "Content-Type": "application/json",
-                "x-goog-api-key": PRIMARY_GOOGLE_API_KEY,
-            }
-            
-            # Cấu hình payload
-            payload = {
-                "contents": [{"parts": [{"text": prompt}]}],
-                "generationConfig": {
-                    "temperature": 0.5,
-                    "maxOutputTokens": 1024,
-                }
-            }
-            
-            # Gọi API với cơ chế retry
-            from vector_search.config import MAX_RETRIES_LLM, INITIAL_RETRY_DELAY_LLM
-            
-            for attempt in range(MAX_RETRIES_LLM):
-                try:
-                    response = requests.post(api_endpoint, headers=headers, json=payload, timeout=60)
-                    
-                    # Xử lý các mã lỗi
-                    if response.status_code == 429:
-                        error_type = "Rate Limit (429)"
-                    elif response.status_code >= 500:
-                        error_type = f"Server Error ({response.status_code})"
-                        try:
-                            error_detail = response.json().get('error', {}).get('message', response.text)
-                            print(f"  Server error detail: {error_detail}")
-                        except json.JSONDecodeError:
-                            print(f"  Server error response (non-JSON): {response.text}")
-                    elif response.status_code != 200:
-                        error_type = f"HTTP Error {response.status_code}"
-                        error_detail = "Unknown error"
-                        try:
-                            error_json = response.json().get('error', {})
-                            error_detail = error_json.get('message', response.text)
-                            if "API key not valid" in error_detail:
-                                print(f"Lỗi API Key không hợp lệ (Key: ...{PRIMARY_GOOGLE_API_KEY[-4:]}). Ngừng thử lại.")
-                                return {}
-                        except json.JSONDecodeError:
-                            error_detail = response.text
-                        print(f"Lỗi không thể thử lại ({error_type}) khi gọi Gemini API: {error_detail}")
-                        return {}
-                    
-                    # Xử lý lỗi có thể thử lại
-                    if response.status_code == 429 or response.status_code >= 500:
-                        if attempt < MAX_RETRIES_LLM - 1:
-                            wait_time = INITIAL_RETRY_DELAY_LLM * (2 ** attempt)
-                            print(f"Lỗi '{error_type}'. Thử lại sau {wait_time} giây... (Lần {attempt+1}/{MAX_RETRIES_LLM})")
-                            time.sleep(wait_time)
-                            continue
-                        else:
-                            print(f"Không thể trích xuất thông tin sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}'.")
-                            return {}
-                    
-                    # Xử lý phản hồi thành công
-                    if response.status_code == 200:
-                        response_data = response.json()
-                        
-                        # Kiểm tra xem có bị block do safety settings không
-                        if response_data.get('promptFeedback', {}).get('blockReason'):
-                            block_reason = response_data['promptFeedback']['blockReason']
-                            print(f"Cảnh báo: Yêu cầu bị chặn do safety settings: {block_reason}")
-                            return {}
-                        
-                        # Trích xuất text từ phản hồi
-                        try:
-                            generated_text = response_data['candidates'][0]['content']['parts'][0]['text']
-                            
-                            if generated_text:
-                                # Tìm và trích xuất phần JSON từ phản hồi
-                                try:
-                                    # Tìm chuỗi JSON trong phản hồi
-                                    import re
-                                    json_match = re.search(r'({[\s\S]*})', generated_text)
-                                    if json_match:
-                                        json_str = json_match.group(1)
-                                        extracted_data = json.loads(json_str)
-                                        return extracted_data
-                                    else:
-                                        print("Không tìm thấy chuỗi JSON trong phản hồi của LLM")
-                                        return {}
-                                except json.JSONDecodeError as e:
-                                    print(f"Không thể phân tích JSON từ phản hồi LLM: {e}")
-                                    print(f"Phản hồi gốc: {generated_text}")
-                                    return {}
-                            else:
-                                print("Gemini API trả về phản hồi thành công nhưng text rỗng.")
-                                return {}
-                        except (KeyError, IndexError, TypeError) as e:
-                            print(f"Lỗi khi phân tích response thành công từ Gemini API: {e}")
-                            print(f"Response data: {response_data}")
-                            return {}
-                
-                except requests.exceptions.RequestException as e:
-                    # Xử lý lỗi mạng
-                    error_type = f"Network Error ({type(e).__name__})"
-                    if attempt < MAX_RETRIES_LLM - 1:
-                        wait_time = INITIAL_RETRY_DELAY_LLM * (2 ** attempt)
-                        print(f"Lỗi '{error_type}'. Thử lại sau {wait_time} giây... (Lần {attempt+1}/{MAX_RETRIES_LLM})")
-                        time.sleep(wait_time)
-                    else:
-                        print(f"Không thể trích xuất thông tin sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}'.")
-                        return {}
-            
-            return {}  # Trả về dict rỗng nếu vòng lặp kết thúc mà không thành công
-                
-        except Exception as e:
-            print(f"Lỗi khi trích xuất thông tin: {str(e)}")
-            return {}
-    
     def generate_full_description(self, description, extracted_info):
         """
-        Tạo mô tả đầy đủ từ tiêu đề, mô tả gốc và thông tin đã trích xuất
+        Tạo mô tả đầy đủ từ tiêu đề, mô tả gốc và thông tin đã trích xuất (profiles.services)
         """
-        title = extracted_info.get('title', '')
-        full_name = extracted_info.get('full_name', '')
-        siblings = extracted_info.get('siblings', '')
-        name_of_father = extracted_info.get('name_of_father', '')
-        name_of_mother = extracted_info.get('name_of_mother', '')
-        born_year = extracted_info.get('born_year', '')
-        losing_year = extracted_info.get('losing_year', '')
-        
-        # Tạo phần thông tin cơ bản
-        basic_info = []
-        if born_year:
-            basic_info.append(f"Năm sinh của người bị thất lạc là {born_year}")
-        if losing_year:
-            basic_info.append(f"thời gian thất lạc là vào {losing_year}")
-        if name_of_father:
-            basic_info.append(f"tên cha người bị thất lạc: {name_of_father}")
-        if name_of_mother:
-            basic_info.append(f"tên mẹ người bị thất lạc: {name_of_mother}")
-        if siblings:
-            basic_info.append(f"tên các anh chị em: {siblings}")
-        
-        # Kết hợp thành mô tả đầy đủ
-        full_description = description
-        
-        # Thêm phần thông tin cơ bản nếu có
-        if basic_info:
-            basic_info_text = "Thông tin cơ bản: " + "; ".join(basic_info) + "."
-            if not full_description.endswith('.'):
-                full_description += '.'
-            full_description += " " + basic_info_text
-        
-        return full_description
-    
-    def perform_create(self, serializer):
-        user_id = self.request.user.id
+        return generate_full_description(description, extracted_info)
 
-        # Thêm người dùng vào hàng đợi
-        add_user_to_queue(user_id)
-        
-        # Chờ đến lượt của người dùng
-        while not is_user_turn(user_id):
-            time.sleep(0.1)  # Chờ 100ms rồi kiểm tra lại
-
-        try:
-            description = serializer.validated_data.get('description', '')
-        
-            # Kiểm duyệt nội dung trước khi xử lý
-            # is_appropriate, feedback = self.moderate_content(description)
-            # if not is_appropriate:
-            #     # Thông báo nội dung không phù hợp
-            #     from notifications.utils import create_notification
-            #     create_notification(
-            #         user=self.request.user,
-            #         notification_type='profile_creating_failed',
-            #         content= f'Nội dung không phù hợp để đăng lên hệ thống: {feedback}',
-            #         additional_data={
-            #             'text': f'Nội dung không phù hợp để đăng lên hệ thống: {feedback}',
-            #         }
-            #     )
-            #     # Trả về lỗi
-            #     from rest_framework.exceptions import ValidationError
-            #     raise ValidationError({
-            #         "description": f"Nội dung không phù hợp để đăng lên hệ thống: {feedback}"
-            #     })
-            # Dừng trong 2 giây để tránh quá tải API
-            # time.sleep(2)
-        
-            # Trích xuất thông tin từ tiêu đề và mô tả
-            extracted_info = self.extract_profile_info(description)
-        
-            # Tạo thông báo đang trong quá trình tạo hồ sơ
-            from notifications.utils import create_notification
-            create_notification(
-                user=self.request.user,
-                notification_type='profile_creating',
-                content=f'Đang trích xuất thông tin từ mô tả...',
-                additional_data={
-                    'text': f'Đang trích xuất thông tin hồ sơ từ mô tả {description}',
-                }
-            )
-        
-            # Cập nhật các trường đã trích xuất vào validated_data (dù có hay không)
-            for field in ['full_name', 'siblings', 'name_of_father', 'name_of_mother', 'born_year', 'losing_year', 'title']:
-                serializer.validated_data[field] = extracted_info.get(field, "")
-        
-            # Tạo mô tả đầy đủ
-            full_description = self.generate_full_description(description, extracted_info)
-            serializer.validated_data['description'] = full_description
-        
-            # Thông báo đã tạo mô tả đầy đủ
-            from notifications.utils import create_notification
-            create_notification(
-                user=self.request.user,
-                notification_type='profile_creating',
-                content=f'Hồ sơ đã được tạo thành công.',
-                additional_data={
-                    'text': f'Hồ sơ đã được tạo thành công với mô tả đầy đủ: {full_description}',
-                }
-            )
-        
-            # Lưu profile
-            profile = serializer.save(user=self.request.user)
-
-            # Thông báo đã lưu profile
-            from notifications.utils import create_notification
-            create_notification(
-                user=self.request.user,
-                notification_type='profile_creating',
-                content=f'Hồ sơ đã được lưu tạm thời thành công.',
-                additional_data={
-                    'text': f'Hồ sơ đã được lưu tạm thời thành công với mô tả đầy đủ: {full_description}',
-                }
-            )
-            
-            # Xử lý embedding và vector search
-            detail_text = getattr(profile, DETAIL_COLUMN_NAME, None)
-            if not detail_text:
-                detail_text = profile.description
-
-            embedding = get_embedding(
-                detail_text,
-                task_type="RETRIEVAL_DOCUMENT"
-            )
-
-            if embedding:
-                try:
-                    if USE_QDRANT:
-                        # Thêm vào Qdrant
-                        qdrant_client = get_qdrant_client()
-                        collection_name = get_qdrant_collection()
-                        if qdrant_client and collection_name:
-                            # Chuẩn bị metadata cho Qdrant (payload)
-                            payload = {
-                                "Tiêu đề": profile.title or "",
-                                "Họ và tên": profile.full_name or "",
-                                "Năm sinh": str(getattr(profile, "born_year", "") or ""),
-                                "Năm thất lạc": str(getattr(profile, "losing_year", "") or ""),
-                                "id": str(profile.id) if profile.id is not None else "",
-                            }
-                            
-                            # Tạo point để upsert vào Qdrant
-                            point = PointStruct(
-                                id=int(profile.id),  # Qdrant yêu cầu integer ID
-                                vector=embedding,
-                                payload=payload
-                            )
-                            
-                            qdrant_client.upsert(
-                                collection_name=collection_name,
-                                points=[point]
-                            )
-                            print(f"Profile {profile.id} embedded and upserted into Qdrant.")
-
-                            # Thông báo đã lưu profile
-                            from notifications.utils import create_notification
-                            create_notification(
-                                user=self.request.user,
-                                notification_type='profile_creating',
-                                content=f'Hồ sơ {profile.title} đã được lưu vào Qdrant thành công.',
-                                additional_data={
-                                    'text': f'Hồ sơ {profile.title} đã được lưu vào Qdrant thành công với mô tả đầy đủ',
-                                }
-                            )
-                        else:
-                            print(f"Qdrant client or collection unavailable. Cannot upsert profile {profile.id}.")
-                    else:
-                        # Fallback: Thêm vào ChromaDB (nếu không dùng Qdrant)
-                        collection = initialize_vector_db()
-                        metadata = {
-                            "Tiêu đề": profile.title or "",
-                            "Họ và tên": profile.full_name or "",
-                            "Năm sinh": getattr(profile, "born_year", "") or "",
-                            "Năm thất lạc": getattr(profile, "losing_year", "") or "",
-                            "id": profile.id if profile.id is not None else "",
-                        }
-                        collection.upsert(
-                            ids=[str(profile.id)],
-                            embeddings=[embedding],
-                            metadatas=[metadata]
-                        )
-                        print(f"Profile {profile.id} embedded and upserted into ChromaDB.")
+    def perform_create(self, serializer):
+        description = serializer.validated_data.get('description', '')
 
-                        # Thông báo đã lưu profile
-                        from notifications.utils import create_notification
-                        create_notification(
-                            user=self.request.user,
-                            notification_type='profile_creating',
-                            content=f'Hồ sơ {profile.title} đã được lưu vào ChromaDB thành công.',
-                            additional_data={
-                                'text': f'Hồ sơ {profile.title} đã được lưu vào ChromaDB thành công với mô tả đầy đủ',
-                            }
-                        )
-                except Exception as e:
-                    vector_db_name = "Qdrant" if USE_QDRANT else "ChromaDB"
-                    print(f"Error upserting profile {profile.id} into {vector_db_name}: {e}")
-            else:
-                print(f"Could not create embedding for profile {profile.id}.")
-                
-            # --- Gợi ý hồ sơ tương tự và lưu vào bảng ProfileMatchSuggestion ---
-            from profiles.models import ProfileMatchSuggestion, Profile as ProfileModel
-            from notifications.utils import create_notification
-            from django.db.models import Q
-            
-            # Lấy toàn bộ profiles dưới dạng DataFrame
-            collection = initialize_vector_db()
-            if collection is None:
-                return Response({"error": "Vector DB unavailable."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            df = fetch_profiles_from_db()
-            if df.empty:
-                return Response({"error": "No profiles found in database."}, status=status.HTTP_404_NOT_FOUND)
-            else:
-                from notifications.utils import create_notification
+        # Kiểm duyệt nội dung trước khi xử lý
+        if CONTENT_MODERATION_ENABLED:
+            is_appropriate, feedback = self.moderate_content(description)
+            if not is_appropriate:
+                # Thông báo nội dung không phù hợp
                 create_notification(
                     user=self.request.user,
-                    notification_type='profile_creating',
-                    content=f'Đang tải toàn bộ hồ sơ từ cơ sở dữ liệu...',
+                    notification_type='profile_creating_failed',
+                    content= f'Nội dung không phù hợp để đăng lên hệ thống: {feedback}',
                     additional_data={
-                        'text': f'Đang tải toàn bộ hồ sơ từ cơ sở dữ liệu...',
+                        'text': f'Nội dung không phù hợp để đăng lên hệ thống: {feedback}',
                     }
                 )
-            
-            # Sử dụng mô tả chi tiết để tìm kiếm các hồ sơ phù hợp nhất
-            id_list = search_combined_chroma(
-                df, collection, detail_text, top_n_final=100, return_json=True, user=self.request.user
-            )
-            if not id_list:
-                return Response({"results": []})
-
-            # For each ID, build a detailed result dict
-            detailed_results = []
-            for idx in id_list:
-                # idx may be string or int, ensure correct type for DataFrame lookup
-                try:
-                    profile_row = df.loc[int(idx)] if int(idx) in df.index else df[df['id'] == int(idx)].iloc[0]
-                except Exception:
-                    continue
-
-                detailed_results.append({
-                    "id": profile_row .get('id', ''),
-                    "title": profile_row .get('Tiêu đề', ''),
-                    "full_name": profile_row .get('Họ và tên', ''),
-                    "losing_year": profile_row .get('Năm thất lạc', ''),
-                    "born_year": profile_row .get('Năm sinh', ''),
-                    "name_of_father": profile_row .get('Tên cha', ''),
-                    "name_of_mother": profile_row .get('Tên mẹ', ''),
-                    "siblings": profile_row .get('Anh chị em', ''),
-                    "detail": str(profile_row .get('Chi tiet_merged', '')),
+                # Trả về lỗi
+                from rest_framework.exceptions import ValidationError
+                raise ValidationError({
+                    "description": f"Nội dung không phù hợp để đăng lên hệ thống: {feedback}"
                 })
 
-            detailed_results = [result for result in detailed_results if result['id'] != str(profile.id)]
-            print("Tìm theo truy vấn detailed_results (trong quá trình tạo):", detailed_results)
-            
-            # Lấy các đối tượng Profile tương ứng
-            similar_profiles = ProfileModel.objects.filter(id__in=[int(result['id']) for result in detailed_results])
-            
-            # Tạo thông báo cho người tạo hồ sơ mới
-            if similar_profiles:
-                # Danh sách thông tin của các hồ sơ khớp để hiển thị trong thông báo
-                match_info = [{"id": p.id, "title": p.title} for p in similar_profiles]
-                
-                # Gửi thông báo cho người tạo hồ sơ
-                create_notification(
-                    user=self.request.user,
-                    notification_type='profile_created_with_matches',
-                    content=f'Hồ sơ "{profile.title}" đã được tạo thành công với {len(similar_profiles) - 1} gợi ý phù hợp.',
-                    related_entity_id=profile.id,
-                    additional_data={
-                        'matching_profiles': match_info,
-                        'profile_id': profile.id
-                    }
-                )
-            else:
-                # Thông báo khi không có hồ sơ phù hợp
-                create_notification(
-                    user=self.request.user,
-                    notification_type='profile_created',
-                    content=f'Hồ sơ "{profile.title}" đã được tạo thành công.',
-                    related_entity_id=profile.id
-                )
-            
-            # Thêm từng cặp vào bảng ProfileMatchSuggestion nếu chưa tồn tại
-            # và gửi thông báo cho chủ sở hữu của hồ sơ phù hợp
-            for similar in similar_profiles:
-                # Bỏ qua nếu profile1 và profile2 là cùng một hồ sơ phù hợp
-                if profile.id == similar.id:
-                    continue
-                    
-                # Kiểm tra xem đã tồn tại gợi ý nào chưa
-                exists = ProfileMatchSuggestion.objects.filter(
-                    Q(profile1=profile, profile2=similar) | 
-                    Q(profile1=similar, profile2=profile)
-                ).exists()
-                
-                if not exists:
-                    # Tạo gợi ý match
-                    suggestion = ProfileMatchSuggestion.objects.create(
-                        profile1=profile,
-                        profile2=similar
-                    )
-                    
-                    # Gửi thông báo cho chủ sở hữu của hồ sơ được khớp
-                    if hasattr(similar, 'user') and similar.user:
-                        create_notification(
-                            user=similar.user,
-                            notification_type='new_match',
-                            content=f'Có hồ sơ mới "{profile.title}" phù hợp với hồ sơ "{similar.title}" của bạn.',
-                            related_entity_id=profile.id,
-                            additional_data={
-                                'matching_profile_id': profile.id,
-                                'matching_profile_title': profile.title,
-                                'your_profile_id': similar.id,
-                                'your_profile_title': similar.title,
-                                'suggestion_id': suggestion.id
-                            }
-                        )
-            
-            # Lưu lại danh sách các hồ sơ tương tự để sử dụng trong create() method
-            self.similar_profiles = similar_profiles
-            return profile
-        
-        finally:
-            # Xóa người dùng khỏi hàng đợi sau khi tìm kiếm xong
-            remove_user_from_queue(user_id)
+        # Lưu hồ sơ ngay với tiêu đề tạm; trích xuất thông tin, embedding và tìm hồ sơ phù hợp
+        # chạy nền trong worker (profiles/tasks.py), tiến độ gửi qua thông báo và processing_status
+        profile = serializer.save(
+            user=self.request.user,
+            title=provisional_title(description),
+            processing_status='pending',
+        )
+        self.processing_job = start_profile_pipeline(profile, description)
+        return profile
 
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
-        similar_profiles = getattr(self, 'similar_profiles', [])
-        serializer = ProfileSerializer(similar_profiles, many=True, context={'request': request})
-        response.data['suggested_profiles'] = serializer.data
+        # Gợi ý hồ sơ phù hợp được tính ở nền: xem thông báo 'profile_created_with_matches'
+        # hoặc GET profiles/{id}/suggested_profiles/ khi processing_status = 'ready'
+        response.data['suggested_profiles'] = []
+        job = getattr(self, 'processing_job', None)
+        response.data['processing_job_id'] = job.id if job else None
         return response
 
+    @action(detail=True, methods=['get'])
+    def processing_status(self, request, pk=None):
+        """Trạng thái xử lý nền của hồ sơ và các tác vụ liên quan (chỉ chủ hồ sơ / admin thấy chi tiết tác vụ)."""
+        profile = self.get_object()
+        data = {'profile_id': profile.id, 'processing_status': profile.processing_status}
+        if request.user.is_staff or profile.user_id == request.user.id:
+            jobs = BackgroundJob.objects.filter(related_entity_id=str(profile.id), task__startswith='profiles.')
+            data['jobs'] = BackgroundJobSerializer(jobs, many=True).data
+        return Response(data)
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         profile_id = instance.id
@@ -780,18 +206,7 @@ class ProfileViewSet(viewsets.ModelViewSet):
         try:
             if USE_QDRANT:
                 # Xóa từ Qdrant
-                qdrant_client = get_qdrant_client()
-                collection_name = get_qdrant_collection()
-                if qdrant_client and collection_name:
-                    qdrant_client.delete(
-                        collection_name=collection_name,
-                        points_selector=qdrant_models.PointIdsList(
-                            points=[int(profile_id)]  # Qdrant yêu cầu integer ID
-                        )
-                    )
-                    print(f"Đã xóa profile {profile_id} khỏi Qdrant.")
-                else:
-                    print(f"Qdrant client hoặc collection không khả dụng. Không thể xóa profile {profile_id} khỏi Qdrant.")
+                delete_profile_vector(profile_id)
             else:
                 # Fallback: Xóa từ ChromaDB
                 collection = initialize_vector_db()
@@ -800,6 +215,10 @@ class ProfileViewSet(viewsets.ModelViewSet):
         except Exception as e:
             vector_db_name = "Qdrant" if USE_QDRANT else "ChromaDB"
             print(f"Lỗi khi xóa profile {profile_id} khỏi {vector_db_name}: {e}")
+
+        # Xóa khỏi chỉ mục vector cục bộ (nếu đã được build) và chỉ mục dự phòng
+        delete_from_local_index(profile_id)
+        delete_profile_fallback(profile_id)
         
         # Xóa từ database
         return super().destroy(request, *args, **kwargs)
@@ -808,13 +227,16 @@ class ProfileViewSet(viewsets.ModelViewSet):
     def suggested_profiles(self, request, pk=None):
         profile = self.get_object() # Đây là profile có id = pk (id truy vấn)
         
-        # Tìm các gợi ý trong đó profile hiện tại (pk) là profile1
-        # và lấy ra các profile2 tương ứng làm hồ sơ gợi ý.
-        suggestions = ProfileMatchSuggestion.objects.filter(profile1=profile)
+        # Mỗi cặp hồ sơ chỉ có một gợi ý (không phân biệt chiều): tìm các gợi ý mà profile hiện tại (pk)
+        # là profile1 hoặc profile2 và lấy hồ sơ còn lại làm hồ sơ gợi ý.
+        suggestions = ProfileMatchSuggestion.objects.filter(
+            Q(profile1=profile) | Q(profile2=profile)
+        ).select_related('profile1', 'profile2').order_by('id')
         
         result = []
         for suggestion in suggestions:
-            profile_data = ProfileSerializer(suggestion.profile2, context={'request': request}).data
+            other = suggestion.profile2 if suggestion.profile1_id == profile.id else suggestion.profile1
+            profile_data = ProfileSerializer(other, context={'request': request}).data
             # Thêm thông tin match_status và suggestion_id
             profile_data['match_status'] = suggestion.match_status
             profile_data['suggestion_id'] = suggestion.id
@@ -830,12 +252,12 @@ class ProfileViewSet(viewsets.ModelViewSet):
         Mỗi hồ sơ gợi ý sẽ có thêm thông tin về hồ sơ gốc đã tạo ra gợi ý.
         """
         # Lấy ID của tất cả hồ sơ thuộc về user hiện tại
-        user_profile_ids = Profile.objects.filter(user=request.user).values_list('id', flat=True)
+        user_profile_ids = set(Profile.objects.filter(user=request.user).values_list('id', flat=True))
         
-        # Lấy tất cả các đề xuất match từ các hồ sơ của user
-        suggestions = ProfileMatchSuggestion.objects.filter(profile1_id__in=user_profile_ids).select_related(
-            'profile1', 'profile2'
-        ).order_by('-created_at')
+        # Lấy tất cả các đề xuất match có hồ sơ của user ở một trong hai phía (mỗi cặp chỉ có một gợi ý)
+        suggestions = ProfileMatchSuggestion.objects.filter(
+            Q(profile1_id__in=user_profile_ids) | Q(profile2_id__in=user_profile_ids)
+        ).select_related('profile1', 'profile2').order_by('-created_at')
         
         # Xử lý phân trang
         page = self.paginate_queryset(suggestions)
@@ -845,14 +267,18 @@ class ProfileViewSet(viewsets.ModelViewSet):
         # Tạo kết quả
         result = []
         for suggestion in suggestions:
-            # Serialize profile2 (hồ sơ được gợi ý)
-            profile_data = ProfileSerializer(suggestion.profile2, context={'request': request}).data
+            # Hồ sơ gốc là hồ sơ của user, hồ sơ được gợi ý là phía còn lại
+            if suggestion.profile1_id in user_profile_ids:
+                source, suggested = suggestion.profile1, suggestion.profile2
+            else:
+                source, suggested = suggestion.profile2, suggestion.profile1
+            profile_data = ProfileSerializer(suggested, context={'request': request}).data
             
-            # Thêm thông tin về profile1 (hồ sơ gốc)
+            # Thêm thông tin về hồ sơ gốc
             profile_data['suggested_from_profile'] = {
-                'id': suggestion.profile1.id,
-                'title': suggestion.profile1.title,
-                'created_at': suggestion.profile1.created_at
+                'id': source.id,
+                'title': source.title,
+                'created_at': source.created_at
             }
             
             # Thêm thông tin về suggestion
@@ -882,8 +308,8 @@ class ProfileViewSet(viewsets.ModelViewSet):
         # Lấy ID của tất cả hồ sơ thuộc về user hiện tại
         user_profile_ids = Profile.objects.filter(user=request.user).values_list('id', flat=True)
         
-        # Lấy tất cả các đề xuất match mà profile2 là hồ sơ của user hiện tại
-        # Điều này ngược với all_suggested_profiles (lấy profile1_id__in)
+        # Lấy tất cả các đề xuất match mà profile2 là hồ sơ của user hiện tại (hồ sơ của người khác
+        # được tạo sau và được ghép với hồ sơ của user); all_suggested_profiles lấy cả hai phía
         suggestions = ProfileMatchSuggestion.objects.filter(profile2_id__in=user_profile_ids).select_related(
             'profile1', 'profile2'
         ).order_by('-created_at')
@@ -936,7 +362,8 @@ class ProfileViewSet(viewsets.ModelViewSet):
         
         # Create a temporary profile object to generate embedding
         temp_profile = Profile(description=description)
-        similar_profiles = find_similar_profiles(temp_profile, top_k=10)
+        query_filter = filter_from_request(request.data, description)
+        similar_profiles = find_similar_profiles(temp_profile, top_k=10, query_filter=query_filter)
         
         serializer = ProfileSerializer(similar_profiles, many=True, context={'request': request})
         return Response(serializer.data)
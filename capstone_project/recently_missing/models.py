@@ -1,5 +1,6 @@
 # recently_missing/models.py
 from django.db import models
+from capstone_project.ids import next_id
 from accounts.models import User
 
 class RecentlyMissingReport(models.Model):  # ✅ Đổi từ RecentlyMissingProfile
@@ -33,8 +34,7 @@ class RecentlyMissingReport(models.Model):  # ✅ Đổi từ RecentlyMissingPro
     
     def save(self, *args, **kwargs):
         if self.id is None:
-            last = RecentlyMissingReport.objects.order_by('-id').first()
-            self.id = 1 if last is None else last.id + 1
+            self.id = next_id(RecentlyMissingReport)
         super().save(*args, **kwargs)
 
     @property
@@ -89,8 +89,7 @@ class MissingPersonMatchResult(models.Model):
 
     def save(self, *args, **kwargs):
         if self.id is None:
-            last = MissingPersonMatchResult.objects.order_by('-id').first()
-            self.id = 1 if last is None else last.id + 1
+            self.id = next_id(MissingPersonMatchResult)
         super().save(*args, **kwargs)
 
     class Meta:
@@ -24,7 +24,7 @@ import cv2
 import google.generativeai as genai
 import json
 from rest_framework import permissions, status
-from notifications.utils import create_notification
+from notifications.utils import create_notifications_bulk, NOTIFICATION_DEDUPE_SECONDS
 from rest_framework.permissions import AllowAny
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Count
@@ -126,51 +126,42 @@ def find_and_save_similar_reports(report_id, embedding):
             matches = future.result()
         
         # Tạo các match result và gửi thông báo nếu match_score >= 92
+        # (báo cáo được lấy một lần, thông báo cho cả hai chủ báo cáo ghi bằng một lần bulk_create)
+        high_matches = [match for match in matches if match['face_match_score'] >= 92]
+        reports = RecentlyMissingReport.objects.select_related('user').in_bulk(
+            {report_id} | {match['report1_id'] for match in high_matches} | {match['report2_id'] for match in high_matches}
+        ) if high_matches else {}
+        current_report = reports.get(report_id)
+        notifications = []
         for match in matches:
             # Tạo match result
             match_result = MissingPersonMatchResult.objects.create(**match)
             
             # Gửi thông báo cho người dùng khi match_score >= 92
             if match['face_match_score'] >= 92:
-                # Lấy thông tin các báo cáo
-                current_report = RecentlyMissingReport.objects.get(id=report_id)
-                other_report = RecentlyMissingReport.objects.get(id=match['report2_id'] if match['report1_id'] == report_id else match['report1_id'])
+                other_report = reports.get(match['report2_id'] if match['report1_id'] == report_id else match['report1_id'])
+                if current_report is None or other_report is None:
+                    continue
                 
-                # Gửi thông báo cho chủ sở hữu của báo cáo hiện tại (báo cáo vừa được upload ảnh)
-                if hasattr(current_report, 'user') and current_report.user:
-                    create_notification(
-                        user=current_report.user,
-                        notification_type='high_face_match',
-                        content=f'Hệ thống đã tìm thấy một kết quả khớp khuôn mặt cao ({match["face_match_score"]:.1f}%) giữa báo cáo "{current_report.title}" của bạn và báo cáo "{other_report.title}".',
-                        related_entity_id=match_result.id,
-                        additional_data={
-                            'match_id': match_result.id,
-                            'your_report_id': current_report.id,
-                            'your_report_title': current_report.title,
-                            'matching_report_id': other_report.id,
-                            'matching_report_title': other_report.title,
-                            'face_match_score': match['face_match_score'],
-                            'match_type': 'face_recognition'
-                        }
-                    )
-                
-                # Gửi thông báo cho chủ sở hữu của báo cáo khớp
-                if hasattr(other_report, 'user') and other_report.user:
-                    create_notification(
-                        user=other_report.user,
-                        notification_type='high_face_match',
-                        content=f'Hệ thống đã tìm thấy một kết quả khớp khuôn mặt cao ({match["face_match_score"]:.1f}%) giữa báo cáo "{other_report.title}" của bạn và báo cáo "{current_report.title}".',
-                        related_entity_id=match_result.id,
-                        additional_data={
-                            'match_id': match_result.id,
-                            'your_report_id': other_report.id,
-                            'your_report_title': other_report.title,
-                            'matching_report_id': current_report.id,
-                            'matching_report_title': current_report.title,
-                            'face_match_score': match['face_match_score'],
-                            'match_type': 'face_recognition'
-                        }
-                    )
+                # Thông báo cho chủ sở hữu của từng báo cáo (báo cáo vừa được upload ảnh và báo cáo khớp)
+                for own_report, matching_report in ((current_report, other_report), (other_report, current_report)):
+                    if own_report.user:
+                        notifications.append((
+                            own_report.user,
+                            'high_face_match',
+                            f'Hệ thống đã tìm thấy một kết quả khớp khuôn mặt cao ({match["face_match_score"]:.1f}%) giữa báo cáo "{own_report.title}" của bạn và báo cáo "{matching_report.title}".',
+                            {
+                                'match_id': match_result.id,
+                                'your_report_id': own_report.id,
+                                'your_report_title': own_report.title,
+                                'matching_report_id': matching_report.id,
+                                'matching_report_title': matching_report.title,
+                                'face_match_score': match['face_match_score'],
+                                'match_type': 'face_recognition'
+                            },
+                            match_result.id,
+                        ))
+        create_notifications_bulk(notifications, dedupe_seconds=NOTIFICATION_DEDUPE_SECONDS)
         
         while not task_queue.empty():
             task_queue.get().result()
@@ -179,7 +170,9 @@ def find_and_save_similar_reports(report_id, embedding):
 
 def analyze_reports_with_gemini(current_report, other_reports):
     """Gọi Gemini API để phân tích và so sánh các báo cáo với thông tin chi tiết hơn."""
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    from vector_search.config import GEMINI_REPORT_MODEL
+    from vector_search import llm_metrics
+    model = genai.GenerativeModel(GEMINI_REPORT_MODEL)
     
     # Hàm helper để format thông tin liên hệ CHI TIẾT
     def format_contact_info_detailed(report):
@@ -327,7 +320,9 @@ Hãy trả về kết quả theo định dạng JSON mẫu sau đây với các
 
     # Phần còn lại của hàm giữ nguyên...
     try:
-        response = model.generate_content(prompt)
+        with llm_metrics.track("report_analysis", GEMINI_REPORT_MODEL) as call:
+            response = model.generate_content(prompt)
+            call["usage"] = llm_metrics.usage_from_sdk(response)
         result_text = response.text.strip()
         
         # Tìm và trích xuất JSON từ response
@@ -607,6 +602,8 @@ def analyze_matches_with_llm(request):
             results.extend(batch_results)
         
         # Cập nhật kết quả vào MissingPersonMatchResult với cấu trúc JSON mới
+        other_reports_by_id = {report.id: report for report in other_reports.select_related('user')}
+        notifications = []
         for result in results:
             report_id = result['report_id']
             match = MissingPersonMatchResult.objects.filter(
@@ -622,47 +619,31 @@ def analyze_matches_with_llm(request):
                     match.save()
                 # Gửi thông báo cho chủ sở hữu của hồ sơ được khớp nếu kết luận là "match"
                 if result['analysis']['summary']['conclusion'] == 'match':
-                    # Lấy thông tin báo cáo hiện tại và báo cáo khớp
-                    other_report = RecentlyMissingReport.objects.get(id=report_id)
-                    
-                    # Gửi thông báo cho chủ sở hữu của báo cáo hiện tại
-                    if hasattr(current_report, 'user') and current_report.user:
-                        create_notification(
-                            user=current_report.user,
-                            notification_type='match_found',
-                            content=f'AI đã tìm thấy một kết quả khớp hoàn toàn giữa báo cáo "{current_report.title}" của bạn và báo cáo "{other_report.title}".',
-                            related_entity_id=match.id,
-                            additional_data={
-                                'match_id': match.id,
-                                'your_report_id': current_report.id,
-                                'your_report_title': current_report.title,
-                                'matching_report_id': other_report.id,
-                                'matching_report_title': other_report.title,
-                                'face_match_score': match.face_match_score,
-                                'match_conclusion': 'match'
-                            }
-                        )
+                    other_report = other_reports_by_id.get(report_id)
+                    if other_report is None:
+                        continue
                     
-                    # Gửi thông báo cho chủ sở hữu của báo cáo khớp
-                    if hasattr(other_report, 'user') and other_report.user:
-                        create_notification(
-                            user=other_report.user,
-                            notification_type='match_found',
-                            content=f'AI đã tìm thấy một kết quả khớp hoàn toàn giữa báo cáo "{other_report.title}" của bạn và báo cáo "{current_report.title}".',
-                            related_entity_id=match.id,
-                            additional_data={
-                                'match_id': match.id,
-                                'your_report_id': other_report.id,
-                                'your_report_title': other_report.title,
-                                'matching_report_id': current_report.id,
-                                'matching_report_title': current_report.title,
-                                'face_match_score': match.face_match_score,
-                                'match_conclusion': 'match'
-                            }
-                        )
+                    # Thông báo cho chủ sở hữu của báo cáo hiện tại và của báo cáo khớp
+                    for own_report, matching_report in ((current_report, other_report), (other_report, current_report)):
+                        if own_report.user:
+                            notifications.append((
+                                own_report.user,
+                                'match_found',
+                                f'AI đã tìm thấy một kết quả khớp hoàn toàn giữa báo cáo "{own_report.title}" của bạn và báo cáo "{matching_report.title}".',
+                                {
+                                    'match_id': match.id,
+                                    'your_report_id': own_report.id,
+                                    'your_report_title': own_report.title,
+                                    'matching_report_id': matching_report.id,
+                                    'matching_report_title': matching_report.title,
+                                    'face_match_score': match.face_match_score,
+                                    'match_conclusion': 'match'
+                                },
+                                match.id,
+                            ))
+        # Một lần ghi cho mọi thông báo; phân tích lại cùng một cặp không gửi lại khi thông báo cũ chưa đọc
+        create_notifications_bulk(notifications, dedupe_seconds=NOTIFICATION_DEDUPE_SECONDS)
 
-
-        
         return Response({'message': 'Phân tích LLM hoàn tất', 'results': results}, status=status.HTTP_200_OK)
     except Exception as e:
         import traceback
@@ -0,0 +1,4 @@
+from django.contrib import admin
+from .models import EmbeddingVersion
+
+admin.site.register(EmbeddingVersion)
@@ -0,0 +1,64 @@
+"""
+Script tạo payload index và cập nhật payload (năm sinh/năm thất lạc dạng số, tên cha mẹ đã bỏ dấu)
+cho các hồ sơ đã có trên Qdrant, để lọc theo năm/tên ngay trong Qdrant.
+
+Chạy: python -m vector_search.backfill_payloads
+"""
+import argparse
+import time
+
+from qdrant_client.http import models as qdrant_models
+
+from .qdrant_helper import get_qdrant_client, get_qdrant_collection, ensure_payload_indexes
+from .indexing import build_profile_payload
+
+
+def backfill_payloads(batch_size=256):
+    from profiles.models import Profile
+
+    client = get_qdrant_client()
+    collection_name = get_qdrant_collection()
+    if collection_name is None:
+        print("Không có collection Qdrant để cập nhật payload.")
+        return
+
+    ensure_payload_indexes(client, collection_name)
+
+    started = time.time()
+    total = 0
+    missing = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False,
+        )
+        profiles = Profile.objects.in_bulk([int(p.id) for p in points])
+        operations = []
+        for point in points:
+            profile = profiles.get(int(point.id))
+            if profile is None:
+                missing += 1
+                continue
+            operations.append(qdrant_models.SetPayloadOperation(
+                set_payload=qdrant_models.SetPayload(payload=build_profile_payload(profile), points=[point.id])
+            ))
+        if operations:
+            client.batch_update_points(collection_name=collection_name, update_operations=operations)
+        total += len(operations)
+        print(f"Đã cập nhật payload cho {total} hồ sơ...")
+        if offset is None:
+            break
+
+    print(f"✅ Hoàn thành {total} hồ sơ trong {time.time() - started:.1f}s "
+          f"({missing} point không còn hồ sơ trong database).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tạo payload index và cập nhật payload lọc cho Qdrant")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+    backfill_payloads(batch_size=args.batch_size)
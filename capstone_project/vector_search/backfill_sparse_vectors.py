@@ -0,0 +1,102 @@
+"""
+Script sinh sparse vector (BM25 tiếng Việt) cho các hồ sơ đã có trên Qdrant, để bật USE_QDRANT_HYBRID.
+
+- Nếu collection đã có sparse vector: cập nhật tại chỗ (update_vectors).
+- Nếu chưa có (Qdrant không cho thêm vector mới vào collection đã tồn tại): tạo collection
+  '<tên>_hybrid' có cả dense + sparse, sao chép dense vector + payload sang và sinh sparse vector.
+  Với --swap: xóa collection cũ và tạo alias '<tên>' trỏ sang collection mới (không cần đổi cấu hình).
+
+Chạy: python -m vector_search.backfill_sparse_vectors [--swap]
+"""
+import argparse
+import time
+
+from qdrant_client.http import models as qdrant_models
+
+from .config import QDRANT_COLLECTION_NAME, SPARSE_VECTOR_NAME
+from .qdrant_helper import get_qdrant_client, has_sparse_vector, create_profile_collection, resolve_alias, switch_alias
+from .indexing import build_lexical_text, build_sparse_vector
+
+
+def _sparse_vectors_for(points):
+    """Sinh sparse vector cho các point, ưu tiên dữ liệu đầy đủ từ database, fallback payload."""
+    from profiles.models import Profile
+
+    profiles = Profile.objects.in_bulk([int(p.id) for p in points])
+    vectors = {}
+    for point in points:
+        profile = profiles.get(int(point.id))
+        if profile is not None:
+            text = build_lexical_text(profile)
+        else:
+            text = " ".join(str(v) for v in (point.payload or {}).values())
+        vectors[point.id] = build_sparse_vector(text)
+    return vectors
+
+
+def backfill_sparse_vectors(batch_size=256, swap=False):
+    client = get_qdrant_client()
+    source_name, is_alias = resolve_alias(client, QDRANT_COLLECTION_NAME)
+    in_place = has_sparse_vector(client, source_name, SPARSE_VECTOR_NAME)
+
+    target_name = source_name
+    if not in_place:
+        target_name = f"{source_name}_hybrid"
+        dense_params = client.get_collection(source_name).config.params.vectors
+        print(f"Collection '{source_name}' chưa có sparse vector. Đang tạo '{target_name}'...")
+        create_profile_collection(client, target_name, dimension=dense_params.size, with_sparse=True)
+
+    started = time.time()
+    total = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=source_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=not in_place,
+        )
+        if points:
+            sparse = _sparse_vectors_for(points)
+            if in_place:
+                client.update_vectors(
+                    collection_name=target_name,
+                    points=[
+                        qdrant_models.PointVectors(id=p.id, vector={SPARSE_VECTOR_NAME: sparse[p.id]})
+                        for p in points
+                    ],
+                )
+            else:
+                client.upsert(
+                    collection_name=target_name,
+                    points=[
+                        qdrant_models.PointStruct(
+                            id=p.id,
+                            vector={"": p.vector, SPARSE_VECTOR_NAME: sparse[p.id]},
+                            payload=p.payload,
+                        )
+                        for p in points
+                    ],
+                )
+            total += len(points)
+            print(f"Đã sinh sparse vector cho {total} hồ sơ...")
+        if offset is None:
+            break
+
+    print(f"✅ Hoàn thành {total} hồ sơ trong {time.time() - started:.1f}s.")
+
+    if not in_place:
+        if swap:
+            switch_alias(client, QDRANT_COLLECTION_NAME, target_name)
+        else:
+            print(f"Chạy lại với --swap để chuyển '{QDRANT_COLLECTION_NAME}' sang '{target_name}', "
+                  f"hoặc đặt QDRANT_COLLECTION_NAME={target_name}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sinh sparse vector BM25 cho hybrid search trên Qdrant")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--swap", action="store_true", help="Chuyển tên collection hiện tại sang collection hybrid mới")
+    args = parser.parse_args()
+    backfill_sparse_vectors(batch_size=args.batch_size, swap=args.swap)
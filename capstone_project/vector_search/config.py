@@ -1,9 +1,13 @@
 import os
+import json
 from django.conf import settings
 from pathlib import Path
 from dotenv import load_dotenv
 import django
 
+# Cho phép chạy các script dạng "python -m vector_search.<script>" mà không cần đặt biến môi trường trước
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "capstone_project.settings")
+
 # --- API Keys Configuration ---
 # Tải biến môi trường từ file .env ở thư mục gốc dự án (nếu có)
 ENV_PATH = Path(settings.BASE_DIR) / ".env"
@@ -32,7 +36,15 @@ CHROMA_PERSIST_PATH = str(Path(settings.BASE_DIR) / "chroma_db_store")
 
 CHROMA_COLLECTION_NAME = "missing_people_profiles"
 EMBEDDING_MODEL_NAME = "models/text-embedding-004"
+# Số chiều embedding (text-embedding-004 mặc định 768). Đặt nhỏ hơn (vd 256) để giảm RAM Qdrant;
+# đổi giá trị này phải tạo lại collection và embed lại toàn bộ hồ sơ.
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "0")) or None
 DETAIL_COLUMN_NAME = "Chi tiet_merged"
+# Cột bản tóm tắt cho LLM (không dùng để đếm từ khóa vì lặp lại nội dung các cột khác)
+DIGEST_COLUMN_NAME = "llm_digest"
+# Phiên bản embedding (blue/green, xem embedding_versions.py): thời gian cache phiên bản active trong mỗi tiến trình
+EMBEDDING_VERSION_CACHE_SECONDS = int(os.getenv("EMBEDDING_VERSION_CACHE_SECONDS", "10"))
+EMBEDDING_BUILD_WORKERS = int(os.getenv("EMBEDDING_BUILD_WORKERS", "4"))  # Số luồng embed khi build phiên bản mới
 
 # --- Vector DB Selection ---
 # Mặc định dùng Qdrant, có thể chuyển về ChromaDB hoặc Pinecone bằng env vars
@@ -45,7 +57,42 @@ QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 QDRANT_URL = os.getenv("QDRANT_URL")  # Cloud: https://xxxxx.qdrant.io
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")  # Cloud API key
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"  # gRPC nhanh hơn cho import số lượng lớn
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "missing_people_profiles")
+# Số vector lấy về ở bước 1 (luôn >= top_n_final để xếp hạng cuối cùng không đổi)
+QDRANT_TOP_K = int(os.getenv("QDRANT_TOP_K", "300"))
+# Bỏ qua các vector có cosine thấp hơn ngưỡng ở bước 1 (hồ sơ khớp từ khóa vẫn được chấm ở bước 2)
+QDRANT_SCORE_THRESHOLD = float(os.getenv("QDRANT_SCORE_THRESHOLD", "0.0"))
+# Số ID mỗi lần chấm điểm các hồ sơ khớp từ khóa nằm ngoài top-k
+QDRANT_RESCORE_BATCH_SIZE = int(os.getenv("QDRANT_RESCORE_BATCH_SIZE", "1000"))
+# Hybrid: dense (Gemini) + sparse (BM25 tiếng Việt) được Qdrant hợp nhất (RRF) trong một truy vấn.
+# Cần chạy vector_search/backfill_sparse_vectors.py trước khi bật.
+USE_QDRANT_HYBRID = os.getenv("USE_QDRANT_HYBRID", "false").lower() == "true"
+SPARSE_VECTOR_NAME = os.getenv("QDRANT_SPARSE_VECTOR_NAME", "text")
+QDRANT_HYBRID_PREFETCH = int(os.getenv("QDRANT_HYBRID_PREFETCH", "300"))  # Số ứng viên mỗi nhánh trước khi hợp nhất
+# Tự trích năm sinh/năm thất lạc/tên cha mẹ từ truy vấn thành Qdrant filter (cần chạy backfill_payloads.py)
+QDRANT_AUTO_FILTERS = os.getenv("QDRANT_AUTO_FILTERS", "false").lower() == "true"
+# Tùy chọn lưu trữ collection (xem qdrant_helper.create_profile_collection / apply_collection_options)
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()  # none | scalar (int8, ~4x) | binary (~32x)
+QDRANT_ON_DISK = os.getenv("QDRANT_ON_DISK", "false").lower() == "true"  # Vector gốc float32 để trên đĩa (mmap)
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", "0")) or None  # ef lúc truy vấn (None = mặc định Qdrant)
+QDRANT_QUANTIZATION_RESCORE = os.getenv("QDRANT_QUANTIZATION_RESCORE", "true").lower() == "true"
+QDRANT_QUANTIZATION_OVERSAMPLING = float(os.getenv("QDRANT_QUANTIZATION_OVERSAMPLING", "2.0"))
+
+# --- pgvector Configuration ---
+# Lưu embedding trong Postgres (bảng cạnh Profile), vector top-k + từ khóa + dữ liệu hồ sơ trong một truy vấn SQL.
+# Tạo bảng/index và nạp dữ liệu: python -m vector_search.pgvector_store build --source qdrant
+USE_PGVECTOR = os.getenv("USE_PGVECTOR", "false").lower() == "true"
+PGVECTOR_TABLE = os.getenv("PGVECTOR_TABLE", "profile_embeddings")
+PGVECTOR_INDEX_TYPE = os.getenv("PGVECTOR_INDEX_TYPE", "hnsw").lower()  # hnsw | ivfflat
+PGVECTOR_HNSW_M = int(os.getenv("PGVECTOR_HNSW_M", "16"))
+PGVECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("PGVECTOR_HNSW_EF_CONSTRUCTION", "64"))
+PGVECTOR_IVFFLAT_LISTS = int(os.getenv("PGVECTOR_IVFFLAT_LISTS", "100"))
+PGVECTOR_IVFFLAT_PROBES = int(os.getenv("PGVECTOR_IVFFLAT_PROBES", "10"))
+PGVECTOR_TOP_K = int(os.getenv("PGVECTOR_TOP_K", "300"))
 
 # --- Pinecone Configuration (đã comment - không dùng nữa) ---
 # USE_PINECONE = os.getenv("USE_PINECONE", "true").lower() == "true"
@@ -54,13 +101,75 @@ PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST")  # v3 host dạng https:/
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")  # tùy chọn nếu dùng client cần tên
 PINECONE_TOP_K = int(os.getenv("PINECONE_TOP_K", "1000"))
 
+# --- Local (in-process) Vector Index Configuration ---
+# Chỉ mục vector chạy ngay trong tiến trình Django, dùng khi Qdrant không khả dụng hoặc deploy nhỏ
+USE_LOCAL_INDEX = os.getenv("USE_LOCAL_INDEX", "false").lower() == "true"
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", str(Path(settings.BASE_DIR) / "local_vector_index"))
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")  # float16: tiết kiệm 1/2 RAM nhưng search chậm hơn (phải đổi kiểu)
+LOCAL_INDEX_HNSW_THRESHOLD = int(os.getenv("LOCAL_INDEX_HNSW_THRESHOLD", "200000"))  # Dưới ngưỡng: tìm chính xác
+LOCAL_INDEX_HNSW_EF = int(os.getenv("LOCAL_INDEX_HNSW_EF", "256"))
+LOCAL_INDEX_TOP_K = int(os.getenv("LOCAL_INDEX_TOP_K", "1000"))
+# Chỉ mục dự phòng (fallback_encoder.py): vector n-gram ký tự băm, tính cục bộ, luôn có kể cả khi hết quota Gemini
+FALLBACK_INDEX_PATH = os.getenv("FALLBACK_INDEX_PATH", str(Path(settings.BASE_DIR) / "fallback_vector_index"))
+FALLBACK_ENCODER_DIMENSION = int(os.getenv("FALLBACK_ENCODER_DIMENSION", "512"))
+# Circuit breaker cho embedding Gemini: sau N lần thất bại liên tiếp, ngừng gọi trong một khoảng thời gian
+EMBEDDING_BREAKER_FAILURES = int(os.getenv("EMBEDDING_BREAKER_FAILURES", "2"))
+EMBEDDING_BREAKER_COOLDOWN = int(os.getenv("EMBEDDING_BREAKER_COOLDOWN", "60"))  # Giây
+
 # --- LLM Configuration ---
-BATCH_SIZE_LLM = 100
-# MAX_CONCURRENT_REQUESTS_LLM = len(GEMINI_API_KEYS)
-MAX_CONCURRENT_REQUESTS_LLM = 1
+BATCH_SIZE_LLM = 100  # Số hồ sơ tối đa trong một lần gọi xác minh
+# Số lô xác minh gọi song song (mặc định: số API key)
+MAX_CONCURRENT_REQUESTS_LLM = int(os.getenv("MAX_CONCURRENT_REQUESTS_LLM", "0")) or max(1, len(GEMINI_API_KEYS))
+# Ngân sách token đầu vào cho mỗi prompt xác minh (hướng dẫn + truy vấn + các hồ sơ); parallel_verify chia lô theo giá trị này
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "12000"))
 MAX_RETRIES_LLM = 1
 INITIAL_RETRY_DELAY_LLM = 5  # Giây
 BATCH_GROUP_DELAY_LLM = 2  # Có thể giảm delay này vì đang dùng nhiều key
+# Model Gemini theo tác vụ. Xác minh dùng 2 tầng: model nhanh sàng lọc (chấm điểm 0-100 từng hồ sơ),
+# chỉ các hồ sơ có điểm trong [LLM_ESCALATE_MIN_SCORE, LLM_ACCEPT_SCORE) mới được gửi sang model mạnh.
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.0-flash-lite")
+GEMINI_STRONG_MODEL = os.getenv("GEMINI_STRONG_MODEL", "gemini-2.0-flash")
+GEMINI_KEYWORD_MODEL = os.getenv("GEMINI_KEYWORD_MODEL", "gemini-2.5-flash")
+GEMINI_EXTRACTION_MODEL = os.getenv("GEMINI_EXTRACTION_MODEL", "gemini-2.0-flash")
+GEMINI_REPORT_MODEL = os.getenv("GEMINI_REPORT_MODEL", "gemini-2.0-flash")
+GEMINI_MODERATION_MODEL = os.getenv("GEMINI_MODERATION_MODEL", "gemini-2.0-flash")
+LLM_TIERING_ENABLED = os.getenv("LLM_TIERING_ENABLED", "true").lower() == "true"
+LLM_ACCEPT_SCORE = int(os.getenv("LLM_ACCEPT_SCORE", "80"))  # >= : nhận luôn, không cần model mạnh
+LLM_ESCALATE_MIN_SCORE = int(os.getenv("LLM_ESCALATE_MIN_SCORE", "30"))  # < : loại luôn
+# Bảng giá ước tính (USD / 1 triệu token vào, ra) cho bộ đếm chi phí (llm_metrics.py); ghi đè bằng JSON
+LLM_MODEL_PRICES = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+LLM_MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.getenv("LLM_MODEL_PRICES", "{}")).items()})
+# Kiểm duyệt nội dung truy vấn / mô tả hồ sơ (xem moderation.py): tầng cục bộ, chỉ nội dung cần xem xét mới hỏi Gemini
+CONTENT_MODERATION_ENABLED = os.getenv("CONTENT_MODERATION_ENABLED", "true").lower() == "true"
+MODERATION_LLM_ENABLED = os.getenv("MODERATION_LLM_ENABLED", "true").lower() == "true"
+MODERATION_CACHE_SECONDS = int(os.getenv("MODERATION_CACHE_SECONDS", "86400"))
+# Trích xuất từ khóa truy vấn (xem keyword_extractor.py): local | llm | hybrid
+KEYWORD_EXTRACTION_MODE = os.getenv("KEYWORD_EXTRACTION_MODE", "hybrid").lower()
+KEYWORD_LLM_TIMEOUT = float(os.getenv("KEYWORD_LLM_TIMEOUT", "4"))  # Giây chờ Gemini ở chế độ hybrid
+# Bản tóm tắt hồ sơ cho LLM (Profile.llm_digest), tính một lần khi tạo/cập nhật hồ sơ
+LLM_DIGEST_MAX_TOKENS = int(os.getenv("LLM_DIGEST_MAX_TOKENS", "128"))
+# Ước lượng số ký tự / token của Gemini với văn bản tiếng Việt có dấu
+LLM_CHARS_PER_TOKEN = float(os.getenv("LLM_CHARS_PER_TOKEN", "3.5"))
+# Lọc sơ bộ theo năm / tên cha mẹ / anh chị em trước khi gửi LLM (xem prefilter.py)
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+PREFILTER_YEAR_TOLERANCE = int(os.getenv("PREFILTER_YEAR_TOLERANCE", "3"))  # Năm trong hồ sơ thường là ước lượng
+PREFILTER_NAME_MIN_SIMILARITY = float(os.getenv("PREFILTER_NAME_MIN_SIMILARITY", "0.5"))
+# Điểm khớp trường có cấu trúc cộng vào tổng điểm: mỗi điểm = PREFILTER_SCORE_WEIGHT × điểm cao nhất của trang
+PREFILTER_SCORE_WEIGHT = float(os.getenv("PREFILTER_SCORE_WEIGHT", "0.05"))
+# Cắt ứng viên thích ứng theo phân bố điểm + phân trang từ danh sách đã xếp hạng (xem ranked_pages.py)
+SEARCH_CUTOFF_MIN_K = int(os.getenv("SEARCH_CUTOFF_MIN_K", "10"))  # Luôn xác minh ít nhất chừng này hồ sơ
+SEARCH_CUTOFF_MIN_SCORE = float(os.getenv("SEARCH_CUTOFF_MIN_SCORE", "0.0"))
+SEARCH_CUTOFF_RELATIVE_FLOOR = float(os.getenv("SEARCH_CUTOFF_RELATIVE_FLOOR", "0.75"))  # Tỉ lệ so với điểm cao nhất
+SEARCH_CUTOFF_GAP_RATIO = float(os.getenv("SEARCH_CUTOFF_GAP_RATIO", "0.3"))  # Khoảng trống / khoảng điểm
+SEARCH_RANKED_CACHE_SIZE = int(os.getenv("SEARCH_RANKED_CACHE_SIZE", "300"))
+SEARCH_RANKED_CACHE_SECONDS = int(os.getenv("SEARCH_RANKED_CACHE_SECONDS", "900"))
+# Gợi ý hồ sơ phù hợp sau khi tạo (search_similar_to_profile): số hồ sơ khớp từ khóa tối đa được nạp từ DB
+MATCH_KEYWORD_CANDIDATES = int(os.getenv("MATCH_KEYWORD_CANDIDATES", "1000"))
 
 # --- Django Integration ---
 # Setup Django environment if running as a standalone script
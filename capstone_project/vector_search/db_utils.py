@@ -1,15 +1,17 @@
 import pandas as pd
 from django.db.models import Q
 
-def fetch_profiles_from_db():
-    """Fetch all profiles from the Django ORM and return as a DataFrame."""
+def fetch_profiles_from_db(ids=None):
+    """Fetch all profiles (hoặc chỉ các hồ sơ có ID trong `ids`) from the Django ORM and return as a DataFrame."""
     try:
         # Import here to avoid circular imports
         from profiles.models import Profile
         
-        queryset = Profile.objects.all().values(
+        queryset = Profile.objects.all() if ids is None else Profile.objects.filter(id__in=list(ids))
+        queryset = queryset.values(
             'id', 'title', 'full_name', 'born_year', 'losing_year', 'description',
-            'name_of_father', 'name_of_mother', 'siblings', 'status', 'created_at', 'updated_at'
+            'name_of_father', 'name_of_mother', 'siblings', 'status', 'created_at', 'updated_at',
+            'llm_digest'
         )
         
         if not queryset.exists():
@@ -41,10 +43,67 @@ def fetch_profiles_from_db():
         print(f"Error fetching profiles from database: {e}")
         return pd.DataFrame()
 
-def find_similar_profiles(profile, top_k=10):
-    """Find similar profiles to the given profile using vector search."""
+# Các field văn bản được đếm khớp từ khóa (như _count_keyword_matches trên DataFrame của fetch_profiles_from_db)
+KEYWORD_FIELDS = (
+    'title', 'full_name', 'born_year', 'losing_year', 'description',
+    'name_of_father', 'name_of_mother', 'siblings', 'status',
+)
+
+
+def fetch_keyword_match_ids(keywords, limit=None):
+    """ID các hồ sơ (mới nhất trước) có ít nhất một field chứa một trong các từ khóa, không phân biệt hoa thường."""
+    condition = Q()
+    for keyword in keywords or []:
+        for field in KEYWORD_FIELDS:
+            condition |= Q(**{f"{field}__icontains": keyword})
+    if not condition:
+        return []
+    try:
+        from profiles.models import Profile
+
+        queryset = Profile.objects.filter(condition).order_by('-id').values_list('id', flat=True)
+        return list(queryset[:limit] if limit else queryset)
+    except Exception as e:
+        print(f"Error fetching keyword matches from database: {e}")
+        return []
+
+
+def _similar_ids_from_qdrant(embedding, top_k, query_filter=None):
+    """Vector search trên Qdrant (có thể kèm filter năm/tên cha mẹ). Trả về list ID hoặc None nếu lỗi."""
+    from .qdrant_helper import get_qdrant_client, get_qdrant_collection, search_params
+
+    client = get_qdrant_client()
+    collection_name = get_qdrant_collection()
+    if collection_name is None:
+        return None
+    try:
+        hits = client.search(
+            collection_name=collection_name,
+            query_vector=embedding,
+            query_filter=query_filter,
+            search_params=search_params(),
+            limit=top_k,
+            with_payload=["id"],
+        )
+    except Exception as e:
+        print(f"Error searching similar profiles on Qdrant: {e}")
+        return None
+    similar_ids = []
+    for hit in hits:
+        try:
+            similar_ids.append(int((hit.payload or {}).get('id') or hit.id))
+        except (ValueError, TypeError):
+            continue
+    return similar_ids
+
+
+def find_similar_profiles(profile, top_k=10, query_filter=None):
+    """
+    Find similar profiles to the given profile using vector search.
+    Dùng Qdrant (kèm query_filter nếu có) khi USE_QDRANT, ngược lại dùng ChromaDB.
+    """
     from .embedding import get_embedding, initialize_vector_db
-    from .config import DETAIL_COLUMN_NAME
+    from .config import DETAIL_COLUMN_NAME, USE_QDRANT
     from profiles.models import Profile as ProfileModel
     
     # Get the profile description
@@ -58,6 +117,14 @@ def find_similar_profiles(profile, top_k=10):
         print(f"Could not create embedding for profile {profile.id}")
         return []
         
+    if USE_QDRANT:
+        similar_ids = _similar_ids_from_qdrant(embedding, top_k + 1, query_filter=query_filter)
+        if similar_ids is not None:
+            similar_ids = [i for i in similar_ids if str(i) != str(profile.id)][:top_k]
+            similar_profiles = list(ProfileModel.objects.filter(id__in=similar_ids))
+            similar_profiles.sort(key=lambda p: similar_ids.index(p.id))
+            return similar_profiles
+
     # Initialize vector DB
     collection = initialize_vector_db()
     if not collection:
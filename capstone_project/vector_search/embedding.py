@@ -1,3 +1,4 @@
+import threading
 import time
 import pandas as pd
 import google.generativeai as genai
@@ -11,7 +12,10 @@ from .config import (
     GEMINI_API_KEYS,
     CHROMA_PERSIST_PATH,
     CHROMA_COLLECTION_NAME,
-    EMBEDDING_MODEL_NAME
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_DIMENSION,
+    EMBEDDING_BREAKER_FAILURES,
+    EMBEDDING_BREAKER_COOLDOWN,
 )
 
 # --- Khởi tạo Google AI ---
@@ -43,21 +47,64 @@ def initialize_vector_db():
         print(f"Lỗi khi kết nối/tạo collection ChromaDB: {e}")
         return None
 
-def get_embedding(text, task_type, model=EMBEDDING_MODEL_NAME, api_keys=None, 
-                 max_wait_time=120, max_consecutive_failures_per_key=3, max_total_attempts=15):
-    """Lấy embedding từ Google API với cơ chế thử lại mạnh mẽ và xoay vòng API key."""
+# --- Circuit breaker: khi mọi key đều hết quota, ngừng gọi Gemini trong EMBEDDING_BREAKER_COOLDOWN giây ---
+# (thay vì mỗi request tự thử lại và chờ tới vài phút); người gọi chuyển sang fallback_encoder.py.
+_breaker_lock = threading.Lock()
+_breaker_state = {"failures": 0, "open_until": 0.0}
+
+
+def embedding_breaker_open():
+    """True nếu đang tạm ngừng gọi Gemini embedding."""
+    return time.time() < _breaker_state["open_until"]
+
+
+def _record_embedding_outcome(ok):
+    with _breaker_lock:
+        if ok:
+            _breaker_state["failures"] = 0
+            _breaker_state["open_until"] = 0.0
+            return
+        _breaker_state["failures"] += 1
+        if _breaker_state["failures"] >= EMBEDDING_BREAKER_FAILURES:
+            _breaker_state["open_until"] = time.time() + EMBEDDING_BREAKER_COOLDOWN
+            print(f"⚠️  Embedding Gemini thất bại {_breaker_state['failures']} lần liên tiếp, "
+                  f"tạm ngừng gọi trong {EMBEDDING_BREAKER_COOLDOWN}s.")
+
+
+def get_embedding(text, task_type, model=None, api_keys=None, 
+                 max_wait_time=120, max_consecutive_failures_per_key=3, max_total_attempts=15,
+                 output_dimensionality=None):
+    """
+    Lấy embedding từ Google API với cơ chế thử lại mạnh mẽ và xoay vòng API key.
+    model=None: dùng model/số chiều của phiên bản embedding đang active (embedding_versions.py),
+    mặc định EMBEDDING_MODEL_NAME / EMBEDDING_DIMENSION.
+    Trả về None ngay (không gọi API) khi circuit breaker đang mở, hoặc khi mọi key đều báo hết quota.
+    output_dimensionality < 768: model trả về vector rút gọn (giảm RAM Qdrant), phải giống nhau
+    giữa lúc index và lúc truy vấn.
+    """
     if not isinstance(text, str) or not text.strip() or pd.isna(text):
         print(f"Cảnh báo: Dữ liệu đầu vào không hợp lệ cho embedding: {text[:50]}...")
         return None
 
+    if model is None:
+        from .embedding_versions import current_embedding_model
+        model, active_dimension = current_embedding_model()
+        if output_dimensionality is None:
+            output_dimensionality = active_dimension
+
     if api_keys is None or not api_keys:
         api_keys = [PRIMARY_GOOGLE_API_KEY]  # Sử dụng key chính nếu không có danh sách
 
+    if embedding_breaker_open():
+        print("Embedding Gemini đang tạm ngừng (circuit breaker), bỏ qua lời gọi.")
+        return None
+
     text = text[:8000]  # Giới hạn độ dài
     total_attempts = 0
     current_key_index = 0
     consecutive_failures_with_current_key = 0
     current_wait_time = 5  # Thời gian chờ ban đầu (giây)
+    exhausted_keys = set()  # Các key đã báo hết quota (429) trong lần gọi này
 
     while total_attempts < max_total_attempts:
         current_api_key = api_keys[current_key_index]
@@ -67,17 +114,24 @@ def get_embedding(text, task_type, model=EMBEDDING_MODEL_NAME, api_keys=None,
             # Cấu hình key hiện tại cho thư viện genai
             genai.configure(api_key=current_api_key)
 
+            extra_args = {}
+            if output_dimensionality:
+                extra_args["output_dimensionality"] = output_dimensionality
             result = genai.embed_content(
                 model=model,
                 content=text,
-                task_type=task_type
+                task_type=task_type,
+                **extra_args
             )
+            _record_embedding_outcome(True)
             return result["embedding"]
 
         # Lỗi cụ thể từ Google API
         except google_exceptions.ResourceExhausted as e:  # Lỗi Quota (429)
             error_type = "ResourceExhausted (429)"
-            consecutive_failures_with_current_key += 1
+            exhausted_keys.add(current_key_index)
+            # Key đã hết quota: chuyển ngay sang key khác thay vì chờ thử lại trên cùng key
+            consecutive_failures_with_current_key = max_consecutive_failures_per_key
         except google_exceptions.ServiceUnavailable as e:  # Lỗi Server (503)
             error_type = "ServiceUnavailable (503)"
             consecutive_failures_with_current_key += 1
@@ -113,6 +167,12 @@ def get_embedding(text, task_type, model=EMBEDDING_MODEL_NAME, api_keys=None,
         # Xử lý thử lại và chuyển key
         print(f"Lỗi '{error_type}' khi tạo embedding cho '{text[:50]}...' (Key index {current_key_index}, Thử lại tổng {total_attempts}/{max_total_attempts}).")
 
+        if len(exhausted_keys) >= len(api_keys):
+            # Mọi key đều hết quota: chờ thêm cũng vô ích, để người gọi dùng embedding dự phòng
+            print("Tất cả API key đều hết quota embedding.")
+            _record_embedding_outcome(False)
+            return None
+
         # Kiểm tra nếu cần chuyển key
         if consecutive_failures_with_current_key >= max_consecutive_failures_per_key:
             current_key_index = (current_key_index + 1) % len(api_keys)
@@ -130,4 +190,5 @@ def get_embedding(text, task_type, model=EMBEDDING_MODEL_NAME, api_keys=None,
 
     # Nếu thoát khỏi vòng lặp do hết max_total_attempts
     print(f"Không thể tạo embedding cho '{text[:50]}...' sau {max_total_attempts} lần thử với các API key khác nhau.")
+    _record_embedding_outcome(False)
     return None
\ No newline at end of file
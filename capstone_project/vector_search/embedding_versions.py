@@ -0,0 +1,422 @@
+"""
+Quản lý phiên bản embedding (blue/green) để đổi model / số chiều mà không làm gián đoạn tìm kiếm.
+
+Quy trình:
+    # 1. Đăng ký collection hiện tại làm phiên bản đang chạy (chỉ cần một lần)
+    python -m vector_search.embedding_versions register --name v1
+    # 2. Tạo phiên bản mới (collection riêng) - từ lúc này hồ sơ mới được ghi vào cả hai phiên bản
+    python -m vector_search.embedding_versions create --name v2 --model models/gemini-embedding-001 --dimension 768
+    # 3. Embed lại toàn bộ hồ sơ ở nền (có checkpoint, chạy lại để tiếp tục)
+    python -m vector_search.embedding_versions build --name v2 --workers 4
+    # 4. Shadow query: so sánh recall@k và độ trễ giữa phiên bản đang chạy và phiên bản mới
+    python -m vector_search.embedding_versions shadow --name v2 --sample 200 [--queries-file queries.txt]
+    # 5. Chuyển đổi (collection + model truy vấn theo bản ghi active), rollback bằng cách activate lại phiên bản cũ
+    python -m vector_search.embedding_versions activate --name v2
+    # 6. Dọn các collection cũ
+    python -m vector_search.embedding_versions cleanup --keep 1
+
+Truy vấn luôn lấy model và collection từ cùng một bản ghi phiên bản 'active' (cache EMBEDDING_VERSION_CACHE_SECONDS),
+nên không bao giờ embed bằng model mới rồi tìm trên collection cũ. Phiên bản cũ vẫn nhận dual-write cho tới khi
+cleanup, nên các tiến trình chưa hết cache vẫn tìm được hồ sơ mới.
+Khi chưa có bản ghi nào, mọi thứ giữ nguyên như trước (EMBEDDING_MODEL_NAME + QDRANT_COLLECTION_NAME).
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_DIMENSION,
+    QDRANT_COLLECTION_NAME,
+    EMBEDDING_VERSION_CACHE_SECONDS,
+    EMBEDDING_BUILD_WORKERS,
+    GEMINI_API_KEYS,
+)
+
+# Các trạng thái vẫn có collection và cần nhận dual-write khi hồ sơ thay đổi
+DUAL_WRITE_STATUSES = ("building", "shadow", "retired")
+
+_cache = {"loaded_at": 0.0, "active": None, "dual_write": []}
+_cache_lock = threading.Lock()
+
+
+def _load_versions():
+    """Đọc phiên bản active và các phiên bản cần dual-write (lỗi DB -> coi như chưa có phiên bản nào)."""
+    try:
+        from .models import EmbeddingVersion
+
+        versions = list(EmbeddingVersion.objects.filter(status__in=("active",) + DUAL_WRITE_STATUSES))
+    except Exception as e:
+        print(f"⚠️  Không đọc được EmbeddingVersion, dùng cấu hình mặc định: {e}")
+        versions = []
+    active = next((v for v in versions if v.status == "active"), None)
+    return active, [v for v in versions if v.status in DUAL_WRITE_STATUSES]
+
+
+def _get_cached():
+    with _cache_lock:
+        if time.time() - _cache["loaded_at"] > EMBEDDING_VERSION_CACHE_SECONDS:
+            _cache["active"], _cache["dual_write"] = _load_versions()
+            _cache["loaded_at"] = time.time()
+        return _cache["active"], _cache["dual_write"]
+
+
+def invalidate_cache():
+    with _cache_lock:
+        _cache["loaded_at"] = 0.0
+
+
+def get_active_version():
+    return _get_cached()[0]
+
+
+def current_embedding_model():
+    """(model, số chiều) dùng cho truy vấn và hồ sơ mới - theo phiên bản active nếu có."""
+    active = get_active_version()
+    if active is None:
+        return EMBEDDING_MODEL_NAME, EMBEDDING_DIMENSION
+    return active.model_name, active.dimension
+
+
+def active_collection_name():
+    """Collection của phiên bản active (None nếu chưa đăng ký phiên bản nào)."""
+    active = get_active_version()
+    return active.collection_name if active is not None else None
+
+
+def _embed_document(text, version, api_keys=None):
+    from .embedding import get_embedding
+
+    return get_embedding(text, task_type="RETRIEVAL_DOCUMENT", model=version.model_name,
+                         output_dimensionality=version.dimension, api_keys=api_keys)
+
+
+def dual_write_targets():
+    """Các phiên bản (ngoài active) cần nhận thêm hồ sơ mới/xóa."""
+    return _get_cached()[1]
+
+
+def dual_write_profile(profile, text, active_embedding=None, targets=None):
+    """
+    Ghi hồ sơ vào các phiên bản đang build/shadow/retired.
+    Phiên bản cùng model + số chiều với phiên bản active dùng lại embedding đã có.
+    """
+    from .qdrant_helper import get_qdrant_client
+    from .indexing import build_profile_point
+
+    active = get_active_version()
+    for version in targets if targets is not None else dual_write_targets():
+        try:
+            same_model = active is not None and (version.model_name, version.dimension) == \
+                (active.model_name, active.dimension)
+            embedding = active_embedding if same_model and active_embedding else _embed_document(text, version)
+            if not embedding:
+                print(f"Không tạo được embedding cho profile {profile.id} (phiên bản {version.name}).")
+                continue
+            get_qdrant_client().upsert(collection_name=version.collection_name,
+                                       points=[build_profile_point(profile, embedding)])
+        except Exception as e:
+            print(f"Lỗi dual-write profile {profile.id} vào phiên bản {version.name}: {e}")
+
+
+def dual_delete_profile(profile_id):
+    from qdrant_client.http import models as qdrant_models
+    from .qdrant_helper import get_qdrant_client
+
+    for version in dual_write_targets():
+        try:
+            get_qdrant_client().delete(collection_name=version.collection_name,
+                                       points_selector=qdrant_models.PointIdsList(points=[int(profile_id)]))
+        except Exception as e:
+            print(f"Lỗi xóa profile {profile_id} khỏi phiên bản {version.name}: {e}")
+
+
+# ------------------------------------------------------------------ Quản lý phiên bản
+def register_current_version(name="v1"):
+    """Đăng ký collection/model hiện tại làm phiên bản active (khi bắt đầu dùng versioning)."""
+    from django.utils import timezone
+    from .models import EmbeddingVersion
+    from .qdrant_helper import get_qdrant_client, resolve_alias
+
+    existing = EmbeddingVersion.objects.filter(status="active").first()
+    if existing:
+        print(f"Đã có phiên bản active: {existing}")
+        return existing
+    collection_name, _ = resolve_alias(get_qdrant_client(), QDRANT_COLLECTION_NAME)
+    version = EmbeddingVersion.objects.create(
+        name=name, model_name=EMBEDDING_MODEL_NAME, dimension=EMBEDDING_DIMENSION,
+        collection_name=collection_name, status="active", activated_at=timezone.now(),
+    )
+    invalidate_cache()
+    print(f"✅ Đã đăng ký phiên bản active: {version}")
+    return version
+
+
+def create_version(name, model_name, dimension=None):
+    """Tạo phiên bản mới với collection riêng '<QDRANT_COLLECTION_NAME>__<name>' (trạng thái building)."""
+    from .models import EmbeddingVersion
+    from .qdrant_helper import get_qdrant_client, create_profile_collection
+    from .embedding import get_embedding
+
+    if not EmbeddingVersion.objects.filter(status="active").exists():
+        register_current_version()
+
+    # Số chiều thật của model (một lần gọi API) để tạo collection đúng kích thước
+    probe = get_embedding("kiểm tra số chiều", task_type="RETRIEVAL_DOCUMENT", model=model_name,
+                          output_dimensionality=dimension)
+    if not probe:
+        print(f"Không gọi được model {model_name}, hủy tạo phiên bản.")
+        return None
+
+    collection_name = f"{QDRANT_COLLECTION_NAME}__{name}"
+    create_profile_collection(get_qdrant_client(), collection_name, dimension=len(probe))
+    version = EmbeddingVersion.objects.create(
+        name=name, model_name=model_name, dimension=dimension, collection_name=collection_name, status="building",
+    )
+    invalidate_cache()
+    print(f"✅ Đã tạo phiên bản {version} - collection '{collection_name}' ({len(probe)} chiều). "
+          f"Hồ sơ mới sẽ được dual-write; chạy 'build' để embed lại hồ sơ cũ.")
+    return version
+
+
+def build_version(name, batch_size=64, workers=EMBEDDING_BUILD_WORKERS):
+    """
+    Embed lại toàn bộ hồ sơ cho phiên bản `name` theo thứ tự ID, lưu checkpoint sau mỗi batch.
+    Mỗi worker dùng một API key riêng (xoay vòng) để không tranh quota với request của người dùng.
+    """
+    from .models import EmbeddingVersion
+    from profiles.models import Profile
+    from .qdrant_helper import get_qdrant_client
+    from .indexing import build_profile_point, profile_embedding_text
+
+    version = EmbeddingVersion.objects.get(name=name)
+    if version.status not in ("building", "shadow"):
+        print(f"Phiên bản {version} không ở trạng thái building/shadow.")
+        return version
+
+    client = get_qdrant_client()
+    keys = GEMINI_API_KEYS or [None]
+    total = Profile.objects.filter(id__gt=version.last_indexed_profile_id).count()
+    print(f"Đang build phiên bản {version.name}: còn {total} hồ sơ (từ ID {version.last_indexed_profile_id}).")
+    started = time.time()
+    done = 0
+
+    def embed(args):
+        position, profile = args
+        key = keys[position % len(keys)]
+        return profile, _embed_document(profile_embedding_text(profile), version,
+                                        api_keys=[key] if key else None)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while True:
+            profiles = list(
+                Profile.objects.filter(id__gt=version.last_indexed_profile_id).order_by("id")[:batch_size]
+            )
+            if not profiles:
+                break
+            results = list(executor.map(embed, enumerate(profiles)))
+            points = [build_profile_point(p, emb) for p, emb in results if emb]
+            if points:
+                client.upsert(collection_name=version.collection_name, points=points)
+            failed = len(profiles) - len(points)
+            if failed:
+                print(f"⚠️  {failed} hồ sơ không tạo được embedding (sẽ được reconcile bổ sung sau).")
+            version.last_indexed_profile_id = profiles[-1].id
+            version.indexed_count += len(points)
+            version.save(update_fields=["last_indexed_profile_id", "indexed_count", "updated_at"])
+            done += len(profiles)
+            elapsed = time.time() - started
+            print(f"Đã build {done}/{total} hồ sơ ({done / max(elapsed, 1e-9):.1f} hồ sơ/s)...")
+
+    if version.status == "building":
+        version.status = "shadow"
+        version.save(update_fields=["status", "updated_at"])
+        invalidate_cache()
+    print(f"✅ Build xong phiên bản {version.name}: {version.indexed_count} hồ sơ trong {time.time() - started:.1f}s. "
+          f"Chạy 'shadow' để so sánh trước khi activate.")
+    return version
+
+
+def _search_ids(client, version, query_text, k):
+    """Embed truy vấn bằng model của phiên bản và tìm top-k trên collection của nó. Trả về (ids, ms)."""
+    from .embedding import get_embedding
+    from .qdrant_helper import search_params
+
+    started = time.perf_counter()
+    embedding = get_embedding(query_text, task_type="RETRIEVAL_QUERY", model=version.model_name,
+                              output_dimensionality=version.dimension)
+    if not embedding:
+        return None, None
+    hits = client.search(collection_name=version.collection_name, query_vector=embedding, limit=k,
+                         search_params=search_params(), with_payload=False)
+    return [int(h.id) for h in hits], (time.perf_counter() - started) * 1000
+
+
+def shadow_compare(name, sample=100, k=10, queries_file=None):
+    """
+    Chạy cùng một tập truy vấn trên phiên bản active và phiên bản `name`:
+      - recall@k (known-item): truy vấn = tiêu đề hồ sơ, kiểm tra hồ sơ gốc có nằm trong top-k không
+      - overlap@k giữa hai phiên bản (với truy vấn thật từ --queries-file)
+      - độ trễ p50/p95 (embed + search)
+    Kết quả lưu vào EmbeddingVersion.metrics["shadow"].
+    """
+    from .models import EmbeddingVersion
+    from profiles.models import Profile
+    from .qdrant_helper import get_qdrant_client
+
+    candidate = EmbeddingVersion.objects.get(name=name)
+    active = EmbeddingVersion.objects.filter(status="active").first()
+    if active is None or active.pk == candidate.pk:
+        print("Cần một phiên bản active khác với phiên bản cần so sánh.")
+        return None
+    client = get_qdrant_client()
+
+    profile_ids = list(Profile.objects.exclude(title="").values_list("id", flat=True))
+    sampled = Profile.objects.filter(id__in=random.sample(profile_ids, min(sample, len(profile_ids))))
+    known_items = [(p.title, int(p.id)) for p in sampled]
+    free_queries = []
+    if queries_file:
+        with open(queries_file, "r", encoding="utf-8") as f:
+            free_queries = [line.strip() for line in f if line.strip()]
+
+    stats = {v.name: {"hits": 0, "total": 0, "latency": []} for v in (active, candidate)}
+    overlaps = []
+    for query_text, expected_id in known_items + [(q, None) for q in free_queries]:
+        results = {}
+        for version in (active, candidate):
+            ids, ms = _search_ids(client, version, query_text, k)
+            if ids is None:
+                continue
+            results[version.name] = ids
+            stats[version.name]["latency"].append(ms)
+            if expected_id is not None:
+                stats[version.name]["total"] += 1
+                stats[version.name]["hits"] += int(expected_id in ids)
+        if len(results) == 2:
+            a, b = results[active.name], results[candidate.name]
+            overlaps.append(len(set(a) & set(b)) / max(len(a), 1))
+
+    report = {"k": k, "queries": len(known_items) + len(free_queries), "compared_with": active.name,
+              "overlap_at_k": float(np.mean(overlaps)) if overlaps else None}
+    for version_name, s in stats.items():
+        latency = np.array(s["latency"]) if s["latency"] else np.array([np.nan])
+        report[version_name] = {
+            "recall_at_k": s["hits"] / s["total"] if s["total"] else None,
+            "latency_p50_ms": float(np.nanpercentile(latency, 50)),
+            "latency_p95_ms": float(np.nanpercentile(latency, 95)),
+        }
+        print(f"  {version_name}: recall@{k}={report[version_name]['recall_at_k']}, "
+              f"p50={report[version_name]['latency_p50_ms']:.0f} ms, p95={report[version_name]['latency_p95_ms']:.0f} ms")
+    print(f"  Overlap@{k} giữa hai phiên bản: {report['overlap_at_k']}")
+
+    candidate.metrics = {**(candidate.metrics or {}), "shadow": report}
+    candidate.save(update_fields=["metrics", "updated_at"])
+    return report
+
+
+def activate_version(name, force=False):
+    """
+    Chuyển phiên bản `name` thành active: cập nhật DB trong một transaction.
+    Tìm kiếm lấy collection từ bản ghi active (active_collection_name), nên không cần đổi tên collection nào;
+    alias QDRANT_COLLECTION_NAME chỉ được chuyển khi nó đã là alias (không bao giờ xóa collection thật).
+    Phiên bản active cũ -> retired (giữ collection + dual-write để rollback).
+    """
+    from django.db import transaction
+    from django.utils import timezone
+    from .models import EmbeddingVersion
+    from .qdrant_helper import get_qdrant_client, resolve_alias, switch_alias
+
+    with transaction.atomic():
+        version = EmbeddingVersion.objects.select_for_update().get(name=name)
+        if version.status == "active":
+            print(f"Phiên bản {version.name} đã active.")
+            return version
+        if version.status == "deleted" or (version.status == "building" and not force):
+            print(f"Không thể activate phiên bản {version} (dùng --force nếu chắc chắn).")
+            return None
+        EmbeddingVersion.objects.filter(status="active").update(status="retired", updated_at=timezone.now())
+        version.status = "active"
+        version.activated_at = timezone.now()
+        version.save(update_fields=["status", "activated_at", "updated_at"])
+
+    client = get_qdrant_client()
+    if resolve_alias(client, QDRANT_COLLECTION_NAME)[1]:
+        switch_alias(client, QDRANT_COLLECTION_NAME, version.collection_name)
+    invalidate_cache()
+    print(f"✅ Phiên bản {version.name} đã active. Các tiến trình khác chuyển sau tối đa "
+          f"{EMBEDDING_VERSION_CACHE_SECONDS}s. Nếu dùng chỉ mục cục bộ, hãy build lại: "
+          f"python -m vector_search.local_index build --source qdrant")
+    return version
+
+
+def cleanup_versions(keep=1):
+    """Xóa collection của các phiên bản retired, giữ lại `keep` phiên bản gần nhất để rollback."""
+    from .models import EmbeddingVersion
+    from .qdrant_helper import get_qdrant_client
+
+    client = get_qdrant_client()
+    retired = list(EmbeddingVersion.objects.filter(status="retired").order_by("-updated_at"))
+    for version in retired[keep:]:
+        try:
+            if client.collection_exists(version.collection_name):
+                client.delete_collection(version.collection_name)
+            version.status = "deleted"
+            version.save(update_fields=["status", "updated_at"])
+            print(f"Đã xóa collection '{version.collection_name}' của phiên bản {version.name}.")
+        except Exception as e:
+            print(f"Lỗi khi xóa phiên bản {version.name}: {e}")
+    invalidate_cache()
+
+
+def list_versions():
+    from .models import EmbeddingVersion
+
+    for version in EmbeddingVersion.objects.order_by("id"):
+        print(f"{version.name:<12} {version.status:<9} {version.model_name} dim={version.dimension or 'mặc định'} "
+              f"collection={version.collection_name} indexed={version.indexed_count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quản lý phiên bản embedding (blue/green)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    register = sub.add_parser("register", help="Đăng ký collection hiện tại làm phiên bản active")
+    register.add_argument("--name", default="v1")
+    create = sub.add_parser("create", help="Tạo phiên bản mới (bắt đầu dual-write)")
+    create.add_argument("--name", required=True)
+    create.add_argument("--model", required=True)
+    create.add_argument("--dimension", type=int)
+    build = sub.add_parser("build", help="Embed lại toàn bộ hồ sơ cho phiên bản mới")
+    build.add_argument("--name", required=True)
+    build.add_argument("--batch-size", type=int, default=64)
+    build.add_argument("--workers", type=int, default=EMBEDDING_BUILD_WORKERS)
+    shadow = sub.add_parser("shadow", help="So sánh recall/độ trễ với phiên bản active")
+    shadow.add_argument("--name", required=True)
+    shadow.add_argument("--sample", type=int, default=100)
+    shadow.add_argument("--k", type=int, default=10)
+    shadow.add_argument("--queries-file")
+    activate = sub.add_parser("activate", help="Chuyển phiên bản thành active (hoặc rollback)")
+    activate.add_argument("--name", required=True)
+    activate.add_argument("--force", action="store_true")
+    cleanup = sub.add_parser("cleanup", help="Xóa collection của các phiên bản cũ")
+    cleanup.add_argument("--keep", type=int, default=1)
+
+    args = parser.parse_args()
+    if args.command == "list":
+        list_versions()
+    elif args.command == "register":
+        register_current_version(args.name)
+    elif args.command == "create":
+        create_version(args.name, args.model, args.dimension)
+    elif args.command == "build":
+        build_version(args.name, batch_size=args.batch_size, workers=args.workers)
+    elif args.command == "shadow":
+        shadow_compare(args.name, sample=args.sample, k=args.k, queries_file=args.queries_file)
+    elif args.command == "activate":
+        activate_version(args.name, force=args.force)
+    else:
+        cleanup_versions(keep=args.keep)
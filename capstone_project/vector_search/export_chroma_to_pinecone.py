@@ -4,6 +4,9 @@ Không thay đổi dữ liệu/logic hiện hữu; chỉ đọc và ghi ra file
 
 Output: ./exports/chroma_pinecone_export.jsonl
   - Mỗi dòng: {"id": "...", "values": [...], "metadata": {...}, "document": "..."}
+
+Để backup / warm start nên dùng snapshot nhị phân (nhỏ hơn ~10 lần, mở bằng mmap):
+    python -m vector_search.snapshot export --source chroma --output exports/snapshot
 """
 
 import json
@@ -0,0 +1,182 @@
+"""
+Embedding dự phòng chạy hoàn toàn trên CPU, dùng khi Gemini không khả dụng (hết quota, lỗi mạng).
+
+Mỗi văn bản (đã bỏ dấu) được tách thành n-gram ký tự (3, 4, 5) và từ đơn; mỗi đặc trưng được băm (crc32)
+vào FALLBACK_PROJECTIONS vị trí có dấu +/- trong vector FALLBACK_ENCODER_DIMENSION chiều (phép chiếu
+ngẫu nhiên thưa cố định, không cần huấn luyện, giống nhau giữa các tiến trình), trọng số 1 + log(tf),
+rồi chuẩn hóa L2. Chất lượng kém embedding Gemini nhưng vẫn bắt được tên riêng, địa danh, năm
+và các cụm từ giống nhau, đủ để tìm kiếm không bị gián đoạn.
+
+Vector dự phòng nằm trong một chỉ mục riêng (LocalVectorIndex tại FALLBACK_INDEX_PATH), được ghi cho
+MỌI hồ sơ khi tạo (kể cả khi Gemini lỗi), nên luôn dùng được:
+  - tìm kiếm: get_embedding trả về None -> vector search trên chỉ mục dự phòng thay vì chỉ dùng từ khóa
+  - tạo hồ sơ: không embed được bằng Gemini -> hồ sơ vẫn tìm thấy qua chỉ mục dự phòng;
+    vector Gemini được bổ sung sau bằng `python -m vector_search.reconcile --targets qdrant`
+
+Xây chỉ mục cho các hồ sơ hiện có:
+    python -m vector_search.fallback_encoder build
+"""
+import argparse
+import math
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from .config import FALLBACK_INDEX_PATH, FALLBACK_ENCODER_DIMENSION, LOCAL_INDEX_TOP_K
+from .local_index import LocalVectorIndex
+from .text_utils import fold_diacritics
+
+NGRAM_SIZES = (3, 4, 5)
+FALLBACK_PROJECTIONS = 2
+WORD_WEIGHT = 2.0
+# Chỉ encode phần đầu văn bản dài (giống get_embedding cắt 8000 ký tự)
+MAX_TEXT_CHARS = 4000
+
+_SPACE_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def _features(text):
+    """Đặc trưng {chuỗi: trọng số} của một văn bản: n-gram ký tự + từ đơn (đã bỏ dấu)."""
+    words = _SPACE_RE.sub(" ", fold_diacritics(text[:MAX_TEXT_CHARS])).split()
+    if not words:
+        return {}
+    padded = " " + " ".join(words) + " "
+    counts = Counter()
+    for n in NGRAM_SIZES:
+        counts.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    features = {gram: 1.0 + math.log(tf) for gram, tf in counts.items()}
+    for word, tf in Counter(words).items():
+        features["w:" + word] = WORD_WEIGHT * (1.0 + math.log(tf))
+    return features
+
+
+def encode(text, dimension=FALLBACK_ENCODER_DIMENSION):
+    """Vector float32 đã chuẩn hóa L2 (None nếu văn bản rỗng)."""
+    if not isinstance(text, str) or not text.strip():
+        return None
+    features = _features(text)
+    if not features:
+        return None
+    positions, values = [], []
+    for feature, weight in features.items():
+        data = feature.encode("utf-8")
+        seed = 0
+        for _ in range(FALLBACK_PROJECTIONS):
+            seed = zlib.crc32(data, seed)
+            positions.append(seed % dimension)
+            values.append(weight if seed & 0x80000000 else -weight)
+    vector = np.zeros(dimension, dtype=np.float32)
+    np.add.at(vector, positions, values)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
+
+
+_fallback_index = None
+_fallback_index_lock = threading.Lock()
+
+
+def get_fallback_index(path=FALLBACK_INDEX_PATH):
+    """Chỉ mục dự phòng (singleton theo tiến trình); chưa có trên đĩa thì trả về chỉ mục rỗng."""
+    global _fallback_index
+    with _fallback_index_lock:
+        if _fallback_index is None:
+            index = LocalVectorIndex(path)
+            if index.exists():
+                index.load()
+            _fallback_index = index
+        else:
+            try:
+                _fallback_index.reload_if_changed()
+            except Exception as e:
+                print(f"⚠️  Không thể nạp lại chỉ mục dự phòng: {e}")
+    return _fallback_index
+
+
+def index_profile_fallback(profile_id, text):
+    """Encode và ghi vector dự phòng của một hồ sơ. Trả về True nếu thành công."""
+    try:
+        vector = encode(text)
+        if vector is None:
+            return False
+        index = get_fallback_index()
+        with index.exclusive():
+            index.add([int(profile_id)], [vector])
+            index.save()
+        print(f"Profile {profile_id} đã được thêm vào chỉ mục dự phòng.")
+        return True
+    except Exception as e:
+        print(f"Lỗi khi thêm profile {profile_id} vào chỉ mục dự phòng: {e}")
+        return False
+
+
+def delete_profile_fallback(profile_id):
+    try:
+        index = get_fallback_index()
+        if index.count() == 0:
+            return False
+        with index.exclusive():
+            index.delete([int(profile_id)])
+            index.save()
+        return True
+    except Exception as e:
+        print(f"Lỗi khi xóa profile {profile_id} khỏi chỉ mục dự phòng: {e}")
+        return False
+
+
+def search_fallback(query_text, limit=LOCAL_INDEX_TOP_K):
+    """Vector search trên chỉ mục dự phòng: list (ID hồ sơ, score) hoặc None nếu chỉ mục rỗng."""
+    query_vector = encode(query_text)
+    index = get_fallback_index()
+    if query_vector is None or index.count() == 0:
+        return None
+    return index.search(query_vector, limit=limit)
+
+
+def build_fallback_index(path=FALLBACK_INDEX_PATH, batch_size=2000):
+    """Encode toàn bộ hồ sơ trong database và ghi thành chỉ mục dự phòng."""
+    from profiles.models import Profile
+    from .indexing import profile_embedding_text
+
+    started = time.perf_counter()
+    ids, vectors = [], []
+    for profile in Profile.objects.order_by("id").iterator(chunk_size=batch_size):
+        vector = encode(profile_embedding_text(profile))
+        if vector is None:
+            continue
+        ids.append(profile.id)
+        vectors.append(vector)
+        if len(ids) % batch_size == 0:
+            print(f"Đã encode {len(ids)} hồ sơ...")
+
+    global _fallback_index
+    index = LocalVectorIndex(path)
+    index.write_base(ids, np.asarray(vectors, dtype=np.float32).reshape(len(ids), FALLBACK_ENCODER_DIMENSION))
+    with _fallback_index_lock:
+        _fallback_index = None
+    print(f"✅ Đã xây chỉ mục dự phòng với {index.count()} vector trong {time.perf_counter() - started:.1f}s.")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chỉ mục embedding dự phòng (n-gram ký tự băm)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Encode toàn bộ hồ sơ và ghi chỉ mục dự phòng")
+    build.add_argument("--path", default=FALLBACK_INDEX_PATH)
+    build.add_argument("--batch-size", type=int, default=2000)
+    query = sub.add_parser("search", help="Thử tìm kiếm trên chỉ mục dự phòng")
+    query.add_argument("text")
+    query.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_fallback_index(args.path, batch_size=args.batch_size)
+    else:
+        started = time.perf_counter()
+        results = search_fallback(args.text, limit=args.limit) or []
+        for profile_id, score in results:
+            print(f"{profile_id}\t{score:.4f}")
+        print(f"{len(results)} kết quả trong {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -1,190 +1,284 @@
 """
-Script để import dữ liệu từ file JSONL vào Qdrant.
-Chạy: python vector_search/import_to_qdrant.py
+Script để import dữ liệu từ file JSONL vào Qdrant (streaming, song song, có thể tiếp tục khi bị ngắt).
+
+- Đọc file một lần duy nhất: dòng đầu tiên xác định dimension rồi tạo collection, các dòng sau
+  được gom batch theo dung lượng (bytes) và upsert song song bằng nhiều worker (gRPC nếu bật).
+- Không xóa collection đang phục vụ: dữ liệu được ghi vào collection mới '<tên>_<thời gian>',
+  xong mới chuyển alias '<tên>' sang collection mới (không downtime).
+- Checkpoint lưu vị trí byte đã import xong liên tục; chạy lại với --resume để tiếp tục.
+
+Chạy:
+    python -m vector_search.import_to_qdrant [--workers 4] [--grpc] [--batch-bytes 4000000]
+    python -m vector_search.import_to_qdrant --resume          # tiếp tục lần import bị ngắt
+    python -m vector_search.import_to_qdrant --drop-old        # xóa collection cũ sau khi chuyển alias
 """
+import argparse
 import json
 import os
-import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from dotenv import load_dotenv
-
-# Load .env file
-BASE_DIR = Path(__file__).resolve().parent.parent
-ENV_PATH = BASE_DIR / ".env"
-if ENV_PATH.exists():
-    load_dotenv(dotenv_path=ENV_PATH)
-    print(f"Đã load file .env từ: {ENV_PATH}")
-else:
-    print(f"Không tìm thấy file .env tại: {ENV_PATH}")
-    print("Sử dụng biến môi trường hệ thống hoặc giá trị mặc định")
-
-# Import trực tiếp từ package qdrant_client (không phải file local)
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-
-# Cấu hình
-JSONL_PATH = BASE_DIR / "exports" / "chroma_pinecone_export.jsonl"
-COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "missing_people_profiles")
-
-# Qdrant connection - ưu tiên Cloud, sau đó mới dùng Local
-QDRANT_URL = os.getenv("QDRANT_URL")  # Cloud: https://xxxxx.qdrant.io
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")  # Cloud API key
-QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
-QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
-
-# Debug: Hiển thị cấu hình
-print(f"\n=== Cấu hình Qdrant ===")
-if QDRANT_URL:
-    print(f"Mode: Cloud")
-    print(f"URL: {QDRANT_URL}")
-    print(f"API Key: {'*' * 10 if QDRANT_API_KEY else 'CHƯA CẤU HÌNH'}")
-else:
-    print(f"Mode: Local")
-    print(f"Host: {QDRANT_HOST}:{QDRANT_PORT}")
-print(f"Collection: {COLLECTION_NAME}")
-print("=" * 30 + "\n")
-
-def get_qdrant_client():
-    """Tạo Qdrant client"""
-    if QDRANT_URL:
-        # Cloud Qdrant
-        return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-    else:
-        # Local Qdrant
-        return QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-
-def import_jsonl_to_qdrant():
-    """Import dữ liệu từ JSONL vào Qdrant"""
-    print(f"Đang đọc file: {JSONL_PATH}")
-    
-    if not JSONL_PATH.exists():
-        print(f"Lỗi: Không tìm thấy file {JSONL_PATH}")
-        return
-    
-    # Kết nối Qdrant
-    print("Đang kết nối Qdrant...")
-    client = get_qdrant_client()
-    
-    # Đọc file và xác định dimension
-    print("Đang đọc file để xác định dimension...")
-    first_line = True
-    dimension = None
-    
-    with open(JSONL_PATH, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                data = json.loads(line)
-                dimension = len(data['values'])
-                break
-    
-    if dimension is None:
-        print("Lỗi: Không thể xác định dimension từ file")
-        return
-    
-    print(f"Dimension: {dimension}")
-    
-    # Tạo collection nếu chưa có
+
+from django.conf import settings
+from qdrant_client.models import PointStruct
+
+from .config import (
+    QDRANT_COLLECTION_NAME,
+    QDRANT_PREFER_GRPC,
+    USE_QDRANT_HYBRID,
+    SPARSE_VECTOR_NAME,
+)
+from .qdrant_helper import create_qdrant_client, create_profile_collection, switch_alias
+from .indexing import build_sparse_vector
+from .query_filters import parse_year, BORN_YEAR_FIELD, LOSING_YEAR_FIELD
+
+JSONL_PATH = Path(settings.BASE_DIR) / "exports" / "chroma_pinecone_export.jsonl"
+CHECKPOINT_PATH = Path(settings.BASE_DIR) / "exports" / "import_to_qdrant.checkpoint.json"
+IMPORT_WORKERS = int(os.getenv("QDRANT_IMPORT_WORKERS", "4"))
+IMPORT_BATCH_BYTES = int(os.getenv("QDRANT_IMPORT_BATCH_BYTES", str(4 * 1024 * 1024)))  # ~4MB JSON mỗi request
+IMPORT_MAX_BATCH_POINTS = int(os.getenv("QDRANT_IMPORT_MAX_BATCH_POINTS", "1000"))
+CHECKPOINT_INTERVAL = 5  # Giây giữa hai lần ghi checkpoint
+
+
+def _load_checkpoint(path):
     try:
-        collections = client.get_collections().collections
-        collection_exists = any(c.name == COLLECTION_NAME for c in collections)
-        
-        if collection_exists:
-            print(f"Collection '{COLLECTION_NAME}' đã tồn tại. Xóa và tạo lại...")
-            client.delete_collection(COLLECTION_NAME)
-        
-        print(f"Đang tạo collection '{COLLECTION_NAME}' với dimension {dimension}...")
-        client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(
-                size=dimension,
-                distance=Distance.COSINE
-            )
-        )
-        print(f"Đã tạo collection '{COLLECTION_NAME}' thành công!")
-    except Exception as e:
-        print(f"Lỗi khi tạo collection: {e}")
-        return
-    
-    # Import dữ liệu
-    print("Đang import dữ liệu...")
-    batch_size = 100
-    points = []
-    total_imported = 0
-    
-    with open(JSONL_PATH, 'r', encoding='utf-8') as f:
-        for line_num, line in enumerate(f, 1):
-            if not line.strip():
-                continue
-            
-            try:
-                data = json.loads(line)
-                
-                # Convert ID sang integer (Qdrant yêu cầu integer hoặc UUID, không chấp nhận string số)
-                point_id = data['id']
-                try:
-                    # Thử convert sang integer
-                    point_id = int(point_id)
-                except (ValueError, TypeError):
-                    # Nếu không convert được, giữ nguyên (có thể là UUID)
-                    pass
-                
-                # Tạo point
-                point = PointStruct(
-                    id=point_id,
-                    vector=data['values'],
-                    payload=data.get('metadata', {})
-                )
-                points.append(point)
-                
-                # Upsert theo batch
-                if len(points) >= batch_size:
-                    try:
-                        client.upsert(
-                            collection_name=COLLECTION_NAME,
-                            points=points
-                        )
-                        total_imported += len(points)
-                        print(f"Đã import {total_imported} records...")
-                        points = []
-                    except Exception as e:
-                        print(f"\n❌ LỖI KHI UPSERT BATCH (dòng {line_num - batch_size + 1} đến {line_num}):")
-                        print(f"Chi tiết: {e}")
-                        print(f"\nDừng import ngay lập tức!")
-                        raise  # Dừng ngay lập tức
-            
-            except json.JSONDecodeError as e:
-                print(f"\n❌ LỖI PARSE JSON ở dòng {line_num}: {e}")
-                print(f"Dừng import ngay lập tức!")
-                raise  # Dừng ngay lập tức
-            except Exception as e:
-                print(f"\n❌ LỖI ở dòng {line_num}: {e}")
-                print(f"Dừng import ngay lập tức!")
-                raise  # Dừng ngay lập tức
-        
-        # Upsert phần còn lại
-        if points:
-            try:
-                client.upsert(
-                    collection_name=COLLECTION_NAME,
-                    points=points
-                )
-                total_imported += len(points)
-            except Exception as e:
-                print(f"\n❌ LỖI KHI UPSERT BATCH CUỐI CÙNG:")
-                print(f"Chi tiết: {e}")
-                print(f"\nDừng import ngay lập tức!")
-                raise  # Dừng ngay lập tức
-    
-    print(f"\n✅ Hoàn thành! Đã import {total_imported} records vào Qdrant.")
-    
-    # Kiểm tra số lượng (bỏ qua lỗi nếu có do version mismatch)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _save_checkpoint(path, state):
+    # Ghi file tạm rồi đổi tên để không bao giờ để lại checkpoint dở dang
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def record_to_point(data):
+    """Chuyển một bản ghi export {"id","values","metadata","document"} thành PointStruct."""
+    # Convert ID sang integer (Qdrant yêu cầu integer hoặc UUID, không chấp nhận string số)
+    point_id = data["id"]
+    try:
+        point_id = int(point_id)
+    except (ValueError, TypeError):
+        pass  # Có thể là UUID
+
+    payload = dict(data.get("metadata") or {})
+    payload.setdefault("id", str(data["id"]))
+    born_year = parse_year(payload.get("Năm sinh"))
+    if born_year:
+        payload[BORN_YEAR_FIELD] = born_year
+    losing_year = parse_year(payload.get("Năm thất lạc"))
+    if losing_year:
+        payload[LOSING_YEAR_FIELD] = losing_year
+
+    vector = data["values"]
+    if USE_QDRANT_HYBRID:
+        text = data.get("document") or " ".join(str(v) for v in payload.values())
+        vector = {"": vector, SPARSE_VECTOR_NAME: build_sparse_vector(text)}
+    return PointStruct(id=point_id, vector=vector, payload=payload)
+
+
+def _iter_batches(f, start_offset, batch_bytes, max_points):
+    """
+    Đọc file (mở ở chế độ binary) từ start_offset, gom batch theo dung lượng.
+    Trả về từng (points, vị trí byte kết thúc batch).
+    """
+    f.seek(start_offset)
+    offset = start_offset
+    points, size = [], 0
+    line_num = 0
+    for raw in f:
+        line_num += 1
+        offset += len(raw)
+        if not raw.strip():
+            continue
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError as e:
+            print(f"\n❌ LỖI PARSE JSON ở byte {offset - len(raw)} (dòng thứ {line_num} kể từ vị trí bắt đầu): {e}")
+            raise
+        points.append(record_to_point(data))
+        size += len(raw)
+        if size >= batch_bytes or len(points) >= max_points:
+            yield points, offset
+            points, size = [], 0
+    if points:
+        yield points, offset
+
+
+class _Progress:
+    """Theo dõi các batch hoàn thành (có thể không theo thứ tự) để tính vị trí checkpoint liên tục."""
+
+    def __init__(self, offset, imported):
+        self.lock = threading.Lock()
+        self.committed_offset = offset
+        self.imported = imported
+        self.bytes = 0
+        self.pending = {}  # seq -> (end_offset, số point, bytes)
+        self.next_seq = 0
+
+    def done(self, seq, end_offset, count, size):
+        with self.lock:
+            self.pending[seq] = (end_offset, count, size)
+            while self.next_seq in self.pending:
+                end, n, b = self.pending.pop(self.next_seq)
+                self.committed_offset = end
+                self.imported += n
+                self.bytes += b
+                self.next_seq += 1
+
+
+def import_jsonl_to_qdrant(
+    jsonl_path=JSONL_PATH,
+    alias_name=QDRANT_COLLECTION_NAME,
+    workers=IMPORT_WORKERS,
+    batch_bytes=IMPORT_BATCH_BYTES,
+    max_batch_points=IMPORT_MAX_BATCH_POINTS,
+    prefer_grpc=QDRANT_PREFER_GRPC,
+    resume=False,
+    drop_old=False,
+    checkpoint_path=CHECKPOINT_PATH,
+):
+    """Import dữ liệu từ JSONL vào collection mới rồi chuyển alias. Trả về số record đã import."""
+    jsonl_path = Path(jsonl_path)
+    print(f"Đang đọc file: {jsonl_path}")
+    if not jsonl_path.exists():
+        print(f"Lỗi: Không tìm thấy file {jsonl_path}")
+        return 0
+
+    print("Đang kết nối Qdrant...")
+    client = create_qdrant_client(prefer_grpc=prefer_grpc, timeout=120)
+
+    checkpoint = _load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint and checkpoint.get("source") != str(jsonl_path.resolve()):
+        print("⚠️  Checkpoint thuộc file khác, bắt đầu lại từ đầu.")
+        checkpoint = None
+    if checkpoint and not client.collection_exists(checkpoint["collection"]):
+        print(f"⚠️  Collection '{checkpoint['collection']}' trong checkpoint không còn, bắt đầu lại từ đầu.")
+        checkpoint = None
+
+    if checkpoint:
+        target_name = checkpoint["collection"]
+        start_offset = checkpoint["offset"]
+        print(f"Tiếp tục import vào '{target_name}' từ byte {start_offset} ({checkpoint['imported']} record đã có).")
+    else:
+        target_name = f"{alias_name}_{time.strftime('%Y%m%d%H%M%S')}"
+        start_offset = 0
+        checkpoint = {"source": str(jsonl_path.resolve()), "collection": target_name, "offset": 0, "imported": 0}
+
+    progress = _Progress(start_offset, checkpoint["imported"])
+    imported_at_start = progress.imported
+    state = {"collection_ready": client.collection_exists(target_name), "last_saved": time.time()}
+
+    def save():
+        checkpoint.update(offset=progress.committed_offset, imported=progress.imported)
+        _save_checkpoint(checkpoint_path, checkpoint)
+        state["last_saved"] = time.time()
+
+    def upload(seq, points, end_offset, size):
+        client.upsert(collection_name=target_name, points=points, wait=True)
+        progress.done(seq, end_offset, len(points), size)
+
+    started = time.time()
+    last_report = started
+    max_in_flight = max(1, workers) * 2  # Giới hạn số batch đang chờ để không đọc hết file vào RAM
+    seq = 0
+    batch_start = start_offset
+    in_flight = set()
+
+    with open(jsonl_path, "rb") as f, ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        try:
+            for points, end_offset in _iter_batches(f, start_offset, batch_bytes, max_batch_points):
+                if not state["collection_ready"]:
+                    vector = points[0].vector
+                    dimension = len(vector[""] if isinstance(vector, dict) else vector)
+                    print(f"Dimension: {dimension}. Đang tạo collection '{target_name}'...")
+                    create_profile_collection(client, target_name, dimension=dimension, with_sparse=USE_QDRANT_HYBRID)
+                    state["collection_ready"] = True
+
+                in_flight.add(executor.submit(upload, seq, points, end_offset, end_offset - batch_start))
+                seq += 1
+                batch_start = end_offset
+
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()  # Ném lỗi upsert ra ngoài ngay
+
+                now = time.time()
+                if now - state["last_saved"] >= CHECKPOINT_INTERVAL:
+                    save()
+                if now - last_report >= 10:
+                    elapsed = now - started
+                    print(f"Đã import {progress.imported} records - "
+                          f"{(progress.imported - imported_at_start) / elapsed:.0f} records/s...")
+                    last_report = now
+
+            for future in in_flight:
+                future.result()
+        except BaseException as e:
+            for future in in_flight:
+                future.cancel()
+            wait(in_flight)
+            save()
+            print(f"\n❌ Import bị dừng: {e}")
+            print(f"Đã lưu checkpoint tại byte {progress.committed_offset} ({progress.imported} records). "
+                  f"Chạy lại với --resume để tiếp tục.")
+            raise
+
+    if not state["collection_ready"]:
+        print("Lỗi: File rỗng, không có gì để import.")
+        return 0
+
+    save()
+    elapsed = max(time.time() - started, 1e-9)
+    imported_now = progress.imported - imported_at_start
+    print(f"\n✅ Hoàn thành! Đã import {progress.imported} records vào '{target_name}' trong {elapsed:.1f}s "
+          f"({imported_now / elapsed:.0f} records/s, {progress.bytes / elapsed / 1024 / 1024:.2f} MB/s, "
+          f"{workers} worker, {'gRPC' if prefer_grpc else 'HTTP'}).")
+
     try:
-        collection_info = client.get_collection(COLLECTION_NAME)
+        collection_info = client.get_collection(target_name)
         print(f"✅ Số lượng vectors trong collection: {collection_info.points_count}")
     except Exception as e:
         print(f"⚠️  Không thể kiểm tra số lượng vectors (có thể do version mismatch): {e}")
-        print(f"✅ Nhưng import đã hoàn thành với {total_imported} records!")
 
-if __name__ == "__main__":
-    import_jsonl_to_qdrant()
+    previous = switch_alias(client, alias_name, target_name)
+    if previous and previous != target_name:
+        if drop_old:
+            client.delete_collection(previous)
+            print(f"Đã xóa collection cũ '{previous}'.")
+        else:
+            print(f"Collection cũ '{previous}' vẫn được giữ lại (dùng --drop-old để xóa).")
+    try:
+        os.remove(checkpoint_path)
+    except FileNotFoundError:
+        pass
+    return progress.imported
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import JSONL export vào Qdrant (streaming, song song, resume)")
+    parser.add_argument("--input", default=str(JSONL_PATH))
+    parser.add_argument("--alias", default=QDRANT_COLLECTION_NAME, help="Tên alias mà ứng dụng dùng để truy vấn")
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS)
+    parser.add_argument("--batch-bytes", type=int, default=IMPORT_BATCH_BYTES)
+    parser.add_argument("--max-batch-points", type=int, default=IMPORT_MAX_BATCH_POINTS)
+    parser.add_argument("--grpc", action="store_true", default=QDRANT_PREFER_GRPC)
+    parser.add_argument("--resume", action="store_true", help="Tiếp tục từ checkpoint của lần import trước")
+    parser.add_argument("--drop-old", action="store_true", help="Xóa collection cũ sau khi chuyển alias")
+    args = parser.parse_args()
+    import_jsonl_to_qdrant(
+        jsonl_path=args.input,
+        alias_name=args.alias,
+        workers=args.workers,
+        batch_bytes=args.batch_bytes,
+        max_batch_points=args.max_batch_points,
+        prefer_grpc=args.grpc,
+        resume=args.resume,
+        drop_old=args.drop_old,
+    )
@@ -0,0 +1,123 @@
+"""
+Ghi/xóa vector hồ sơ trên Qdrant (dùng chung cho tạo hồ sơ, xóa hồ sơ và các script backfill).
+Mỗi point gồm:
+  - dense vector (Gemini embedding, vector mặc định không tên)
+  - sparse vector SPARSE_VECTOR_NAME (BM25, tiếng Việt bỏ dấu) khi bật USE_QDRANT_HYBRID
+"""
+import threading
+
+from qdrant_client.http import models as qdrant_models
+
+from .config import USE_QDRANT_HYBRID, SPARSE_VECTOR_NAME, DETAIL_COLUMN_NAME
+from .qdrant_helper import get_qdrant_client, get_qdrant_collection
+from .text_utils import document_sparse_vector, fold_diacritics
+from .query_filters import parse_year, BORN_YEAR_FIELD, LOSING_YEAR_FIELD, PARENT_NAMES_FIELD
+
+# Các field của Profile được đưa vào sparse vector (tìm kiếm theo từ khóa)
+LEXICAL_FIELDS = (
+    "title", "full_name", "name_of_father", "name_of_mother",
+    "siblings", "born_year", "losing_year", "description",
+)
+
+
+def build_profile_payload(profile):
+    """
+    Payload lưu kèm point trên Qdrant.
+    Các field *_int và parent_names được đánh payload index để lọc (xem query_filters.py);
+    field không có giá trị thì bỏ qua để điều kiện IsEmpty giữ lại hồ sơ.
+    """
+    payload = {
+        "Tiêu đề": profile.title or "",
+        "Họ và tên": profile.full_name or "",
+        "Năm sinh": str(getattr(profile, "born_year", "") or ""),
+        "Năm thất lạc": str(getattr(profile, "losing_year", "") or ""),
+        "id": str(profile.id) if profile.id is not None else "",
+    }
+    born_year = parse_year(getattr(profile, "born_year", None))
+    if born_year:
+        payload[BORN_YEAR_FIELD] = born_year
+    losing_year = parse_year(getattr(profile, "losing_year", None))
+    if losing_year:
+        payload[LOSING_YEAR_FIELD] = losing_year
+    parent_names = fold_diacritics(" ".join(
+        str(getattr(profile, field, "") or "") for field in ("name_of_father", "name_of_mother")
+    )).strip()
+    if parent_names:
+        payload[PARENT_NAMES_FIELD] = parent_names
+    return payload
+
+
+def profile_embedding_text(profile):
+    """Văn bản dùng để embed hồ sơ (giống lúc tạo hồ sơ)."""
+    return getattr(profile, DETAIL_COLUMN_NAME, None) or profile.description
+
+
+def build_lexical_text(profile):
+    """Ghép các field văn bản của hồ sơ thành một chuỗi để sinh sparse vector."""
+    return " ".join(str(getattr(profile, field, "") or "") for field in LEXICAL_FIELDS)
+
+
+def build_sparse_vector(text):
+    indices, values = document_sparse_vector(text)
+    return qdrant_models.SparseVector(indices=indices, values=values)
+
+
+def build_profile_point(profile, embedding):
+    """Tạo PointStruct cho hồ sơ (kèm sparse vector nếu bật hybrid)."""
+    if USE_QDRANT_HYBRID:
+        vector = {"": embedding, SPARSE_VECTOR_NAME: build_sparse_vector(build_lexical_text(profile))}
+    else:
+        vector = embedding
+    return qdrant_models.PointStruct(
+        id=int(profile.id),  # Qdrant yêu cầu integer ID
+        vector=vector,
+        payload=build_profile_payload(profile),
+    )
+
+
+def upsert_profile_vector(profile, embedding, text=None):
+    """
+    Upsert vector của một hồ sơ vào Qdrant. Trả về True nếu thành công.
+    Nếu đang có phiên bản embedding mới (build/shadow/retired), hồ sơ được ghi thêm vào đó ở luồng nền
+    (embed lại `text` bằng model của phiên bản đó).
+    """
+    qdrant_client = get_qdrant_client()
+    collection_name = get_qdrant_collection()
+    if not (qdrant_client and collection_name):
+        print(f"Qdrant client or collection unavailable. Cannot upsert profile {profile.id}.")
+        return False
+    qdrant_client.upsert(
+        collection_name=collection_name,
+        points=[build_profile_point(profile, embedding)],
+    )
+    print(f"Profile {profile.id} embedded and upserted into Qdrant.")
+
+    from .embedding_versions import dual_write_targets, dual_write_profile
+    targets = dual_write_targets()
+    if targets:
+        threading.Thread(
+            target=dual_write_profile,
+            args=(profile, text or profile_embedding_text(profile), embedding, targets),
+            daemon=True,
+        ).start()
+    return True
+
+
+def delete_profile_vector(profile_id):
+    """Xóa point của hồ sơ khỏi Qdrant. Trả về True nếu thành công."""
+    qdrant_client = get_qdrant_client()
+    collection_name = get_qdrant_collection()
+    if not (qdrant_client and collection_name):
+        print(f"Qdrant client hoặc collection không khả dụng. Không thể xóa profile {profile_id} khỏi Qdrant.")
+        return False
+    qdrant_client.delete(
+        collection_name=collection_name,
+        points_selector=qdrant_models.PointIdsList(
+            points=[int(profile_id)]  # Qdrant yêu cầu integer ID
+        ),
+    )
+    print(f"Đã xóa profile {profile_id} khỏi Qdrant.")
+
+    from .embedding_versions import dual_delete_profile
+    dual_delete_profile(profile_id)
+    return True
@@ -0,0 +1,312 @@
+"""
+Trích xuất từ khóa cho truy vấn tìm người thân, chạy ngay trong tiến trình (không gọi LLM, < 1 ms).
+
+Kết quả cùng dạng với extract_keywords_gemini (list chuỗi có dấu, dùng cho str.contains không phân biệt hoa thường):
+  - tên người (chuỗi âm tiết viết hoa bắt đầu bằng họ) + tên gọi: "Lê Thị Hạnh" -> "Lê Thị Hạnh", "Hạnh"
+  - tên gọi đơn sau danh xưng / trong danh sách: "ông Tiên", "anh chị em là Viết, Thơ" -> "Tiên", "Viết", "Thơ"
+  - năm (19xx, 20xx) và địa danh (tỉnh/thành, cụm viết hoa sau "xã, huyện, ga, nông trường...")
+  - từ khóa sự kiện / hoàn cảnh + từ liên quan theo bảng đồng nghĩa (chiến tranh -> chạy giặc, vượt biên, ...)
+
+Chế độ (KEYWORD_EXTRACTION_MODE):
+  - local: chỉ dùng bộ trích xuất cục bộ
+  - llm: chỉ dùng Gemini (lỗi / rỗng -> cục bộ)
+  - hybrid: chạy song song; chờ Gemini tối đa KEYWORD_LLM_TIMEOUT giây rồi gộp, quá hạn thì dùng kết quả cục bộ
+"""
+import re
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from .config import KEYWORD_EXTRACTION_MODE, KEYWORD_LLM_TIMEOUT
+from .text_utils import fold_diacritics
+
+# Từ không mang thông tin tìm kiếm (đã bỏ dấu)
+STOPWORDS = {
+    "va", "voi", "cua", "la", "thi", "ma", "nhung", "con", "cac", "nhieu", "mot", "hai", "ba", "nhu", "nay", "do",
+    "kia", "ay", "khi", "luc", "sau", "truoc", "tu", "den", "tai", "o", "vao", "ra", "len", "xuong", "ve", "di",
+    "da", "dang", "se", "van", "cung", "rat", "qua", "khong", "chua", "co", "duoc", "bi", "nen", "vi", "de",
+    "cho", "nam", "thang", "ngay", "khoang", "tam", "chung", "nguoi", "gia", "dinh", "tim", "kiem", "that",
+    "lac", "mat", "tich", "lien", "he", "tin", "tuc", "ten", "goi", "ro", "biet", "nghe", "thay", "gap",
+    "hien", "nay", "tro", "lai", "nua", "roi", "tung", "moi", "deu", "chi", "em", "anh", "bo", "me", "vo",
+    "chong", "trong", "ngoai", "tren", "duoi", "giua", "theo", "nhau", "minh", "ho", "no", "toi", "chung",
+    "sinh", "song", "que", "quan", "dia", "chi", "thong", "tin", "dac", "diem", "nhan", "dang", "ky", "uc",
+}
+# Cụm phổ biến không dùng làm từ khóa (đã bỏ dấu)
+STOP_PHRASES = {
+    "gia dinh", "tim kiem", "that lac", "mat tich", "mat lien lac", "khong ro", "que quan", "dia chi",
+    "nhu chua he co cuoc chia ly", "nam sinh", "dac diem nhan dang",
+}
+# Danh xưng đứng trước tên người (đã bỏ dấu)
+HONORIFICS = {
+    "ong", "ba", "cu", "co", "chu", "bac", "anh", "chi", "em", "me", "bo", "cha", "ma", "chau", "di", "duong",
+    "thim", "mo", "cau", "mu", "o", "ban", "con", "be", "vo", "chong",
+}
+# Họ phổ biến (đã bỏ dấu): chuỗi viết hoa bắt đầu bằng họ được coi là tên người
+SURNAMES = {
+    "nguyen", "tran", "le", "pham", "hoang", "huynh", "phan", "vu", "vo", "dang", "bui", "do", "ho", "ngo",
+    "duong", "ly", "dinh", "doan", "trinh", "mai", "luu", "cao", "ta", "ha", "lam", "truong", "chau", "quach",
+    "to", "thai", "kieu", "dao", "luong", "chu", "la", "tang", "phung", "vuong", "tieu", "trieu", "diep",
+    "khuc", "lai", "nghiem", "mac", "thach", "tong", "quan", "giang", "hua", "au", "lu", "ton",
+}
+# Tỉnh / thành (dạng chuẩn có dấu) và một số tên cũ hay gặp trong hồ sơ
+PROVINCES = [
+    "An Giang", "Bà Rịa", "Vũng Tàu", "Bắc Giang", "Bắc Kạn", "Bạc Liêu", "Bắc Ninh", "Bến Tre", "Bình Định",
+    "Bình Dương", "Bình Phước", "Bình Thuận", "Cà Mau", "Cần Thơ", "Cao Bằng", "Đà Nẵng", "Đắk Lắk",
+    "Đắk Nông", "Điện Biên", "Đồng Nai", "Đồng Tháp", "Gia Lai", "Hà Giang", "Hà Nam", "Hà Nội", "Hà Tĩnh",
+    "Hải Dương", "Hải Phòng", "Hậu Giang", "Hòa Bình", "Hưng Yên", "Khánh Hòa", "Kiên Giang", "Kon Tum",
+    "Lai Châu", "Lâm Đồng", "Lạng Sơn", "Lào Cai", "Long An", "Nam Định", "Nghệ An", "Ninh Bình",
+    "Ninh Thuận", "Phú Thọ", "Phú Yên", "Quảng Bình", "Quảng Nam", "Quảng Ngãi", "Quảng Ninh", "Quảng Trị",
+    "Sóc Trăng", "Sơn La", "Tây Ninh", "Thái Bình", "Thái Nguyên", "Thanh Hóa", "Thừa Thiên Huế",
+    "Tiền Giang", "Trà Vinh", "Tuyên Quang", "Vĩnh Long", "Vĩnh Phúc", "Yên Bái", "Sài Gòn", "Hồ Chí Minh",
+    "Hà Tây", "Hà Bắc", "Nghĩa Bình", "Hà Sơn Bình", "Minh Hải", "Sông Bé", "Hoàng Liên Sơn", "Bình Trị Thiên",
+    "Nghệ Tĩnh", "Hải Hưng", "Cửu Long", "Hậu Nghĩa", "Gia Định", "Biên Hòa", "Buôn Ma Thuột", "Pleiku",
+]
+# Từ đứng trước địa danh (đã bỏ dấu)
+PLACE_PREFIXES = (
+    "tinh", "thanh pho", "tp", "huyen", "quan", "thi xa", "thi tran", "xa", "phuong", "thon", "ap", "xom",
+    "lang", "ban", "que", "ga", "ben xe", "ben tau", "cho", "nong truong", "lam truong", "cong truong",
+    "tram", "benh vien", "trai", "khu", "duong", "pho",
+)
+# Bảng mở rộng đồng nghĩa: cụm chuẩn -> các cụm liên quan (giống cách prompt Gemini sinh từ liên quan)
+SYNONYMS = {
+    "chiến tranh": ["chạy giặc", "vượt biên", "di cư", "xung đột", "sơ tán"],
+    "chạy giặc": ["chiến tranh", "sơ tán", "di tản"],
+    "vượt biên": ["di cư", "chiến tranh", "tàu thuyền", "trại tị nạn"],
+    "di cư": ["di chuyển", "vượt biên", "chuyển nhà"],
+    "di tản": ["sơ tán", "chạy giặc", "di cư"],
+    "sơ tán": ["di tản", "chạy giặc"],
+    "bộ đội": ["quân đội", "nhập ngũ", "đi lính", "chiến trường"],
+    "nhập ngũ": ["bộ đội", "đi lính", "quân đội"],
+    "đi lính": ["bộ đội", "nhập ngũ", "quân đội"],
+    "hy sinh": ["liệt sĩ", "tử trận"],
+    "liệt sĩ": ["hy sinh", "bộ đội"],
+    "thương binh": ["bộ đội", "chiến tranh"],
+    "cho đi": ["cho làm con nuôi", "nhận nuôi", "con nuôi"],
+    "con nuôi": ["nhận nuôi", "cho đi", "nuôi dưỡng"],
+    "nhận nuôi": ["con nuôi", "nuôi dưỡng", "cho đi"],
+    "bắt cóc": ["bị bắt", "mang đi", "bán đi"],
+    "bán đi": ["bắt cóc", "mua bán", "bán sang"],
+    "trung quốc": ["bán sang", "biên giới"],
+    "mồ côi": ["trại mồ côi", "trẻ mồ côi", "cô nhi viện"],
+    "cô nhi viện": ["trại mồ côi", "mồ côi", "trẻ mồ côi"],
+    "trại mồ côi": ["cô nhi viện", "mồ côi"],
+    "mới sinh": ["sơ sinh", "mới đẻ", "đỏ hỏn"],
+    "sơ sinh": ["mới sinh", "mới đẻ"],
+    "bệnh viện": ["nhà hộ sinh", "trạm xá", "sinh con"],
+    "nhà hộ sinh": ["bệnh viện", "trạm xá"],
+    "ga tàu": ["nhà ga", "tàu hỏa", "đường sắt"],
+    "nhà ga": ["ga tàu", "tàu hỏa"],
+    "tàu hỏa": ["ga tàu", "nhà ga", "đường sắt"],
+    "bến xe": ["xe khách", "xe đò"],
+    "nông trường": ["làm nông", "nông nghiệp", "lâm trường"],
+    "lâm trường": ["nông trường", "rừng"],
+    "thanh niên xung phong": ["xung phong", "mở đường"],
+    "đi kinh tế mới": ["kinh tế mới", "khai hoang", "di cư"],
+    "kinh tế mới": ["khai hoang", "di cư"],
+    "khai hoang": ["kinh tế mới", "vỡ đất"],
+    "lái xe": ["tài xế", "lái xe tải", "vận tải"],
+    "tài xế": ["lái xe", "vận tải"],
+    "công nhân": ["nhà máy", "xí nghiệp"],
+    "nhà máy": ["công nhân", "xí nghiệp"],
+    "khó khăn": ["thiếu thốn", "nghèo khổ", "túng quẫn"],
+    "nghèo": ["khó khăn", "thiếu thốn", "nghèo khổ"],
+    "tật": ["khiếm khuyết", "khuyết tật", "tàn tật"],
+    "khuyết tật": ["tật", "khiếm khuyết", "tàn tật"],
+    "không minh mẫn": ["thần kinh", "tâm thần"],
+    "tâm thần": ["thần kinh", "không minh mẫn"],
+    "vết sẹo": ["sẹo", "vết thương"],
+    "nốt ruồi": ["vết bớt", "đặc điểm"],
+    "vết bớt": ["nốt ruồi", "bớt"],
+    "đi lạc": ["lạc đường", "đi lạc"],
+    "bỏ nhà": ["bỏ đi", "đi bụi", "lang thang"],
+    "lang thang": ["bỏ nhà", "đi bụi", "ăn xin"],
+    "bán vé số": ["vé số", "buôn bán"],
+    "tị nạn": ["trại tị nạn", "vượt biên", "định cư"],
+    "định cư": ["xuất cảnh", "nước ngoài", "tị nạn"],
+    "xuất khẩu lao động": ["đi lao động", "nước ngoài"],
+    "học tập cải tạo": ["cải tạo", "trại cải tạo"],
+    "cải tạo": ["học tập cải tạo", "trại cải tạo"],
+}
+
+_WORD_RE = re.compile(r"\w+|[.!?;:,()\"\n]", re.UNICODE)
+_YEAR_RE = re.compile(r"(?<!\d)(?:19|20)\d{2}(?!\d)")
+_SENTENCE_END = {".", "!", "?", "\n", ":", ";"}
+
+
+def _phrase_regex(phrases):
+    """Một regex khớp nguyên cụm cho cả danh sách, ưu tiên cụm dài."""
+    phrases = sorted(set(phrases), key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(p) for p in phrases) + r")\b")
+
+
+# Tỉnh/thành so khớp trên văn bản đã bỏ dấu (truy vấn gõ không dấu vẫn nhận ra);
+# bảng đồng nghĩa so khớp có dấu vì cụm ngắn bỏ dấu dễ trùng ("tật" / "tất")
+_PROVINCE_BY_FOLDED = {fold_diacritics(p): p for p in PROVINCES}
+_PROVINCE_RE = _phrase_regex(_PROVINCE_BY_FOLDED)
+_SYNONYM_RE = _phrase_regex(SYNONYMS)
+_PLACE_PREFIX_FOLDED = set(PLACE_PREFIXES)
+# Từ chỉ địa danh không trùng danh xưng ("bạn", "dượng" vừa là danh xưng vừa là "bản", "đường")
+_PLACE_ONLY_PREFIXES = _PLACE_PREFIX_FOLDED - HONORIFICS
+# Từ khóa ngắn hơn (trừ khi là một phần của cụm dài) khớp quá nhiều hồ sơ khi str.contains ("An" -> "Thanh")
+MIN_KEYWORD_LENGTH = 3
+
+
+def _is_capitalized(token):
+    return token[:1].isupper()
+
+
+def _capitalized_runs(query):
+    """
+    Các chuỗi từ viết hoa liền nhau: [(words, at_sentence_start, prefix_words)],
+    prefix_words là tối đa 2 từ (đã bỏ dấu) đứng ngay trước chuỗi.
+    """
+    tokens = _WORD_RE.findall(query)
+    runs = []
+    sentence_start = True
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in _SENTENCE_END:
+            sentence_start = True
+            i += 1
+            continue
+        if not token[0].isalnum():
+            i += 1
+            continue
+        if _is_capitalized(token) and not token.isdigit():
+            start = i
+            while i < len(tokens) and tokens[i][0].isalpha() and _is_capitalized(tokens[i]):
+                i += 1
+            prefix = [fold_diacritics(t) for t in tokens[max(0, start - 2):start] if t[0].isalpha()]
+            runs.append((tokens[start:i], sentence_start, prefix))
+            sentence_start = False
+            continue
+        sentence_start = False
+        i += 1
+    return runs
+
+
+def _is_place_prefix(folded_words):
+    return bool(folded_words) and (
+        folded_words[-1] in _PLACE_ONLY_PREFIXES or " ".join(folded_words[-2:]) in _PLACE_ONLY_PREFIXES
+    )
+
+
+def _place_keywords(words, folded, prefix):
+    """Địa danh nếu cả chuỗi là địa danh; xét trước khi bỏ từ dừng để "Nghệ An" không thành "An"."""
+    for i in range(len(folded)):
+        # "Quê Nghệ An", "Tại Bến Tre": các từ đầu là từ dừng / danh xưng / từ chỉ địa danh
+        if any(f not in STOPWORDS and f not in HONORIFICS and f not in _PLACE_PREFIX_FOLDED for f in folded[:i]):
+            break
+        if " ".join(folded[i:]) in _PROVINCE_BY_FOLDED:
+            return [_PROVINCE_BY_FOLDED[" ".join(folded[i:])]]
+    # "huyện Chợ Gạo", "Huyện Chợ Gạo": giữ nguyên cả cụm
+    if _is_place_prefix(prefix) or (len(folded) > 1 and folded[0] in _PLACE_ONLY_PREFIXES) or (
+            len(folded) > 2 and " ".join(folded[:2]) in _PLACE_ONLY_PREFIXES):
+        return [" ".join(words)]
+    return None
+
+
+def _name_keywords(words, sentence_start, prefix):
+    """Từ khóa từ một chuỗi viết hoa: tên người (+ tên gọi), địa danh hoặc tên riêng khác."""
+    folded = [fold_diacritics(w) for w in words]
+    place = _place_keywords(words, folded, prefix)
+    if place is not None:
+        return place
+    # Bỏ danh xưng / từ thường viết hoa đầu câu ("Chị Lê Thị Toàn", "Khoảng năm ...")
+    had_honorific = bool(prefix) and prefix[-1] in HONORIFICS
+    while folded and (folded[0] in HONORIFICS or folded[0] in STOPWORDS) and folded[0] not in SURNAMES:
+        had_honorific = had_honorific or folded[0] in HONORIFICS
+        words, folded = words[1:], folded[1:]
+        sentence_start = False
+    if len(folded) >= 2 and folded[0] in HONORIFICS and folded[1] in SURNAMES:
+        # "Bà Lê Thị ..." - danh xưng trùng với họ ("Lê"/"La"...) chỉ bỏ khi theo sau là một họ khác
+        words, folded = words[1:], folded[1:]
+    if not words:
+        return []
+
+    phrase = " ".join(words)
+    folded_phrase = " ".join(folded)
+    if folded_phrase in STOP_PHRASES:
+        return []
+    if folded_phrase in _PROVINCE_BY_FOLDED:
+        return [_PROVINCE_BY_FOLDED[folded_phrase]]
+    if len(words) == 1:
+        # Một từ viết hoa: tên gọi nếu có danh xưng trước hoặc nằm giữa câu (danh sách anh chị em...)
+        if folded[0] in STOPWORDS or len(folded[0]) < 2 or (sentence_start and not had_honorific):
+            return []
+        return [phrase]
+    if folded[0] in SURNAMES and len(words) <= 4:
+        given = words[-1]
+        return [phrase, given] if len(given) >= 2 else [phrase]
+    # Tên riêng khác (địa danh nhỏ, tên đơn vị...): bỏ các cụm toàn từ dừng
+    if all(f in STOPWORDS for f in folded):
+        return []
+    return [phrase]
+
+
+def extract_keywords_local(query):
+    """Từ khóa (có dấu, không trùng lặp, giữ thứ tự) trích từ truy vấn, không gọi LLM."""
+    if not query or not str(query).strip():
+        return []
+    query = str(query)
+    folded_query = fold_diacritics(query)
+    keywords = []
+
+    for words, sentence_start, prefix in _capitalized_runs(query):
+        keywords.extend(_name_keywords(words, sentence_start, prefix))
+
+    keywords.extend(_YEAR_RE.findall(query))
+
+    for match in _PROVINCE_RE.finditer(folded_query):
+        keywords.append(_PROVINCE_BY_FOLDED[match.group(1)])
+
+    for match in _SYNONYM_RE.finditer(unicodedata.normalize("NFC", query).lower()):
+        canonical = match.group(1)
+        keywords.append(canonical)
+        keywords.extend(SYNONYMS[canonical])
+
+    return [keyword for keyword in merge_keywords(keywords) if len(keyword) >= MIN_KEYWORD_LENGTH]
+
+
+def merge_keywords(*keyword_lists):
+    """Gộp nhiều danh sách từ khóa, bỏ trùng (không phân biệt hoa thường), giữ thứ tự xuất hiện đầu tiên."""
+    merged = {}
+    for keywords in keyword_lists:
+        for keyword in keywords or []:
+            keyword = str(keyword).strip()
+            key = keyword.lower()
+            if keyword and key not in merged and fold_diacritics(keyword) not in STOP_PHRASES:
+                merged[key] = keyword
+    return list(merged.values())
+
+
+# Luồng chạy Gemini song song với bộ trích xuất cục bộ; lời gọi quá hạn vẫn chạy nốt nhưng không ai chờ
+_llm_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="keywords-llm")
+
+
+def extract_keywords(query, mode=KEYWORD_EXTRACTION_MODE, llm_timeout=KEYWORD_LLM_TIMEOUT):
+    """Trích xuất từ khóa theo chế độ local / llm / hybrid (xem đầu file)."""
+    from .llm_utils import extract_keywords_gemini
+
+    if mode == "local":
+        return extract_keywords_local(query)
+    if mode == "llm":
+        return extract_keywords_gemini(query) or extract_keywords_local(query)
+
+    future = _llm_executor.submit(extract_keywords_gemini, query)
+    started = time.perf_counter()
+    local_keywords = extract_keywords_local(query)
+    local_ms = (time.perf_counter() - started) * 1000
+    try:
+        llm_keywords = future.result(timeout=llm_timeout)
+    except FutureTimeoutError:
+        print(f"Gemini trích xuất từ khóa quá {llm_timeout}s, dùng từ khóa cục bộ.")
+        llm_keywords = []
+    except Exception as e:
+        print(f"Lỗi khi trích xuất từ khóa bằng Gemini, dùng từ khóa cục bộ: {e}")
+        llm_keywords = []
+    keywords = merge_keywords(llm_keywords, local_keywords)
+    print(f"Từ khóa: {len(llm_keywords)} từ Gemini + {len(local_keywords)} cục bộ ({local_ms:.2f} ms) "
+          f"-> {len(keywords)} sau khi gộp")
+    return keywords
@@ -0,0 +1,112 @@
+"""
+Bộ đếm độ trễ / token / chi phí cho các lần gọi Gemini, theo (tác vụ, model).
+
+Tác vụ: verify_screen (model nhanh, sàng lọc), verify (model mạnh), keywords, profile_extract, report_analysis...
+Số liệu nằm trong bộ nhớ của từng tiến trình; xem qua API llm-metrics/ (admin) hoặc snapshot().
+Chi phí ước tính theo bảng giá LLM_MODEL_PRICES (USD / 1 triệu token vào, ra).
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import LLM_MODEL_PRICES
+
+_lock = threading.Lock()
+_counters = {}
+_started_at = time.time()
+
+
+def _empty():
+    return {"calls": 0, "errors": 0, "latency_total_s": 0.0, "latency_max_s": 0.0,
+            "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+
+
+def estimate_cost(model, input_tokens, output_tokens):
+    input_price, output_price = LLM_MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def record_call(task, model, latency, input_tokens=0, output_tokens=0, ok=True):
+    """Ghi nhận một lần gọi model."""
+    input_tokens = int(input_tokens or 0)
+    output_tokens = int(output_tokens or 0)
+    with _lock:
+        counter = _counters.setdefault((task, model), _empty())
+        counter["calls"] += 1
+        counter["errors"] += 0 if ok else 1
+        counter["latency_total_s"] += latency
+        counter["latency_max_s"] = max(counter["latency_max_s"], latency)
+        counter["input_tokens"] += input_tokens
+        counter["output_tokens"] += output_tokens
+        counter["cost_usd"] += estimate_cost(model, input_tokens, output_tokens)
+
+
+def usage_from_rest(response_data):
+    """(input_tokens, output_tokens) từ usageMetadata của REST API generateContent."""
+    usage = (response_data or {}).get("usageMetadata") or {}
+    return usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0)
+
+
+def record_rest_response(task, model, started, response):
+    """Ghi nhận một lần gọi REST (requests.Response) bắt đầu tại time.perf_counter() = started."""
+    usage = (0, 0)
+    if response.status_code == 200:
+        try:
+            usage = usage_from_rest(response.json())
+        except ValueError:
+            pass
+    record_call(task, model, time.perf_counter() - started, *usage, ok=response.status_code == 200)
+
+
+def usage_from_sdk(response):
+    """(input_tokens, output_tokens) từ response của google.generativeai."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return getattr(usage, "prompt_token_count", 0), getattr(usage, "candidates_token_count", 0)
+
+
+@contextmanager
+def track(task, model):
+    """
+    Đo một lần gọi SDK:
+        with track("keywords", model) as call:
+            response = model_instance.generate_content(prompt)
+            call["usage"] = usage_from_sdk(response)
+    Lỗi (exception) được tính vào errors rồi ném lại.
+    """
+    call = {"usage": (0, 0), "ok": True}
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call["ok"] = False
+        raise
+    finally:
+        record_call(task, model, time.perf_counter() - started, *call["usage"], ok=call["ok"])
+
+
+def snapshot():
+    """Số liệu hiện tại: list dict theo (tác vụ, model), kèm độ trễ trung bình."""
+    with _lock:
+        items = [(key, dict(value)) for key, value in _counters.items()]
+    result = []
+    for (task, model), counter in sorted(items):
+        calls = counter["calls"] or 1
+        counter.update(
+            task=task,
+            model=model,
+            latency_avg_s=round(counter["latency_total_s"] / calls, 3),
+            latency_total_s=round(counter["latency_total_s"], 3),
+            latency_max_s=round(counter["latency_max_s"], 3),
+            cost_usd=round(counter["cost_usd"], 6),
+        )
+        result.append(counter)
+    return {"since": _started_at, "counters": result}
+
+
+def reset():
+    global _started_at
+    with _lock:
+        _counters.clear()
+        _started_at = time.time()
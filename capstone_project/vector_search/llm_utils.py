@@ -1,7 +1,7 @@
 import time
 import json
 import requests
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import google.generativeai as genai
 import random # Import random for jitter
@@ -12,35 +12,59 @@ from .config import (
     PRIMARY_GOOGLE_API_KEY,
     GEMINI_API_KEYS,
     DETAIL_COLUMN_NAME,
+    DIGEST_COLUMN_NAME,
     BATCH_SIZE_LLM,
     MAX_CONCURRENT_REQUESTS_LLM,
     MAX_RETRIES_LLM,
     INITIAL_RETRY_DELAY_LLM,
-    BATCH_GROUP_DELAY_LLM
+    BATCH_GROUP_DELAY_LLM,
+    LLM_PROMPT_TOKEN_BUDGET,
+    GEMINI_FAST_MODEL,
+    GEMINI_STRONG_MODEL,
+    GEMINI_KEYWORD_MODEL,
+    LLM_TIERING_ENABLED,
+    LLM_ACCEPT_SCORE,
+    LLM_ESCALATE_MIN_SCORE,
 )
-
-# --- Hàm xác minh hồ sơ bằng LLM (Prompt đã được cải thiện ở lần trước) ---
-def verify_profiles_with_llm(query, profiles_data, api_key):
-    """Verify profiles using direct HTTP requests to Gemini API with specific key."""
-    # ... (phần tạo profile_strings và prompt giữ nguyên) ...
-    profile_strings = []
-    for profile in profiles_data:
-        profile_id = profile.get('id') if isinstance(profile, dict) else profile.name
-        title = profile.get('Tiêu đề', 'N/A')
-        name = profile.get('Họ và tên', 'N/A')
-        detail_source = profile.get('metadata', {}) if isinstance(profile, dict) and 'metadata' in profile else profile
-        detail = detail_source.get(DETAIL_COLUMN_NAME, 'N/A')
-        detail = str(detail).replace('\\', '/')[:1000]
-
-        profile_str = f"""
+from . import llm_metrics
+from .profile_digest import estimate_tokens
+
+def build_profile_block(profile):
+    """
+    Khối văn bản của một ứng viên trong prompt xác minh.
+    Dùng bản tóm tắt đã tính sẵn (cột llm_digest, xem profile_digest.py) nếu có;
+    hồ sơ chưa được backfill thì cắt 1000 ký tự mô tả như trước.
+    """
+    profile_id = profile.get('id') if isinstance(profile, dict) else profile.name
+    detail_source = profile.get('metadata', {}) if isinstance(profile, dict) and 'metadata' in profile else profile
+    digest = profile.get(DIGEST_COLUMN_NAME) or detail_source.get(DIGEST_COLUMN_NAME)
+    if isinstance(digest, str) and digest.strip():
+        return f"""
+Index: {profile_id}
+{digest.strip()}
+{"-"*20}"""
+
+    title = profile.get('Tiêu đề', 'N/A')
+    name = profile.get('Họ và tên', 'N/A')
+    detail = detail_source.get(DETAIL_COLUMN_NAME, 'N/A')
+    detail = str(detail).replace('\\', '/')[:1000]
+    return f"""
 Index: {profile_id}
 Tiêu đề: {title}
 Họ tên: {name}
 Chi tiết: {detail}
 {"-"*40}"""
-        profile_strings.append(profile_str)
 
-    prompt = f"""Bạn là chuyên gia phân tích hồ sơ tìm kiếm người thân thất lạc với khả năng nhận diện pattern phức tạp. Nhiệm vụ của bạn là tìm những hồ sơ có khả năng mô tả **cùng một người** và **cùng một hoàn cảnh thất lạc** với yêu cầu tìm kiếm bên dưới.
+VERIFY_OUTPUT_INSTRUCTIONS = """ **Hãy trả về duy nhất danh sách các Index** của hồ sơ phù hợp, mỗi index trên một dòng. Nếu không có hồ sơ phù hợp, trả về đúng từ `none`."""
+
+# Tầng sàng lọc (model nhanh): chấm điểm thay vì chọn, để định tuyến hồ sơ lưng chừng sang model mạnh
+SCREEN_OUTPUT_INSTRUCTIONS = """ **Hãy chấm điểm từ 0 đến 100** mức độ chắc chắn mỗi hồ sơ mô tả cùng một người với yêu cầu tìm kiếm (bỏ qua giới hạn 20 hồ sơ ở trên).
+Mỗi hồ sơ có điểm từ 20 trở lên trả về đúng một dòng dạng `Index: điểm` (ví dụ `123: 85`). Bỏ qua các hồ sơ dưới 20 điểm. Nếu không có hồ sơ nào, trả về đúng từ `none`."""
+
+
+def build_verification_prompt(query, profile_strings, output_instructions=VERIFY_OUTPUT_INSTRUCTIONS):
+    """Prompt xác minh cho một lô ứng viên (profile_strings: các khối từ build_profile_block)."""
+    return f"""Bạn là chuyên gia phân tích hồ sơ tìm kiếm người thân thất lạc với khả năng nhận diện pattern phức tạp. Nhiệm vụ của bạn là tìm những hồ sơ có khả năng mô tả **cùng một người** và **cùng một hoàn cảnh thất lạc** với yêu cầu tìm kiếm bên dưới.
 
 ## CÁC YẾU TỐ QUAN TRỌNG (THEO MỨC ĐỘ ƯU TIÊN):
 
@@ -94,11 +118,17 @@ Các hồ sơ cần kiểm tra:
 
 ---
 
- **Hãy trả về duy nhất danh sách các Index** của hồ sơ phù hợp, mỗi index trên một dòng. Nếu không có hồ sơ phù hợp, trả về đúng từ `none`.
+{output_instructions}
 """
 
-    api_endpoint = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    # api_endpoint = "https://generativelanguage.googleapis.com/v1/models/gemini-2.5-flash:generateContent"
+# --- Gọi Gemini REST API (retry + bộ đếm llm_metrics) ---
+def call_gemini_rest(prompt, api_key, model, task, temperature=0.2, max_output_tokens=100, response_schema=None):
+    """
+    Gọi generateContent của model với key cho trước.
+    response_schema: nếu có, bật JSON mode (responseMimeType application/json) với schema đó.
+    Trả về text sinh ra, hoặc None nếu lỗi (nên thử key khác).
+    """
+    api_endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
     headers = {
         "Content-Type": "application/json",
         "x-goog-api-key": api_key,
@@ -107,14 +137,19 @@ Các hồ sơ cần kiểm tra:
         "contents": [{"parts": [{"text": prompt}]}],
         # Có thể thêm generationConfig và safetySettings nếu cần
         "generationConfig": {
-             "temperature": 0.2,
-             "maxOutputTokens": 100
+             "temperature": temperature,
+             "maxOutputTokens": max_output_tokens
         }
     }
+    if response_schema is not None:
+        payload["generationConfig"]["responseMimeType"] = "application/json"
+        payload["generationConfig"]["responseSchema"] = response_schema
 
     for attempt in range(MAX_RETRIES_LLM):
+        started = time.perf_counter()
         try:
             response = requests.post(api_endpoint, headers=headers, json=payload, timeout=60) # Thêm timeout
+            llm_metrics.record_rest_response(task, model, started, response)
 
             # Kiểm tra lỗi Rate Limit (429) hoặc Server Error (5xx)
             if response.status_code == 429:
@@ -138,11 +173,11 @@ Các hồ sơ cần kiểm tra:
                     # Kiểm tra lỗi API key cụ thể
                     if "API key not valid" in error_detail:
                          print(f"Lỗi API Key không hợp lệ (Key: ...{api_key[-4:]}). Ngừng thử lại với key này.")
-                         return [] # Trả về list rỗng
+                         return None
                 except json.JSONDecodeError:
                      error_detail = response.text # Nếu response không phải JSON
                 print(f"Lỗi không thể thử lại ({error_type}) khi gọi Gemini API (Key ...{api_key[-4:]}): {error_detail}")
-                return [] # Không thử lại các lỗi client khác 429
+                return None # Không thử lại các lỗi client khác 429
 
             # Nếu là lỗi có thể thử lại (429, 5xx)
             if response.status_code == 429 or response.status_code >= 500:
@@ -152,8 +187,8 @@ Các hồ sơ cần kiểm tra:
                     time.sleep(wait_time)
                     continue # Thử lại vòng lặp
                  else:
-                    print(f"Không thể xác minh batch sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}' (Key ...{api_key[-4:]}).")
-                    return [] # Hết số lần thử
+                    print(f"Không thể gọi {model} sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}' (Key ...{api_key[-4:]}).")
+                    return None # Hết số lần thử
 
             # Nếu thành công (status_code == 200)
             response_data = response.json()
@@ -164,66 +199,186 @@ Các hồ sơ cần kiểm tra:
                 if response_data.get('promptFeedback', {}).get('blockReason'):
                     block_reason = response_data['promptFeedback']['blockReason']
                     print(f"Cảnh báo: Yêu cầu bị chặn do safety settings (Key ...{api_key[-4:]}): {block_reason}")
-                    return []
+                    return None
 
                 # Kiểm tra cấu trúc response chuẩn
                 generated_text = response_data['candidates'][0]['content']['parts'][0]['text']
 
                 if generated_text:
-                    if generated_text.strip().lower() == 'none':
-                        return [] # Không có kết quả phù hợp
-                    # Tách và chuyển đổi index
-                    matched_indices_str = [idx.strip() for idx in generated_text.split('\n') if idx.strip().isdigit()]
-                    return matched_indices_str
+                    return generated_text
                 else:
                     print(f"Cảnh báo: Gemini API trả về phản hồi thành công nhưng text rỗng (Key ...{api_key[-4:]}).")
-                    return []
+                    return None
             except (KeyError, IndexError, TypeError) as e:
                 print(f"Lỗi khi phân tích response thành công từ Gemini API (Key ...{api_key[-4:]}): {e}")
                 print(f"  Response data: {response_data}")
-                return [] # Coi như lỗi
+                return None # Coi như lỗi
 
         except requests.exceptions.RequestException as e:
             # Lỗi mạng (Timeout, ConnectionError, etc.)
+            llm_metrics.record_call(task, model, time.perf_counter() - started, ok=False)
             error_type = f"Network Error ({type(e).__name__})"
             if attempt < MAX_RETRIES_LLM - 1:
                 wait_time = INITIAL_RETRY_DELAY_LLM * (2 ** attempt)
                 print(f"Lỗi '{error_type}' (Key ...{api_key[-4:]}). Retrying in {wait_time} seconds... (Attempt {attempt+1}/{MAX_RETRIES_LLM})")
                 time.sleep(wait_time)
             else:
-                print(f"Không thể xác minh batch sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}' (Key ...{api_key[-4:]}).")
-                return [] # Hết số lần thử
+                print(f"Không thể gọi {model} sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}' (Key ...{api_key[-4:]}).")
+                return None # Hết số lần thử
+
+    return None # Vòng lặp kết thúc mà không thành công
+
+# --- Hàm xác minh hồ sơ bằng LLM (Prompt đã được cải thiện ở lần trước) ---
+def verify_profiles_with_llm(query, profiles_data, api_key, profile_strings=None, model=GEMINI_STRONG_MODEL):
+    """
+    Verify profiles using direct HTTP requests to Gemini API with specific key.
+    Trả về list Index phù hợp ([] nếu LLM trả lời `none`), hoặc None nếu lỗi (nên thử key khác).
+    """
+    if profile_strings is None:
+        profile_strings = [build_profile_block(profile) for profile in profiles_data]
+    prompt = build_verification_prompt(query, profile_strings)
+    generated_text = call_gemini_rest(prompt, api_key, model, task="verify")
+    if generated_text is None:
+        return None
+    if generated_text.strip().lower() == 'none':
+        return [] # Không có kết quả phù hợp
+    # Tách và chuyển đổi index
+    return [idx.strip() for idx in generated_text.split('\n') if idx.strip().isdigit()]
+
+
+_SCORE_LINE_RE = re.compile(r"(\d+)\s*[:\-|]\s*(\d{1,3})")
+
+
+def screen_profiles_with_llm(query, profiles_data, api_key, profile_strings=None, model=GEMINI_FAST_MODEL):
+    """
+    Tầng sàng lọc bằng model nhanh: {Index: điểm 0-100} cho các hồ sơ từ 20 điểm trở lên
+    ({} nếu LLM trả lời `none`), hoặc None nếu lỗi.
+    """
+    if profile_strings is None:
+        profile_strings = [build_profile_block(profile) for profile in profiles_data]
+    prompt = build_verification_prompt(query, profile_strings, output_instructions=SCREEN_OUTPUT_INSTRUCTIONS)
+    # Mỗi dòng "Index: điểm" ~6 token
+    generated_text = call_gemini_rest(prompt, api_key, model, task="verify_screen",
+                                      max_output_tokens=max(100, 8 * len(profile_strings)))
+    if generated_text is None:
+        return None
+    if generated_text.strip().lower() == 'none':
+        return {}
+    return {index: min(int(score), 100) for index, score in _SCORE_LINE_RE.findall(generated_text)}
+
+# --- Chia lô theo ngân sách token ---
+def pack_verification_batches(query, profiles, token_budget=LLM_PROMPT_TOKEN_BUDGET, max_per_batch=BATCH_SIZE_LLM):
+    """
+    Xếp các ứng viên (giữ thứ tự xếp hạng) vào các lô sao cho mỗi prompt không vượt token_budget.
+    Trả về list các lô, mỗi lô là (profiles, profile_strings).
+    """
+    overhead = estimate_tokens(build_verification_prompt(query, []))
+    capacity = max(token_budget - overhead, 1)
+
+    batches = []
+    current, current_strings, used = [], [], 0
+    for profile in profiles:
+        block = build_profile_block(profile)
+        cost = estimate_tokens(block)
+        if current and (used + cost > capacity or len(current) >= max_per_batch):
+            batches.append((current, current_strings))
+            current, current_strings, used = [], [], 0
+        # Một hồ sơ lớn hơn cả ngân sách vẫn được gửi (một mình một lô)
+        current.append(profile)
+        current_strings.append(block)
+        used += cost
+    if current:
+        batches.append((current, current_strings))
+    return batches
+
+
+def _with_key_rotation(func, query, batch, profile_strings, first_key_index):
+    """Gọi func với lần lượt các key (bắt đầu từ key riêng của lô) cho tới khi không lỗi; None nếu mọi key lỗi."""
+    keys = GEMINI_API_KEYS[first_key_index:] + GEMINI_API_KEYS[:first_key_index]
+    for api_key in keys:
+        result = func(query, batch, api_key, profile_strings=profile_strings)
+        if result is not None:
+            return result
+        print(f"❌ Không xác minh được lô {len(batch)} hồ sơ với key ...{api_key[-4:]}, thử key khác.")
+    return None
+
+
+def _profile_index(profile):
+    return str(profile.get('id') if isinstance(profile, dict) else profile.name)
+
+
+def _verify_batch(query, batch, profile_strings, first_key_index):
+    """
+    Xác minh một lô. Khi LLM_TIERING_ENABLED: model nhanh chấm điểm cả lô; điểm >= LLM_ACCEPT_SCORE được nhận,
+    điểm < LLM_ESCALATE_MIN_SCORE (hoặc không được liệt kê) bị loại, phần lưng chừng gửi sang model mạnh.
+    Tầng sàng lọc lỗi -> xác minh cả lô bằng model mạnh như trước.
+    Chỉ trả về Index thuộc lô (LLM có thể bịa Index hoặc trả Index của lô khác).
+    """
+    batch_ids = {_profile_index(profile) for profile in batch}
+    if LLM_TIERING_ENABLED:
+        scores = _with_key_rotation(screen_profiles_with_llm, query, batch, profile_strings, first_key_index)
+        if scores is not None:
+            scores = {index: score for index, score in scores.items() if index in batch_ids}
+            accepted = [index for index, score in scores.items() if score >= LLM_ACCEPT_SCORE]
+            borderline = {index for index, score in scores.items() if LLM_ESCALATE_MIN_SCORE <= score < LLM_ACCEPT_SCORE}
+            print(f"Sàng lọc lô {len(batch)} hồ sơ: nhận {len(accepted)}, chuyển model mạnh {len(borderline)}")
+            if not borderline:
+                return accepted
+            escalated = [(profile, block) for profile, block in zip(batch, profile_strings)
+                         if _profile_index(profile) in borderline]
+            confirmed = _with_key_rotation(verify_profiles_with_llm, query, [p for p, _ in escalated],
+                                           [b for _, b in escalated], first_key_index)
+            return accepted + [index for index in confirmed or [] if index in borderline]
+
+    verified = _with_key_rotation(verify_profiles_with_llm, query, batch, profile_strings, first_key_index)
+    return [index for index in verified or [] if index in batch_ids]
 
-    return [] # Trả về list rỗng nếu vòng lặp kết thúc mà không thành công
 
 # --- Hàm xác minh song song (Cập nhật để xử lý profile_data) ---
-def parallel_verify(query, ranked_profiles_data, max_profiles=300):
+def parallel_verify(query, ranked_profiles_data, max_profiles=300, on_batch=None):
+    """
+    Xác minh song song theo lô; on_batch(indices) được gọi ngay khi mỗi lô xong (để stream kết quả),
+    theo thứ tự hoàn thành chứ không theo thứ tự lô.
+    """
     max_profiles = min(max_profiles, len(ranked_profiles_data))
     profiles_to_verify = ranked_profiles_data[:max_profiles]
     print(f"Xử lý {max_profiles} hồ sơ có điểm số cao nhất để xác minh bằng LLM")
 
-    if not profiles_to_verify:
+    if not profiles_to_verify or not GEMINI_API_KEYS:
         return []
 
-    print(f"Xử lý {len(profiles_to_verify)} hồ sơ trong 1 lần gọi API")
+    batches = pack_verification_batches(query, profiles_to_verify)
+    print(f"Chia {len(profiles_to_verify)} hồ sơ thành {len(batches)} lô "
+          f"(<= {LLM_PROMPT_TOKEN_BUDGET} token/lô): {[len(b) for b, _ in batches]}")
 
     verified_indices_str = set()
+    # Mỗi lô bắt đầu với một key khác nhau để rải đều quota
+    key_offset = random.randrange(len(GEMINI_API_KEYS))
+    workers = min(MAX_CONCURRENT_REQUESTS_LLM, len(batches))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_verify_batch, query, batch, strings, (key_offset + i) % len(GEMINI_API_KEYS))
+            for i, (batch, strings) in enumerate(batches)
+        ]
+        for future in as_completed(futures):
+            try:
+                batch_verified = future.result()
+            except Exception as e:
+                print(f"Lỗi khi xác minh một lô: {e}")
+                continue
+            new_indices = [idx for idx in batch_verified if idx not in verified_indices_str]
+            verified_indices_str.update(new_indices)
+            if on_batch is not None and new_indices:
+                try:
+                    on_batch(new_indices)
+                except Exception as e:
+                    print(f"Lỗi khi gửi kết quả một lô: {e}")
 
-    # 🔁 Thử nhiều key nếu gặp lỗi
-    for api_key in random.sample(GEMINI_API_KEYS, len(GEMINI_API_KEYS)):
-        print(f"Thử xác minh với API key ...{api_key[-4:]}")
-        result = verify_profiles_with_llm(query, profiles_to_verify, api_key)
-        if result:
-            verified_indices_str.update(result)
-            print(f"✅ Đã xác minh thành công {len(result)} hồ sơ với key ...{api_key[-4:]}")
-            break  # Nếu thành công thì dừng lại
-        else:
-            print(f"❌ Không xác minh được với key ...{api_key[-4:]}, thử key khác.")
-
+    print(f"✅ Đã xác minh {len(verified_indices_str)} hồ sơ phù hợp")
     return list(verified_indices_str)
 
 # --- Hàm trích xuất từ khóa từ truy vấn bằng Gemini ---
-def extract_keywords_gemini(query, model="gemini-2.5-flash"): # Use a valid model name
+def extract_keywords_gemini(query, model=GEMINI_KEYWORD_MODEL):
     """Trích xuất các từ khóa quan trọng từ truy vấn bằng Gemini (có ví dụ và làm sạch)."""
     prompt = f"""Phân tích yêu cầu / hồ sơ tìm kiếm người thân thất lạc sau và trích xuất các từ khóa quan trọng có thể dùng để tìm kiếm thông tin liên quan đến người mất tích. Trả về một danh sách các từ khóa và những từ có khả năng liên quan. Lưu ý tên riêng có thể phân tích nhỏ hơn thành tên riêng (ví dụ: Lê Thị Hạnh => Hạnh). Từ khóa liên quan có thể được sinh ra từ các từ khóa chính (ví dụ: chiến tranh => xung đột, chạy giặc, vượt biên, di cư,...) hoặc từ các từ khóa khác trong đoạn văn bản. Vậy nhiệm vụ của bạn là trích xuất các từ khóa quan trọng nhất có thể dùng để tìm kiếm thông tin liên quan đến người mất tích và các từ khóa liên quan có thể sinh ra từ các từ khóa chính. Các từ khóa này có thể là tên riêng, địa danh, năm sinh, địa chỉ, đặc điểm nhận dạng, ký ức hoặc các thông tin khác... . Hãy trả về danh sách các từ khóa và các từ khóa liên quan có thể sinh ra từ các từ khóa chính, mỗi từ khóa cách nhau bởi dấu phẩy.
 
@@ -255,7 +410,9 @@ Các từ khóa quan trọng:""" # Updated prompt to ask for comma-separated lis
 
         # Use the correct model name if different from default
         model_instance = genai.GenerativeModel(model) # Use the model parameter
-        response = model_instance.generate_content(prompt)
+        with llm_metrics.track("keywords", model) as call:
+            response = model_instance.generate_content(prompt)
+            call["usage"] = llm_metrics.usage_from_sdk(response)
 
         if response.text:
             keywords_str = response.text.strip()
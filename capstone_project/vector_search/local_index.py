@@ -0,0 +1,564 @@
+"""
+Chỉ mục vector chạy ngay trong tiến trình (in-process), không phụ thuộc Qdrant/Chroma.
+
+Dùng khi Qdrant không khả dụng hoặc cho các triển khai nhỏ. Dữ liệu nằm trong một thư mục:
+  - vectors.npy        : ma trận float32/float16 (N x D), đã chuẩn hóa L2, mở bằng mmap
+  - ids.npy            : mảng int64 (N) - ID hồ sơ trong database
+  - delta_vectors.npy  : các vector được thêm sau lần compact gần nhất
+  - delta_ids.npy      : ID tương ứng với delta_vectors.npy
+  - tombstones.npy     : các ID đã bị xóa (chưa compact)
+  - hnsw.bin           : (tùy chọn) đồ thị HNSW, chỉ dùng khi có hnswlib và N đủ lớn
+  - .lock              : khóa file (fcntl) cho chu trình nạp lại -> sửa -> ghi giữa các tiến trình
+
+Corpus nhỏ: tìm kiếm chính xác bằng tích vô hướng NumPy theo từng khối.
+Corpus lớn: dùng đồ thị HNSW (hnswlib, đã có sẵn qua chroma-hnswlib).
+
+Xây chỉ mục từ Qdrant hoặc file JSONL export:
+    python -m vector_search.local_index build --source qdrant
+    python -m vector_search.local_index build --source jsonl --input exports/chroma_pinecone_export.jsonl
+    python -m vector_search.local_index build --source snapshot --input exports/snapshot   # warm start (xem snapshot.py)
+"""
+import os
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có khóa liên tiến trình, chỉ còn khóa luồng
+    fcntl = None
+
+try:
+    import hnswlib
+except ImportError:  # hnswlib là tùy chọn
+    hnswlib = None
+
+from .config import (
+    LOCAL_INDEX_PATH,
+    LOCAL_INDEX_DTYPE,
+    LOCAL_INDEX_HNSW_THRESHOLD,
+    LOCAL_INDEX_HNSW_EF,
+)
+
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+DELTA_VECTORS_FILE = "delta_vectors.npy"
+DELTA_IDS_FILE = "delta_ids.npy"
+TOMBSTONES_FILE = "tombstones.npy"
+HNSW_FILE = "hnsw.bin"
+LOCK_FILE = ".lock"
+
+# Số dòng xử lý mỗi lần nhân ma trận khi tìm kiếm chính xác (giới hạn bộ nhớ tạm)
+SEARCH_CHUNK_ROWS = 65536
+
+
+def _normalize(vectors):
+    """Chuẩn hóa L2 từng dòng để tích vô hướng = cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _atomic_save(path, array):
+    """Ghi file .npy qua file tạm rồi os.replace để tiến trình khác không đọc phải file dở dang."""
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+class LocalVectorIndex:
+    """Chỉ mục vector cosine trong bộ nhớ, hỗ trợ thêm dần (append) và xóa bằng tombstone."""
+
+    def __init__(self, path, dtype=LOCAL_INDEX_DTYPE, hnsw_threshold=LOCAL_INDEX_HNSW_THRESHOLD,
+                 hnsw_ef=LOCAL_INDEX_HNSW_EF):
+        self.path = str(path)
+        self.dtype = np.dtype(dtype)
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_ef = hnsw_ef
+        self.dimension = None
+        self._lock = threading.RLock()
+        self._file_lock_depth = 0
+        self._base_vectors = None      # np.memmap (N x D)
+        self._base_ids = np.empty(0, dtype=np.int64)
+        self._base_alive = np.empty(0, dtype=bool)
+        self._delta_vectors = None     # np.ndarray float32 (M x D)
+        self._delta_ids = np.empty(0, dtype=np.int64)
+        self._tombstones = set()
+        self._hnsw = None
+        self._loaded_mtime = None
+
+    # ------------------------------------------------------------------ I/O
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _state_mtime(self):
+        """Thời điểm sửa đổi mới nhất của các file trạng thái (để phát hiện worker khác đã ghi)."""
+        mtimes = []
+        for name in (VECTORS_FILE, DELTA_IDS_FILE, TOMBSTONES_FILE):
+            try:
+                mtimes.append(os.stat(self._file(name)).st_mtime_ns)
+            except FileNotFoundError:
+                continue
+        return max(mtimes) if mtimes else None
+
+    @contextmanager
+    def _file_lock(self):
+        """Khóa độc quyền giữa các tiến trình (flock trên .lock); lồng nhau được trong cùng tiến trình."""
+        with self._lock:
+            if fcntl is None or self._file_lock_depth:
+                self._file_lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._file_lock_depth -= 1
+                return
+            os.makedirs(self.path, exist_ok=True)
+            with open(self._file(LOCK_FILE), "a") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                self._file_lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._file_lock_depth -= 1
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Giữ khóa file và nạp lại phần tiến trình khác vừa ghi, để chu trình add/delete -> save()
+        không ghi đè delta/tombstone của worker khác:
+            with index.exclusive():
+                index.add(ids, vectors)
+                index.save()
+        """
+        with self._file_lock():
+            self.reload_if_changed()
+            yield self
+
+    def exists(self):
+        return os.path.exists(self._file(VECTORS_FILE)) or os.path.exists(self._file(DELTA_IDS_FILE))
+
+    def load(self):
+        """Nạp chỉ mục từ đĩa. Ma trận gốc được mở bằng mmap nên không tốn RAM ngay lập tức."""
+        with self._lock:
+            if os.path.exists(self._file(VECTORS_FILE)):
+                self._base_vectors = np.load(self._file(VECTORS_FILE), mmap_mode="r")
+                self._base_ids = np.load(self._file(IDS_FILE)).astype(np.int64, copy=False)
+                self.dimension = int(self._base_vectors.shape[1])
+            else:
+                self._base_vectors = None
+                self._base_ids = np.empty(0, dtype=np.int64)
+
+            if os.path.exists(self._file(DELTA_IDS_FILE)):
+                self._delta_ids = np.load(self._file(DELTA_IDS_FILE)).astype(np.int64, copy=False)
+                self._delta_vectors = np.load(self._file(DELTA_VECTORS_FILE)).astype(np.float32, copy=False)
+                if self.dimension is None and len(self._delta_ids):
+                    self.dimension = int(self._delta_vectors.shape[1])
+            else:
+                self._delta_ids = np.empty(0, dtype=np.int64)
+                self._delta_vectors = None
+
+            if os.path.exists(self._file(TOMBSTONES_FILE)):
+                self._tombstones = set(np.load(self._file(TOMBSTONES_FILE)).tolist())
+            else:
+                self._tombstones = set()
+
+            self._refresh_base_alive()
+            self._load_hnsw()
+            self._loaded_mtime = self._state_mtime()
+            print(f"Đã nạp chỉ mục vector cục bộ '{self.path}': {self.count()} vector "
+                  f"({'HNSW' if self._hnsw is not None else 'exact'}).")
+        return self
+
+    def reload_if_changed(self):
+        """Nạp lại nếu một tiến trình khác đã ghi delta/tombstone mới (rẻ: chỉ os.stat)."""
+        if self._state_mtime() != self._loaded_mtime:
+            self.load()
+
+    def save(self):
+        """Lưu phần delta và tombstone. Ma trận gốc chỉ được ghi lại khi compact()."""
+        with self._file_lock():
+            os.makedirs(self.path, exist_ok=True)
+            if len(self._delta_ids):
+                _atomic_save(self._file(DELTA_VECTORS_FILE), self._delta_vectors)
+                _atomic_save(self._file(DELTA_IDS_FILE), self._delta_ids)
+            else:
+                for name in (DELTA_VECTORS_FILE, DELTA_IDS_FILE):
+                    if os.path.exists(self._file(name)):
+                        os.remove(self._file(name))
+            _atomic_save(self._file(TOMBSTONES_FILE), np.array(sorted(self._tombstones), dtype=np.int64))
+            if self._hnsw is not None:
+                self._hnsw.save_index(self._file(HNSW_FILE))
+            self._loaded_mtime = self._state_mtime()
+
+    def compact(self):
+        """Gộp delta vào ma trận gốc, loại bỏ các dòng đã xóa và xây lại HNSW (nếu cần)."""
+        with self.exclusive():
+            ids, vectors = self._alive_arrays()
+            self.write_base(ids, vectors)
+
+    def write_base(self, ids, vectors):
+        """Ghi toàn bộ ma trận gốc (dùng khi build hoặc compact) rồi nạp lại."""
+        with self._file_lock():
+            os.makedirs(self.path, exist_ok=True)
+            vectors = _normalize(vectors).astype(self.dtype, copy=False) if len(ids) else \
+                np.empty((0, self.dimension or 0), dtype=self.dtype)
+            _atomic_save(self._file(VECTORS_FILE), vectors)
+            _atomic_save(self._file(IDS_FILE), np.asarray(ids, dtype=np.int64))
+            for name in (DELTA_VECTORS_FILE, DELTA_IDS_FILE, TOMBSTONES_FILE, HNSW_FILE):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self.load()
+            if self._hnsw is None and self._should_use_hnsw():
+                self._build_hnsw()
+                self.save()
+
+    # ------------------------------------------------------------- HNSW
+    def _should_use_hnsw(self):
+        return hnswlib is not None and self.count() >= self.hnsw_threshold
+
+    def _load_hnsw(self):
+        self._hnsw = None
+        if not self._should_use_hnsw() or not os.path.exists(self._file(HNSW_FILE)):
+            return
+        index = hnswlib.Index(space="ip", dim=self.dimension)
+        index.load_index(self._file(HNSW_FILE), max_elements=self.count() + 10000, allow_replace_deleted=True)
+        index.set_ef(self.hnsw_ef)
+        self._hnsw = index
+
+    def _build_hnsw(self):
+        ids, vectors = self._alive_arrays()
+        print(f"Đang xây đồ thị HNSW cho {len(ids)} vector...")
+        index = hnswlib.Index(space="ip", dim=self.dimension)
+        index.init_index(max_elements=len(ids) + 10000, ef_construction=200, M=16, allow_replace_deleted=True)
+        for start in range(0, len(ids), SEARCH_CHUNK_ROWS):
+            index.add_items(vectors[start:start + SEARCH_CHUNK_ROWS], ids[start:start + SEARCH_CHUNK_ROWS])
+        index.set_ef(self.hnsw_ef)
+        self._hnsw = index
+
+    # --------------------------------------------------------- mutations
+    def _refresh_base_alive(self):
+        if len(self._base_ids) and self._tombstones:
+            tombstones = np.fromiter(self._tombstones, dtype=np.int64)
+            self._base_alive = ~np.isin(self._base_ids, tombstones)
+        else:
+            self._base_alive = np.ones(len(self._base_ids), dtype=bool)
+
+    def add(self, ids, vectors):
+        """Thêm/cập nhật vector. ID đã có sẽ bị thay thế (dòng cũ được đánh tombstone)."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = _normalize(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError("Số lượng ids và vectors không khớp")
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Dimension không khớp: {vectors.shape[1]} != {self.dimension}")
+
+            # Dòng cũ trong ma trận gốc coi như đã xóa; dòng cũ trong delta thì bỏ hẳn
+            self._tombstones.update(self._base_ids[np.isin(self._base_ids, ids)].tolist())
+            if len(self._delta_ids):
+                keep = ~np.isin(self._delta_ids, ids)
+                self._delta_ids = self._delta_ids[keep]
+                self._delta_vectors = self._delta_vectors[keep]
+            self._delta_ids = np.concatenate([self._delta_ids, ids])
+            self._delta_vectors = vectors if self._delta_vectors is None or not len(self._delta_vectors) \
+                else np.vstack([self._delta_vectors, vectors])
+            self._refresh_base_alive()
+
+            if self._hnsw is not None:
+                if self._hnsw.get_current_count() + len(ids) > self._hnsw.get_max_elements():
+                    self._hnsw.resize_index(self._hnsw.get_max_elements() + max(len(ids), 10000))
+                self._hnsw.add_items(vectors, ids, replace_deleted=True)
+
+    def delete(self, ids):
+        """Xóa mềm (tombstone) các ID; dữ liệu thật chỉ bị loại bỏ khi compact()."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        with self._lock:
+            in_base = self._base_ids[np.isin(self._base_ids, ids)]
+            self._tombstones.update(in_base.tolist())
+            if len(self._delta_ids):
+                keep = ~np.isin(self._delta_ids, ids)
+                self._delta_ids = self._delta_ids[keep]
+                self._delta_vectors = self._delta_vectors[keep]
+            self._refresh_base_alive()
+            if self._hnsw is not None:
+                for profile_id in ids.tolist():
+                    try:
+                        self._hnsw.mark_deleted(profile_id)
+                    except RuntimeError:
+                        continue  # ID không có trong đồ thị
+
+    # ------------------------------------------------------------ queries
+    def count(self):
+        return int(self._base_alive.sum()) + len(self._delta_ids)
+
+    def ids(self):
+        """Mảng các ID còn hiệu lực (đã loại tombstone)."""
+        return np.concatenate([self._base_ids[self._base_alive], self._delta_ids])
+
+    def _alive_arrays(self):
+        parts_ids, parts_vectors = [], []
+        if self._base_vectors is not None and len(self._base_ids):
+            parts_ids.append(self._base_ids[self._base_alive])
+            parts_vectors.append(np.asarray(self._base_vectors[self._base_alive], dtype=np.float32))
+        if len(self._delta_ids):
+            parts_ids.append(self._delta_ids)
+            parts_vectors.append(self._delta_vectors)
+        if not parts_ids:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dimension or 0), dtype=np.float32)
+        return np.concatenate(parts_ids), np.vstack(parts_vectors)
+
+    def get_vector(self, profile_id):
+        """Lấy vector đã lưu của một ID (None nếu không có hoặc đã xóa)."""
+        with self._lock:
+            pos = np.flatnonzero(self._delta_ids == profile_id)
+            if len(pos):
+                return self._delta_vectors[pos[-1]].copy()
+            if profile_id in self._tombstones:
+                return None
+            pos = np.flatnonzero(self._base_ids == profile_id)
+            if len(pos):
+                return np.asarray(self._base_vectors[pos[0]], dtype=np.float32)
+        return None
+
+    def search(self, query_vector, limit=10, candidate_ids=None):
+        """Trả về list (id, score) theo cosine giảm dần."""
+        results = self.search_many([query_vector], limit=limit, candidate_ids=candidate_ids)
+        return results[0] if results else []
+
+    def search_many(self, query_vectors, limit=10, candidate_ids=None):
+        """
+        Tìm kiếm nhiều truy vấn cùng lúc.
+        - candidate_ids: nếu có, chỉ chấm điểm các ID này (luôn chính xác, không qua HNSW).
+        """
+        queries = _normalize(query_vectors)
+        with self._lock:
+            if self.count() == 0:
+                return [[] for _ in range(len(queries))]
+            if candidate_ids is not None:
+                return self._score_candidates(queries, candidate_ids, limit)
+            if self._hnsw is not None:
+                return self._search_hnsw(queries, limit)
+            return self._search_exact(queries, limit)
+
+    def _search_hnsw(self, queries, limit):
+        # get_current_count() vẫn tính các phần tử đã mark_deleted; k lớn hơn số phần tử còn sống
+        # làm knn_query báo lỗi, nên dùng count()
+        k = min(limit, self.count())
+        if self._hnsw.ef < k:
+            self._hnsw.set_ef(k)
+        try:
+            labels, distances = self._hnsw.knn_query(queries, k=k)
+        except RuntimeError as e:
+            # Đồ thị có nhiều phần tử đã xóa có thể không tìm đủ k láng giềng
+            print(f"⚠️  HNSW không trả đủ {k} kết quả ({e}), chuyển sang tìm kiếm chính xác.")
+            return self._search_exact(queries, limit)
+        # space="ip": distance = 1 - dot
+        return [
+            [(int(label), float(1.0 - dist)) for label, dist in zip(row_labels, row_dists)]
+            for row_labels, row_dists in zip(labels, distances)
+        ]
+
+    def _search_exact(self, queries, limit):
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+
+        def merge(scores, ids):
+            nonlocal best_scores, best_ids
+            scores = np.concatenate([best_scores, scores], axis=1)
+            ids = np.concatenate([best_ids, np.broadcast_to(ids, (len(queries), len(ids)))], axis=1)
+            if scores.shape[1] > limit:
+                top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+                scores = np.take_along_axis(scores, top, axis=1)
+                ids = np.take_along_axis(ids, top, axis=1)
+            best_scores, best_ids = scores, ids
+
+        if self._base_vectors is not None:
+            for start in range(0, len(self._base_ids), SEARCH_CHUNK_ROWS):
+                block = np.asarray(self._base_vectors[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+                scores = queries @ block.T
+                alive = self._base_alive[start:start + SEARCH_CHUNK_ROWS]
+                if not alive.all():
+                    scores[:, ~alive] = -np.inf
+                merge(scores, self._base_ids[start:start + SEARCH_CHUNK_ROWS])
+        if len(self._delta_ids):
+            merge(queries @ self._delta_vectors.T, self._delta_ids)
+
+        results = []
+        for scores, ids in zip(best_scores, best_ids):
+            order = np.argsort(-scores)
+            results.append([(int(ids[i]), float(scores[i])) for i in order if np.isfinite(scores[i])])
+        return results
+
+    def _score_candidates(self, queries, candidate_ids, limit):
+        candidate_ids = np.asarray(list(candidate_ids), dtype=np.int64)
+        ids, vectors = [], []
+        if len(self._delta_ids):
+            mask = np.isin(self._delta_ids, candidate_ids)
+            ids.append(self._delta_ids[mask])
+            vectors.append(self._delta_vectors[mask])
+        if self._base_vectors is not None:
+            rows = np.flatnonzero(np.isin(self._base_ids, candidate_ids) & self._base_alive)
+            ids.append(self._base_ids[rows])
+            vectors.append(np.asarray(self._base_vectors[rows], dtype=np.float32))
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+        if not len(ids):
+            return [[] for _ in range(len(queries))]
+        scores = queries @ np.vstack(vectors).T
+        results = []
+        for row in scores:
+            order = np.argsort(-row)[:limit]
+            results.append([(int(ids[i]), float(row[i])) for i in order])
+        return results
+
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_index(path=LOCAL_INDEX_PATH, create=False):
+    """
+    Lấy chỉ mục cục bộ (singleton theo tiến trình).
+    Trả về None nếu chưa được build, trừ khi create=True (khi đó trả về chỉ mục rỗng).
+    """
+    global _local_index
+    with _local_index_lock:
+        if _local_index is None:
+            index = LocalVectorIndex(path)
+            if index.exists():
+                index.load()
+            elif not create:
+                return None
+            _local_index = index
+        else:
+            try:
+                _local_index.reload_if_changed()
+            except Exception as e:
+                print(f"⚠️  Không thể nạp lại chỉ mục vector cục bộ: {e}")
+    return _local_index
+
+
+def add_to_local_index(profile_id, embedding):
+    """Thêm/cập nhật vector của một hồ sơ vào chỉ mục cục bộ (bỏ qua nếu chưa build)."""
+    try:
+        index = get_local_index()
+        if index is None:
+            return False
+        with index.exclusive():
+            index.add([int(profile_id)], [embedding])
+            index.save()
+        print(f"Profile {profile_id} đã được thêm vào chỉ mục vector cục bộ.")
+        return True
+    except Exception as e:
+        print(f"Lỗi khi thêm profile {profile_id} vào chỉ mục vector cục bộ: {e}")
+        return False
+
+
+def delete_from_local_index(profile_id):
+    """Đánh tombstone vector của một hồ sơ trong chỉ mục cục bộ (bỏ qua nếu chưa build)."""
+    try:
+        index = get_local_index()
+        if index is None:
+            return False
+        with index.exclusive():
+            index.delete([int(profile_id)])
+            index.save()
+        print(f"Đã xóa profile {profile_id} khỏi chỉ mục vector cục bộ.")
+        return True
+    except Exception as e:
+        print(f"Lỗi khi xóa profile {profile_id} khỏi chỉ mục vector cục bộ: {e}")
+        return False
+
+
+def build_local_index_from_qdrant(path=LOCAL_INDEX_PATH, batch_size=1000):
+    """Scroll toàn bộ vector từ Qdrant và ghi thành chỉ mục cục bộ."""
+    from .qdrant_helper import get_qdrant_client, get_qdrant_collection
+
+    client = get_qdrant_client()
+    collection_name = get_qdrant_collection()
+    if collection_name is None:
+        print("Không có collection Qdrant để xây chỉ mục cục bộ.")
+        return None
+
+    ids, vectors = [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=["id"],
+            with_vectors=True,
+        )
+        for point in points:
+            db_id = (point.payload or {}).get("id") or point.id
+            try:
+                ids.append(int(db_id))
+            except (ValueError, TypeError):
+                continue
+            vectors.append(point.vector)
+        print(f"Đã đọc {len(ids)} vector từ Qdrant...")
+        if offset is None:
+            break
+
+    index = LocalVectorIndex(path)
+    index.write_base(ids, np.asarray(vectors, dtype=np.float32))
+    return index
+
+
+def build_local_index_from_jsonl(input_path, path=LOCAL_INDEX_PATH):
+    """Xây chỉ mục cục bộ từ file JSONL export (mỗi dòng: {"id", "values", "metadata"})."""
+    ids, vectors = [], []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            db_id = (data.get("metadata") or {}).get("id") or data["id"]
+            try:
+                ids.append(int(db_id))
+            except (ValueError, TypeError):
+                continue
+            vectors.append(data["values"])
+
+    index = LocalVectorIndex(path)
+    index.write_base(ids, np.asarray(vectors, dtype=np.float32))
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Quản lý chỉ mục vector cục bộ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Xây chỉ mục từ Qdrant hoặc file JSONL")
+    build.add_argument("--source", choices=["qdrant", "jsonl", "snapshot"], default="qdrant")
+    build.add_argument("--input", help="Đường dẫn file JSONL / thư mục snapshot (khi --source jsonl/snapshot)")
+    build.add_argument("--path", default=LOCAL_INDEX_PATH)
+    compact = sub.add_parser("compact", help="Gộp delta/tombstone vào ma trận gốc")
+    compact.add_argument("--path", default=LOCAL_INDEX_PATH)
+    args = parser.parse_args()
+
+    started = time.time()
+    if args.command == "build":
+        if args.source == "qdrant":
+            built = build_local_index_from_qdrant(args.path)
+        elif args.source == "snapshot":
+            from .snapshot import import_snapshot_to_local_index
+            built = import_snapshot_to_local_index(args.input, args.path)
+        else:
+            built = build_local_index_from_jsonl(args.input, args.path)
+        if built is not None:
+            print(f"✅ Đã xây chỉ mục với {built.count()} vector trong {time.time() - started:.1f}s.")
+    else:
+        index = LocalVectorIndex(args.path).load()
+        index.compact()
+        print(f"✅ Đã compact chỉ mục: {index.count()} vector trong {time.time() - started:.1f}s.")
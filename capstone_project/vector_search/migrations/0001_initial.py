@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-19 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingVersion',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Version name')),
+                ('model_name', models.CharField(max_length=255, verbose_name='Embedding model')),
+                ('dimension', models.IntegerField(blank=True, null=True, verbose_name='Output dimensionality')),
+                ('collection_name', models.CharField(max_length=255, unique=True, verbose_name='Qdrant collection')),
+                ('status', models.CharField(choices=[('building', 'Building'), ('shadow', 'Shadow'), ('active', 'Active'), ('retired', 'Retired'), ('deleted', 'Deleted')], default='building', max_length=20, verbose_name='Status')),
+                ('indexed_count', models.IntegerField(default=0, verbose_name='Indexed profiles')),
+                ('last_indexed_profile_id', models.IntegerField(default=0, verbose_name='Build checkpoint')),
+                ('metrics', models.JSONField(blank=True, default=dict, verbose_name='Shadow metrics')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+from capstone_project.ids import next_id
+
+
+class EmbeddingVersion(models.Model):
+    """
+    Một phiên bản embedding (model + số chiều) cùng collection Qdrant riêng của nó.
+    Tìm kiếm luôn dùng collection của phiên bản 'active'; alias QDRANT_COLLECTION_NAME (nếu là alias)
+    cũng được chuyển theo (xem vector_search/embedding_versions.py).
+    """
+    STATUS_CHOICES = (
+        ('building', _('Building')),   # Đang embed lại toàn bộ hồ sơ ở nền
+        ('shadow', _('Shadow')),       # Đã build xong, chờ so sánh và chuyển đổi
+        ('active', _('Active')),       # Đang phục vụ tìm kiếm
+        ('retired', _('Retired')),     # Phiên bản cũ, vẫn giữ collection để rollback
+        ('deleted', _('Deleted')),     # Đã xóa collection
+    )
+
+    id = models.IntegerField(primary_key=True)
+    name = models.CharField(_("Version name"), max_length=100, unique=True)
+    model_name = models.CharField(_("Embedding model"), max_length=255)
+    dimension = models.IntegerField(_("Output dimensionality"), null=True, blank=True)
+    collection_name = models.CharField(_("Qdrant collection"), max_length=255, unique=True)
+    status = models.CharField(_("Status"), max_length=20, choices=STATUS_CHOICES, default='building')
+    indexed_count = models.IntegerField(_("Indexed profiles"), default=0)
+    last_indexed_profile_id = models.IntegerField(_("Build checkpoint"), default=0)
+    metrics = models.JSONField(_("Shadow metrics"), default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.name} ({self.model_name}, {self.status})"
+
+    def save(self, *args, **kwargs):
+        if self.id is None:
+            self.id = next_id(EmbeddingVersion)
+        super().save(*args, **kwargs)
@@ -0,0 +1,295 @@
+"""
+Kiểm duyệt nội dung (truy vấn tìm kiếm, mô tả hồ sơ) nhiều tầng, để bật lại kiểm duyệt mà không tốn
+một lần gọi Gemini cho mỗi request:
+
+  1. cache: kết luận được lưu theo hash của nội dung đã chuẩn hóa (MODERATION_CACHE_SECONDS)
+  2. tầng cục bộ (< 1 ms):
+       - danh sách từ cấm / từ nhạy cảm, so khớp Aho-Corasick trên văn bản đã chuẩn hóa
+         (chữ thường, leetspeak "d1t" -> "dit", ký tự lặp, chữ tách bằng dấu câu "đ.ị.t" -> "địt");
+         từ có dấu so khớp có dấu ("lồn" khác "lớn"); từ lóng không dấu so khớp trên văn bản bỏ dấu nhưng chỉ
+         đánh dấu cần xem xét ("du me" có thể là "Dù mẹ...", "dm"/"vl" có thể là chữ viết tắt tên người)
+       - heuristic: đường link, số điện thoại, spam (ký tự / từ lặp lại, viết hoa toàn bộ, emoji)
+     kết luận: chặn (từ cấm) | cho phép (không có dấu hiệu gì) | cần xem xét
+  3. chỉ nội dung "cần xem xét" mới được gửi sang Gemini (MODERATION_LLM_ENABLED)
+
+Lỗi Gemini -> cho phép tạm thời (giống trước đây).
+"""
+import hashlib
+import json
+import random
+import re
+import unicodedata
+from collections import deque
+
+from django.core.cache import cache
+
+from .config import (
+    GEMINI_API_KEYS,
+    GEMINI_MODERATION_MODEL,
+    MODERATION_LLM_ENABLED,
+    MODERATION_CACHE_SECONDS,
+)
+from .text_utils import fold_diacritics
+
+ALLOW, BLOCK, REVIEW = "allow", "block", "review"
+
+# Từ thô tục nặng -> chặn ngay (chỉ so khớp đúng dạng có dấu)
+BLOCK_TERMS = (
+    "địt", "đụ má", "đụ mẹ", "đụ mày", "lồn", "cặc", "buồi", "đéo", "con đĩ", "đồ đĩ",
+    "thằng chó đẻ", "đồ chó đẻ", "đm", "đmm", "đcm", "đkm", "fuck", "shit", "bitch",
+)
+# Nội dung nhạy cảm nhưng có thể hợp lệ trong bối cảnh tìm người thân -> cần xem xét
+REVIEW_TERMS = (
+    # quảng cáo, lừa đảo
+    "cho vay", "vay tiền", "lãi suất", "cá độ", "nhà cái", "tài xỉu", "lô đề", "số đề", "kiếm tiền online",
+    "việc nhẹ lương cao", "đa cấp", "nạp tiền", "chuyển khoản", "mã giảm giá", "khuyến mãi", "giảm giá",
+    "mua ngay", "đặt hàng", "liên hệ ngay",
+    # thông tin nhạy cảm
+    "số tài khoản", "mật khẩu", "căn cước", "chứng minh nhân dân",
+    # thù ghét, bạo lực
+    "mọi rợ", "khựa", "phản động", "khủng bố", "giết chết", "chém chết", "trả thù", "đánh chết",
+    # xúc phạm nhưng cũng có nghĩa bình thường ("chăn nuôi súc vật", lời kể "mẹ mày đi chợ rồi")
+    "súc vật", "mẹ mày", "bố mày", "óc lợn",
+)
+# So khớp trên văn bản bỏ dấu -> chỉ cần xem xét, không bao giờ chặn ngay
+REVIEW_TERMS_FOLDED = (
+    # từ lóng viết tắt / không dấu
+    "dm", "dmm", "dcm", "dkm", "vcl", "vkl", "vl", "clgt", "cmm", "dit me", "dit con me", "du ma", "du me",
+    "casino", "stk", "otp", "cmnd", "cccd", "zalo", "telegram", "inbox", "sex", "xxx", "porn", "18+", "bet",
+)
+
+_LEET = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"})
+_NON_WORD_RE = re.compile(r"[^\w+]+", re.UNICODE)
+# Chữ cái đơn nối bằng dấu câu: "đ.m", "đ-m", "đ.ị.t" (không gồm dấu cách: "xã Đ M", "Văn B ở" là chữ viết tắt)
+_SPLIT_LETTERS_RE = re.compile(r"(?<![\w+])\w(?:(?:[^\w\s+]|_)+\w)+(?![\w+])", re.UNICODE)
+_SEPARATOR_RE = re.compile(r"[^\w+]|_", re.UNICODE)
+_REPEAT_RE = re.compile(r"(\w)\1{2,}", re.UNICODE)
+_URL_RE = re.compile(r"https?://|www\.|\bt\.me/|\bbit\.ly/|\b[\w-]+\.(?:com|net|org|vn|info|xyz|top|io|me|link|club|site)\b",
+                     re.IGNORECASE)
+_PHONE_RE = re.compile(r"(?<!\d)(?:\+?84|0)(?:[\s.\-]?\d){8,10}(?!\d)")
+_LONG_RUN_RE = re.compile(r"(.)\1{5,}")
+_EMOJI_RE = re.compile("[\U0001F300-\U0001FAFF☀-➿]")
+
+
+class AhoCorasick:
+    """Automaton Aho-Corasick: tìm mọi mẫu trong văn bản với một lần duyệt."""
+
+    def __init__(self, patterns):
+        """patterns: dict {mẫu: giá trị trả về khi khớp}."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern, value in patterns.items():
+            state = 0
+            for ch in pattern:
+                if ch not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][ch] = len(self._goto) - 1
+                state = self._goto[state][ch]
+            self._out[state].append(value)
+
+        # Duyệt theo chiều rộng: liên kết fail của con = trạng thái dài nhất khớp hậu tố
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0) if state else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text):
+        """Giá trị của các mẫu xuất hiện trong text (có thể lặp lại)."""
+        state = 0
+        found = []
+        for ch in text:
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            if self._out[state]:
+                found.extend(self._out[state])
+        return found
+
+
+def _unleet(token):
+    # Chỉ đổi số -> chữ trong token lẫn cả chữ và số ("d1t"), giữ nguyên năm, số điện thoại
+    if any(ch.isalpha() for ch in token) and any(not ch.isalpha() for ch in token):
+        return token.translate(_LEET)
+    return token
+
+
+def _join_split_letters(match):
+    run = match.group(0)
+    parts = [part for part in _SEPARATOR_RE.split(run) if part]
+    return "".join(parts) if all(len(part) == 1 for part in parts) else run
+
+
+def normalize_text(text):
+    """Chuẩn hóa để so khớp: chữ thường, leetspeak, bỏ ký tự lặp, ghép chữ tách bằng dấu câu ("đ.ị.t" -> "địt")."""
+    text = unicodedata.normalize("NFC", str(text or "")).lower()
+    text = _SPLIT_LETTERS_RE.sub(_join_split_letters, text)
+    text = _REPEAT_RE.sub(r"\1", _NON_WORD_RE.sub(" ", text))
+    return " ".join(map(_unleet, text.split()))
+
+
+def _build_matcher(block_terms, review_terms, normalize):
+    """Mẫu được bao dấu cách (văn bản cũng vậy) để chỉ khớp nguyên từ; giá trị trả về: (loại, từ)."""
+    patterns = {f" {normalize(t)} ": (REVIEW, t) for t in review_terms}
+    patterns.update({f" {normalize(t)} ": (BLOCK, t) for t in block_terms})
+    return AhoCorasick(patterns)
+
+
+_ACCENTED_MATCHER = _build_matcher(BLOCK_TERMS, REVIEW_TERMS, normalize_text)
+_FOLDED_MATCHER = _build_matcher((), REVIEW_TERMS_FOLDED, lambda t: fold_diacritics(normalize_text(t)))
+
+
+def _heuristics(text, words, kind):
+    """Dấu hiệu spam / thông tin nhạy cảm (không có từ cấm)."""
+    reasons = []
+    urls = len(_URL_RE.findall(text))
+    phones = len(_PHONE_RE.findall(text))
+    if urls:
+        reasons.append(f"chứa {urls} đường link")
+    # Hồ sơ thường ghi một số điện thoại liên hệ; truy vấn tìm kiếm thì không cần
+    if phones > (1 if kind == "profile" else 0):
+        reasons.append(f"chứa {phones} số điện thoại")
+    if _LONG_RUN_RE.search(text):
+        reasons.append("ký tự lặp lại nhiều lần")
+    if len(_EMOJI_RE.findall(text)) > 10:
+        reasons.append("quá nhiều emoji")
+    letters = [ch for ch in text if ch.isalpha()]
+    if len(letters) >= 30 and sum(ch.isupper() for ch in letters) / len(letters) > 0.7:
+        reasons.append("viết hoa toàn bộ")
+    if len(words) >= 20 and len(set(words)) / len(words) < 0.3:
+        reasons.append("từ ngữ lặp lại nhiều lần")
+    if kind == "profile" and len(words) < 5:
+        reasons.append("mô tả quá ngắn, không rõ nội dung tìm kiếm")
+    return reasons
+
+
+def classify_locally(text, kind="search"):
+    """
+    Phân loại cục bộ: (verdict, reasons) với verdict ALLOW | BLOCK | REVIEW.
+    kind: "search" (truy vấn tìm kiếm) hoặc "profile" (mô tả hồ sơ).
+    """
+    normalized = normalize_text(text)
+    folded = fold_diacritics(normalized)
+    matches = _ACCENTED_MATCHER.find(f" {normalized} ") + _FOLDED_MATCHER.find(f" {folded} ")
+    blocked = sorted({term for verdict, term in matches if verdict == BLOCK})
+    if blocked:
+        return BLOCK, [f"ngôn từ thô tục/xúc phạm ({', '.join(blocked)})"]
+    reasons = [f"từ ngữ nhạy cảm: {term}" for verdict, term in dict.fromkeys(matches) if verdict == REVIEW]
+    reasons += _heuristics(str(text), normalized.split(), kind)
+    return (REVIEW if reasons else ALLOW), reasons
+
+
+MODERATION_PROMPT = """
+Tưởng tượng bạn là một nhà kiểm duyệt các nội dung tìm kiếm cho một chương trình tìm kiếm người thất lạc.
+Hãy kiểm duyệt {subject} dưới đây và xác định xem nó có phù hợp để sử dụng trong hệ thống tìm kiếm người thất lạc hay không.
+{extra}
+Nội dung cần kiểm duyệt:
+{text}
+
+Bộ lọc tự động đã đánh dấu nội dung này vì: {reasons}. Đây chỉ là dấu hiệu, hãy tự đánh giá.
+
+Hãy kiểm tra các tiêu chí sau:
+1. Không chứa nội dung bạo lực, phân biệt chủng tộc, tôn giáo, giới tính
+2. Không chứa ngôn từ xúc phạm, thô tục
+3. Không chứa thông tin cá nhân nhạy cảm không liên quan đến việc tìm kiếm người thất lạc
+4. Không chứa nội dung quảng cáo, spam
+5. Không chứa nội dung lừa đảo, giả mạo
+
+Trả về kết quả dưới dạng JSON với các trường sau:
+{{
+    "is_appropriate": true/false,
+    "feedback": "Lý do tại sao nội dung (không) phù hợp"
+}}
+* Lưu ý: Không nên quá khắt khe trong nội dung kiểm duyệt. Nội dùng tìm kiếm khá là đa dạng nên không phải lúc nào xuất
+hiện những từ ngữ liên quan đến tiêu chuẩn là bị cho là không phù hợp. Hãy phân tích nội dung thật kỹ để tránh đưa ra những kết luận quá
+khắt khe khiến cho việc xử lý tìm kiếm cho người dùng gặp thất bại.
+Ví dụ:
++ Tìm kiếm con lai thì là nội dung bình thường, không phải là nội dung kì thị - phân biệt
++ Những hồ sơ nào có liên quan đến đặc điểm nhận dạng trên cơ thể cũng là nội dung bình thường, không phải là nội dung thô tục, khiêu dâm, ...
++ Chiến tranh, bom đạn, bị đánh đập, bị bắt cóc... là hoàn cảnh thất lạc bình thường
+"""
+
+
+def moderate_with_llm(text, kind="search", reasons=()):
+    """Hỏi Gemini cho nội dung cần xem xét. Trả về (is_appropriate, feedback), hoặc None nếu lỗi API / phản hồi."""
+    from .llm_utils import call_gemini_rest
+
+    if not GEMINI_API_KEYS:
+        print("Không có API key Gemini để kiểm duyệt nội dung")
+        return None
+    if kind == "profile":
+        subject, extra = "mô tả hồ sơ tìm người thân", (
+            "Những nội dung không có ý nghĩa là đăng tin tìm kiếm người thất lạc cũng được coi là không phù hợp.\n")
+    else:
+        subject, extra = "nội dung truy vấn tìm kiếm", ""
+    prompt = MODERATION_PROMPT.format(subject=subject, extra=extra, text=text, reasons="; ".join(reasons) or "không rõ")
+
+    start = random.randrange(len(GEMINI_API_KEYS))
+    for i in range(len(GEMINI_API_KEYS)):
+        api_key = GEMINI_API_KEYS[(start + i) % len(GEMINI_API_KEYS)]
+        generated_text = call_gemini_rest(prompt, api_key, GEMINI_MODERATION_MODEL, "moderation",
+                                          temperature=0.2, max_output_tokens=256)
+        if generated_text is None:
+            continue
+        json_match = re.search(r"({[\s\S]*})", generated_text)
+        if not json_match:
+            print("Không tìm thấy chuỗi JSON trong phản hồi kiểm duyệt của LLM")
+            return None
+        try:
+            result = json.loads(json_match.group(1))
+        except json.JSONDecodeError as e:
+            print(f"Không thể phân tích JSON từ phản hồi LLM: {e}")
+            return None
+        return bool(result.get("is_appropriate", True)), result.get("feedback", "")
+    return None
+
+
+def _cache_key(text, kind):
+    digest = hashlib.sha1(f"{kind}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+    return f"moderation:{digest}"
+
+
+def moderate_text(text, kind="search", use_llm=MODERATION_LLM_ENABLED):
+    """
+    Kiểm duyệt một đoạn nội dung. Trả về (is_appropriate, feedback).
+    Chỉ nội dung tầng cục bộ đánh giá "cần xem xét" mới tốn một lần gọi Gemini.
+    """
+    if not text or not str(text).strip():
+        return True, ""
+    key = _cache_key(text, kind)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        print(f"Không thể đọc cache kiểm duyệt: {e}")
+        cached = None
+    if cached is not None:
+        return tuple(cached)
+
+    verdict, reasons = classify_locally(text, kind)
+    if verdict == BLOCK:
+        result = (False, "Nội dung không phù hợp: " + "; ".join(reasons))
+    elif verdict == ALLOW:
+        result = (True, "Nội dung phù hợp")
+    elif use_llm:
+        print(f"Kiểm duyệt: nội dung cần xem xét ({'; '.join(reasons)}), hỏi Gemini...")
+        result = moderate_with_llm(text, kind, reasons)
+        if result is None:
+            # Lỗi Gemini: cho phép tạm thời, không lưu cache để lần sau thử lại
+            return True, "Không thể kiểm duyệt nội dung do lỗi API, cho phép tạm thời"
+    else:
+        result = (True, "Nội dung có dấu hiệu cần xem xét: " + "; ".join(reasons))
+    print(f"Kiểm duyệt ({kind}): {verdict} -> {'phù hợp' if result[0] else 'không phù hợp'}")
+
+    try:
+        cache.set(key, result, MODERATION_CACHE_SECONDS)
+    except Exception as e:
+        print(f"Không thể lưu cache kiểm duyệt: {e}")
+    return result
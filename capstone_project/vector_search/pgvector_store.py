@@ -0,0 +1,273 @@
+"""
+Lưu embedding hồ sơ trong Postgres bằng extension pgvector (thay cho Qdrant khi bật USE_PGVECTOR).
+
+Bảng PGVECTOR_TABLE (profile_id -> embedding) nằm cạnh bảng Profile, khóa ngoại ON DELETE CASCADE nên
+xóa hồ sơ là xóa luôn vector. Một truy vấn SQL duy nhất trả về: top-k theo cosine (index HNSW/IVFFlat),
+hồ sơ khớp từ khóa, điểm kết hợp và các field cần cho kết quả - không cần đọc toàn bộ bảng Profile
+rồi ghép theo payload['id'] trong Python.
+
+Chạy thử với Postgres cục bộ:
+    docker run -d --name pgvector -e POSTGRES_PASSWORD=postgres -p 5432:5432 pgvector/pgvector:pg16
+    export DB_HOST=localhost DB_PORT=5432 DB_USER=postgres DB_PASSWORD=postgres DB_NAME=postgres
+    python manage.py migrate
+    python -m vector_search.pgvector_store build --source qdrant      # hoặc --source snapshot --input exports/snapshot
+    USE_PGVECTOR=true python manage.py runserver
+"""
+import argparse
+import time
+
+import numpy as np
+from django.db import connection, transaction
+
+from .config import (
+    PGVECTOR_TABLE,
+    PGVECTOR_INDEX_TYPE,
+    PGVECTOR_HNSW_M,
+    PGVECTOR_HNSW_EF_CONSTRUCTION,
+    PGVECTOR_IVFFLAT_LISTS,
+    PGVECTOR_IVFFLAT_PROBES,
+    PGVECTOR_TOP_K,
+)
+
+# Các cột văn bản của Profile được đếm khớp từ khóa (giống _count_keyword_matches trên DataFrame)
+KEYWORD_COLUMNS = (
+    "title", "full_name", "born_year", "losing_year", "description",
+    "name_of_father", "name_of_mother", "siblings", "status",
+)
+# Cột trả về, cùng tên cột với fetch_profiles_from_db
+RESULT_COLUMNS = (
+    ("id", "id"), ("title", "Tiêu đề"), ("full_name", "Họ và tên"), ("born_year", "Năm sinh"),
+    ("losing_year", "Năm thất lạc"), ("description", "Chi tiet_merged"), ("name_of_father", "Tên cha"),
+    ("name_of_mother", "Tên mẹ"), ("siblings", "Anh chị em"), ("status", "status"),
+    ("created_at", "created_at"), ("updated_at", "updated_at"), ("llm_digest", "llm_digest"),
+)
+
+
+def _profile_table():
+    from profiles.models import Profile
+
+    return connection.ops.quote_name(Profile._meta.db_table)
+
+
+def _table():
+    return connection.ops.quote_name(PGVECTOR_TABLE)
+
+
+def _vector_literal(embedding):
+    """pgvector nhận vector dạng chuỗi '[x1,x2,...]' (không cần thư viện pgvector cho Python)."""
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+def ensure_schema(dimension, index_type=PGVECTOR_INDEX_TYPE):
+    """Tạo extension, bảng embedding và index ANN (idempotent)."""
+    table = _table()
+    index_name = connection.ops.quote_name(f"{PGVECTOR_TABLE}_embedding_{index_type}")
+    if index_type == "ivfflat":
+        index_sql = (f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} "
+                     f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {int(PGVECTOR_IVFFLAT_LISTS)})")
+    else:
+        index_sql = (f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} "
+                     f"USING hnsw (embedding vector_cosine_ops) "
+                     f"WITH (m = {int(PGVECTOR_HNSW_M)}, ef_construction = {int(PGVECTOR_HNSW_EF_CONSTRUCTION)})")
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f" profile_id integer PRIMARY KEY REFERENCES {_profile_table()} (id) ON DELETE CASCADE,"
+            f" embedding vector({int(dimension)}) NOT NULL,"
+            f" updated_at timestamptz NOT NULL DEFAULT now())"
+        )
+        cursor.execute(index_sql)
+    print(f"Đã đảm bảo bảng pgvector {PGVECTOR_TABLE} (dim={dimension}, index={index_type}).")
+
+
+def upsert_embeddings(rows):
+    """Upsert nhiều (profile_id, embedding) trong một lệnh executemany."""
+    rows = [(int(pid), _vector_literal(emb)) for pid, emb in rows]
+    if not rows:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {_table()} (profile_id, embedding) VALUES (%s, %s::vector) "
+            f"ON CONFLICT (profile_id) DO UPDATE SET embedding = EXCLUDED.embedding, updated_at = now()",
+            rows,
+        )
+    return len(rows)
+
+
+def upsert_profile_embedding(profile_id, embedding):
+    """Lưu embedding của một hồ sơ. Trả về True nếu thành công."""
+    try:
+        upsert_embeddings([(profile_id, embedding)])
+        print(f"Profile {profile_id} embedded and upserted into pgvector.")
+        return True
+    except Exception as e:
+        print(f"Lỗi khi lưu embedding profile {profile_id} vào pgvector: {e}")
+        return False
+
+
+def get_profile_embedding(profile_id):
+    """Embedding đã lưu của một hồ sơ (list float), None nếu chưa có."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT embedding::text FROM {_table()} WHERE profile_id = %s", [int(profile_id)])
+        row = cursor.fetchone()
+    return [float(x) for x in row[0].strip("[]").split(",")] if row else None
+
+
+def _keyword_sql(keywords):
+    """(biểu thức đếm khớp, điều kiện có ít nhất 1 khớp, params) - khớp không phân biệt hoa thường."""
+    terms, params = [], []
+    for keyword in keywords:
+        for column in KEYWORD_COLUMNS:
+            terms.append(f"(strpos(lower(coalesce(p.{column}, '')), lower(%s)) > 0)")
+            params.append(keyword)
+    if not terms:
+        return "0", "false", []
+    return " + ".join(f"{t}::int" for t in terms), " OR ".join(terms), params
+
+
+def _constraint_sql(constraints):
+    """Ràng buộc năm sinh/năm thất lạc/tên cha mẹ (hồ sơ không có giá trị vẫn được giữ, như trên Qdrant)."""
+    conditions, params = [], []
+    for column in ("born_year", "losing_year"):
+        if column in (constraints or {}):
+            lo, hi = constraints[column]
+            year = f"substring(p.{column} from '(\\d{{4}})')::int"
+            conditions.append(f"({year} IS NULL OR {year} BETWEEN %s AND %s)")
+            params.extend([lo, hi])
+    for name in (constraints or {}).get("parent_names", []):
+        conditions.append(
+            "(coalesce(p.name_of_father, '') || coalesce(p.name_of_mother, '') = '' OR "
+            "strpos(lower(unaccent(coalesce(p.name_of_father, '') || ' ' || coalesce(p.name_of_mother, ''))), %s) > 0)"
+        )
+        params.append(name.lower())
+    return (" AND ".join(conditions) if conditions else "true"), params
+
+
+def search_profiles(query_embedding, keywords, limit=100, top_k=PGVECTOR_TOP_K, keyword_bonus=0.05,
+                    constraints=None):
+    """
+    Một truy vấn: ứng viên = top_k vector gần nhất ∪ hồ sơ khớp từ khóa (đều thỏa constraints),
+    điểm = cosine + số từ khóa khớp × keyword_bonus, trả về `limit` hồ sơ điểm cao nhất.
+    Trả về list dict: các cột RESULT_COLUMNS + vector_score + keyword_count + total_score.
+    query_embedding=None: chỉ xếp hạng theo từ khóa.
+    """
+    kw_count_sql, kw_any_sql, kw_params = _keyword_sql(keywords or [])
+    where_sql, where_params = _constraint_sql(constraints)
+    select_columns = ", ".join(f"p.{column}" for column, _ in RESULT_COLUMNS)
+
+    if query_embedding is not None:
+        vector = _vector_literal(query_embedding)
+        knn_sql = (f"SELECT e.profile_id FROM {_table()} e JOIN {_profile_table()} p ON p.id = e.profile_id "
+                   f"WHERE {where_sql} ORDER BY e.embedding <=> %s::vector LIMIT %s")
+        knn_params = where_params + [vector, int(top_k)]
+        score_sql = "coalesce(1 - (e.embedding <=> %s::vector), 0)"
+        score_params = [vector]
+    else:
+        knn_sql = "SELECT NULL::integer AS profile_id WHERE false"
+        knn_params = []
+        score_sql = "0.0"
+        score_params = []
+
+    sql = f"""
+        WITH knn AS ({knn_sql}),
+        kw AS (
+            SELECT p.id AS profile_id, ({kw_count_sql}) AS keyword_count
+            FROM {_profile_table()} p
+            WHERE ({kw_any_sql}) AND {where_sql}
+        ),
+        candidates AS (SELECT profile_id FROM knn UNION SELECT profile_id FROM kw),
+        scored AS (
+            SELECT {select_columns},
+                   {score_sql} AS vector_score,
+                   coalesce(kw.keyword_count, 0) AS keyword_count
+            FROM candidates c
+            JOIN {_profile_table()} p ON p.id = c.profile_id
+            LEFT JOIN {_table()} e ON e.profile_id = p.id
+            LEFT JOIN kw ON kw.profile_id = p.id
+        )
+        SELECT *, vector_score + keyword_count * %s AS total_score
+        FROM scored
+        ORDER BY total_score DESC
+        LIMIT %s
+    """
+    # kw_params xuất hiện hai lần: biểu thức đếm và điều kiện WHERE
+    params = knn_params + kw_params + kw_params + where_params + score_params + [keyword_bonus, int(limit)]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # ef_search/probes phải >= top_k để index ANN trả đủ ứng viên (SET LOCAL: chỉ trong transaction này)
+        if PGVECTOR_INDEX_TYPE == "ivfflat":
+            cursor.execute(f"SET LOCAL ivfflat.probes = {int(PGVECTOR_IVFFLAT_PROBES)}")
+        else:
+            cursor.execute(f"SET LOCAL hnsw.ef_search = {max(int(top_k), 40)}")
+        cursor.execute(sql, params)
+        names = [col[0] for col in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def build_from_qdrant(batch_size=1000):
+    """Sao chép toàn bộ vector từ Qdrant sang pgvector (bỏ qua point không còn hồ sơ)."""
+    from profiles.models import Profile
+    from .qdrant_helper import get_qdrant_client, get_qdrant_collection
+
+    client = get_qdrant_client()
+    collection_name = get_qdrant_collection()
+    if collection_name is None:
+        print("Không có collection Qdrant để sao chép.")
+        return 0
+    existing = set(Profile.objects.values_list("id", flat=True))
+    total = 0
+    schema_ready = False
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, limit=batch_size, offset=offset,
+                                       with_payload=False, with_vectors=True)
+        rows = []
+        for point in points:
+            vector = point.vector.get("") if isinstance(point.vector, dict) else point.vector
+            if vector is not None and int(point.id) in existing:
+                rows.append((int(point.id), vector))
+        if rows and not schema_ready:
+            ensure_schema(len(rows[0][1]))
+            schema_ready = True
+        total += upsert_embeddings(rows)
+        print(f"Đã sao chép {total} vector sang pgvector...")
+        if offset is None:
+            break
+    return total
+
+
+def build_from_snapshot(snapshot_path, batch_size=1000):
+    """Nạp vector từ snapshot nhị phân (xem snapshot.py)."""
+    from profiles.models import Profile
+    from .snapshot import load_snapshot
+
+    snapshot = load_snapshot(snapshot_path)
+    ensure_schema(snapshot.manifest["dimension"])
+    existing = np.fromiter(Profile.objects.values_list("id", flat=True), dtype=np.int64)
+    total = 0
+    for ids, vectors, _, _ in snapshot.iter_batches(batch_size, with_metadata=False):
+        keep = np.isin(np.asarray(ids, dtype=np.int64), existing)
+        total += upsert_embeddings([(pid, vec) for pid, vec, ok in zip(ids, vectors, keep) if ok])
+        print(f"Đã nạp {total} vector sang pgvector...")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quản lý bảng embedding pgvector")
+    sub = parser.add_subparsers(dest="command", required=True)
+    schema = sub.add_parser("schema", help="Tạo extension/bảng/index")
+    schema.add_argument("--dimension", type=int, required=True)
+    schema.add_argument("--index", choices=["hnsw", "ivfflat"], default=PGVECTOR_INDEX_TYPE)
+    build = sub.add_parser("build", help="Nạp embedding từ Qdrant hoặc snapshot")
+    build.add_argument("--source", choices=["qdrant", "snapshot"], default="qdrant")
+    build.add_argument("--input", help="Thư mục snapshot (khi --source snapshot)")
+    args = parser.parse_args()
+
+    started = time.time()
+    if args.command == "schema":
+        ensure_schema(args.dimension, args.index)
+    else:
+        count = build_from_qdrant() if args.source == "qdrant" else build_from_snapshot(args.input)
+        print(f"✅ Đã nạp {count} vector trong {time.time() - started:.1f}s.")
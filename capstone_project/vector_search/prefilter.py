@@ -0,0 +1,183 @@
+"""
+Lọc sơ bộ (không gọi LLM) các ứng viên mâu thuẫn rõ ràng với truy vấn trước bước parallel_verify.
+
+So khớp trên các trường có cấu trúc của hồ sơ (Năm sinh, Năm thất lạc, Tên cha, Tên mẹ, Anh chị em).
+Chỉ ràng buộc truyền tường minh qua API (query_filters.constraints_from_params) mới được dùng để loại:
+  - năm: loại nếu lệch quá PREFILTER_YEAR_TOLERANCE năm ngoài khoảng yêu cầu
+  - father_name / mother_name (bỏ dấu, bỏ "ông/bà/cụ"): so với đúng Tên cha / Tên mẹ, loại nếu khác hẳn
+Ràng buộc tự trích từ truy vấn (query_filters.extract_query_constraints) và tên anh chị em chỉ cộng điểm:
+năm hay tên trong câu có thể là của người tìm ("Tôi sinh năm 1985...") hoặc chính người được tìm
+("Tôi tìm mẹ tên là Lê Thị Hoa" -> hồ sơ của bà Hoa), không phải của cha mẹ ứng viên.
+Trường để trống ở một trong hai phía không bao giờ làm loại hồ sơ.
+Điểm của các hồ sơ được giữ lại cộng vào tổng điểm (apply_structured_scores) để xếp lại thứ tự trước LLM.
+Mỗi ứng viên chỉ tốn vài phép so sánh chuỗi (vài micro giây).
+"""
+import re
+
+from .config import PREFILTER_ENABLED, PREFILTER_YEAR_TOLERANCE, PREFILTER_NAME_MIN_SIMILARITY, PREFILTER_SCORE_WEIGHT
+from .query_filters import extract_query_constraints, parse_year
+from .text_utils import fold_diacritics
+
+_HONORIFICS = {"ong", "ba", "cu", "co", "chu", "bac", "anh", "chi", "em", "me", "bo", "cha"}
+_NAME_SPLIT_RE = re.compile(r"\s*(?:,|;|/|\bva\b|\n)\s*")
+_WORD_RE = re.compile(r"[a-z]+")
+_SIBLINGS_RE = re.compile(r"\b(?:anh chi em|anh em|chi em)(?:\s+(?:trong gia dinh|ruot))?\s+(?:la|gom|ten la|ten)\s+"
+                          r"([a-z ,]+?)(?:\.|$)")
+
+
+def _name_tokens(name):
+    """'Bà Nguyễn Thị Hoa' -> ['nguyen', 'thi', 'hoa']."""
+    tokens = _WORD_RE.findall(fold_diacritics(name))
+    while tokens and tokens[0] in _HONORIFICS:
+        tokens = tokens[1:]
+    return tokens
+
+
+def name_similarity(a, b):
+    """
+    Độ giống nhau (0..1) giữa hai tên, không phân biệt dấu.
+    Tên gọi (âm tiết cuối) quyết định: họ và tên đệm tiếng Việt trùng nhau rất nhiều ("Nguyễn Thị ...").
+    """
+    a = a if isinstance(a, list) else _name_tokens(a)
+    b = b if isinstance(b, list) else _name_tokens(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    common = len(set(a) & set(b))
+    dice = 2.0 * common / (len(a) + len(b))
+    if a[-1] == b[-1]:
+        return 0.7 + 0.3 * dice
+    return 0.2 * dice
+
+
+def _split_names(value):
+    if value is None:
+        return []
+    text = fold_diacritics(value)
+    if text in ("", "nan", "none", "khong ro"):
+        return []
+    return [tokens for tokens in (_name_tokens(part) for part in _NAME_SPLIT_RE.split(text)) if tokens]
+
+
+def extract_sibling_names(query):
+    """Tên anh chị em trong truy vấn ("anh chị em là Viết, Thơ và Dũng") -> [['viet'], ['tho'], ['dung']]."""
+    match = _SIBLINGS_RE.search(fold_diacritics(query))
+    return _split_names(match.group(1)) if match else []
+
+
+def query_profile(query, constraints=None):
+    """
+    Ràng buộc có cấu trúc của truy vấn. constraints: ràng buộc tường minh từ API (constraints_from_params),
+    ghi đè phần trích tự động và là phần duy nhất được dùng để loại hồ sơ (khóa trong "required").
+    """
+    constraints = constraints or {}
+    auto = extract_query_constraints(query)
+    parsed = {"required": set()}
+    for key in ("born_year", "losing_year"):
+        if constraints.get(key):
+            parsed[key] = constraints[key]
+            parsed["required"].add(key)
+        elif auto.get(key):
+            parsed[key] = auto[key]
+    for key, param in (("father_tokens", "father_name"), ("mother_tokens", "mother_name")):
+        tokens = _name_tokens(constraints.get(param) or "")
+        if tokens:
+            parsed[key] = tokens
+    # Tên không rõ là cha hay mẹ (tự trích từ truy vấn) -> chỉ cộng điểm
+    sided = {" ".join(parsed.get(k, [])) for k in ("father_tokens", "mother_tokens")}
+    parsed["parent_tokens"] = [tokens for tokens in (_name_tokens(n) for n in auto.get("parent_names", []))
+                               if tokens and " ".join(tokens) not in sided]
+    parsed["sibling_tokens"] = extract_sibling_names(query)
+    return parsed
+
+
+def _year_ok(year_range, value, tolerance):
+    year = parse_year(value)
+    if year is None or not year_range:
+        return None
+    lo, hi = year_range
+    return lo - tolerance <= year <= hi + tolerance
+
+
+def score_candidate(parsed_query, profile, year_tolerance=PREFILTER_YEAR_TOLERANCE,
+                    min_name_similarity=PREFILTER_NAME_MIN_SIMILARITY):
+    """
+    Chấm một ứng viên (dòng DataFrame / dict) theo ràng buộc truy vấn (xem query_profile).
+    Trả về (plausible, score, reason); reason khác None khi hồ sơ bị loại.
+    """
+    score = 0.0
+    required = parsed_query.get("required", ())
+    for key, column in (("born_year", "Năm sinh"), ("losing_year", "Năm thất lạc")):
+        ok = _year_ok(parsed_query.get(key), profile.get(column), year_tolerance)
+        if ok is False and key in required:
+            return False, 0.0, f"{column} {profile.get(column)} ngoài khoảng {parsed_query[key]}"
+        if ok:
+            score += 1.0
+
+    # Tên cha so với Tên cha, tên mẹ so với Tên mẹ
+    for key, column in (("father_tokens", "Tên cha"), ("mother_tokens", "Tên mẹ")):
+        query_name = parsed_query.get(key)
+        candidate_names = _split_names(profile.get(column))
+        if query_name and candidate_names:
+            best = max(name_similarity(query_name, c) for c in candidate_names)
+            if best < min_name_similarity:
+                return False, 0.0, f"{column.lower()} khác hoàn toàn"
+            score += best
+
+    query_parents = parsed_query.get("parent_tokens")
+    if query_parents:
+        candidate_parents = _split_names(profile.get("Tên cha")) + _split_names(profile.get("Tên mẹ"))
+        if candidate_parents:
+            best = max(name_similarity(q, c) for q in query_parents for c in candidate_parents)
+            if best >= min_name_similarity:
+                score += best
+
+    query_siblings = parsed_query.get("sibling_tokens")
+    if query_siblings:
+        candidate_siblings = {tokens[-1] for tokens in _split_names(profile.get("Anh chị em"))}
+        if candidate_siblings:
+            score += sum(1 for tokens in query_siblings if tokens[-1] in candidate_siblings) / len(query_siblings)
+    return True, score, None
+
+
+def prefilter_candidates(query, candidates, constraints=None, enabled=PREFILTER_ENABLED):
+    """
+    Lọc danh sách (index, profile) trước khi xác minh bằng LLM, giữ nguyên thứ tự.
+    constraints: ràng buộc tường minh từ API (constraints_from_params); chỉ chúng mới làm loại hồ sơ.
+    Trả về (kept, structured_scores) với structured_scores {index: điểm}.
+    """
+    if not enabled or not candidates:
+        return candidates, {}
+    parsed = query_profile(query, constraints)
+    if not any(parsed.get(key) for key in ("born_year", "losing_year", "father_tokens", "mother_tokens",
+                                           "parent_tokens", "sibling_tokens")):
+        return candidates, {}
+
+    kept, scores, rejected = [], {}, 0
+    for idx, profile in candidates:
+        plausible, score, reason = score_candidate(parsed, profile)
+        if plausible:
+            kept.append((idx, profile))
+            scores[idx] = score
+        else:
+            rejected += 1
+    print(f"Lọc sơ bộ theo trường có cấu trúc: giữ {len(kept)}/{len(candidates)} hồ sơ, loại {rejected}")
+    return kept, scores
+
+
+def apply_structured_scores(candidates, combined_scores, structured_scores, weight=PREFILTER_SCORE_WEIGHT):
+    """
+    Cộng điểm trường có cấu trúc vào tổng điểm và xếp lại ứng viên (giảm dần, ổn định).
+    Mỗi điểm có cấu trúc = weight × tổng điểm cao nhất trong danh sách, nên dùng được cho cả điểm cosine
+    lẫn điểm RRF. Trả về (candidates, combined_scores) mới; không sửa dict đầu vào.
+    """
+    if not structured_scores or not candidates:
+        return candidates, combined_scores
+    unit = weight * max(combined_scores.get(idx, 0) for idx, _ in candidates)
+    combined_scores = dict(combined_scores)
+    for idx, score in structured_scores.items():
+        if idx in combined_scores:
+            combined_scores[idx] += score * unit
+    candidates = sorted(candidates, key=lambda candidate: combined_scores.get(candidate[0], 0), reverse=True)
+    return candidates, combined_scores
@@ -0,0 +1,195 @@
+"""
+Bản tóm tắt hồ sơ gọn cho bước xác minh bằng LLM (Profile.llm_digest).
+
+Trước đây mỗi lần tìm kiếm, verify_profiles_with_llm cắt 1000 ký tự đầu của mô tả cho từng ứng viên,
+phần lớn là văn xuôi lặp lại (lời kể sau khi thất lạc, thông tin liên hệ...). Bản tóm tắt được tính
+một lần khi tạo/cập nhật hồ sơ (Profile.save) và gồm:
+  - dòng thông tin chính: tên, năm sinh, năm thất lạc, cha, mẹ, anh chị em
+  - các câu mô tả có nhiều manh mối nhất (năm, địa danh, sự kiện đặc trưng, đặc điểm nhận dạng)
+trong giới hạn LLM_DIGEST_MAX_TOKENS token, nên prompt nhỏ hơn vài lần và mỗi lần gọi chứa được nhiều ứng viên hơn.
+
+Bổ sung cho các hồ sơ cũ:
+    python -m vector_search.profile_digest backfill
+    python -m vector_search.profile_digest show 123
+"""
+import argparse
+import re
+
+from .config import LLM_DIGEST_MAX_TOKENS, LLM_CHARS_PER_TOKEN
+from .text_utils import fold_diacritics
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+|\n+")
+_YEAR_RE = re.compile(r"\b(?:19|20)\d{2}\b")
+_AGE_RE = re.compile(r"\b\d{1,2}\s*tuổi\b", re.IGNORECASE)
+_PROPER_RE = re.compile(r"\b[A-ZÀ-Ỹ][\wÀ-ỹ]*(?:\s+[A-ZÀ-Ỹ][\wÀ-ỹ]*)+")
+_SPACE_RE = re.compile(r"\s+")
+_CLUES_PREFIX = "Manh mối: "
+
+# Từ khóa (đã bỏ dấu) cho biết câu có manh mối quan trọng
+_EVENT_MARKERS = (
+    "that lac", "mat lien lac", "di lac", "bi lac", "cho di", "dem cho", "nhan nuoi", "con nuoi",
+    "vuot bien", "chien tranh", "chay giac", "bo nha", "bo di", "di cu", "so tan", "bat coc", "ban di",
+    "tre mo coi", "trai mo coi", "benh vien", "nha ga", "ben xe", "ben tau",
+)
+_PLACE_MARKERS = (
+    "tinh ", "huyen ", "thon ", "phuong ", "thi xa", "thanh pho", "que ", "ga ", "lang ", "nong truong",
+)
+_IDENTITY_MARKERS = (
+    "vet seo", "vet bot", "not ruoi", "khuyet tat", "tat o", "dac diem", "nhan dang", "hinh xam", "bi tat",
+)
+# Câu gần như không giúp phân biệt hồ sơ
+_NOISE_MARKERS = (
+    "lien he", "so dien thoai", "dien thoai", "chuong trinh", "nhu chua he co cuoc chia ly",
+    "mong moi", "mong tim", "xin cam on", "ai biet", "vui long",
+)
+
+
+def estimate_tokens(text):
+    """Ước lượng số token Gemini của một đoạn văn bản (không gọi API)."""
+    if not text:
+        return 0
+    return int(len(str(text)) / LLM_CHARS_PER_TOKEN) + 1
+
+
+def _clean(value):
+    if value is None:
+        return ""
+    value = str(value).replace("\\", "/")
+    value = _SPACE_RE.sub(" ", value).strip()
+    return "" if value.lower() in ("nan", "none", "n/a", "không rõ") else value
+
+
+def _header_lines(title, full_name, born_year, losing_year, father, mother, siblings):
+    person = [f"Tên: {full_name}" if full_name else "",
+              f"Sinh: {born_year}" if born_year else "",
+              f"Thất lạc: {losing_year}" if losing_year else ""]
+    parents = [f"Cha: {father}" if father else "", f"Mẹ: {mother}" if mother else ""]
+    lines = [f"Tiêu đề: {title}" if title else "",
+             " | ".join(p for p in person if p),
+             " | ".join(p for p in parents if p),
+             f"Anh chị em: {siblings}" if siblings else ""]
+    return [line for line in lines if line]
+
+
+def _score_sentence(sentence, position, known):
+    """Điểm manh mối của một câu; known là các tên đã có ở dòng thông tin chính (đã bỏ dấu)."""
+    folded = fold_diacritics(sentence)
+    score = 0.0
+    score += 2.0 * len(_YEAR_RE.findall(sentence)) + 1.0 * len(_AGE_RE.findall(sentence))
+    score += 2.0 * sum(1 for m in _EVENT_MARKERS if m in folded)
+    score += 1.0 * sum(1 for m in _PLACE_MARKERS if m in folded)
+    score += 2.5 * sum(1 for m in _IDENTITY_MARKERS if m in folded)
+    # Tên riêng / địa danh viết hoa chưa có ở dòng thông tin chính
+    for proper in _PROPER_RE.findall(sentence):
+        if fold_diacritics(proper) not in known:
+            score += 1.0
+    score -= 3.0 * sum(1 for m in _NOISE_MARKERS if m in folded)
+    # Các câu đầu thường tóm tắt hoàn cảnh thất lạc
+    score += max(0.0, 1.5 - 0.3 * position)
+    # Câu quá dài tốn chỗ: chuẩn hóa nhẹ theo độ dài
+    return score / (1.0 + len(sentence) / 400.0)
+
+
+def build_digest(title=None, full_name=None, born_year=None, losing_year=None, father=None, mother=None,
+                 siblings=None, description=None, max_tokens=LLM_DIGEST_MAX_TOKENS):
+    """
+    Tạo bản tóm tắt cho một hồ sơ: dòng thông tin chính + các câu mô tả nhiều manh mối nhất
+    (giữ nguyên thứ tự xuất hiện) trong giới hạn max_tokens.
+    """
+    fields = [_clean(v) for v in (title, full_name, born_year, losing_year, father, mother, siblings)]
+    lines = _header_lines(*fields)
+    # Trừ cả tiền tố "Manh mối: " của dòng câu mô tả
+    budget = max_tokens - sum(estimate_tokens(line) for line in lines) - estimate_tokens(_CLUES_PREFIX)
+
+    known = {fold_diacritics(v) for v in fields[1:] if v}
+    sentences = [s for s in (_clean(s) for s in _SENTENCE_RE.split(_clean(description))) if len(s) > 3]
+    sentences = list(dict.fromkeys(sentences))  # Mô tả ghép từ nhiều nguồn thường lặp câu
+    ranked = sorted(range(len(sentences)), key=lambda i: _score_sentence(sentences[i], i, known), reverse=True)
+
+    chosen = []
+    for i in ranked:
+        cost = estimate_tokens(sentences[i])
+        if cost <= budget:
+            chosen.append(i)
+            budget -= cost
+        elif not chosen and budget > 8:
+            # Không câu nào vừa: cắt câu tốt nhất theo số ký tự còn lại
+            limit = int(budget * LLM_CHARS_PER_TOKEN)
+            sentences[i] = sentences[i][:limit].rsplit(" ", 1)[0] + "…"
+            chosen.append(i)
+            break
+        if budget <= 8:
+            break
+
+    if chosen:
+        lines.append(_CLUES_PREFIX + " ".join(sentences[i] for i in sorted(chosen)))
+    return "\n".join(lines)
+
+
+def build_profile_digest(profile, max_tokens=LLM_DIGEST_MAX_TOKENS):
+    """Bản tóm tắt cho một Profile model instance."""
+    return build_digest(
+        title=profile.title,
+        full_name=profile.full_name,
+        born_year=profile.born_year,
+        losing_year=profile.losing_year,
+        father=profile.name_of_father,
+        mother=profile.name_of_mother,
+        siblings=profile.siblings,
+        description=profile.description,
+        max_tokens=max_tokens,
+    )
+
+
+def backfill_digests(batch_size=500, force=False, max_tokens=LLM_DIGEST_MAX_TOKENS):
+    """Tính llm_digest cho các hồ sơ chưa có (hoặc tất cả nếu force) bằng bulk_update theo lô."""
+    from profiles.models import Profile
+
+    queryset = Profile.objects.order_by("id")
+    if not force:
+        queryset = queryset.filter(llm_digest__isnull=True)
+    total = queryset.count()
+    print(f"Cần tính bản tóm tắt cho {total} hồ sơ...")
+
+    updated = 0
+    batch = []
+    for profile in queryset.only("id", "title", "full_name", "born_year", "losing_year", "name_of_father",
+                                 "name_of_mother", "siblings", "description").iterator(chunk_size=batch_size):
+        profile.llm_digest = build_profile_digest(profile, max_tokens=max_tokens)
+        batch.append(profile)
+        if len(batch) >= batch_size:
+            # bulk_update không gọi save() nên không đụng tới updated_at
+            Profile.objects.bulk_update(batch, ["llm_digest"])
+            updated += len(batch)
+            batch = []
+            print(f"  Đã cập nhật {updated}/{total} hồ sơ")
+    if batch:
+        Profile.objects.bulk_update(batch, ["llm_digest"])
+        updated += len(batch)
+    print(f"Hoàn tất: {updated} hồ sơ đã có bản tóm tắt.")
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bản tóm tắt hồ sơ cho bước xác minh bằng LLM")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill", help="Tính llm_digest cho các hồ sơ chưa có")
+    backfill_parser.add_argument("--batch-size", type=int, default=500)
+    backfill_parser.add_argument("--force", action="store_true", help="Tính lại cho tất cả hồ sơ")
+    backfill_parser.add_argument("--max-tokens", type=int, default=LLM_DIGEST_MAX_TOKENS)
+
+    show_parser = subparsers.add_parser("show", help="In bản tóm tắt của một hồ sơ và so sánh kích thước")
+    show_parser.add_argument("profile_id", type=int)
+
+    args = parser.parse_args()
+    if args.command == "backfill":
+        backfill_digests(batch_size=args.batch_size, force=args.force, max_tokens=args.max_tokens)
+    else:
+        from profiles.models import Profile
+
+        profile = Profile.objects.get(id=args.profile_id)
+        digest = build_profile_digest(profile)
+        print(digest)
+        print(f"\n~{estimate_tokens(digest)} token (mô tả gốc cắt 1000 ký tự: "
+              f"~{estimate_tokens(str(profile.description)[:1000])} token)")
@@ -3,7 +3,16 @@ Qdrant client helper để thay thế ChromaDB và Pinecone
 """
 import os
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client.models import (
+    Distance,
+    VectorParams,
+    SparseVectorParams,
+    Modifier,
+    PayloadSchemaType,
+    TextIndexParams,
+    TextIndexType,
+    TokenizerType,
+)
 
 # Cấu hình từ environment variables
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
@@ -12,26 +21,39 @@ QDRANT_URL = os.getenv("QDRANT_URL")  # Cloud: https://xxxxx.qdrant.io
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")  # Cloud API key
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "missing_people_profiles")
 
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+
 _qdrant_client = None
 _qdrant_collection = None
 
+def create_qdrant_client(prefer_grpc=False, timeout=None):
+    """Tạo Qdrant client mới (prefer_grpc=True: dùng gRPC khi server hỗ trợ - nhanh hơn cho import lớn)"""
+    if QDRANT_URL:
+        # Cloud Qdrant
+        client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=prefer_grpc, timeout=timeout)
+        print(f"Đã kết nối Qdrant Cloud: {QDRANT_URL}")
+    else:
+        # Local Qdrant
+        client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, grpc_port=QDRANT_GRPC_PORT,
+                              prefer_grpc=prefer_grpc, timeout=timeout)
+        print(f"Đã kết nối Qdrant Local: {QDRANT_HOST}:{QDRANT_PORT}")
+    return client
+
 def get_qdrant_client():
     """Lấy Qdrant client (singleton)"""
     global _qdrant_client
     if _qdrant_client is None:
-        if QDRANT_URL:
-            # Cloud Qdrant
-            _qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-            print(f"Đã kết nối Qdrant Cloud: {QDRANT_URL}")
-        else:
-            # Local Qdrant
-            _qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-            print(f"Đã kết nối Qdrant Local: {QDRANT_HOST}:{QDRANT_PORT}")
+        _qdrant_client = create_qdrant_client()
     return _qdrant_client
 
 def get_qdrant_collection():
     """Lấy collection Qdrant (singleton) - chỉ trả về tên collection, không kiểm tra info"""
     global _qdrant_collection
+    # Có phiên bản embedding active: dùng đúng collection của nó (cùng model với embedding truy vấn)
+    from .embedding_versions import active_collection_name
+    versioned_collection = active_collection_name()
+    if versioned_collection:
+        return versioned_collection
     if _qdrant_collection is None:
         client = get_qdrant_client()
         # Kiểm tra collection có tồn tại không (bỏ qua lỗi version mismatch)
@@ -39,6 +61,10 @@ def get_qdrant_collection():
             # Thử kiểm tra collection có tồn tại không bằng cách list collections
             collections = client.get_collections()
             collection_exists = any(c.name == QDRANT_COLLECTION_NAME for c in collections.collections)
+            if not collection_exists:
+                # Tên có thể là alias trỏ tới collection thật (sau khi migrate/tạo lại collection)
+                aliases = client.get_aliases()
+                collection_exists = any(a.alias_name == QDRANT_COLLECTION_NAME for a in aliases.aliases)
             if collection_exists:
                 _qdrant_collection = QDRANT_COLLECTION_NAME
                 print(f"Đã xác nhận collection '{QDRANT_COLLECTION_NAME}' tồn tại.")
@@ -59,3 +85,184 @@ def initialize_qdrant():
         return get_qdrant_client()
     return None
 
+
+def sparse_vectors_config(sparse_vector_name):
+    """Cấu hình sparse vector BM25: Qdrant tự nhân IDF (Modifier.IDF) khi truy vấn."""
+    return {sparse_vector_name: SparseVectorParams(modifier=Modifier.IDF)}
+
+
+def has_sparse_vector(client, collection_name, sparse_vector_name):
+    """Kiểm tra collection đã có sparse vector sparse_vector_name chưa."""
+    info = client.get_collection(collection_name)
+    return sparse_vector_name in (info.config.params.sparse_vectors or {})
+
+
+def ensure_payload_indexes(client, collection_name):
+    """
+    Tạo payload index cho các field dùng để lọc (idempotent - gọi lại không sao).
+    - id: keyword (lọc/chấm lại theo ID hồ sơ)
+    - born_year_int, losing_year_int: integer (lọc theo khoảng năm)
+    - parent_names: full-text (tên cha/mẹ đã bỏ dấu)
+    """
+    from .query_filters import BORN_YEAR_FIELD, LOSING_YEAR_FIELD, PARENT_NAMES_FIELD
+
+    indexes = [
+        ("id", PayloadSchemaType.KEYWORD),
+        (BORN_YEAR_FIELD, PayloadSchemaType.INTEGER),
+        (LOSING_YEAR_FIELD, PayloadSchemaType.INTEGER),
+        (PARENT_NAMES_FIELD, TextIndexParams(
+            type=TextIndexType.TEXT, tokenizer=TokenizerType.WORD, lowercase=True, min_token_len=1)),
+    ]
+    for field_name, field_schema in indexes:
+        try:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+            print(f"Đã tạo payload index '{field_name}' cho collection '{collection_name}'.")
+        except Exception as e:
+            print(f"⚠️  Không thể tạo payload index '{field_name}': {e}")
+
+
+def quantization_config(mode):
+    """Cấu hình quantization: 'scalar' (int8, ~4x ít RAM), 'binary' (~32x), 'none'."""
+    from qdrant_client.http import models as qdrant_models
+
+    if mode == "scalar":
+        return qdrant_models.ScalarQuantization(
+            scalar=qdrant_models.ScalarQuantizationConfig(
+                type=qdrant_models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if mode == "binary":
+        return qdrant_models.BinaryQuantization(
+            binary=qdrant_models.BinaryQuantizationConfig(always_ram=True)
+        )
+    return None
+
+
+def search_params(exact=False):
+    """SearchParams cho truy vấn: rescore bằng vector gốc + oversampling khi có quantization."""
+    from qdrant_client.http import models as qdrant_models
+    from .config import (
+        QDRANT_QUANTIZATION,
+        QDRANT_HNSW_EF,
+        QDRANT_QUANTIZATION_RESCORE,
+        QDRANT_QUANTIZATION_OVERSAMPLING,
+    )
+
+    if exact:
+        return qdrant_models.SearchParams(
+            exact=True, quantization=qdrant_models.QuantizationSearchParams(ignore=True)
+        )
+    if QDRANT_QUANTIZATION == "none" and not QDRANT_HNSW_EF:
+        return None
+    quantization = None
+    if QDRANT_QUANTIZATION != "none":
+        quantization = qdrant_models.QuantizationSearchParams(
+            rescore=QDRANT_QUANTIZATION_RESCORE,
+            oversampling=QDRANT_QUANTIZATION_OVERSAMPLING,
+        )
+    return qdrant_models.SearchParams(hnsw_ef=QDRANT_HNSW_EF, quantization=quantization)
+
+
+def create_profile_collection(client, collection_name, dimension=None, quantization=None, on_disk=None,
+                              hnsw_m=None, hnsw_ef_construct=None, with_sparse=None):
+    """
+    Tạo collection hồ sơ với các tùy chọn lưu trữ (mặc định lấy từ config):
+    - quantization: none | scalar | binary (bản lượng tử hóa luôn ở RAM, vector gốc dùng để rescore)
+    - on_disk: để vector gốc float32 trên đĩa (mmap)
+    - hnsw_m / hnsw_ef_construct: tham số đồ thị HNSW
+    - with_sparse: thêm sparse vector cho hybrid search
+    """
+    from qdrant_client.http import models as qdrant_models
+    from .config import (
+        EMBEDDING_DIMENSION,
+        QDRANT_QUANTIZATION,
+        QDRANT_ON_DISK,
+        QDRANT_HNSW_M,
+        QDRANT_HNSW_EF_CONSTRUCT,
+        USE_QDRANT_HYBRID,
+        SPARSE_VECTOR_NAME,
+    )
+
+    dimension = dimension or EMBEDDING_DIMENSION or 768
+    quantization = quantization or QDRANT_QUANTIZATION
+    on_disk = QDRANT_ON_DISK if on_disk is None else on_disk
+    with_sparse = USE_QDRANT_HYBRID if with_sparse is None else with_sparse
+
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(size=dimension, distance=Distance.COSINE, on_disk=on_disk),
+        sparse_vectors_config=sparse_vectors_config(SPARSE_VECTOR_NAME) if with_sparse else None,
+        hnsw_config=qdrant_models.HnswConfigDiff(
+            m=hnsw_m or QDRANT_HNSW_M,
+            ef_construct=hnsw_ef_construct or QDRANT_HNSW_EF_CONSTRUCT,
+        ),
+        quantization_config=quantization_config(quantization),
+    )
+    print(f"Đã tạo collection '{collection_name}' (dim={dimension}, quantization={quantization}, "
+          f"on_disk={on_disk}, sparse={with_sparse}).")
+    ensure_payload_indexes(client, collection_name)
+
+
+def apply_collection_options(client, collection_name, quantization=None, on_disk=None,
+                             hnsw_m=None, hnsw_ef_construct=None):
+    """
+    Áp dụng quantization / on_disk / HNSW cho collection đã tồn tại (Qdrant tự build lại ở nền).
+    Số chiều vector thì không đổi được - phải tạo collection mới và embed lại.
+    """
+    from qdrant_client.http import models as qdrant_models
+    from .config import QDRANT_QUANTIZATION, QDRANT_ON_DISK, QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT
+
+    quantization = quantization or QDRANT_QUANTIZATION
+    on_disk = QDRANT_ON_DISK if on_disk is None else on_disk
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": qdrant_models.VectorParamsDiff(on_disk=on_disk)},
+        hnsw_config=qdrant_models.HnswConfigDiff(
+            m=hnsw_m or QDRANT_HNSW_M,
+            ef_construct=hnsw_ef_construct or QDRANT_HNSW_EF_CONSTRUCT,
+        ),
+        quantization_config=quantization_config(quantization) or qdrant_models.Disabled.DISABLED,
+    )
+    print(f"Đã cập nhật collection '{collection_name}' (quantization={quantization}, on_disk={on_disk}).")
+
+
+def resolve_alias(client, name):
+    """Trả về (tên collection thật, có phải alias không) cho một tên collection/alias."""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == name:
+            return alias.collection_name, True
+    return name, False
+
+
+def switch_alias(client, alias_name, collection_name):
+    """
+    Trỏ alias_name sang collection_name (nguyên tử nếu alias_name đã là alias).
+    Không bao giờ xóa collection: nếu alias_name đang là collection thật thì giữ nguyên và bỏ qua
+    (đặt QDRANT_COLLECTION_NAME=<collection mới> hoặc dùng phiên bản embedding để chuyển).
+    Trả về tên collection mà alias trỏ tới trước đó (None nếu không có hoặc không chuyển được).
+    """
+    from qdrant_client.http import models as qdrant_models
+
+    previous, is_alias = resolve_alias(client, alias_name)
+    if alias_name == collection_name:
+        print(f"'{alias_name}' đã là collection đích, không cần chuyển alias.")
+        return None
+    operations = []
+    if is_alias:
+        operations.append(qdrant_models.DeleteAliasOperation(
+            delete_alias=qdrant_models.DeleteAlias(alias_name=alias_name)))
+    elif client.collection_exists(alias_name):
+        print(f"⚠️  '{alias_name}' đang là collection thật nên không thể dùng làm alias (không xóa dữ liệu). "
+              f"Đặt QDRANT_COLLECTION_NAME={collection_name} để chuyển sang collection mới.")
+        return None
+    else:
+        previous = None
+    operations.append(qdrant_models.CreateAliasOperation(
+        create_alias=qdrant_models.CreateAlias(collection_name=collection_name, alias_name=alias_name)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    print(f"✅ Alias '{alias_name}' -> '{collection_name}'.")
+    return previous
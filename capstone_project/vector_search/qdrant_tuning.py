@@ -0,0 +1,194 @@
+"""
+Cấu hình lưu trữ cho collection hồ sơ trên Qdrant và đo recall sau khi nén.
+
+    # Tạo collection mới với các tùy chọn trong config (QDRANT_QUANTIZATION, QDRANT_ON_DISK, ...)
+    python -m vector_search.qdrant_tuning create --name missing_people_profiles_v2 --dimension 256
+    # Áp dụng quantization / on_disk / HNSW cho collection hiện tại (Qdrant tự build lại ở nền)
+    python -m vector_search.qdrant_tuning apply --quantization scalar --on-disk
+    # Đo recall@k so với tìm kiếm chính xác trên vector gốc float32
+    python -m vector_search.qdrant_tuning benchmark --queries 200 --k 10 100
+
+Benchmark gồm:
+  1. Recall@k của truy vấn thường (HNSW + quantization + rescore) so với exact search (bỏ quantization).
+  2. Recall@k khi rút gọn số chiều (output_dimensionality): cắt vector về d chiều đầu và chuẩn hóa lại
+     (cách text-embedding-004 tạo vector rút gọn), so với 768 chiều - tính bằng NumPy trên mẫu.
+  3. Ước lượng RAM cho vector: float32 / int8 / binary.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from .config import QDRANT_COLLECTION_NAME
+from .qdrant_helper import (
+    get_qdrant_client,
+    get_qdrant_collection,
+    create_profile_collection,
+    apply_collection_options,
+    search_params,
+)
+
+
+def _load_sample(client, collection_name, limit):
+    """Scroll tối đa `limit` vector (id, vector) từ collection."""
+    ids, vectors = [], []
+    offset = None
+    while len(ids) < limit:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=min(1000, limit - len(ids)),
+            offset=offset,
+            with_payload=False,
+            with_vectors=True,
+        )
+        for point in points:
+            vector = point.vector.get("") if isinstance(point.vector, dict) else point.vector
+            if vector is not None:
+                ids.append(point.id)
+                vectors.append(vector)
+        if offset is None:
+            break
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def _recall(expected, actual, k):
+    expected = set(expected[:k])
+    if not expected:
+        return 1.0
+    return len(expected & set(actual[:k])) / len(expected)
+
+
+def benchmark_collection(client, collection_name, query_ids, query_vectors, ks):
+    """Recall@k (cấu hình hiện tại) so với exact search, kèm độ trễ trung bình."""
+    max_k = max(ks)
+    recalls = {k: [] for k in ks}
+    latencies = []
+    for query_id, vector in zip(query_ids, query_vectors):
+        exact = client.search(
+            collection_name=collection_name, query_vector=vector.tolist(), limit=max_k + 1,
+            search_params=search_params(exact=True), with_payload=False,
+        )
+        started = time.perf_counter()
+        approx = client.search(
+            collection_name=collection_name, query_vector=vector.tolist(), limit=max_k + 1,
+            search_params=search_params(), with_payload=False,
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        # Bỏ chính điểm truy vấn ra khỏi kết quả
+        exact_ids = [p.id for p in exact if p.id != query_id]
+        approx_ids = [p.id for p in approx if p.id != query_id]
+        for k in ks:
+            recalls[k].append(_recall(exact_ids, approx_ids, k))
+    return {k: float(np.mean(v)) for k, v in recalls.items()}, float(np.mean(latencies))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def benchmark_dimensions(corpus, query_rows, ks, dimensions):
+    """Recall@k khi cắt vector về d chiều (so với đầy đủ chiều), tính trên mẫu bằng NumPy."""
+    max_k = max(ks)
+    full = _normalize(corpus)
+    queries = full[query_rows]
+    baseline = np.argsort(-(queries @ full.T), axis=1)[:, 1:max_k + 1]
+    results = {}
+    for dim in dimensions:
+        if dim >= corpus.shape[1]:
+            continue
+        reduced = _normalize(corpus[:, :dim])
+        ranked = np.argsort(-(reduced[query_rows] @ reduced.T), axis=1)
+        ranked = [[i for i in row if i != q][:max_k] for row, q in zip(ranked[:, :max_k + 1], query_rows)]
+        results[dim] = {
+            k: float(np.mean([_recall(list(b), r, k) for b, r in zip(baseline, ranked)])) for k in ks
+        }
+    return results
+
+
+def memory_estimate(count, dimension):
+    """Ước lượng RAM cho vector (chưa tính đồ thị HNSW)."""
+    mb = 1024 * 1024
+    return {
+        "float32": count * dimension * 4 / mb,
+        "int8 (scalar)": count * dimension / mb,
+        "binary": count * dimension / 8 / mb,
+    }
+
+
+def run_benchmark(collection_name, num_queries, ks, sample_size, dimensions):
+    client = get_qdrant_client()
+    info = client.get_collection(collection_name)
+    count = info.points_count or 0
+    ids, vectors = _load_sample(client, collection_name, sample_size)
+    if not ids:
+        print("Collection rỗng, không có gì để đo.")
+        return
+    rng = np.random.default_rng(42)
+    query_rows = rng.choice(len(ids), size=min(num_queries, len(ids)), replace=False)
+
+    print(f"\n=== Collection '{collection_name}': {count} vector, dim={vectors.shape[1]} ===")
+    print(f"Quantization: {info.config.quantization_config}")
+    recalls, latency = benchmark_collection(
+        client, collection_name, [ids[i] for i in query_rows], vectors[query_rows], ks
+    )
+    for k in ks:
+        print(f"  Recall@{k} (cấu hình hiện tại vs exact float32): {recalls[k]:.4f}")
+    print(f"  Độ trễ trung bình: {latency:.1f} ms/truy vấn")
+
+    print(f"\n=== Rút gọn số chiều (mẫu {len(ids)} vector) ===")
+    for dim, dim_recalls in benchmark_dimensions(vectors, query_rows, ks, dimensions).items():
+        summary = ", ".join(f"Recall@{k}={v:.4f}" for k, v in dim_recalls.items())
+        print(f"  {dim} chiều: {summary}")
+
+    print("\n=== Ước lượng RAM cho vector ===")
+    for dim in [vectors.shape[1]] + [d for d in dimensions if d < vectors.shape[1]]:
+        estimate = ", ".join(f"{name}: {mb:.1f} MB" for name, mb in memory_estimate(count, dim).items())
+        print(f"  {dim} chiều - {estimate}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tùy chọn lưu trữ và benchmark recall cho Qdrant")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create = sub.add_parser("create", help="Tạo collection mới với tùy chọn lưu trữ")
+    create.add_argument("--name", required=True)
+    create.add_argument("--dimension", type=int)
+    create.add_argument("--quantization", choices=["none", "scalar", "binary"])
+    create.add_argument("--on-disk", action="store_true", default=None)
+    create.add_argument("--m", type=int)
+    create.add_argument("--ef-construct", type=int)
+
+    apply = sub.add_parser("apply", help="Áp dụng tùy chọn cho collection hiện có")
+    apply.add_argument("--name", default=None)
+    apply.add_argument("--quantization", choices=["none", "scalar", "binary"])
+    apply.add_argument("--on-disk", action="store_true", default=None)
+    apply.add_argument("--m", type=int)
+    apply.add_argument("--ef-construct", type=int)
+
+    bench = sub.add_parser("benchmark", help="Đo recall@k so với tìm kiếm chính xác")
+    bench.add_argument("--name", default=None)
+    bench.add_argument("--queries", type=int, default=100)
+    bench.add_argument("--k", type=int, nargs="+", default=[10, 100])
+    bench.add_argument("--sample-size", type=int, default=20000)
+    bench.add_argument("--dimensions", type=int, nargs="+", default=[512, 256, 128])
+
+    args = parser.parse_args()
+    qdrant_client = get_qdrant_client()
+    if args.command == "create":
+        create_profile_collection(
+            qdrant_client, args.name, dimension=args.dimension, quantization=args.quantization,
+            on_disk=args.on_disk, hnsw_m=args.m, hnsw_ef_construct=args.ef_construct,
+        )
+    elif args.command == "apply":
+        apply_collection_options(
+            qdrant_client, args.name or get_qdrant_collection() or QDRANT_COLLECTION_NAME,
+            quantization=args.quantization, on_disk=args.on_disk,
+            hnsw_m=args.m, hnsw_ef_construct=args.ef_construct,
+        )
+    else:
+        run_benchmark(
+            args.name or get_qdrant_collection() or QDRANT_COLLECTION_NAME,
+            args.queries, args.k, args.sample_size, args.dimensions,
+        )
@@ -0,0 +1,174 @@
+"""
+Trích xuất ràng buộc có cấu trúc (năm sinh, năm thất lạc, tên cha/mẹ) từ truy vấn
+và chuyển thành Qdrant Filter để lọc ngay trong vector engine.
+
+Ví dụ: "sinh khoảng năm 1975, thất lạc năm 1979, mẹ tên Lê Thị Hoa"
+    -> born_year 1973..1977, losing_year 1979..1979, parent_names ["le thi hoa"]
+
+Hồ sơ không có dữ liệu cho field bị lọc (năm để trống...) vẫn được giữ lại (IsEmpty),
+vì phần lớn hồ sơ chỉ ghi năm ước lượng hoặc bỏ trống.
+"""
+import re
+
+from qdrant_client.http import models as qdrant_models
+
+from .config import QDRANT_AUTO_FILTERS
+from .text_utils import fold_diacritics
+
+# Payload field (được đánh index) dùng để lọc
+BORN_YEAR_FIELD = "born_year_int"
+LOSING_YEAR_FIELD = "losing_year_int"
+PARENT_NAMES_FIELD = "parent_names"
+
+# Sai số mặc định khi truy vấn dùng từ "khoảng/tầm/around"
+APPROX_YEAR_TOLERANCE = 2
+
+_YEAR = r"((?:19|20)\d{2})"
+_APPROX = r"(khoang|tam|chung|around|about|circa|~)?\s*"
+_YEAR_RE = re.compile(r"(?<!\d)(?:19|20)\d{2}(?!\d)")
+
+# Các mẫu đã bỏ dấu (so khớp trên văn bản fold_diacritics)
+_BORN_PATTERNS = [
+    re.compile(r"\b(?:sinh|ra doi|born)(?:\s+(?:nam|vao|in))*\s*" + _APPROX + r"(?:nam\s+|in\s+)?" + _YEAR),
+]
+_LOST_PATTERNS = [
+    re.compile(r"\b(?:that lac|mat tich|mat lien lac|lac|lost|missing)(?:\s+(?:nam|vao|tu|in|since))*\s*"
+               + _APPROX + r"(?:nam\s+|in\s+)?" + _YEAR),
+]
+_PARENT_PATTERNS = [
+    re.compile(r"\b(?:bo|cha|father|me|mother)\s+(?:ten\s+la|ten|la|named)\s+([a-z]+(?:\s+[a-z]+){0,3})"),
+]
+# Từ dừng kết thúc cụm tên (tên riêng tiếng Việt thường 2-4 âm tiết).
+# Không có "nam" vì "Nam" là tên riêng phổ biến (trùng với "năm" sau khi bỏ dấu).
+_NAME_STOP_WORDS = {
+    "sinh", "that", "lac", "mat", "tich", "o", "tai", "que", "va", "con", "em", "anh", "chi",
+    "bo", "cha", "me", "ma", "nguoi", "tu", "vao", "khi", "born", "lost", "and", "in",
+}
+
+
+def _year_range(approx, year):
+    year = int(year)
+    tolerance = APPROX_YEAR_TOLERANCE if approx else 0
+    return year - tolerance, year + tolerance
+
+
+def parse_year(value):
+    """Lấy năm (4 chữ số) đầu tiên trong chuỗi; trả về None nếu không có."""
+    match = _YEAR_RE.search(str(value or ""))
+    return int(match.group(0)) if match else None
+
+
+def _clean_name(raw):
+    words = []
+    for word in raw.split():
+        if word in _NAME_STOP_WORDS:
+            break
+        words.append(word)
+    return " ".join(words) if len(words) >= 2 else None
+
+
+def extract_query_constraints(query):
+    """
+    Trích xuất ràng buộc từ truy vấn tự do.
+    Trả về dict có thể gồm: born_year (lo, hi), losing_year (lo, hi), parent_names [..] (đã bỏ dấu).
+    """
+    text = fold_diacritics(query)
+    constraints = {}
+
+    for pattern in _BORN_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            constraints["born_year"] = _year_range(match.group(1), match.group(2))
+            break
+    for pattern in _LOST_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            constraints["losing_year"] = _year_range(match.group(1), match.group(2))
+            break
+
+    names = []
+    for pattern in _PARENT_PATTERNS:
+        for match in pattern.finditer(text):
+            name = _clean_name(match.group(1))
+            if name and name not in names:
+                names.append(name)
+    if names:
+        constraints["parent_names"] = names
+    return constraints
+
+
+def constraints_from_params(params):
+    """
+    Ràng buộc truyền trực tiếp qua API:
+    born_year_from/born_year_to, losing_year_from/losing_year_to, father_name, mother_name.
+    """
+    constraints = {}
+    for key in ("born_year", "losing_year"):
+        lo = parse_year(params.get(f"{key}_from"))
+        hi = parse_year(params.get(f"{key}_to"))
+        if lo or hi:
+            constraints[key] = (lo or hi, hi or lo)
+    names = []
+    for key in ("father_name", "mother_name"):
+        if params.get(key):
+            # Giữ riêng tên cha / tên mẹ để lọc sơ bộ so đúng trường (prefilter.py)
+            constraints[key] = fold_diacritics(params.get(key)).strip()
+            names.append(constraints[key])
+    if names:
+        constraints["parent_names"] = names
+    return constraints
+
+
+def _keep_empty(field, condition):
+    """Điều kiện trên field HOẶC field không có giá trị."""
+    return qdrant_models.Filter(should=[
+        condition,
+        qdrant_models.IsEmptyCondition(is_empty=qdrant_models.PayloadField(key=field)),
+    ])
+
+
+def build_qdrant_filter(constraints):
+    """Chuyển dict ràng buộc thành qdrant Filter (None nếu không có ràng buộc)."""
+    if not constraints:
+        return None
+    must = []
+    for key, field in (("born_year", BORN_YEAR_FIELD), ("losing_year", LOSING_YEAR_FIELD)):
+        if key in constraints:
+            lo, hi = constraints[key]
+            must.append(_keep_empty(field, qdrant_models.FieldCondition(
+                key=field, range=qdrant_models.Range(gte=lo, lte=hi))))
+    for name in constraints.get("parent_names", []):
+        must.append(_keep_empty(PARENT_NAMES_FIELD, qdrant_models.FieldCondition(
+            key=PARENT_NAMES_FIELD, match=qdrant_models.MatchText(text=name))))
+    return qdrant_models.Filter(must=must) if must else None
+
+
+def combine_filters(*filters):
+    """Gộp nhiều Filter (AND); bỏ qua None."""
+    filters = [f for f in filters if f is not None]
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    return qdrant_models.Filter(must=filters)
+
+
+def constraints_from_request(data, query_text):
+    """
+    Ràng buộc cho một request API: tham số lọc tường minh (ưu tiên) + ràng buộc tự trích từ truy vấn
+    (khi auto_filters, mặc định QDRANT_AUTO_FILTERS).
+    """
+    auto_filters = data.get("auto_filters", QDRANT_AUTO_FILTERS)
+    if isinstance(auto_filters, str):
+        auto_filters = auto_filters.lower() == "true"
+    constraints = extract_query_constraints(query_text) if auto_filters else {}
+    constraints.update(constraints_from_params(data))
+    return constraints
+
+
+def filter_from_request(data, query_text):
+    """Qdrant Filter cho một request API (xem constraints_from_request)."""
+    constraints = constraints_from_request(data, query_text)
+    if constraints:
+        print(f"Ràng buộc lọc trên Qdrant: {constraints}")
+    return build_qdrant_filter(constraints)
@@ -0,0 +1,137 @@
+"""
+Cắt danh sách ứng viên thích ứng theo phân bố điểm và phân trang kết quả tìm kiếm.
+
+Thay vì luôn gửi đúng top_n_final (100) hồ sơ sang LLM, số ứng viên mỗi trang được chọn theo
+hình dạng đường điểm kết hợp (đã sắp xếp giảm dần):
+  - ngưỡng điểm: bỏ các hồ sơ dưới SEARCH_CUTOFF_MIN_SCORE hoặc dưới SEARCH_CUTOFF_RELATIVE_FLOOR × điểm cao nhất
+    (chỉ với điểm cosine; điểm RRF / embedding dự phòng có thang khác nên bỏ ngưỡng tương đối, relative_floor=0)
+  - khoảng trống (gap): cắt tại bước giảm lớn nhất nếu nó chiếm >= SEARCH_CUTOFF_GAP_RATIO khoảng điểm
+  - điểm gãy (knee, Kneedle): nếu không có gap rõ ràng, cắt tại điểm xa dây cung nhất
+luôn nằm trong [SEARCH_CUTOFF_MIN_K, max_k].
+
+Danh sách đã xếp hạng (tối đa SEARCH_RANKED_CACHE_SIZE hồ sơ, chỉ ID và điểm) được lưu trong Django cache
+(dùng chung giữa các worker, xem CACHES trong settings) theo (user, truy vấn, tham số lọc); trang 2, 3... lấy
+phần tiếp theo từ cache, đọc lại dữ liệu hồ sơ của trang đó từ database và chỉ chạy bước xác minh LLM, không
+chạy lại trích từ khóa / embedding / vector search.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+
+from .config import (
+    SEARCH_CUTOFF_MIN_K,
+    SEARCH_CUTOFF_MIN_SCORE,
+    SEARCH_CUTOFF_RELATIVE_FLOOR,
+    SEARCH_CUTOFF_GAP_RATIO,
+    SEARCH_RANKED_CACHE_SIZE,
+    SEARCH_RANKED_CACHE_SECONDS,
+)
+
+# Tham số request không ảnh hưởng tới danh sách xếp hạng
+_NON_RANKING_PARAMS = {"page", "stream", "format"}
+
+
+def _knee_index(scores):
+    """Vị trí điểm gãy (Kneedle): điểm xa dây cung nối điểm đầu và điểm cuối nhất (đã chuẩn hóa)."""
+    n = len(scores)
+    top, bottom = scores[0], scores[-1]
+    if n < 3 or top == bottom:
+        return None
+    best_i, best_distance = None, 0.0
+    for i in range(1, n - 1):
+        x = i / (n - 1)
+        y = (scores[i] - bottom) / (top - bottom)
+        distance = (1.0 - x) - y  # Đường cong lõm xuống dưới dây cung y = 1 - x
+        if distance > best_distance:
+            best_i, best_distance = i, distance
+    return best_i
+
+
+def adaptive_cutoff(scores, max_k, min_k=SEARCH_CUTOFF_MIN_K, min_score=SEARCH_CUTOFF_MIN_SCORE,
+                    relative_floor=SEARCH_CUTOFF_RELATIVE_FLOOR, gap_ratio=SEARCH_CUTOFF_GAP_RATIO):
+    """Số ứng viên nên xác minh từ danh sách điểm đã sắp xếp giảm dần."""
+    cap = min(max_k, len(scores))
+    if cap <= min_k:
+        return cap
+
+    floor = max(min_score, scores[0] * relative_floor)
+    n = cap
+    for i in range(cap):
+        if scores[i] < floor:
+            n = i
+            break
+    if n <= min_k:
+        return min(min_k, cap)
+
+    window = scores[:n]
+    spread = window[0] - window[-1]
+    if spread > 0:
+        gaps = [(window[i - 1] - window[i], i) for i in range(min_k, n)]
+        largest_gap, gap_at = max(gaps) if gaps else (0.0, None)
+        if gap_at is not None and largest_gap >= gap_ratio * spread:
+            return gap_at
+        knee = _knee_index(window)
+        if knee is not None and knee >= min_k:
+            return knee + 1
+    return n
+
+
+def page_boundaries(scores, max_k, relative_floor=SEARCH_CUTOFF_RELATIVE_FLOOR):
+    """Chia toàn bộ danh sách thành các trang [(start, end), ...], mỗi trang cắt thích ứng trên phần còn lại."""
+    boundaries = []
+    start = 0
+    while start < len(scores):
+        end = start + max(1, adaptive_cutoff(scores[start:], max_k, relative_floor=relative_floor))
+        boundaries.append((start, end))
+        start = end
+    return boundaries
+
+
+def search_cache_key(user_id, query, params=None):
+    """Khóa cache cho danh sách xếp hạng của một truy vấn (bỏ qua tham số phân trang)."""
+    params = {k: v for k, v in dict(params or {}).items() if k not in _NON_RANKING_PARAMS and k != "query"}
+    raw = json.dumps([user_id, query.strip(), params], sort_keys=True, ensure_ascii=False, default=str)
+    return "ranked_search:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def store_ranked(cache_key, df_original, ranked_results, boundaries, vector_distances, keyword_match_counts,
+                 constraints=None):
+    """Lưu danh sách xếp hạng (ID hồ sơ + điểm, không kèm dữ liệu hồ sơ) để phục vụ các trang tiếp theo."""
+    ranked_results = ranked_results[:SEARCH_RANKED_CACHE_SIZE]
+    has_id_column = 'id' in df_original.columns
+    rows = []
+    for idx, score in ranked_results:
+        try:
+            profile_id = int(df_original.at[idx, 'id']) if has_id_column else int(idx)
+        except (KeyError, ValueError, TypeError):
+            continue
+        rows.append({
+            "id": profile_id,
+            "total_score": score,
+            "vector_score": vector_distances.get(idx, 0),
+            "keyword_count": keyword_match_counts.get(idx, 0),
+        })
+    state = {
+        "rows": rows,
+        "boundaries": [(s, min(e, len(rows))) for s, e in boundaries if s < len(rows)],
+        "constraints": constraints,
+    }
+    try:
+        cache.set(cache_key, state, SEARCH_RANKED_CACHE_SECONDS)
+    except Exception as e:
+        print(f"Không thể lưu danh sách xếp hạng vào cache: {e}")
+    return state
+
+
+def load_ranked(cache_key):
+    try:
+        return cache.get(cache_key)
+    except Exception as e:
+        print(f"Không thể đọc danh sách xếp hạng từ cache: {e}")
+        return None
+
+
+def page_count(cache_key):
+    state = load_ranked(cache_key)
+    return len(state["boundaries"]) if state else 0
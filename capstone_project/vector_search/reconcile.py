@@ -0,0 +1,344 @@
+"""
+Đối soát database với các vector store và sửa lệch (drift).
+
+perform_create/destroy bỏ qua lỗi khi ghi/xóa vector, nên theo thời gian:
+  - vector mồ côi (orphan): còn trên vector store nhưng hồ sơ đã bị xóa -> chiếm chỗ trong top-k
+  - vector thiếu (missing): hồ sơ có trong database nhưng không có vector -> không bao giờ được tìm thấy
+
+Các đích đối soát:
+  - qdrant : collection hồ sơ (Profile)
+  - face   : ChromaDB khuôn mặt chroma_db_face/face_report (RecentlyMissingReport có image_url)
+  - local  : chỉ mục vector cục bộ (local_index.py), bổ sung vector thiếu từ Qdrant
+  - fallback: chỉ mục embedding dự phòng (fallback_encoder.py), vector thiếu được encode lại cục bộ
+
+ID được đọc thành mảng int64 đã sắp xếp rồi so bằng np.setdiff1d (vài chục ms cho một triệu ID);
+thời gian chủ yếu nằm ở việc scroll vector store.
+
+    python -m vector_search.reconcile --dry-run
+    python -m vector_search.reconcile --targets qdrant face --batch-size 500
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .config import GEMINI_API_KEYS, EMBEDDING_BUILD_WORKERS
+
+SCROLL_PAGE_SIZE = 10000
+DB_CHUNK_SIZE = 50000
+
+
+def _sorted_ids(chunks):
+    """Ghép các mảng ID thành một mảng int64 đã sắp xếp, không trùng lặp."""
+    chunks = [np.asarray(c, dtype=np.int64) for c in chunks if len(c)]
+    if not chunks:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(chunks))
+
+
+def diff_ids(db_ids, store_ids):
+    """(orphans, missing) giữa hai mảng ID đã sắp xếp, không trùng lặp."""
+    orphans = np.setdiff1d(store_ids, db_ids, assume_unique=True)
+    missing = np.setdiff1d(db_ids, store_ids, assume_unique=True)
+    return orphans, missing
+
+
+def db_ids(queryset):
+    """Stream ID từ Postgres theo từng khối (không tạo model instance)."""
+    values = queryset.order_by().values_list("id", flat=True).iterator(chunk_size=DB_CHUNK_SIZE)
+    return _sorted_ids([np.fromiter(values, dtype=np.int64)])
+
+
+def qdrant_ids(client, collection_name):
+    """Scroll toàn bộ ID (không payload, không vector)."""
+    chunks = []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=SCROLL_PAGE_SIZE,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False,
+        )
+        chunks.append(np.fromiter((int(p.id) for p in points), dtype=np.int64, count=len(points)))
+        if offset is None:
+            break
+    return _sorted_ids(chunks)
+
+
+def chroma_ids(collection):
+    """Đọc toàn bộ ID của collection ChromaDB (include=[]: chỉ lấy ID)."""
+    chunks = []
+    offset = 0
+    while True:
+        batch = collection.get(include=[], limit=SCROLL_PAGE_SIZE, offset=offset)
+        ids = batch.get("ids", [])
+        if not ids:
+            break
+        chunks.append(np.array([int(i) for i in ids if str(i).isdigit()], dtype=np.int64))
+        offset += len(ids)
+    return _sorted_ids(chunks)
+
+
+def _batches(ids, batch_size):
+    for start in range(0, len(ids), batch_size):
+        yield ids[start:start + batch_size].tolist()
+
+
+def _report(name, db_count, store_count, orphans, missing, timings):
+    drift = (len(orphans) + len(missing)) / max(db_count, 1)
+    report = {
+        "target": name,
+        "db_count": int(db_count),
+        "store_count": int(store_count),
+        "orphans": int(len(orphans)),
+        "missing": int(len(missing)),
+        "drift_ratio": round(drift, 6),
+        "timings_s": {k: round(v, 3) for k, v in timings.items()},
+    }
+    print(f"[{name}] DB={db_count} store={store_count} orphan={len(orphans)} missing={len(missing)} "
+          f"drift={drift:.4%} | " + ", ".join(f"{k}={v:.2f}s" for k, v in timings.items()))
+    return report
+
+
+# ------------------------------------------------------------------ Qdrant
+def _embed_profiles(profiles, workers):
+    from .embedding import get_embedding
+    from .indexing import profile_embedding_text
+
+    keys = GEMINI_API_KEYS or [None]
+
+    def embed(args):
+        position, profile = args
+        key = keys[position % len(keys)]
+        return profile, get_embedding(profile_embedding_text(profile), task_type="RETRIEVAL_DOCUMENT",
+                                      api_keys=[key] if key else None)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(embed, enumerate(profiles)))
+
+
+def reconcile_qdrant(dry_run=False, batch_size=500, workers=EMBEDDING_BUILD_WORKERS):
+    from qdrant_client.http import models as qdrant_models
+    from profiles.models import Profile
+    from .qdrant_helper import get_qdrant_client, get_qdrant_collection
+    from .indexing import build_profile_point
+
+    client = get_qdrant_client()
+    collection_name = get_qdrant_collection()
+    if collection_name is None:
+        print("[qdrant] Không có collection để đối soát.")
+        return None
+
+    timings = {}
+    started = time.perf_counter()
+    store = qdrant_ids(client, collection_name)
+    timings["scroll"] = time.perf_counter() - started
+    started = time.perf_counter()
+    database = db_ids(Profile.objects.all())
+    timings["db"] = time.perf_counter() - started
+    started = time.perf_counter()
+    orphans, missing = diff_ids(database, store)
+    timings["diff"] = time.perf_counter() - started
+
+    repaired = failed = 0
+    if not dry_run:
+        started = time.perf_counter()
+        for batch in _batches(orphans, batch_size):
+            client.delete(collection_name=collection_name,
+                          points_selector=qdrant_models.PointIdsList(points=batch))
+        for batch in _batches(missing, batch_size):
+            profiles = list(Profile.objects.filter(id__in=batch))
+            points = [build_profile_point(p, emb) for p, emb in _embed_profiles(profiles, workers) if emb]
+            if points:
+                client.upsert(collection_name=collection_name, points=points)
+            repaired += len(points)
+            failed += len(profiles) - len(points)
+            print(f"[qdrant] Đã bổ sung {repaired}/{len(missing)} vector thiếu...")
+        timings["repair"] = time.perf_counter() - started
+
+    report = _report("qdrant", len(database), len(store), orphans, missing, timings)
+    report.update(repaired=repaired, failed=failed, dry_run=dry_run)
+    return report
+
+
+# ------------------------------------------------------------------ ChromaDB khuôn mặt
+def reconcile_face(dry_run=False, batch_size=500, workers=4):
+    from recently_missing.models import RecentlyMissingReport
+    from recently_missing.views import get_chroma_collection, encode_face_from_url, save_embedding_to_chroma
+
+    collection = get_chroma_collection()
+    timings = {}
+    started = time.perf_counter()
+    store = chroma_ids(collection)
+    timings["scroll"] = time.perf_counter() - started
+    started = time.perf_counter()
+    # Chỉ report có ảnh mới có vector khuôn mặt
+    with_image = RecentlyMissingReport.objects.exclude(image_url__isnull=True).exclude(image_url="")
+    database = db_ids(with_image)
+    all_reports = db_ids(RecentlyMissingReport.objects.all())
+    timings["db"] = time.perf_counter() - started
+    started = time.perf_counter()
+    orphans = np.setdiff1d(store, all_reports, assume_unique=True)
+    missing = np.setdiff1d(database, store, assume_unique=True)
+    timings["diff"] = time.perf_counter() - started
+
+    repaired = failed = 0
+    if not dry_run:
+        started = time.perf_counter()
+        for batch in _batches(orphans, batch_size):
+            collection.delete(ids=[str(i) for i in batch])
+
+        def encode(report):
+            try:
+                embedding, _ = encode_face_from_url(report.image_url)
+                return report.id, embedding
+            except ValueError as e:
+                print(f"[face] Report {report.id}: {e}")
+                return report.id, None
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for batch in _batches(missing, batch_size):
+                for report_id, embedding in executor.map(encode, with_image.filter(id__in=batch)):
+                    if embedding is None:
+                        failed += 1
+                        continue
+                    save_embedding_to_chroma(report_id, embedding)
+                    repaired += 1
+        timings["repair"] = time.perf_counter() - started
+
+    report = _report("face", len(database), len(store), orphans, missing, timings)
+    report.update(repaired=repaired, failed=failed, dry_run=dry_run)
+    return report
+
+
+# ------------------------------------------------------------------ Chỉ mục cục bộ
+def reconcile_local(dry_run=False, batch_size=1000):
+    from profiles.models import Profile
+    from .local_index import get_local_index
+    from .qdrant_helper import get_qdrant_client, get_qdrant_collection
+
+    index = get_local_index()
+    if index is None:
+        print("[local] Chỉ mục cục bộ chưa được build, bỏ qua.")
+        return None
+
+    timings = {}
+    started = time.perf_counter()
+    store = _sorted_ids([index.ids()])
+    timings["scroll"] = time.perf_counter() - started
+    started = time.perf_counter()
+    database = db_ids(Profile.objects.all())
+    timings["db"] = time.perf_counter() - started
+    started = time.perf_counter()
+    orphans, missing = diff_ids(database, store)
+    timings["diff"] = time.perf_counter() - started
+
+    repaired = 0
+    if not dry_run:
+        started = time.perf_counter()
+        # Khóa chỉ mục theo từng lô (không giữ suốt quá trình) để worker web vẫn ghi được hồ sơ mới
+        if len(orphans):
+            with index.exclusive():
+                index.delete(orphans.tolist())
+                index.save()
+        client = get_qdrant_client()
+        collection_name = get_qdrant_collection()
+        if collection_name is not None:
+            for batch in _batches(missing, batch_size):
+                points = client.retrieve(collection_name=collection_name, ids=batch,
+                                         with_payload=False, with_vectors=True)
+                points = [p for p in points if p.vector is not None]
+                if points:
+                    with index.exclusive():
+                        index.add([int(p.id) for p in points],
+                                  [p.vector.get("") if isinstance(p.vector, dict) else p.vector for p in points])
+                        index.save()
+                repaired += len(points)
+        timings["repair"] = time.perf_counter() - started
+
+    report = _report("local", len(database), len(store), orphans, missing, timings)
+    report.update(repaired=repaired, failed=int(len(missing)) - repaired if not dry_run else 0, dry_run=dry_run)
+    return report
+
+
+# ------------------------------------------------------------------ Chỉ mục dự phòng
+def reconcile_fallback(dry_run=False, batch_size=1000):
+    from profiles.models import Profile
+    from .fallback_encoder import get_fallback_index, encode
+    from .indexing import profile_embedding_text
+
+    index = get_fallback_index()
+    timings = {}
+    started = time.perf_counter()
+    store = _sorted_ids([index.ids()])
+    timings["scroll"] = time.perf_counter() - started
+    started = time.perf_counter()
+    database = db_ids(Profile.objects.all())
+    timings["db"] = time.perf_counter() - started
+    started = time.perf_counter()
+    orphans, missing = diff_ids(database, store)
+    timings["diff"] = time.perf_counter() - started
+
+    repaired = 0
+    if not dry_run:
+        started = time.perf_counter()
+        if len(orphans):
+            with index.exclusive():
+                index.delete(orphans.tolist())
+                index.save()
+        for batch in _batches(missing, batch_size):
+            ids, vectors = [], []
+            for profile in Profile.objects.filter(id__in=batch):
+                vector = encode(profile_embedding_text(profile))
+                if vector is not None:
+                    ids.append(profile.id)
+                    vectors.append(vector)
+            if ids:
+                with index.exclusive():
+                    index.add(ids, vectors)
+                    index.save()
+            repaired += len(ids)
+        timings["repair"] = time.perf_counter() - started
+
+    report = _report("fallback", len(database), len(store), orphans, missing, timings)
+    report.update(repaired=repaired, failed=int(len(missing)) - repaired if not dry_run else 0, dry_run=dry_run)
+    return report
+
+
+RECONCILERS = {
+    "qdrant": reconcile_qdrant,
+    "face": reconcile_face,
+    "local": reconcile_local,
+    "fallback": reconcile_fallback,
+}
+
+
+def reconcile(targets=("qdrant", "face", "local", "fallback"), dry_run=False, batch_size=500):
+    reports = []
+    for target in targets:
+        try:
+            report = RECONCILERS[target](dry_run=dry_run, batch_size=batch_size)
+        except Exception as e:
+            print(f"[{target}] Lỗi khi đối soát: {e}")
+            report = {"target": target, "error": str(e)}
+        if report is not None:
+            reports.append(report)
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đối soát database với Qdrant / ChromaDB khuôn mặt / chỉ mục cục bộ / dự phòng")
+    parser.add_argument("--targets", nargs="+", choices=list(RECONCILERS), default=list(RECONCILERS))
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ báo cáo, không sửa")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--json", help="Ghi báo cáo drift ra file JSON")
+    args = parser.parse_args()
+
+    results = reconcile(targets=args.targets, dry_run=args.dry_run, batch_size=args.batch_size)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
@@ -3,23 +3,45 @@ import pandas as pd
 import time
 import math
 
-from .config import DETAIL_COLUMN_NAME, PINECONE_TOP_K
+from .config import (
+    DETAIL_COLUMN_NAME,
+    DIGEST_COLUMN_NAME,
+    PINECONE_TOP_K,
+    LOCAL_INDEX_TOP_K,
+    QDRANT_TOP_K,
+    QDRANT_SCORE_THRESHOLD,
+    QDRANT_RESCORE_BATCH_SIZE,
+    USE_QDRANT_HYBRID,
+    SPARSE_VECTOR_NAME,
+    QDRANT_HYBRID_PREFETCH,
+    SEARCH_RANKED_CACHE_SIZE,
+    SEARCH_CUTOFF_RELATIVE_FLOOR,
+)
 from .embedding import get_embedding
-from .llm_utils import extract_keywords_gemini, parallel_verify
-from .qdrant_helper import get_qdrant_client, get_qdrant_collection
-
-def search_combined_chroma(df_original, collection, user_query, top_n_final=100, return_json=False, user=None):
+from .llm_utils import parallel_verify
+from .keyword_extractor import extract_keywords
+from .qdrant_helper import get_qdrant_client, get_qdrant_collection, search_params
+from .text_utils import query_sparse_vector
+from .query_filters import combine_filters
+from .prefilter import prefilter_candidates, apply_structured_scores
+from .db_utils import fetch_profiles_from_db
+from .ranked_pages import adaptive_cutoff, page_boundaries, store_ranked, load_ranked
+
+def search_combined_chroma(df_original, collection, user_query, top_n_final=100, return_json=False, user=None,
+                           keywords=None):
     """
     Thực hiện tìm kiếm kết hợp:
     1. Tìm tất cả hồ sơ có ít nhất 1 từ khóa trùng khớp
     2. Thực hiện vector search trên tất cả hồ sơ
     3. Tính tổng điểm = điểm tương đồng vector + (số từ khóa khớp × 0.05)
     4. Chọn top_n_final hồ sơ có tổng điểm cao nhất để LLM lọc tiếp
+    keywords: từ khóa đã có sẵn (vd: Profile.search_keywords lúc tạo hồ sơ) thì không trích xuất lại.
     """
     print("\n--- Bắt đầu Tìm kiếm (Kết hợp Từ Khóa và Vector Search -> LLM) ---")
 
     # --- Bước 1: Trích xuất từ khóa và tìm tất cả hồ sơ có ít nhất 1 từ khóa trùng khớp ---
-    keywords = extract_keywords_gemini(user_query)
+    if not keywords:
+        keywords = extract_keywords(user_query)
     print("Từ khóa trích xuất từ Gemini:", keywords)
     
     # Chỉ tạo thông báo nếu có user
@@ -51,7 +73,7 @@ def search_combined_chroma(df_original, collection, user_query, top_n_final=100,
         )
         for keyword in keywords:
             for col in df_original.columns:
-                if df_original[col].dtype == object:
+                if df_original[col].dtype == object and col != DIGEST_COLUMN_NAME:
                     try:
                         matches = df_original[col].str.contains(keyword, case=False, na=False)
                         matched_indices = df_original[matches].index
@@ -344,13 +366,13 @@ def search_combined_pinecone(df_original, index, user_query, top_n_final=100, to
     print("\n--- Bắt đầu Tìm kiếm (Pinecone + Từ Khóa -> LLM) ---")
 
     # B1: từ khóa (giữ nguyên logic)
-    keywords = extract_keywords_gemini(user_query)
+    keywords = extract_keywords(user_query)
     keyword_match_indices = set()
     keyword_match_counts = {}
     if keywords:
         for keyword in keywords:
             for col in df_original.columns:
-                if df_original[col].dtype == object:
+                if df_original[col].dtype == object and col != DIGEST_COLUMN_NAME:
                     try:
                         matches = df_original[col].str.contains(keyword, case=False, na=False)
                         matched_indices = df_original[matches].index
@@ -488,196 +510,174 @@ def search_combined_pinecone(df_original, index, user_query, top_n_final=100, to
     return verified_indices_str
 
 
-def search_combined_qdrant(df_original, qdrant_client, collection_name, user_query, top_n_final=100, return_json=False, user=None):
-    """
-    Thực hiện tìm kiếm kết hợp với Qdrant:
-    1. Tìm tất cả hồ sơ có ít nhất 1 từ khóa trùng khớp
-    2. Thực hiện vector search trên Qdrant
-    3. Tính tổng điểm = điểm tương đồng vector + (số từ khóa khớp × 0.05)
-    4. Chọn top_n_final hồ sơ có tổng điểm cao nhất để LLM lọc tiếp
-    """
-    print("\n--- Bắt đầu Tìm kiếm (Kết hợp Từ Khóa và Qdrant Vector Search -> LLM) ---")
+KEYWORD_BONUS = 0.05
 
-    # --- Bước 1: Trích xuất từ khóa và tìm tất cả hồ sơ có ít nhất 1 từ khóa trùng khớp ---
-    keywords = extract_keywords_gemini(user_query)
-    print("Từ khóa trích xuất từ Gemini:", keywords)
-    
+
+def _notify_progress(user, text):
+    """Gửi thông báo tiến trình tìm kiếm cho user (nếu có)."""
     if user:
         from notifications.utils import create_notification
         create_notification(
             user=user,
             notification_type='profile_creating',
-            content=f'Đang trích xuất các từ khóa từ Gemini: {keywords}',
-            additional_data={'text': f'Đang trích xuất các từ khóa từ Gemini: {keywords}'}
+            content=text,
+            additional_data={'text': text}
         )
 
-    keyword_match_indices = set()
+
+def _count_keyword_matches(df_original, keywords):
+    """Đếm số lần khớp từ khóa (theo cột) cho từng DataFrame index."""
     keyword_match_counts = {}
+    for keyword in keywords or []:
+        for col in df_original.columns:
+            # pandas >= 3 dùng dtype "str" cho cột chuỗi thay vì object
+            if (df_original[col].dtype == object or pd.api.types.is_string_dtype(df_original[col])) \
+                    and col != DIGEST_COLUMN_NAME:
+                try:
+                    matches = df_original[col].str.contains(keyword, case=False, na=False)
+                    for idx in df_original.index[matches.values]:
+                        keyword_match_counts[idx] = keyword_match_counts.get(idx, 0) + 1
+                except Exception:
+                    continue
+    return keyword_match_counts
 
-    if keywords:
-        print("Đang tìm kiếm hồ sơ chứa từ khóa...")
-        if user:
-            from notifications.utils import create_notification
-            create_notification(
-                user=user,
-                notification_type='profile_creating',
-                content=f'Đang tìm kiếm các hồ sơ chứa ít nhất 1 trong các từ khóa: {keywords}',
-                additional_data={'text': f'Đang tìm kiếm các hồ sơ chứa ít nhất 1 trong các từ khóa: {keywords}'}
-            )
-        for keyword in keywords:
-            for col in df_original.columns:
-                if df_original[col].dtype == object:
-                    try:
-                        matches = df_original[col].str.contains(keyword, case=False, na=False)
-                        matched_indices = df_original[matches].index
-                        keyword_match_indices.update(matched_indices)
-                        for idx in matched_indices:
-                            keyword_match_counts[idx] = keyword_match_counts.get(idx, 0) + 1
-                    except Exception:
-                        continue
 
-    valid_keyword_indices = [idx for idx in keyword_match_indices if idx in df_original.index]
+def _db_id_to_df_index(df_original):
+    """Map database ID -> DataFrame index (không dùng iterrows)."""
+    if 'id' not in df_original.columns:
+        return {}
+    db_ids = pd.to_numeric(df_original['id'], errors='coerce')
+    valid = db_ids.notna()
+    return dict(zip(db_ids[valid].astype(np.int64).tolist(), df_original.index[valid.values].tolist()))
 
-    if not valid_keyword_indices:
-        print("\nKhông tìm thấy hồ sơ nào khớp với từ khóa. Sẽ tìm kiếm bằng vector search trên toàn bộ dữ liệu.")
-        if user:
-            from notifications.utils import create_notification
-            create_notification(
-                user=user,
-                notification_type='profile_creating',
-                content=f'Không tìm thấy hồ sơ nào khớp với từ khóa: {keywords}. Sẽ tìm kiếm bằng vector search trên toàn bộ dữ liệu.',
-                additional_data={'text': f'Không tìm thấy hồ sơ nào khớp với từ khóa: {keywords}. Sẽ tìm kiếm bằng vector search trên toàn bộ dữ liệu.'}
-            )
-        keyword_match_counts = {idx: 0 for idx in df_original.index}
-    else:
-        print(f"\nTìm thấy {len(valid_keyword_indices)} hồ sơ khớp với ít nhất một từ khóa.")
 
-    # --- Bước 2: Thực hiện vector search trên Qdrant ---
-    print("\nĐang tạo embedding cho truy vấn...")
-    if user:
-        from notifications.utils import create_notification
-        create_notification(
-            user=user,
-            notification_type='profile_creating',
-            content=f'Đang tạo mã hóa cho truy vấn: {user_query}',
-            additional_data={'text': f'Đang tạo mã hóa cho truy vấn: {user_query}'}
-        )
-    query_embedding = get_embedding(user_query, task_type="RETRIEVAL_QUERY")
-
-    if query_embedding is None:
-        print("Lỗi: Không thể tạo embedding cho truy vấn. Sử dụng chỉ kết quả từ khóa.")
-        if not valid_keyword_indices:
-            return None
-        ranked_by_keywords = sorted(keyword_match_counts.items(), key=lambda x: x[1], reverse=True)
-        top_keyword_profiles = ranked_by_keywords[:top_n_final]
-        profiles_for_llm = []
-        for idx, _ in top_keyword_profiles:
-            try:
-                profile_data = df_original.loc[idx].copy()
-                profile_data['id'] = str(idx)
-                profiles_for_llm.append(profile_data)
-            except KeyError:
-                continue
-        verified_indices_str = parallel_verify(user_query, profiles_for_llm, max_profiles=len(profiles_for_llm))
-        return verified_indices_str
+def _local_vector_scores(df_original, query_embedding, limit=None):
+    """
+    Vector search bằng chỉ mục cục bộ (in-process).
+    Trả về dict {DataFrame index: score} hoặc None nếu chỉ mục chưa được build.
+    """
+    from .local_index import get_local_index
 
-    # Thực hiện vector search trên Qdrant
-    print("Đang thực hiện vector search trên Qdrant...")
-    if user:
-        from notifications.utils import create_notification
-        create_notification(
-            user=user,
-            notification_type='profile_creating',
-            content=f'Đang thực hiện vector search trên Qdrant...',
-            additional_data={'text': f'Đang thực hiện vector search trên Qdrant...'}
-        )
-    
-    try:
-        # Query Qdrant - không cần lấy collection info (tránh version mismatch)
-        # Sử dụng limit lớn để lấy nhiều kết quả nhất có thể
-        search_results = qdrant_client.search(
-            collection_name=collection_name,
-            query_vector=query_embedding,
-            limit=10000  # Giới hạn tối đa 10000 vectors
-        )
-    except Exception as e:
-        print(f"Lỗi khi truy vấn Qdrant: {e}")
+    index = get_local_index()
+    if index is None or index.count() == 0:
+        print("Chỉ mục vector cục bộ chưa được build.")
         return None
 
-    # --- Bước 3: Kết hợp kết quả từ khóa và vector ---
-    print("Đang kết hợp kết quả từ khóa và vector...")
-    if user:
-        from notifications.utils import create_notification
-        create_notification(
-            user=user,
-            notification_type='profile_creating',
-            content=f'Đang kết hợp kết quả từ khóa và vector...',
-            additional_data={'text': f'Đang kết hợp kết quả từ khóa và vector...'}
-        )
+    started = time.perf_counter()
+    results = index.search(query_embedding, limit=limit or LOCAL_INDEX_TOP_K)
+    print(f"Vector search cục bộ: {len(results)} kết quả trong {(time.perf_counter() - started) * 1000:.1f} ms.")
+    return _db_scores_to_df_index(df_original, results)
 
-    # Mapping: Qdrant point ID -> Database profile ID
-    # Lấy ID thực từ payload (metadata) thay vì dùng point ID
-    vector_distances = {}  # Key: DataFrame index, Value: vector score
-    db_id_to_df_index = {}  # Map từ database ID sang DataFrame index
-    
-    # Tạo mapping từ database ID sang DataFrame index một lần
-    if 'id' in df_original.columns:
-        for df_idx, row in df_original.iterrows():
-            db_id = row.get('id')
-            if db_id is not None:
-                try:
-                    db_id = int(db_id)
-                    db_id_to_df_index[db_id] = df_idx
-                except (ValueError, TypeError):
-                    pass
-    
-    if search_results:
-        for result in search_results:
-            try:
-                qdrant_point_id = int(result.id)
-                # Lấy ID thực từ payload (metadata) - đây là ID từ database
-                payload = result.payload if hasattr(result, 'payload') else {}
-                db_id_str = payload.get('id', '')
-                
-                if db_id_str:
-                    try:
-                        db_id = int(db_id_str)
-                        # Tìm DataFrame index từ database ID
-                        if db_id in db_id_to_df_index:
-                            df_idx = db_id_to_df_index[db_id]
-                            vector_distances[df_idx] = result.score
-                        else:
-                            # Fallback: thử tìm trực tiếp trong DataFrame
-                            matching_rows = df_original[df_original['id'] == db_id]
-                            if not matching_rows.empty:
-                                df_idx = matching_rows.index[0]
-                                vector_distances[df_idx] = result.score
-                                db_id_to_df_index[db_id] = df_idx
-                    except (ValueError, TypeError):
-                        # Nếu không parse được, bỏ qua
-                        continue
-                else:
-                    # Nếu không có ID trong payload, thử dùng point ID (fallback)
-                    # Chỉ dùng nếu point ID trùng với database ID
-                    if qdrant_point_id in db_id_to_df_index:
-                        df_idx = db_id_to_df_index[qdrant_point_id]
-                        vector_distances[df_idx] = result.score
-            except (ValueError, AttributeError) as e:
-                print(f"Lỗi khi xử lý kết quả từ Qdrant: {e}")
-                continue
-    else:
-        print("Không nhận được kết quả từ vector search.")
+
+def _fallback_vector_scores(df_original, user_query, limit=None):
+    """
+    Vector search bằng embedding dự phòng (fallback_encoder.py) khi không tạo được embedding Gemini.
+    Trả về dict {DataFrame index: score} hoặc None nếu chỉ mục dự phòng chưa có dữ liệu.
+    """
+    from .fallback_encoder import search_fallback
+
+    started = time.perf_counter()
+    results = search_fallback(user_query, limit=limit or LOCAL_INDEX_TOP_K)
+    if results is None:
+        print("Chỉ mục dự phòng chưa có dữ liệu.")
         return None
+    print(f"Vector search dự phòng (n-gram băm): {len(results)} kết quả trong "
+          f"{(time.perf_counter() - started) * 1000:.1f} ms.")
+    return _db_scores_to_df_index(df_original, results)
 
-    combined_scores = {}
-    KEYWORD_BONUS = 0.05
 
-    for idx in df_original.index:
-        vector_score = vector_distances.get(idx, 0)
-        keyword_count = keyword_match_counts.get(idx, 0)
-        total_score = vector_score + keyword_count * KEYWORD_BONUS
-        if total_score > 0:
-            combined_scores[idx] = total_score
+def _db_scores_to_df_index(df_original, results):
+    """[(ID hồ sơ, score)] -> {DataFrame index: score}."""
+    db_id_to_df_index = _db_id_to_df_index(df_original)
+    vector_distances = {}
+    for db_id, score in results:
+        df_idx = db_id_to_df_index.get(db_id)
+        if df_idx is not None:
+            vector_distances[df_idx] = score
+    return vector_distances
+
+
+def _build_json_results(df_original, verified_indices_str, combined_scores, vector_distances, keyword_match_counts):
+    """Chuyển danh sách index đã được LLM xác minh thành list dict trả về cho API."""
+    result_list = []
+    for idx in verified_indices_str or []:
+        try:
+            idx_int = int(idx)
+            profile = df_original.loc[idx_int]
+            # Lấy ID thực từ database (từ cột 'id' hoặc dùng index nếu index là ID)
+            if 'id' in df_original.columns:
+                db_id = profile.get('id', idx_int)
+                # Đảm bảo db_id là số nguyên
+                try:
+                    db_id = int(db_id) if db_id is not None else idx_int
+                except (ValueError, TypeError):
+                    db_id = idx_int
+            else:
+                db_id = idx_int
+
+            result_list.append({
+                "id": str(db_id),  # Dùng ID thực từ database
+                "total_score": combined_scores.get(idx_int, 0),
+                "vector_score": vector_distances.get(idx_int, 0),
+                "keyword_score": keyword_match_counts.get(idx_int, 0) * KEYWORD_BONUS,
+                "matched_keywords": keyword_match_counts.get(idx_int, 0),
+                "title": profile.get('Tiêu đề', ''),
+                "full_name": profile.get('Họ và tên', ''),
+                "losing_year": profile.get('Năm thất lạc', ''),
+                "born_year": profile.get('Năm sinh', ''),
+                "name_of_father": profile.get('Tên cha', ''),
+                "name_of_mother": profile.get('Tên mẹ', ''),
+                "siblings": profile.get('Anh chị em', ''),
+                "detail": str(profile.get(DETAIL_COLUMN_NAME, '')),
+                "link": profile.get('Link', ''),
+            })
+        except Exception as e:
+            print(f"Lỗi khi build kết quả JSON: {e}")
+            continue
+    return result_list
+
+
+def _candidate_summaries(df_original, candidates, combined_scores):
+    """Thông tin ngắn của các ứng viên (trước LLM) cho sự kiện stream "candidates"."""
+    summaries = []
+    for idx, profile in candidates:
+        # profile['id'] đã bị ghi đè bằng index DataFrame cho prompt LLM; ID thật nằm trong df_original
+        db_id = df_original.loc[idx].get('id', idx)
+        summaries.append({
+            "id": str(db_id),
+            "title": profile.get('Tiêu đề', ''),
+            "full_name": profile.get('Họ và tên', ''),
+            "total_score": combined_scores.get(idx, 0),
+        })
+    return summaries
+
+
+def _rank_and_verify(df_original, user_query, vector_distances, keyword_match_counts, top_n_final=100,
+                     return_json=False, user=None, combined_scores=None, constraints=None, page_cache_key=None,
+                     on_event=None, rank_only=False, relative_floor=SEARCH_CUTOFF_RELATIVE_FLOOR):
+    """
+    Bước 3-4 chung cho mọi vector backend:
+    tổng điểm = vector + số từ khóa khớp × 0.05 -> cắt thích ứng (tối đa top_n_final, xem ranked_pages.py)
+    -> lọc sơ bộ (prefilter.py) -> LLM xác minh.
+    Nếu combined_scores đã được tính sẵn (ví dụ Qdrant hybrid hợp nhất phía server) thì dùng luôn.
+    page_cache_key: lưu danh sách xếp hạng để verify_ranked_page phục vụ các trang tiếp theo.
+    on_event: callback(event, data) cho API stream (xem _verify_top_results).
+    rank_only: chỉ xếp hạng và lưu vào page_cache_key, không xác minh (trang > 1 khi cache đã hết hạn);
+    trả về [].
+    constraints: ràng buộc tường minh từ API (constraints_from_params) cho bước lọc sơ bộ.
+    relative_floor: ngưỡng tương đối của adaptive_cutoff; 0 với điểm không phải cosine (RRF, embedding dự phòng).
+    """
+    if combined_scores is None:
+        print("Đang kết hợp kết quả từ khóa và vector...")
+        _notify_progress(user, 'Đang kết hợp kết quả từ khóa và vector...')
+
+        combined_scores = {}
+        for idx in df_original.index:
+            vector_score = vector_distances.get(idx, 0)
+            keyword_count = keyword_match_counts.get(idx, 0)
+            total_score = vector_score + keyword_count * KEYWORD_BONUS
+            if total_score > 0:
+                combined_scores[idx] = total_score
 
     if not combined_scores:
         print("Không tìm thấy hồ sơ nào có điểm kết hợp > 0.")
@@ -685,52 +685,69 @@ def search_combined_qdrant(df_original, qdrant_client, collection_name, user_que
 
     print(f"Đang xếp hạng {len(combined_scores)} hồ sơ theo điểm kết hợp...")
     ranked_results = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
-    top_results = ranked_results[:top_n_final]
+    scores = [score for _, score in ranked_results]
+    if page_cache_key:
+        boundaries = page_boundaries(scores[:SEARCH_RANKED_CACHE_SIZE], top_n_final, relative_floor=relative_floor)
+        store_ranked(page_cache_key, df_original, ranked_results, boundaries, vector_distances,
+                     keyword_match_counts, constraints)
+        if rank_only:
+            return []
+        cutoff = boundaries[0][1]
+    else:
+        cutoff = adaptive_cutoff(scores, top_n_final, relative_floor=relative_floor)
+    top_results = ranked_results[:cutoff]
+    print(f"Cắt thích ứng: xác minh {len(top_results)}/{min(top_n_final, len(ranked_results))} hồ sơ đầu")
 
     print(f"\n--- Top {min(10, len(top_results))} Kết quả (Theo Điểm Kết Hợp, Trước LLM) ---")
-    if user:
-        from notifications.utils import create_notification
-        create_notification(
-            user=user,
-            notification_type='profile_creating',
-            content=f'Đã tìm thấy {len(top_results)} hồ sơ phù hợp sau khi kết hợp từ khóa và vector search.',
-            additional_data={'text': f'Đã tìm thấy {len(top_results)} hồ sơ phù hợp sau khi kết hợp từ khóa và vector search.'}
-        )
+    _notify_progress(user, f'Đã tìm thấy {len(top_results)} hồ sơ phù hợp sau khi kết hợp từ khóa và vector search.')
 
-    profiles_for_llm = []
+    return _verify_top_results(df_original, user_query, top_results, combined_scores, vector_distances,
+                               keyword_match_counts, return_json=return_json, user=user, constraints=constraints,
+                               on_event=on_event)
+
+
+def _verify_top_results(df_original, user_query, top_results, combined_scores, vector_distances,
+                        keyword_match_counts, return_json=False, user=None, constraints=None, on_event=None):
+    """
+    Lọc sơ bộ + LLM xác minh một trang ứng viên [(index, tổng điểm), ...] đã xếp hạng.
+    on_event(event, data) nếu có: "candidates" (ứng viên đã xếp hạng, trước LLM) rồi "results"
+    (kết quả dạng JSON của từng lô ngay khi Gemini xác minh xong).
+    """
+    candidates = []
     for idx, _ in top_results:
         try:
             profile_data = df_original.loc[idx].copy()
             profile_data['id'] = str(idx)
-            profiles_for_llm.append(profile_data)
+            candidates.append((idx, profile_data))
         except KeyError:
             continue
 
+    # Loại các hồ sơ mâu thuẫn rõ ràng (năm lệch xa, tên cha mẹ khác hẳn) trước khi tốn token LLM;
+    # hồ sơ khớp năm / tên cha mẹ / anh chị em được cộng điểm và xếp lên trước (lô đầu, stream trước)
+    candidates, structured_scores = prefilter_candidates(user_query, candidates, constraints=constraints)
+    candidates, combined_scores = apply_structured_scores(candidates, combined_scores, structured_scores)
+    profiles_for_llm = [profile_data for _, profile_data in candidates]
+
     if not profiles_for_llm:
         print("Không tìm thấy hồ sơ hợp lệ để gửi đến LLM.")
         return None
 
+    on_batch = None
+    if on_event is not None:
+        on_event("candidates", _candidate_summaries(df_original, candidates, combined_scores))
+
+        def on_batch(batch_indices_str):
+            on_event("results", _build_json_results(df_original, batch_indices_str, combined_scores,
+                                                    vector_distances, keyword_match_counts))
+
     print(f"\nĐang xác minh {len(profiles_for_llm)} kết quả với Gemini LLM...")
-    if user:
-        from notifications.utils import create_notification
-        create_notification(
-            user=user,
-            notification_type='profile_creating',
-            content=f'Đang xác minh {len(profiles_for_llm)} kết quả với Gemini LLM...',
-            additional_data={'text': f'Đang xác minh {len(profiles_for_llm)} kết quả với Gemini LLM...'}
-        )
-    verified_indices_str = parallel_verify(user_query, profiles_for_llm, max_profiles=len(profiles_for_llm))
+    _notify_progress(user, f'Đang xác minh {len(profiles_for_llm)} kết quả với Gemini LLM...')
+    verified_indices_str = parallel_verify(user_query, profiles_for_llm, max_profiles=len(profiles_for_llm),
+                                           on_batch=on_batch)
 
     if verified_indices_str:
         print(f"\n=== {len(verified_indices_str)} KẾT QUẢ PHÙ HỢP NHẤT SAU KHI LỌC BẰNG LLM ===")
-        if user:
-            from notifications.utils import create_notification
-            create_notification(
-                user=user,
-                notification_type='profile_creating',
-                content=f'Đã tìm thấy {len(verified_indices_str) - 1} kết quả phù hợp nhất sau khi lọc bằng LLM.',
-                additional_data={'text': f'Đã tìm thấy {len(verified_indices_str) - 1} kết quả phù hợp nhất sau khi lọc bằng LLM.'}
-            )
+        _notify_progress(user, f'Đã tìm thấy {len(verified_indices_str) - 1} kết quả phù hợp nhất sau khi lọc bằng LLM.')
         verified_indices_int = [int(id_str) for id_str in verified_indices_str if id_str.isdigit()]
         verified_with_scores = [(idx, combined_scores.get(idx, 0)) for idx in verified_indices_int if idx in combined_scores]
         verified_with_scores.sort(key=lambda x: x[1], reverse=True)
@@ -755,41 +772,529 @@ def search_combined_qdrant(df_original, qdrant_client, collection_name, user_que
         print("\nKhông tìm thấy hồ sơ nào phù hợp sau khi xác minh bằng LLM.")
 
     if return_json:
-        result_list = []
-        for idx in verified_indices_str:
+        return _build_json_results(df_original, verified_indices_str, combined_scores, vector_distances, keyword_match_counts)
+
+    return verified_indices_str
+
+
+def verify_ranked_page(user_query, page_cache_key, page, return_json=False, user=None, on_event=None):
+    """
+    Trang `page` (bắt đầu từ 1) của một truy vấn đã chạy: lấy phần tiếp theo của danh sách xếp hạng
+    trong cache, đọc dữ liệu các hồ sơ của trang từ database và chỉ chạy bước xác minh LLM.
+    Trả về None nếu cache đã hết hạn (cần xếp hạng lại), [] nếu không còn trang.
+    """
+    state = load_ranked(page_cache_key)
+    if state is None:
+        return None
+    if page < 1 or page > len(state["boundaries"]):
+        return []
+    start, end = state["boundaries"][page - 1]
+    rows = state["rows"][start:end]
+    print(f"Trang {page}: xác minh hồ sơ {start + 1}-{end} từ danh sách đã xếp hạng (không chạy lại tìm kiếm)")
+
+    # DataFrame của trang với index = ID hồ sơ (hồ sơ đã bị xóa từ lúc xếp hạng thì bỏ qua)
+    df_page = fetch_profiles_from_db(ids=[r["id"] for r in rows])
+    if df_page.empty:
+        return []
+    df_page.index = df_page['id'].astype(np.int64)
+    rows = [r for r in rows if r["id"] in df_page.index]
+    combined_scores = {r["id"]: r["total_score"] for r in rows}
+    vector_distances = {r["id"]: r["vector_score"] for r in rows}
+    keyword_match_counts = {r["id"]: r["keyword_count"] for r in rows}
+    top_results = [(r["id"], r["total_score"]) for r in rows]
+    return _verify_top_results(df_page, user_query, top_results, combined_scores, vector_distances,
+                               keyword_match_counts, return_json=return_json, user=user,
+                               constraints=state.get("constraints"), on_event=on_event)
+
+
+def _prepare_keywords_and_embedding(df_original, user_query, user=None):
+    """
+    Bước 1-2 chung: trích xuất từ khóa, đếm khớp và tạo embedding truy vấn.
+    Trả về (keyword_match_counts, has_keyword_match, query_embedding).
+    """
+    keywords = extract_keywords(user_query)
+    print("Từ khóa trích xuất:", keywords)
+    _notify_progress(user, f'Đang trích xuất các từ khóa: {keywords}')
+
+    keyword_match_counts = {}
+    if keywords:
+        print("Đang tìm kiếm hồ sơ chứa từ khóa...")
+        _notify_progress(user, f'Đang tìm kiếm các hồ sơ chứa ít nhất 1 trong các từ khóa: {keywords}')
+        keyword_match_counts = _count_keyword_matches(df_original, keywords)
+
+    has_keyword_match = bool(keyword_match_counts)
+    if not has_keyword_match:
+        print("\nKhông tìm thấy hồ sơ nào khớp với từ khóa. Sẽ tìm kiếm bằng vector search trên toàn bộ dữ liệu.")
+        _notify_progress(user, f'Không tìm thấy hồ sơ nào khớp với từ khóa: {keywords}. Sẽ tìm kiếm bằng vector search trên toàn bộ dữ liệu.')
+        keyword_match_counts = {idx: 0 for idx in df_original.index}
+    else:
+        print(f"\nTìm thấy {len(keyword_match_counts)} hồ sơ khớp với ít nhất một từ khóa.")
+
+    print("\nĐang tạo embedding cho truy vấn...")
+    _notify_progress(user, f'Đang tạo mã hóa cho truy vấn: {user_query}')
+    query_embedding = get_embedding(user_query, task_type="RETRIEVAL_QUERY")
+    return keyword_match_counts, has_keyword_match, query_embedding
+
+
+def _verify_keyword_only(df_original, user_query, keyword_match_counts, top_n_final):
+    """Fallback khi không tạo được embedding: xếp hạng chỉ theo số từ khóa khớp rồi LLM xác minh."""
+    ranked_by_keywords = sorted(keyword_match_counts.items(), key=lambda x: x[1], reverse=True)
+    top_keyword_profiles = ranked_by_keywords[:top_n_final]
+    profiles_for_llm = []
+    for idx, _ in top_keyword_profiles:
+        try:
+            profile_data = df_original.loc[idx].copy()
+            profile_data['id'] = str(idx)
+            profiles_for_llm.append(profile_data)
+        except KeyError:
+            continue
+    return parallel_verify(user_query, profiles_for_llm, max_profiles=len(profiles_for_llm))
+
+
+def _qdrant_hits_to_scores(hits, db_id_to_df_index, vector_distances):
+    """Ghi điểm vector của các point Qdrant vào dict {DataFrame index: score} (db_id_to_df_index=None: theo ID hồ sơ)."""
+    for hit in hits or []:
+        try:
+            # Lấy ID thực từ payload (metadata); nếu không có thì dùng point ID (trùng database ID)
+            db_id_str = (getattr(hit, 'payload', None) or {}).get('id', '')
+            db_id = int(db_id_str) if db_id_str else int(hit.id)
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Lỗi khi xử lý kết quả từ Qdrant: {e}")
+            continue
+        df_idx = db_id if db_id_to_df_index is None else db_id_to_df_index.get(db_id)
+        if df_idx is not None:
+            vector_distances[df_idx] = hit.score
+
+
+def _qdrant_nearest(qdrant_client, collection_name, query, query_filter, params, limit, score_threshold=None):
+    """
+    Tìm các point gần nhất. query: vector truy vấn, hoặc ID (int) của một point đã lưu -> Qdrant dùng
+    chính vector của point đó (query-by-id), không cần embed lại.
+    """
+    if isinstance(query, int):
+        return qdrant_client.query_points(
+            collection_name=collection_name,
+            query=query,
+            query_filter=query_filter,
+            search_params=params,
+            limit=limit,
+            score_threshold=score_threshold,
+            with_payload=["id"],
+        ).points
+    return qdrant_client.search(
+        collection_name=collection_name,
+        query_vector=query,
+        query_filter=query_filter,
+        search_params=params,
+        limit=limit,
+        score_threshold=score_threshold,
+        with_payload=["id"],
+    )
+
+
+def _qdrant_rescore_ids(qdrant_client, collection_name, query, db_ids, query_filter, params, db_id_to_df_index,
+                        vector_distances):
+    """Chấm điểm vector cho đúng các hồ sơ `db_ids` (lọc theo ID, từng lô QDRANT_RESCORE_BATCH_SIZE)."""
+    from qdrant_client.http import models as qdrant_models
+
+    for start in range(0, len(db_ids), QDRANT_RESCORE_BATCH_SIZE):
+        chunk = db_ids[start:start + QDRANT_RESCORE_BATCH_SIZE]
+        id_filter = qdrant_models.Filter(should=[
+            qdrant_models.HasIdCondition(has_id=chunk),
+            qdrant_models.FieldCondition(key="id", match=qdrant_models.MatchAny(any=[str(i) for i in chunk])),
+        ])
+        hits = _qdrant_nearest(qdrant_client, collection_name, query, combine_filters(id_filter, query_filter),
+                               params, limit=len(chunk))
+        _qdrant_hits_to_scores(hits, db_id_to_df_index, vector_distances)
+
+
+def _qdrant_vector_scores(qdrant_client, collection_name, query_embedding, df_original, db_id_to_df_index,
+                          keyword_match_counts, top_k=QDRANT_TOP_K, query_filter=None):
+    """
+    Vector search 2 bước trên Qdrant (thay cho việc kéo limit=10000 kèm toàn bộ payload):
+    1. Lấy top_k gần nhất, chỉ kèm payload 'id'.
+    2. Chấm điểm riêng các hồ sơ khớp từ khóa nằm ngoài top_k bằng filter theo ID.
+    Hồ sơ không khớp từ khóa và ngoài top_k có điểm <= điểm thứ top_k nên không thể lọt
+    vào top_n_final (top_k >= top_n_final) -> xếp hạng cuối cùng không đổi.
+    query_filter (năm sinh/năm thất lạc/tên cha mẹ) được áp dụng ở cả 2 bước.
+    query_embedding có thể là ID của một hồ sơ đã có trong Qdrant (xem _qdrant_nearest).
+    """
+    started = time.perf_counter()
+    params = search_params()
+    vector_distances = {}
+    search_results = _qdrant_nearest(qdrant_client, collection_name, query_embedding, query_filter, params,
+                                     limit=top_k, score_threshold=QDRANT_SCORE_THRESHOLD)
+    _qdrant_hits_to_scores(search_results, db_id_to_df_index, vector_distances)
+
+    # Bước 2: các hồ sơ khớp từ khóa nhưng chưa có điểm vector
+    missing_db_ids = []
+    for idx, count in keyword_match_counts.items():
+        if count > 0 and idx not in vector_distances:
             try:
-                idx_int = int(idx)
-                profile = df_original.loc[idx_int]
-                # Lấy ID thực từ database (từ cột 'id' hoặc dùng index nếu index là ID)
-                if 'id' in df_original.columns:
-                    db_id = profile.get('id', idx_int)
-                    # Đảm bảo db_id là số nguyên
-                    try:
-                        db_id = int(db_id) if db_id is not None else idx_int
-                    except (ValueError, TypeError):
-                        db_id = idx_int
-                else:
-                    db_id = idx_int
-                
-                result_list.append({
-                    "id": str(db_id),  # Dùng ID thực từ database
-                    "total_score": combined_scores.get(idx_int, 0),
-                    "vector_score": vector_distances.get(idx_int, 0),
-                    "keyword_score": keyword_match_counts.get(idx_int, 0) * KEYWORD_BONUS,
-                    "matched_keywords": keyword_match_counts.get(idx_int, 0),
-                    "title": profile.get('Tiêu đề', ''),
-                    "full_name": profile.get('Họ và tên', ''),
-                    "losing_year": profile.get('Năm thất lạc', ''),
-                    "born_year": profile.get('Năm sinh', ''),
-                    "name_of_father": profile.get('Tên cha', ''),
-                    "name_of_mother": profile.get('Tên mẹ', ''),
-                    "siblings": profile.get('Anh chị em', ''),
-                    "detail": str(profile.get(DETAIL_COLUMN_NAME, '')),
-                    "link": profile.get('Link', ''),
-                })
-            except Exception as e:
-                print(f"Lỗi khi build kết quả JSON: {e}")
+                missing_db_ids.append(int(df_original.at[idx, 'id']) if 'id' in df_original.columns else int(idx))
+            except (ValueError, TypeError, KeyError):
                 continue
-        return result_list
 
-    return verified_indices_str
\ No newline at end of file
+    _qdrant_rescore_ids(qdrant_client, collection_name, query_embedding, missing_db_ids, query_filter, params,
+                        db_id_to_df_index, vector_distances)
+
+    print(f"Qdrant: {len(search_results)} kết quả top-k + {len(missing_db_ids)} hồ sơ khớp từ khóa được chấm lại "
+          f"trong {(time.perf_counter() - started) * 1000:.1f} ms.")
+    return vector_distances
+
+
+def _qdrant_hybrid_scores(qdrant_client, collection_name, query_embedding, query_text, db_id_to_df_index, limit,
+                          query_filter=None):
+    """
+    Hybrid search phía server: Qdrant chạy song song nhánh dense (Gemini) và sparse (BM25 tiếng Việt)
+    rồi hợp nhất bằng Reciprocal Rank Fusion trong cùng một truy vấn.
+    Trả về dict {DataFrame index: điểm RRF}.
+    """
+    from qdrant_client.http import models as qdrant_models
+
+    started = time.perf_counter()
+    prefetch = []
+    if query_embedding is not None:
+        prefetch.append(qdrant_models.Prefetch(
+            query=query_embedding, filter=query_filter, params=search_params(), limit=QDRANT_HYBRID_PREFETCH))
+    sparse_indices, sparse_values = query_sparse_vector(query_text)
+    if sparse_indices:
+        prefetch.append(qdrant_models.Prefetch(
+            query=qdrant_models.SparseVector(indices=sparse_indices, values=sparse_values),
+            using=SPARSE_VECTOR_NAME,
+            filter=query_filter,
+            limit=QDRANT_HYBRID_PREFETCH,
+        ))
+    if not prefetch:
+        return {}
+
+    response = qdrant_client.query_points(
+        collection_name=collection_name,
+        prefetch=prefetch,
+        query=qdrant_models.FusionQuery(fusion=qdrant_models.Fusion.RRF),
+        limit=limit,
+        with_payload=["id"],
+    )
+    fused_scores = {}
+    _qdrant_hits_to_scores(response.points, db_id_to_df_index, fused_scores)
+    print(f"Qdrant hybrid (dense + sparse, RRF): {len(response.points)} kết quả "
+          f"trong {(time.perf_counter() - started) * 1000:.1f} ms.")
+    return fused_scores
+
+
+def _search_qdrant_hybrid(df_original, qdrant_client, collection_name, user_query, top_n_final=100,
+                          return_json=False, user=None, query_filter=None, page_cache_key=None, on_event=None,
+                          rank_only=False, api_constraints=None):
+    """Nhánh hybrid của search_combined_qdrant: không quét từ khóa trên DataFrame, không join trong Python."""
+    print("\n--- Bắt đầu Tìm kiếm (Qdrant Hybrid Dense + Sparse -> LLM) ---")
+
+    keywords = extract_keywords(user_query)
+    print("Từ khóa trích xuất:", keywords)
+    _notify_progress(user, f'Đang trích xuất các từ khóa: {keywords}')
+
+    print("\nĐang tạo embedding cho truy vấn...")
+    _notify_progress(user, f'Đang tạo mã hóa cho truy vấn: {user_query}')
+    query_embedding = get_embedding(user_query, task_type="RETRIEVAL_QUERY")
+    if query_embedding is None:
+        print("Lỗi: Không thể tạo embedding cho truy vấn. Chỉ dùng nhánh sparse (từ khóa).")
+
+    print("Đang thực hiện hybrid search trên Qdrant...")
+    _notify_progress(user, 'Đang thực hiện vector search trên Qdrant...')
+    query_text = " ".join([user_query] + list(keywords or []))
+    fused_scores = _qdrant_hybrid_scores(
+        qdrant_client, collection_name, query_embedding, query_text,
+        _db_id_to_df_index(df_original),
+        limit=max(top_n_final, SEARCH_RANKED_CACHE_SIZE) if page_cache_key else top_n_final,
+        query_filter=query_filter
+    )
+    if not fused_scores:
+        print("Không nhận được kết quả từ hybrid search.")
+        return None
+
+    # Điểm RRF (~1/60) không có thang cosine -> không dùng ngưỡng tương đối so với điểm cao nhất
+    return _rank_and_verify(df_original, user_query, fused_scores, {}, top_n_final=top_n_final,
+                            return_json=return_json, user=user, combined_scores=fused_scores,
+                            page_cache_key=page_cache_key, on_event=on_event, rank_only=rank_only,
+                            constraints=api_constraints, relative_floor=0.0)
+
+
+def search_combined_qdrant(df_original, qdrant_client, collection_name, user_query, top_n_final=100, return_json=False, user=None,
+                           query_filter=None, page_cache_key=None, on_event=None, rank_only=False, api_constraints=None):
+    """
+    Thực hiện tìm kiếm kết hợp với Qdrant:
+    1. Tìm tất cả hồ sơ có ít nhất 1 từ khóa trùng khớp
+    2. Thực hiện vector search trên Qdrant (lỗi -> dùng chỉ mục cục bộ nếu có)
+    3. Tính tổng điểm = điểm tương đồng vector + (số từ khóa khớp × 0.05)
+    4. Chọn top_n_final hồ sơ có tổng điểm cao nhất để LLM lọc tiếp
+    Khi bật USE_QDRANT_HYBRID: bước 1-3 được thay bằng một truy vấn hybrid (dense + sparse) trên Qdrant.
+    query_filter: Qdrant Filter (xem query_filters.py) để thu hẹp ứng viên ngay trong Qdrant.
+    page_cache_key: lưu danh sách xếp hạng cho các trang tiếp theo (xem verify_ranked_page).
+    rank_only: chỉ xếp hạng lại vào page_cache_key, không xác minh LLM (xem _rank_and_verify).
+    api_constraints: ràng buộc tường minh từ API (constraints_from_params) cho bước lọc sơ bộ.
+    """
+    if USE_QDRANT_HYBRID:
+        try:
+            return _search_qdrant_hybrid(df_original, qdrant_client, collection_name, user_query,
+                                         top_n_final=top_n_final, return_json=return_json, user=user,
+                                         query_filter=query_filter, page_cache_key=page_cache_key,
+                                         on_event=on_event, rank_only=rank_only, api_constraints=api_constraints)
+        except Exception as e:
+            print(f"Lỗi khi hybrid search trên Qdrant, chuyển về tìm kiếm kết hợp thông thường: {e}")
+
+    print("\n--- Bắt đầu Tìm kiếm (Kết hợp Từ Khóa và Qdrant Vector Search -> LLM) ---")
+
+    keyword_match_counts, has_keyword_match, query_embedding = _prepare_keywords_and_embedding(df_original, user_query, user)
+
+    if query_embedding is None:
+        print("Lỗi: Không thể tạo embedding cho truy vấn. Dùng embedding dự phòng.")
+        _notify_progress(user, 'Đang tìm kiếm ở chế độ dự phòng (không tạo được mã hóa Gemini)...')
+        vector_distances = _fallback_vector_scores(df_original, user_query)
+        if vector_distances:
+            # Điểm n-gram băm có thang khác cosine Gemini -> không dùng ngưỡng tương đối
+            return _rank_and_verify(df_original, user_query, vector_distances, keyword_match_counts,
+                                    top_n_final=top_n_final, return_json=return_json, user=user,
+                                    page_cache_key=page_cache_key, on_event=on_event, rank_only=rank_only,
+                                    constraints=api_constraints,
+                                    relative_floor=0.0)
+        print("Không có kết quả từ embedding dự phòng. Sử dụng chỉ kết quả từ khóa.")
+        if not has_keyword_match or rank_only:
+            return None
+        return _verify_keyword_only(df_original, user_query, keyword_match_counts, top_n_final)
+
+    # Thực hiện vector search trên Qdrant
+    print("Đang thực hiện vector search trên Qdrant...")
+    _notify_progress(user, 'Đang thực hiện vector search trên Qdrant...')
+
+    db_id_to_df_index = _db_id_to_df_index(df_original)  # Map từ database ID sang DataFrame index
+    try:
+        vector_distances = _qdrant_vector_scores(
+            qdrant_client, collection_name, query_embedding, df_original, db_id_to_df_index,
+            keyword_match_counts, top_k=max(QDRANT_TOP_K, top_n_final), query_filter=query_filter
+        )
+        if query_filter is not None:
+            # Hồ sơ khớp từ khóa nhưng không thỏa filter thì Qdrant không trả về -> loại luôn
+            keyword_match_counts = {idx: count for idx, count in keyword_match_counts.items() if idx in vector_distances}
+    except Exception as e:
+        print(f"Lỗi khi truy vấn Qdrant: {e}")
+        # Qdrant lỗi -> thử chỉ mục vector cục bộ
+        vector_distances = _local_vector_scores(df_original, query_embedding)
+        if vector_distances is None:
+            return None
+
+    if not vector_distances and not has_keyword_match:
+        print("Không nhận được kết quả từ vector search.")
+        return None
+
+    return _rank_and_verify(df_original, user_query, vector_distances, keyword_match_counts,
+                            top_n_final=top_n_final, return_json=return_json, user=user,
+                            page_cache_key=page_cache_key, on_event=on_event, rank_only=rank_only,
+                            constraints=api_constraints)
+
+
+def search_combined_local(df_original, user_query, top_n_final=100, return_json=False, user=None, page_cache_key=None,
+                          on_event=None, rank_only=False, api_constraints=None):
+    """
+    Tìm kiếm kết hợp chạy hoàn toàn trong tiến trình (không cần Qdrant/Chroma):
+    giống search_combined_qdrant nhưng vector search dùng LocalVectorIndex.
+    """
+    print("\n--- Bắt đầu Tìm kiếm (Kết hợp Từ Khóa và Vector Index cục bộ -> LLM) ---")
+
+    keyword_match_counts, has_keyword_match, query_embedding = _prepare_keywords_and_embedding(df_original, user_query, user)
+
+    if query_embedding is None:
+        print("Lỗi: Không thể tạo embedding cho truy vấn. Dùng embedding dự phòng.")
+        _notify_progress(user, 'Đang tìm kiếm ở chế độ dự phòng (không tạo được mã hóa Gemini)...')
+        vector_distances = _fallback_vector_scores(df_original, user_query)
+        if vector_distances:
+            # Điểm n-gram băm có thang khác cosine Gemini -> không dùng ngưỡng tương đối
+            return _rank_and_verify(df_original, user_query, vector_distances, keyword_match_counts,
+                                    top_n_final=top_n_final, return_json=return_json, user=user,
+                                    page_cache_key=page_cache_key, on_event=on_event, rank_only=rank_only,
+                                    constraints=api_constraints,
+                                    relative_floor=0.0)
+        print("Không có kết quả từ embedding dự phòng. Sử dụng chỉ kết quả từ khóa.")
+        if not has_keyword_match or rank_only:
+            return None
+        return _verify_keyword_only(df_original, user_query, keyword_match_counts, top_n_final)
+
+    print("Đang thực hiện vector search trên chỉ mục cục bộ...")
+    _notify_progress(user, 'Đang thực hiện vector search...')
+    vector_distances = _local_vector_scores(df_original, query_embedding)
+    if vector_distances is None:
+        return None
+
+    return _rank_and_verify(df_original, user_query, vector_distances, keyword_match_counts,
+                            top_n_final=top_n_final, return_json=return_json, user=user,
+                            page_cache_key=page_cache_key, on_event=on_event, rank_only=rank_only,
+                            constraints=api_constraints)
+
+
+def _pgvector_candidates(rows):
+    """
+    Kết quả pgvector_store.search_profiles -> DataFrame nhỏ (chỉ các ứng viên) với index = ID hồ sơ, cùng tên
+    cột với fetch_profiles_from_db, kèm (vector_distances, keyword_match_counts, combined_scores).
+    """
+    from .pgvector_store import RESULT_COLUMNS
+
+    df_candidates = pd.DataFrame(rows).rename(columns=dict(RESULT_COLUMNS))
+    df_candidates.index = df_candidates['id'].astype(np.int64)
+    vector_distances = {int(r['id']): float(r['vector_score']) for r in rows}
+    keyword_match_counts = {int(r['id']): int(r['keyword_count']) for r in rows if r['keyword_count']}
+    combined_scores = {int(r['id']): float(r['total_score']) for r in rows if r['total_score'] > 0}
+    return df_candidates, vector_distances, keyword_match_counts, combined_scores
+
+
+def search_combined_pgvector(user_query, top_n_final=100, return_json=False, user=None, constraints=None,
+                             page_cache_key=None, on_event=None, rank_only=False, api_constraints=None):
+    """
+    Tìm kiếm kết hợp trên Postgres + pgvector: vector top-k, đếm từ khóa, tổng điểm và dữ liệu hồ sơ
+    được tính trong một truy vấn SQL (pgvector_store.search_profiles), không cần fetch_profiles_from_db.
+    Bước LLM xác minh giữ nguyên như các backend khác.
+    constraints: lọc trong SQL (tường minh + tự trích); api_constraints: chỉ phần tường minh, cho bước lọc sơ bộ.
+    """
+    from .pgvector_store import search_profiles
+
+    print("\n--- Bắt đầu Tìm kiếm (Kết hợp Từ Khóa và pgvector trong Postgres -> LLM) ---")
+    keywords = extract_keywords(user_query)
+    print("Từ khóa trích xuất:", keywords)
+    _notify_progress(user, f'Đang trích xuất các từ khóa: {keywords}')
+
+    print("\nĐang tạo embedding cho truy vấn...")
+    _notify_progress(user, f'Đang tạo mã hóa cho truy vấn: {user_query}')
+    query_embedding = get_embedding(user_query, task_type="RETRIEVAL_QUERY")
+    if query_embedding is None and not keywords:
+        print("Lỗi: Không thể tạo embedding và không có từ khóa.")
+        return None
+
+    print("Đang thực hiện vector search + từ khóa trên Postgres...")
+    _notify_progress(user, 'Đang thực hiện vector search...')
+    limit = max(top_n_final, SEARCH_RANKED_CACHE_SIZE) if page_cache_key else top_n_final
+    rows = search_profiles(query_embedding, keywords, limit=limit, keyword_bonus=KEYWORD_BONUS,
+                           constraints=constraints)
+    if not rows:
+        print("Không nhận được kết quả từ pgvector.")
+        return None
+
+    df_candidates, vector_distances, keyword_match_counts, combined_scores = _pgvector_candidates(rows)
+    return _rank_and_verify(df_candidates, user_query, vector_distances, keyword_match_counts,
+                            top_n_final=top_n_final, return_json=return_json, user=user,
+                            combined_scores=combined_scores, constraints=api_constraints,
+                            page_cache_key=page_cache_key, on_event=on_event, rank_only=rank_only)
+
+
+def _profile_keywords(profile):
+    """Từ khóa của hồ sơ đã lưu: search_keywords (trích lúc tạo), không có thì lấy từ các field đã trích xuất."""
+    if getattr(profile, 'search_keywords', None):
+        return list(profile.search_keywords)
+    keywords = []
+    for field in ('full_name', 'name_of_father', 'name_of_mother', 'born_year', 'losing_year'):
+        value = str(getattr(profile, field, '') or '').strip()
+        if value:
+            keywords.append(value)
+    keywords += [name.strip() for name in str(profile.siblings or '').split(',') if name.strip()]
+    return keywords
+
+
+def _stored_vector_scores(profile_id, keyword_ids, top_k):
+    """
+    Điểm vector theo vector ĐÃ LƯU của hồ sơ (không embed lại):
+    Qdrant query-by-id -> chỉ mục cục bộ -> chỉ mục dự phòng. Hồ sơ khớp từ khóa (keyword_ids) nằm ngoài
+    top_k được chấm thêm. Trả về {ID hồ sơ: score} hoặc None nếu hồ sơ chưa có vector nào.
+    """
+    from .config import USE_QDRANT
+    from .local_index import get_local_index
+    from .fallback_encoder import get_fallback_index
+
+    profile_id = int(profile_id)
+    if USE_QDRANT:
+        collection_name = get_qdrant_collection()
+        if collection_name is not None:
+            try:
+                client, params = get_qdrant_client(), search_params()
+                vector_distances = {}
+                hits = _qdrant_nearest(client, collection_name, profile_id, None, params, limit=top_k,
+                                       score_threshold=QDRANT_SCORE_THRESHOLD)
+                _qdrant_hits_to_scores(hits, None, vector_distances)
+                missing_ids = [i for i in keyword_ids if i not in vector_distances]
+                _qdrant_rescore_ids(client, collection_name, profile_id, missing_ids, None, params, None,
+                                    vector_distances)
+                return vector_distances
+            except Exception as e:
+                print(f"Không thể truy vấn Qdrant theo ID hồ sơ {profile_id}: {e}")
+
+    for index in (get_local_index(), get_fallback_index()):
+        vector = index.get_vector(profile_id) if index is not None and index.count() else None
+        if vector is None:
+            continue
+        vector_distances = dict(index.search(vector, limit=top_k))
+        missing_ids = [i for i in keyword_ids if i not in vector_distances]
+        if missing_ids:
+            vector_distances.update(index.search(vector, limit=len(missing_ids), candidate_ids=missing_ids))
+        return vector_distances
+    return None
+
+
+def _search_similar_pgvector(profile, keywords, top_n_final, return_json, user):
+    """search_similar_to_profile trên pgvector: embedding đã lưu trong PGVECTOR_TABLE + một truy vấn SQL."""
+    from .indexing import profile_embedding_text
+    from .pgvector_store import get_profile_embedding, search_profiles
+
+    try:
+        embedding = get_profile_embedding(profile.id)
+    except Exception as e:
+        print(f"Không thể đọc embedding của hồ sơ {profile.id} từ pgvector: {e}")
+        embedding = None
+    if embedding is None:
+        print(f"Hồ sơ {profile.id} chưa có vector đã lưu.")
+        return None
+    rows = [r for r in search_profiles(embedding, keywords, limit=top_n_final + 1, keyword_bonus=KEYWORD_BONUS)
+            if int(r['id']) != int(profile.id)]
+    if not rows:
+        return []
+    df_candidates, vector_distances, keyword_match_counts, combined_scores = _pgvector_candidates(rows)
+    _notify_progress(user, 'Đang tìm các hồ sơ phù hợp với hồ sơ vừa tạo...')
+    return _rank_and_verify(df_candidates, profile_embedding_text(profile), vector_distances, keyword_match_counts,
+                            top_n_final=top_n_final, return_json=return_json, user=user,
+                            combined_scores=combined_scores)
+
+
+def search_similar_to_profile(profile, top_n_final=100, return_json=False, user=None):
+    """
+    Tìm hồ sơ phù hợp với một hồ sơ vừa tạo (bước profiles.match), không gọi lại Gemini cho truy vấn
+    và không đọc toàn bộ bảng Profile:
+    - từ khóa: dùng Profile.search_keywords / các field đã trích xuất (không gọi LLM trích từ khóa),
+      hồ sơ khớp được tìm bằng truy vấn DB (fetch_keyword_match_ids)
+    - vector: dùng vector đã lưu của hồ sơ (pgvector, Qdrant query-by-id, chỉ mục cục bộ hoặc dự phòng)
+    - chỉ nạp các ứng viên (top-k vector ∪ hồ sơ khớp từ khóa) rồi xếp hạng + LLM xác minh như
+      search_combined_*; bản thân hồ sơ bị loại khỏi kết quả.
+    Kết quả (index của DataFrame ứng viên) chính là ID hồ sơ.
+    Trả về None nếu hồ sơ chưa có vector nào (gọi nơi khác tự quyết định fallback).
+    """
+    from .config import USE_PGVECTOR, MATCH_KEYWORD_CANDIDATES
+    from .db_utils import fetch_keyword_match_ids
+    from .indexing import profile_embedding_text
+
+    print(f"\n--- Bắt đầu Tìm hồ sơ phù hợp với hồ sơ {profile.id} (vector đã lưu + từ khóa đã trích -> LLM) ---")
+    keywords = _profile_keywords(profile)
+    print("Từ khóa của hồ sơ:", keywords)
+    if USE_PGVECTOR:
+        return _search_similar_pgvector(profile, keywords, top_n_final, return_json, user)
+
+    keyword_ids = fetch_keyword_match_ids(keywords, limit=MATCH_KEYWORD_CANDIDATES) if keywords else []
+    vector_scores = _stored_vector_scores(profile.id, keyword_ids, top_k=max(LOCAL_INDEX_TOP_K, top_n_final))
+    if vector_scores is None:
+        print(f"Hồ sơ {profile.id} chưa có vector đã lưu.")
+        return None
+
+    candidate_ids = (set(vector_scores) | set(keyword_ids)) - {int(profile.id)}
+    df_candidates = fetch_profiles_from_db(ids=candidate_ids) if candidate_ids else pd.DataFrame()
+    if df_candidates.empty:
+        return []
+    df_candidates.index = df_candidates['id'].astype(np.int64)
+    print(f"Đã nạp {len(df_candidates)} hồ sơ ứng viên ({len(keyword_ids)} khớp từ khóa).")
+    keyword_match_counts = _count_keyword_matches(df_candidates, keywords) if keywords else {}
+    vector_distances = {db_id: score for db_id, score in vector_scores.items() if db_id in df_candidates.index}
+
+    _notify_progress(user, 'Đang tìm các hồ sơ phù hợp với hồ sơ vừa tạo...')
+    return _rank_and_verify(df_candidates, profile_embedding_text(profile), vector_distances, keyword_match_counts,
+                            top_n_final=top_n_final, return_json=return_json, user=user)
@@ -0,0 +1,394 @@
+"""
+Snapshot vector dạng nhị phân (thay cho file JSONL export) - dùng để export, backup và warm start.
+
+Một snapshot là một thư mục:
+  - vectors.npy         : ma trận float32/float16 (N x D), mở được bằng mmap
+  - ids.npy             : mảng ID (int64, hoặc chuỗi nếu nguồn có ID không phải số)
+  - metadata.jsonl.gz   : mỗi dòng {"metadata": {...}, "document": ...} theo đúng thứ tự vectors.npy
+  - manifest.json       : số lượng, số chiều, dtype, nguồn, đã chuẩn hóa L2 hay chưa
+
+So với JSONL (~10 byte/số thực dạng text), vectors.npy chỉ tốn 4 byte (float32) hoặc 2 byte (float16)
+và không cần parse: np.load(mmap_mode="r") mở một triệu vector gần như tức thì.
+vectors.npy/ids.npy cùng tên file với chỉ mục cục bộ (local_index.py), nên snapshot đã chuẩn hóa
+được dùng làm ma trận gốc của chỉ mục cục bộ chỉ bằng cách hard link / copy file.
+
+    python -m vector_search.snapshot export --source qdrant --output exports/snapshot
+    python -m vector_search.snapshot export --source chroma --output exports/snapshot --dtype float16
+    python -m vector_search.snapshot export --source jsonl --input exports/chroma_pinecone_export.jsonl --output exports/snapshot
+    python -m vector_search.snapshot import --target qdrant --input exports/snapshot [--swap]
+    python -m vector_search.snapshot import --target chroma --input exports/snapshot
+    python -m vector_search.snapshot import --target local --input exports/snapshot
+    python -m vector_search.snapshot info --input exports/snapshot
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .config import (
+    QDRANT_COLLECTION_NAME,
+    CHROMA_COLLECTION_NAME,
+    LOCAL_INDEX_PATH,
+    USE_QDRANT_HYBRID,
+)
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+METADATA_FILE = "metadata.jsonl.gz"
+# Sai số cho phép khi kiểm tra vector đã chuẩn hóa L2 (float16 làm tròn khoảng 1e-3)
+NORM_TOLERANCE = 1e-2
+
+
+class SnapshotWriter:
+    """
+    Ghi snapshot theo kiểu streaming (không cần biết trước số lượng).
+    Vector được ghi thẳng ra file tạm dạng nhị phân, khi close() mới ghép header .npy vào.
+    """
+
+    def __init__(self, path, dtype="float32", source=None):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.source = source
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._raw_path = self.path / f"{VECTORS_FILE}.raw"
+        self._raw = open(self._raw_path, "wb")
+        self._meta = gzip.open(self.path / METADATA_FILE, "wt", encoding="utf-8", compresslevel=6)
+        self._ids = []
+        self.count = 0
+        self.dimension = None
+        self.normalized = True
+
+    def add(self, ids, vectors, metadatas=None, documents=None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("vectors phải là ma trận (N x D) cùng số dòng với ids")
+        if not len(ids):
+            return
+        if self.dimension is None:
+            self.dimension = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(f"Số chiều không khớp: {vectors.shape[1]} != {self.dimension}")
+
+        if self.normalized:
+            norms = np.linalg.norm(vectors, axis=1)
+            self.normalized = bool(np.all(np.abs(norms - 1.0) <= NORM_TOLERANCE))
+        self._raw.write(np.ascontiguousarray(vectors.astype(self.dtype, copy=False)).tobytes())
+        self._ids.extend(ids)
+        for i in range(len(ids)):
+            record = {
+                "metadata": metadatas[i] if metadatas is not None else None,
+                "document": documents[i] if documents is not None else None,
+            }
+            self._meta.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += len(ids)
+
+    def close(self):
+        """Hoàn tất: ghi vectors.npy (header + dữ liệu), ids.npy và manifest.json."""
+        self._raw.close()
+        self._meta.close()
+        dimension = self.dimension or 0
+        header = {"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False,
+                  "shape": (self.count, dimension)}
+        tmp_path = self.path / f"{VECTORS_FILE}.tmp"
+        with open(tmp_path, "wb") as out, open(self._raw_path, "rb") as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, length=16 * 1024 * 1024)
+        os.replace(tmp_path, self.path / VECTORS_FILE)
+        os.remove(self._raw_path)
+
+        try:
+            ids = np.asarray([int(i) for i in self._ids], dtype=np.int64)
+        except (ValueError, TypeError):
+            ids = np.asarray([str(i) for i in self._ids])
+        np.save(self.path / IDS_FILE, ids)
+
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "count": self.count,
+            "dimension": dimension,
+            "dtype": self.dtype.name,
+            "ids_dtype": ids.dtype.str,
+            "normalized": self.normalized and self.count > 0,
+            "metric": "cosine",
+            "source": self.source,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with open(self.path / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        print(f"✅ Đã ghi snapshot {self.count} vector (dim={dimension}, {self.dtype.name}) vào {self.path}")
+        return manifest
+
+
+class Snapshot:
+    """Snapshot đã ghi trên đĩa. vectors được mở bằng mmap (chỉ đọc)."""
+
+    def __init__(self, path, mmap=True):
+        self.path = Path(path)
+        with open(self.path / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Không hỗ trợ snapshot phiên bản {self.manifest.get('format_version')}")
+        self.vectors = np.load(self.path / VECTORS_FILE, mmap_mode="r" if mmap else None)
+        self.ids = np.load(self.path / IDS_FILE)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def iter_metadata(self):
+        """Duyệt (metadata, document) theo đúng thứ tự vector."""
+        with gzip.open(self.path / METADATA_FILE, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                yield record.get("metadata"), record.get("document")
+
+    def iter_batches(self, batch_size=1000, with_metadata=True):
+        """Duyệt theo batch: (ids, vectors float32, metadatas, documents)."""
+        meta_iter = self.iter_metadata() if with_metadata else None
+        for start in range(0, len(self), batch_size):
+            end = min(start + batch_size, len(self))
+            vectors = np.asarray(self.vectors[start:end], dtype=np.float32)
+            metadatas, documents = [], []
+            if meta_iter is not None:
+                for _ in range(end - start):
+                    metadata, document = next(meta_iter)
+                    metadatas.append(metadata or {})
+                    documents.append(document)
+            yield self.ids[start:end].tolist(), vectors, metadatas, documents
+
+
+def load_snapshot(path, mmap=True):
+    return Snapshot(path, mmap=mmap)
+
+
+# ------------------------------------------------------------------ Export
+def export_qdrant_snapshot(output_path, collection_name=None, dtype="float32", batch_size=1000):
+    """Scroll toàn bộ collection Qdrant (vector + payload) ra snapshot."""
+    from .qdrant_helper import get_qdrant_client, get_qdrant_collection
+
+    client = get_qdrant_client()
+    collection_name = collection_name or get_qdrant_collection()
+    if collection_name is None:
+        print("Không có collection Qdrant để export.")
+        return None
+
+    writer = SnapshotWriter(output_path, dtype=dtype, source=f"qdrant:{collection_name}")
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        rows = []
+        for point in points:
+            vector = point.vector.get("") if isinstance(point.vector, dict) else point.vector
+            if vector is not None:
+                rows.append((point.id, vector, point.payload or {}))
+        if rows:
+            writer.add([r[0] for r in rows], [r[1] for r in rows], metadatas=[r[2] for r in rows])
+        print(f"Đã export {writer.count} vector từ Qdrant...")
+        if offset is None:
+            break
+    return writer.close()
+
+
+def export_chroma_snapshot(output_path, collection_name=CHROMA_COLLECTION_NAME, dtype="float32", batch_size=500):
+    """Đọc toàn bộ collection ChromaDB (embedding + metadata + document) ra snapshot."""
+    from .export_chroma_to_pinecone import get_client
+
+    collection = get_client().get_or_create_collection(name=collection_name)
+    total = collection.count()
+    writer = SnapshotWriter(output_path, dtype=dtype, source=f"chroma:{collection_name}")
+    offset = 0
+    while True:
+        batch = collection.get(
+            include=["embeddings", "metadatas", "documents"],
+            limit=batch_size,
+            offset=offset,
+        )
+        ids = batch.get("ids", [])
+        if not ids:
+            break
+        writer.add(ids, batch.get("embeddings"), metadatas=batch.get("metadatas"),
+                   documents=batch.get("documents"))
+        offset += len(ids)
+        print(f"Đã export {writer.count}/{total} vector từ ChromaDB...")
+    return writer.close()
+
+
+def export_jsonl_snapshot(input_path, output_path, dtype="float32", batch_size=1000):
+    """Chuyển file JSONL export cũ ({"id","values","metadata","document"}) sang snapshot."""
+    writer = SnapshotWriter(output_path, dtype=dtype, source=f"jsonl:{Path(input_path).name}")
+    ids, vectors, metadatas, documents = [], [], [], []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            ids.append(data["id"])
+            vectors.append(data["values"])
+            metadatas.append(data.get("metadata") or {})
+            documents.append(data.get("document"))
+            if len(ids) >= batch_size:
+                writer.add(ids, vectors, metadatas, documents)
+                ids, vectors, metadatas, documents = [], [], [], []
+    if ids:
+        writer.add(ids, vectors, metadatas, documents)
+    return writer.close()
+
+
+# ------------------------------------------------------------------ Import
+def import_snapshot_to_qdrant(snapshot_path, alias_name=QDRANT_COLLECTION_NAME, batch_size=256,
+                              parallel=1, swap=False, drop_old=False):
+    """
+    Nạp snapshot vào collection mới '<alias>_<thời gian>' (upload_points, parallel tiến trình),
+    sau đó chuyển alias nếu swap=True. Payload/sparse vector được bổ sung như import_to_qdrant.
+    """
+    from .qdrant_helper import create_qdrant_client, create_profile_collection, switch_alias
+    from .import_to_qdrant import record_to_point
+    from .config import QDRANT_PREFER_GRPC
+
+    snapshot = load_snapshot(snapshot_path)
+    client = create_qdrant_client(prefer_grpc=QDRANT_PREFER_GRPC, timeout=120)
+    target_name = f"{alias_name}_{time.strftime('%Y%m%d%H%M%S')}"
+    create_profile_collection(client, target_name, dimension=snapshot.manifest["dimension"],
+                              with_sparse=USE_QDRANT_HYBRID)
+
+    def points():
+        for ids, vectors, metadatas, documents in snapshot.iter_batches(batch_size):
+            for point_id, vector, metadata, document in zip(ids, vectors, metadatas, documents):
+                yield record_to_point({"id": point_id, "values": vector.tolist(),
+                                       "metadata": metadata, "document": document})
+
+    started = time.time()
+    client.upload_points(collection_name=target_name, points=points(), batch_size=batch_size,
+                         parallel=parallel, wait=True)
+    elapsed = max(time.time() - started, 1e-9)
+    print(f"✅ Đã nạp {len(snapshot)} vector vào '{target_name}' trong {elapsed:.1f}s "
+          f"({len(snapshot) / elapsed:.0f} vector/s).")
+
+    if swap:
+        previous = switch_alias(client, alias_name, target_name)
+        if drop_old and previous and previous != target_name:
+            client.delete_collection(previous)
+            print(f"Đã xóa collection cũ '{previous}'.")
+    else:
+        print(f"Chạy lại với --swap để chuyển '{alias_name}' sang '{target_name}'.")
+    return target_name
+
+
+def import_snapshot_to_chroma(snapshot_path, collection_name=CHROMA_COLLECTION_NAME, batch_size=500):
+    """Upsert snapshot vào collection ChromaDB (ID dạng chuỗi như khi embed hồ sơ)."""
+    from .export_chroma_to_pinecone import get_client
+
+    snapshot = load_snapshot(snapshot_path)
+    collection = get_client().get_or_create_collection(name=collection_name)
+    total = 0
+    for ids, vectors, metadatas, documents in snapshot.iter_batches(batch_size):
+        collection.upsert(
+            ids=[str(i) for i in ids],
+            embeddings=vectors.tolist(),
+            metadatas=[m or None for m in metadatas],
+            documents=documents if any(d is not None for d in documents) else None,
+        )
+        total += len(ids)
+        print(f"Đã nạp {total}/{len(snapshot)} vector vào ChromaDB...")
+    return total
+
+
+def import_snapshot_to_local_index(snapshot_path, path=LOCAL_INDEX_PATH):
+    """
+    Warm start chỉ mục cục bộ từ snapshot.
+    Snapshot đã chuẩn hóa, cùng dtype và ID số: hard link (hoặc copy) thẳng vectors.npy/ids.npy,
+    không phải đọc ma trận vào RAM. Ngược lại: chuẩn hóa và ghi lại qua write_base().
+    """
+    from .local_index import (
+        LocalVectorIndex, DELTA_VECTORS_FILE, DELTA_IDS_FILE, TOMBSTONES_FILE, HNSW_FILE,
+    )
+
+    snapshot = load_snapshot(snapshot_path)
+    index = LocalVectorIndex(path)
+    manifest = snapshot.manifest
+    if manifest["normalized"] and np.dtype(manifest["dtype"]) == index.dtype and snapshot.ids.dtype.kind == "i":
+        os.makedirs(index.path, exist_ok=True)
+        for name in (VECTORS_FILE, IDS_FILE):
+            tmp_path = os.path.join(index.path, f"{name}.tmp")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            try:
+                os.link(snapshot.path / name, tmp_path)
+            except OSError:
+                shutil.copyfile(snapshot.path / name, tmp_path)
+            os.replace(tmp_path, os.path.join(index.path, name))
+        # Bỏ delta/tombstone/HNSW cũ như write_base()
+        for name in (DELTA_VECTORS_FILE, DELTA_IDS_FILE, TOMBSTONES_FILE, HNSW_FILE):
+            if os.path.exists(os.path.join(index.path, name)):
+                os.remove(os.path.join(index.path, name))
+        index.load()
+    else:
+        ids = snapshot.ids
+        if ids.dtype.kind != "i":
+            ids = ids.astype(np.int64)
+        index.write_base(ids, np.asarray(snapshot.vectors, dtype=np.float32))
+    return index
+
+
+def snapshot_info(path):
+    snapshot = load_snapshot(path)
+    size_mb = sum(f.stat().st_size for f in snapshot.path.iterdir() if f.is_file()) / 1024 / 1024
+    print(json.dumps(snapshot.manifest, ensure_ascii=False, indent=2))
+    print(f"Dung lượng: {size_mb:.1f} MB")
+    return snapshot.manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export/import snapshot vector nhị phân")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Ghi snapshot từ Qdrant, ChromaDB hoặc JSONL")
+    export.add_argument("--source", choices=["qdrant", "chroma", "jsonl"], default="qdrant")
+    export.add_argument("--input", help="File JSONL (khi --source jsonl)")
+    export.add_argument("--collection", default=None)
+    export.add_argument("--output", required=True)
+    export.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+
+    load = sub.add_parser("import", help="Nạp snapshot vào Qdrant, ChromaDB hoặc chỉ mục cục bộ")
+    load.add_argument("--target", choices=["qdrant", "chroma", "local"], default="qdrant")
+    load.add_argument("--input", required=True)
+    load.add_argument("--parallel", type=int, default=1, help="Số tiến trình upload (Qdrant)")
+    load.add_argument("--swap", action="store_true", help="Chuyển alias sang collection mới (Qdrant)")
+    load.add_argument("--drop-old", action="store_true", help="Xóa collection cũ sau khi chuyển alias")
+    load.add_argument("--path", default=LOCAL_INDEX_PATH, help="Thư mục chỉ mục cục bộ (--target local)")
+
+    info = sub.add_parser("info", help="Xem manifest của snapshot")
+    info.add_argument("--input", required=True)
+
+    args = parser.parse_args()
+    started = time.time()
+    if args.command == "export":
+        if args.source == "qdrant":
+            export_qdrant_snapshot(args.output, args.collection, dtype=args.dtype)
+        elif args.source == "chroma":
+            export_chroma_snapshot(args.output, args.collection or CHROMA_COLLECTION_NAME, dtype=args.dtype)
+        else:
+            export_jsonl_snapshot(args.input, args.output, dtype=args.dtype)
+    elif args.command == "import":
+        if args.target == "qdrant":
+            import_snapshot_to_qdrant(args.input, parallel=args.parallel, swap=args.swap, drop_old=args.drop_old)
+        elif args.target == "chroma":
+            import_snapshot_to_chroma(args.input)
+        else:
+            built = import_snapshot_to_local_index(args.input, args.path)
+            print(f"✅ Chỉ mục cục bộ có {built.count()} vector.")
+    else:
+        snapshot_info(args.input)
+    print(f"Thời gian: {time.time() - started:.1f}s")
@@ -0,0 +1,1016 @@
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from .local_index import LocalVectorIndex, hnswlib
+from .profile_digest import build_digest, estimate_tokens
+from .keyword_extractor import MIN_KEYWORD_LENGTH, extract_keywords_local
+from .text_utils import document_sparse_vector, fold_diacritics, query_sparse_vector, token_index, tokenize
+from .query_filters import build_qdrant_filter, constraints_from_params, constraints_from_request, extract_query_constraints
+from .prefilter import apply_structured_scores, name_similarity, prefilter_candidates
+from .moderation import ALLOW, BLOCK, REVIEW, classify_locally, moderate_text, normalize_text
+from .models import EmbeddingVersion
+from .ranked_pages import adaptive_cutoff, load_ranked, page_boundaries
+from . import embedding, embedding_versions, fallback_encoder, import_to_qdrant, llm_utils, pgvector_store, qdrant_helper, qdrant_tuning, reconcile, search, snapshot, views_api
+
+
+class ModerationTests(SimpleTestCase):
+    def test_blocks_profanity(self):
+        for text in ["địt", "đ.ị.t", "đ.m", "đ-m thằng kia", "đụ má nó", "đm mày"]:
+            with self.subTest(text=text):
+                self.assertEqual(classify_locally(text)[0], BLOCK)
+
+    def test_diacritic_free_slang_only_needs_review(self):
+        for text in ["d1t me", "vcl", "du ma no"]:
+            with self.subTest(text=text):
+                self.assertEqual(classify_locally(text)[0], REVIEW)
+
+    def test_ordinary_text_folding_to_slang_is_not_blocked(self):
+        for text in ["Dù mẹ đã tìm kiếm nhiều năm nhưng vẫn chưa có tin tức gì",
+                     "đủ mẹ con đi tìm khắp nơi", "Anh Vl sinh năm 1970", "Tìm anh Đỗ Mạnh (DM) ở Hải Phòng"]:
+            with self.subTest(text=text):
+                self.assertNotEqual(classify_locally(text)[0], BLOCK)
+                self.assertTrue(moderate_text(text, use_llm=False)[0])
+
+    def test_insults_with_innocent_meaning_only_need_review(self):
+        for text in ["chăn nuôi súc vật", "mẹ mày đi chợ rồi", "bố mày về chưa", "mày là đồ óc lợn"]:
+            with self.subTest(text=text):
+                self.assertEqual(classify_locally(text)[0], REVIEW)
+
+    def test_initials_separated_by_spaces_are_not_joined(self):
+        self.assertEqual(normalize_text("xã Đ M"), "xã đ m")
+        self.assertEqual(normalize_text("Văn B ở Hà Nội"), "văn b ở hà nội")
+        self.assertEqual(classify_locally("Tìm anh Nguyễn Văn B ở xã Đ M")[0], ALLOW)
+
+    def test_letters_separated_by_punctuation_are_joined(self):
+        self.assertEqual(normalize_text("đ.ị.t"), "địt")
+        self.assertEqual(normalize_text("t.p hcm"), "tp hcm")
+
+    def test_ordinary_search_is_allowed(self):
+        self.assertEqual(classify_locally("Tìm mẹ Nguyễn Thị Lan, thất lạc năm 1985 ở Nghệ An"), (ALLOW, []))
+
+    def test_accented_term_does_not_match_other_tone(self):
+        self.assertEqual(classify_locally("con trai lớn tên Minh")[0], ALLOW)
+
+
+class KeywordExtractorTests(SimpleTestCase):
+    def test_province_keeps_first_word(self):
+        keywords = extract_keywords_local("Tìm mẹ quê Nghệ An, thất lạc năm 1975")
+        self.assertIn("Nghệ An", keywords)
+        self.assertIn("1975", keywords)
+        self.assertNotIn("An", keywords)
+        self.assertEqual(extract_keywords_local("Quê Nghệ An"), ["Nghệ An"])
+
+    def test_place_after_prefix_is_kept_whole(self):
+        keywords = extract_keywords_local("Tôi ở huyện Chợ Gạo, Tiền Giang")
+        self.assertIn("Chợ Gạo", keywords)
+        self.assertIn("Tiền Giang", keywords)
+        self.assertNotIn("Gạo", keywords)
+
+    def test_names_and_given_names(self):
+        keywords = extract_keywords_local("Chị Lê Thị Hạnh tìm em, anh chị em là Viết, Thơ")
+        self.assertEqual(keywords[:4], ["Lê Thị Hạnh", "Hạnh", "Viết", "Thơ"])
+
+    def test_no_short_keywords(self):
+        for query in ["quê Nghệ An", "huyện Chợ Gạo", "tìm em Tư ở xã An", "Nguyễn Văn A sinh năm 1980"]:
+            with self.subTest(query=query):
+                self.assertTrue(all(len(k) >= MIN_KEYWORD_LENGTH for k in extract_keywords_local(query)))
+
+    def test_synonyms_are_expanded(self):
+        keywords = extract_keywords_local("ông Tiên đi bộ đội năm 1968")
+        self.assertIn("Tiên", keywords)
+        self.assertIn("nhập ngũ", keywords)
+
+
+class RankedPagesTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cut_at_largest_gap(self):
+        self.assertEqual(adaptive_cutoff([0.9] * 15 + [0.3] * 20, max_k=100, relative_floor=0.0), 15)
+
+    def test_relative_floor_on_cosine_scores(self):
+        scores = [0.8 - 0.01 * i for i in range(40)]  # 0.8 -> 0.41; 0.75 × 0.8 = 0.6
+        self.assertEqual(adaptive_cutoff(scores, max_k=100, gap_ratio=1.1), 21)
+
+    def test_rrf_scores_are_not_cut_by_relative_floor(self):
+        rrf = [1 / (60 + rank) for rank in range(1, 101)]
+        floor_cut = adaptive_cutoff(rrf, max_k=100)
+        self.assertGreater(adaptive_cutoff(rrf, max_k=100, relative_floor=0.0), floor_cut)
+
+    def test_page_boundaries_cover_all_scores(self):
+        scores = [1 / (60 + rank) for rank in range(1, 301)]
+        boundaries = page_boundaries(scores, max_k=100, relative_floor=0.0)
+        self.assertEqual(boundaries[0][0], 0)
+        self.assertEqual(boundaries[-1][1], len(scores))
+        for (_, end), (start, _) in zip(boundaries, boundaries[1:]):
+            self.assertEqual(end, start)
+        self.assertTrue(all(end - start <= 100 for start, end in boundaries))
+
+    def _ranked_df(self, n=60):
+        return pd.DataFrame({"id": [1000 + i for i in range(n)], "Tiêu đề": [f"Hồ sơ {i}" for i in range(n)]})
+
+    def test_rank_only_stores_ids_without_verifying(self):
+        df = self._ranked_df()
+        vector_scores = {idx: 0.9 if idx < 15 else 0.3 for idx in df.index}
+        with mock.patch.object(search, "_verify_top_results") as verify:
+            result = search._rank_and_verify(df, "truy vấn", vector_scores, {}, top_n_final=100,
+                                             page_cache_key="k", rank_only=True)
+        self.assertEqual(result, [])
+        verify.assert_not_called()
+        state = load_ranked("k")
+        self.assertEqual([row["id"] for row in state["rows"][:3]], [1000, 1001, 1002])
+        self.assertNotIn("row", state["rows"][0])
+        self.assertEqual(state["boundaries"][0], (0, 15))
+
+    def test_verify_ranked_page_reads_rows_of_requested_page(self):
+        df = self._ranked_df()
+        vector_scores = {idx: 0.9 if idx < 15 else 0.3 for idx in df.index}
+        with mock.patch.object(search, "_verify_top_results"):
+            search._rank_and_verify(df, "truy vấn", vector_scores, {}, top_n_final=100, page_cache_key="k",
+                                    rank_only=True)
+        with mock.patch.object(search, "fetch_profiles_from_db", return_value=df.iloc[15:]) as fetch, \
+                mock.patch.object(search, "_verify_top_results", return_value=["ok"]) as verify:
+            self.assertEqual(search.verify_ranked_page("truy vấn", "k", 2), ["ok"])
+        self.assertEqual(fetch.call_args.kwargs["ids"][0], 1015)
+        top_results = verify.call_args.args[2]
+        self.assertEqual(top_results[0], (1015, 0.3))
+        self.assertIsNone(search.verify_ranked_page("truy vấn", "missing", 2))
+
+
+class SearchPaginationViewTests(SimpleTestCase):
+    def test_cache_miss_ranks_only_then_verifies_requested_page(self):
+        view = views_api.ProfileSearchAPIView()
+        view.request = SimpleNamespace(user=None)
+        request = SimpleNamespace(data={"query": "tìm mẹ", "page": 2})
+        page_results = [{"id": "7"}]
+        with mock.patch.object(views_api, "USE_PGVECTOR", True), \
+                mock.patch.object(views_api, "verify_ranked_page", side_effect=[None, page_results]) as verify, \
+                mock.patch.object(views_api, "search_combined_pgvector", return_value=[]) as rank:
+            id_list, _, error = view._run_search(request, "tìm mẹ", 2, "k", on_event=mock.Mock())
+        self.assertIsNone(error)
+        self.assertEqual(id_list, page_results)
+        self.assertTrue(rank.call_args.kwargs["rank_only"])
+        self.assertEqual([c.args[2] for c in verify.call_args_list], [2, 2])
+
+
+class TieredVerificationTests(SimpleTestCase):
+    def _batch(self, *ids):
+        return [pd.Series({"id": str(i), "Tiêu đề": f"Hồ sơ {i}"}, name=i) for i in ids]
+
+    def _run(self, batch, screen_scores, strong_result):
+        calls = []
+
+        def fake_rotation(func, query, profiles, profile_strings, first_key_index):
+            calls.append((func, [p["id"] for p in profiles]))
+            return screen_scores if func is llm_utils.screen_profiles_with_llm else strong_result
+
+        with mock.patch.object(llm_utils, "LLM_TIERING_ENABLED", True), \
+                mock.patch.object(llm_utils, "LLM_ACCEPT_SCORE", 80), \
+                mock.patch.object(llm_utils, "LLM_ESCALATE_MIN_SCORE", 40), \
+                mock.patch.object(llm_utils, "_with_key_rotation", side_effect=fake_rotation):
+            return llm_utils._verify_batch("q", batch, ["block"] * len(batch), 0), calls
+
+    def test_accept_reject_and_escalate(self):
+        verified, calls = self._run(self._batch(1, 2, 3), {"1": 95, "2": 60, "3": 10}, ["2"])
+        self.assertEqual(verified, ["1", "2"])
+        self.assertEqual(calls[1], (llm_utils.verify_profiles_with_llm, ["2"]))
+
+    def test_indices_outside_batch_are_dropped(self):
+        verified, calls = self._run(self._batch(1, 2), {"1": 90, "77": 99, "88": 50}, ["88"])
+        self.assertEqual(verified, ["1"])
+        self.assertEqual(len(calls), 1)  # "88" không thuộc lô -> không chuyển model mạnh
+
+    def test_strong_model_cannot_add_indices(self):
+        verified, _ = self._run(self._batch(1, 2), {"2": 50}, ["2", "1", "99"])
+        self.assertEqual(verified, ["2"])
+
+    def test_screen_failure_falls_back_to_strong_model(self):
+        verified, calls = self._run(self._batch(1, 2), None, ["1", "5"])
+        self.assertEqual(verified, ["1"])
+        self.assertEqual([func for func, _ in calls],
+                         [llm_utils.screen_profiles_with_llm, llm_utils.verify_profiles_with_llm])
+
+
+class PrefilterTests(SimpleTestCase):
+    QUERY = "Tìm con trai sinh năm 1970, thất lạc năm 1975, anh chị em là Viết, Thơ"
+    CONSTRAINTS = {"born_year": (1970, 1970), "losing_year": (1975, 1975)}
+
+    def _candidates(self):
+        rows = [
+            {"Năm sinh": "1990", "Năm thất lạc": "1995"},                      # lệch năm -> loại
+            {"Năm sinh": "", "Năm thất lạc": ""},                               # trống -> giữ, 0 điểm
+            {"Năm sinh": "1971", "Năm thất lạc": "1975", "Anh chị em": "Viết, Thơ, Dũng"},
+        ]
+        return [(i, pd.Series(row)) for i, row in enumerate(rows)]
+
+    def test_rejects_contradicting_explicit_years_and_scores_the_rest(self):
+        constraints = constraints_from_params({"born_year_from": "1970", "losing_year_from": "1975"})
+        self.assertEqual(constraints, self.CONSTRAINTS)
+        kept, scores = prefilter_candidates(self.QUERY, self._candidates(), constraints=constraints, enabled=True)
+        self.assertEqual([idx for idx, _ in kept], [1, 2])
+        self.assertEqual(scores, {1: 0.0, 2: 3.0})
+
+    def test_years_from_query_text_only_boost(self):
+        kept, scores = prefilter_candidates(self.QUERY, self._candidates(), enabled=True)
+        self.assertEqual([idx for idx, _ in kept], [0, 1, 2])
+        self.assertEqual(scores, {0: 0.0, 1: 0.0, 2: 3.0})
+
+    def test_searcher_details_in_query_do_not_reject_target(self):
+        hoa = pd.Series({"Họ và tên": "Lê Thị Hoa", "Năm sinh": "1950", "Tên cha": "Lê Văn Tám",
+                         "Tên mẹ": "Trần Thị Mai"})
+        for query in ["Tôi tìm mẹ tên là Lê Thị Hoa, thất lạc ở Nghệ An",
+                      "Tôi sinh năm 1985, tìm bố mẹ, mẹ tôi sinh năm 1950"]:
+            with self.subTest(query=query):
+                kept, _ = prefilter_candidates(query, [(0, hoa)], enabled=True)
+                self.assertEqual([idx for idx, _ in kept], [0])
+
+    def test_explicit_parent_names_compare_same_side(self):
+        profile = pd.Series({"Tên cha": "", "Tên mẹ": "Nguyễn Thị Lan"})
+        father_only = constraints_from_params({"father_name": "Trần Văn Nam"})
+        self.assertEqual(len(prefilter_candidates("tìm con", [(0, profile)], constraints=father_only,
+                                                  enabled=True)[0]), 1)
+        mother = constraints_from_params({"mother_name": "Lê Thị Hoa"})
+        self.assertEqual(prefilter_candidates("tìm con", [(0, profile)], constraints=mother, enabled=True)[0], [])
+        same_mother = constraints_from_params({"mother_name": "Bà Nguyễn Thị Lan"})
+        self.assertEqual(prefilter_candidates("tìm con", [(0, profile)], constraints=same_mother,
+                                              enabled=True)[1], {0: 1.0})
+
+    def test_no_constraints_keeps_everything(self):
+        candidates = self._candidates()
+        self.assertEqual(prefilter_candidates("tìm người thân", candidates, enabled=True), (candidates, {}))
+
+    def test_structured_scores_reorder_candidates(self):
+        kept, scores = prefilter_candidates(self.QUERY, self._candidates(), constraints=self.CONSTRAINTS, enabled=True)
+        candidates, combined = apply_structured_scores(kept, {1: 0.80, 2: 0.75}, scores, weight=0.05)
+        self.assertEqual([idx for idx, _ in candidates], [2, 1])
+        self.assertAlmostEqual(combined[2], 0.75 + 3.0 * 0.05 * 0.80)
+
+    def test_structured_scores_scale_with_rrf_scores(self):
+        candidates = [(1, {}), (2, {})]
+        _, combined = apply_structured_scores(candidates, {1: 0.033, 2: 0.032}, {2: 1.0}, weight=0.05)
+        self.assertLess(combined[2] - 0.032, 0.002)
+
+    def test_verification_receives_reordered_candidates(self):
+        df = pd.DataFrame([row for _, row in self._candidates()])
+        with mock.patch.object(search, "parallel_verify", return_value=[]) as verify:
+            search._verify_top_results(df, self.QUERY, [(0, 0.9), (1, 0.8), (2, 0.75)], {0: 0.9, 1: 0.8, 2: 0.75},
+                                       {}, {}, constraints=self.CONSTRAINTS)
+        self.assertEqual([p["id"] for p in verify.call_args.args[1]], ["2", "1"])
+
+    def test_name_similarity_uses_given_name(self):
+        self.assertEqual(name_similarity("Bà Nguyễn Thị Hoa", "nguyen thi hoa"), 1.0)
+        self.assertLess(name_similarity("Nguyễn Thị Hoa", "Nguyễn Thị Lan"), 0.5)
+
+
+class LocalIndexTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = tmp.name
+        self.vectors = np.random.default_rng(0).normal(size=(20, 8)).astype(np.float32)
+
+    def _index(self, **kwargs):
+        index = LocalVectorIndex(self.path, dtype="float32", **kwargs)
+        index.write_base(np.arange(1, 21), self.vectors)
+        return index
+
+    def test_exact_search_skips_deleted(self):
+        index = self._index(hnsw_threshold=10 ** 9)
+        self.assertEqual(index.search(self.vectors[4])[0][0], 5)
+        index.delete([5])
+        self.assertNotIn(5, [i for i, _ in index.search(self.vectors[4], limit=20)])
+        self.assertEqual(index.count(), 19)
+
+    def test_hnsw_limit_above_live_count(self):
+        if hnswlib is None:
+            self.skipTest("hnswlib chưa được cài")
+        index = self._index(hnsw_threshold=1)
+        self.assertIsNotNone(index._hnsw)
+        index.delete(list(range(1, 16)))
+        results = index.search(self.vectors[17], limit=10)
+        self.assertEqual(results[0][0], 18)
+        self.assertEqual(sorted(i for i, _ in results), [16, 17, 18, 19, 20])
+
+    def test_writers_in_other_processes_are_not_overwritten(self):
+        self._index(hnsw_threshold=10 ** 9)
+        first = LocalVectorIndex(self.path, dtype="float32", hnsw_threshold=10 ** 9).load()
+        second = LocalVectorIndex(self.path, dtype="float32", hnsw_threshold=10 ** 9).load()
+        with first.exclusive():
+            first.add([100], self.vectors[:1])
+            first.save()
+        with second.exclusive():
+            second.delete([1])
+            second.save()
+        reloaded = LocalVectorIndex(self.path, dtype="float32", hnsw_threshold=10 ** 9).load()
+        self.assertIn(100, reloaded.ids().tolist())
+        self.assertNotIn(1, reloaded.ids().tolist())
+
+
+class PackVerificationBatchesTests(SimpleTestCase):
+    QUERY = "Tìm mẹ Nguyễn Thị Lan, thất lạc năm 1985"
+
+    @staticmethod
+    def _profiles(n, detail_chars=200):
+        return [{"id": i, "Tiêu đề": f"Hồ sơ {i}", "Họ và tên": "Nguyễn Thị Lan", "metadata": {},
+                 llm_utils.DETAIL_COLUMN_NAME: "x" * detail_chars} for i in range(n)]
+
+    def _budget(self, n_blocks):
+        overhead = llm_utils.estimate_tokens(llm_utils.build_verification_prompt(self.QUERY, []))
+        block = llm_utils.estimate_tokens(llm_utils.build_profile_block(self._profiles(1)[0]))
+        return overhead + n_blocks * block
+
+    def test_batches_fit_budget_and_keep_order(self):
+        profiles = self._profiles(10)
+        batches = llm_utils.pack_verification_batches(self.QUERY, profiles, token_budget=self._budget(3),
+                                                      max_per_batch=100)
+        self.assertEqual([len(batch) for batch, _ in batches], [3, 3, 3, 1])
+        self.assertEqual([p["id"] for batch, _ in batches for p in batch], list(range(10)))
+        for batch, strings in batches:
+            self.assertLessEqual(
+                llm_utils.estimate_tokens(llm_utils.build_verification_prompt(self.QUERY, strings)),
+                self._budget(3) + len(strings))
+
+    def test_max_per_batch(self):
+        batches = llm_utils.pack_verification_batches(self.QUERY, self._profiles(5), token_budget=10 ** 6,
+                                                      max_per_batch=2)
+        self.assertEqual([len(batch) for batch, _ in batches], [2, 2, 1])
+
+    def test_oversized_profile_gets_its_own_batch(self):
+        profiles = self._profiles(3)
+        profiles[1][llm_utils.DETAIL_COLUMN_NAME] = "y" * 5000
+        profiles[1][llm_utils.DIGEST_COLUMN_NAME] = "z" * 20000
+        batches = llm_utils.pack_verification_batches(self.QUERY, profiles, token_budget=self._budget(2),
+                                                      max_per_batch=100)
+        self.assertEqual([[p["id"] for p in batch] for batch, _ in batches], [[0], [1], [2]])
+
+    def test_digest_replaces_truncated_description(self):
+        profile = self._profiles(1, detail_chars=3000)[0]
+        profile[llm_utils.DIGEST_COLUMN_NAME] = "Tên: Nguyễn Thị Lan | Thất lạc: 1985"
+        block = llm_utils.build_profile_block(profile)
+        self.assertIn("Thất lạc: 1985", block)
+        self.assertNotIn("xxx", block)
+
+
+class ProfileDigestTests(SimpleTestCase):
+    DESCRIPTION = (
+        "Mẹ tôi là Nguyễn Thị Lan. Năm 1975 gia đình thất lạc ở ga Hàng Cỏ khi tôi 5 tuổi. "
+        "Tôi có vết sẹo ở trán. Gia đình rất mong tìm lại mẹ. Mọi thông tin xin liên hệ số điện thoại 0900000000. "
+        "Mẹ tôi là Nguyễn Thị Lan."
+    )
+
+    def test_header_and_clue_sentences(self):
+        digest = build_digest(title="Tìm mẹ", full_name="Trần Văn An", born_year=1970, losing_year="nan",
+                              mother="Nguyễn Thị Lan", description=self.DESCRIPTION, max_tokens=60)
+        lines = digest.split("\n")
+        self.assertEqual(lines[:3], ["Tiêu đề: Tìm mẹ", "Tên: Trần Văn An | Sinh: 1970", "Mẹ: Nguyễn Thị Lan"])
+        self.assertIn("ga Hàng Cỏ", digest)
+        self.assertIn("vết sẹo", digest)
+        self.assertNotIn("điện thoại", digest)
+        self.assertLessEqual(digest.count("Mẹ tôi là Nguyễn Thị Lan"), 1)
+
+    def test_respects_token_budget(self):
+        for max_tokens in (20, 40, 80):
+            with self.subTest(max_tokens=max_tokens):
+                digest = build_digest(full_name="Trần Văn An", description=self.DESCRIPTION * 5, max_tokens=max_tokens)
+                self.assertLessEqual(sum(estimate_tokens(line) for line in digest.split("\n")), max_tokens + 1)
+
+    def test_long_single_sentence_is_truncated(self):
+        digest = build_digest(description="Thất lạc năm 1980 " + "rất lâu " * 500, max_tokens=40)
+        self.assertTrue(digest.startswith("Manh mối: Thất lạc năm 1980"))
+        self.assertTrue(digest.endswith("…"))
+
+    def test_empty_profile(self):
+        self.assertEqual(build_digest(), "")
+
+
+class QueryFiltersTests(SimpleTestCase):
+    def test_years_and_parent_names(self):
+        constraints = extract_query_constraints("Tìm con sinh khoảng năm 1975, thất lạc năm 1979, mẹ tên Lê Thị Hoa ở Huế")
+        self.assertEqual(constraints, {"born_year": (1973, 1977), "losing_year": (1979, 1979),
+                                       "parent_names": ["le thi hoa"]})
+
+    def test_single_word_and_missing_constraints(self):
+        self.assertEqual(extract_query_constraints("mẹ tên Hoa, quê Nam Định"), {})
+        self.assertEqual(extract_query_constraints("Nguyễn Văn Nam 1980"), {})
+
+    def test_explicit_params_override_query(self):
+        constraints = constraints_from_request(
+            {"born_year_from": "1970", "mother_name": "Lê Thị Hoa", "auto_filters": "true"},
+            "sinh năm 1975, thất lạc năm 1979")
+        self.assertEqual(constraints, {"born_year": (1970, 1970), "losing_year": (1979, 1979),
+                                       "mother_name": "le thi hoa", "parent_names": ["le thi hoa"]})
+        self.assertEqual(constraints_from_request({"auto_filters": "false"}, "sinh năm 1975"), {})
+
+    def test_filter_keeps_profiles_without_the_field(self):
+        self.assertIsNone(build_qdrant_filter({}))
+        condition = build_qdrant_filter({"born_year": (1973, 1977)}).must[0]
+        self.assertEqual(condition.should[0].range.gte, 1973)
+        self.assertEqual(condition.should[1].is_empty.key, "born_year_int")
+
+
+class FallbackEncoderTests(SimpleTestCase):
+    def test_vectors_are_normalized_and_deterministic(self):
+        vector = fallback_encoder.encode("Nguyễn Thị Lan, thất lạc năm 1975 ở Nghệ An")
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=5)
+        np.testing.assert_array_equal(vector, fallback_encoder.encode("Nguyễn Thị Lan, thất lạc năm 1975 ở Nghệ An"))
+        self.assertIsNone(fallback_encoder.encode("  ... "))
+        self.assertIsNone(fallback_encoder.encode(None))
+
+    def test_similar_texts_score_higher(self):
+        query = fallback_encoder.encode("tim me Nguyen Thi Lan que Nghe An")
+        same = fallback_encoder.encode("Tìm mẹ Nguyễn Thị Lan, quê Nghệ An, thất lạc năm 1975")
+        other = fallback_encoder.encode("Anh Trần Văn Bình đi bộ đội ở Quảng Trị năm 1972")
+        self.assertGreater(float(query @ same), float(query @ other) + 0.3)
+
+    def test_search_uses_fallback_index(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        index = LocalVectorIndex(tmp.name, dtype="float32", hnsw_threshold=10 ** 9)
+        texts = {1: "Tìm mẹ Nguyễn Thị Lan quê Nghệ An", 2: "Tìm anh Trần Văn Bình ở Quảng Trị"}
+        index.write_base(list(texts), np.vstack([fallback_encoder.encode(t) for t in texts.values()]))
+        with mock.patch.object(fallback_encoder, "get_fallback_index", return_value=index):
+            self.assertEqual(fallback_encoder.search_fallback("mẹ Lan Nghệ An")[0][0], 1)
+
+
+class EmbeddingBreakerTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(embedding._breaker_state, {"failures": 0, "open_until": 0.0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_opens_after_consecutive_failures_and_skips_calls(self):
+        for _ in range(embedding.EMBEDDING_BREAKER_FAILURES):
+            embedding._record_embedding_outcome(False)
+        self.assertTrue(embedding.embedding_breaker_open())
+        with mock.patch.object(embedding.genai, "embed_content") as embed:
+            self.assertIsNone(embedding.get_embedding("Nguyễn Thị Lan", "retrieval_query", model="m"))
+        embed.assert_not_called()
+
+    def test_success_resets_failures(self):
+        with mock.patch.object(embedding, "EMBEDDING_BREAKER_FAILURES", 2):
+            embedding._record_embedding_outcome(False)
+            embedding._record_embedding_outcome(True)
+            embedding._record_embedding_outcome(False)
+        self.assertFalse(embedding.embedding_breaker_open())
+
+
+class ReconcileTests(TestCase):
+    def test_diff_ids(self):
+        database = reconcile._sorted_ids([[5, 1, 3], [3, 7]])
+        store = reconcile._sorted_ids([np.array([1, 2, 7]), []])
+        self.assertEqual(database.tolist(), [1, 3, 5, 7])
+        orphans, missing = reconcile.diff_ids(database, store)
+        self.assertEqual((orphans.tolist(), missing.tolist()), ([2], [3, 5]))
+        self.assertEqual(reconcile._sorted_ids([]).tolist(), [])
+
+    def test_reconcile_fallback_repairs_drift(self):
+        from accounts.models import User
+        from profiles.models import Profile
+
+        user = User.objects.create(username="owner", email="owner@example.com")
+        kept, missing = [Profile.objects.create(user=user, title=f"Tìm mẹ {name}", description=f"Mẹ tên {name}")
+                         for name in ("Lan", "Hoa")]
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        index = LocalVectorIndex(tmp.name, dtype="float32", hnsw_threshold=10 ** 9)
+        orphan_id = missing.id + 100
+        index.write_base([kept.id, orphan_id], np.vstack([fallback_encoder.encode("Lan"), fallback_encoder.encode("x y z")]))
+
+        with mock.patch.object(fallback_encoder, "get_fallback_index", return_value=index):
+            self.assertEqual(reconcile.reconcile_fallback(dry_run=True)["missing"], 1)
+            self.assertEqual(sorted(index.ids().tolist()), sorted([kept.id, orphan_id]))
+            report = reconcile.reconcile_fallback()
+        self.assertEqual((report["orphans"], report["missing"], report["repaired"]), (1, 1, 1))
+        self.assertEqual(sorted(index.ids().tolist()), sorted([kept.id, missing.id]))
+        reloaded = LocalVectorIndex(tmp.name, dtype="float32", hnsw_threshold=10 ** 9).load()
+        self.assertEqual(sorted(reloaded.ids().tolist()), sorted([kept.id, missing.id]))
+
+
+class SnapshotTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = tmp.name
+        self.vectors = np.random.default_rng(1).normal(size=(7, 6)).astype(np.float32)
+        self.vectors /= np.linalg.norm(self.vectors, axis=1, keepdims=True)
+
+    def _write(self, ids, vectors, dtype="float32"):
+        writer = snapshot.SnapshotWriter(f"{self.path}/snap", dtype=dtype, source="test")
+        writer.add(ids[:4], vectors[:4], metadatas=[{"i": i} for i in ids[:4]])
+        writer.add(ids[4:], vectors[4:], metadatas=[{"i": i} for i in ids[4:]], documents=["d"] * len(ids[4:]))
+        return writer.close()
+
+    def test_round_trip_in_batches(self):
+        manifest = self._write(list(range(10, 17)), self.vectors, dtype="float16")
+        self.assertEqual((manifest["count"], manifest["dimension"], manifest["normalized"]), (7, 6, True))
+        loaded = snapshot.load_snapshot(f"{self.path}/snap")
+        self.assertEqual(loaded.ids.tolist(), list(range(10, 17)))
+        batches = list(loaded.iter_batches(batch_size=3))
+        self.assertEqual([len(ids) for ids, *_ in batches], [3, 3, 1])
+        np.testing.assert_allclose(np.vstack([v for _, v, _, _ in batches]), self.vectors, atol=1e-3)
+        self.assertEqual(batches[2][2:], ([{"i": 16}], ["d"]))
+
+    def test_string_ids_and_unnormalized_vectors(self):
+        manifest = self._write([f"p{i}" for i in range(7)], self.vectors * 3)
+        self.assertFalse(manifest["normalized"])
+        self.assertEqual(snapshot.load_snapshot(f"{self.path}/snap").ids.tolist()[0], "p0")
+
+    def test_dimension_mismatch(self):
+        writer = snapshot.SnapshotWriter(f"{self.path}/snap")
+        writer.add([1], self.vectors[:1])
+        with self.assertRaises(ValueError):
+            writer.add([2], np.ones((1, 3), dtype=np.float32))
+        writer.close()
+
+    def test_warm_start_local_index(self):
+        self._write(list(range(10, 17)), self.vectors)
+        index = snapshot.import_snapshot_to_local_index(f"{self.path}/snap", path=f"{self.path}/index")
+        self.assertEqual(index.count(), 7)
+        self.assertEqual(index.search(self.vectors[5])[0][0], 15)
+
+
+class SearchStreamTests(SimpleTestCase):
+    def _request(self, data=None, accept=""):
+        return SimpleNamespace(data=data or {}, query_params={}, META={"HTTP_ACCEPT": accept})
+
+    def test_stream_format(self):
+        view = views_api.ProfileSearchAPIView
+        self.assertEqual(view._stream_format(self._request({"stream": "sse"})), "sse")
+        self.assertEqual(view._stream_format(self._request(accept="text/event-stream")), "sse")
+        self.assertEqual(view._stream_format(self._request({"stream": True})), "ndjson")
+        self.assertIsNone(view._stream_format(self._request({"query": "tìm mẹ"})))
+
+    def _stream(self, run_search, stream_format):
+        view = views_api.ProfileSearchAPIView()
+        with mock.patch.object(view, "_run_search", side_effect=run_search), \
+                mock.patch.object(views_api, "is_user_turn", return_value=True), \
+                mock.patch.object(views_api, "remove_user_from_queue") as release, \
+                mock.patch.object(views_api, "page_count", return_value=1):
+            response = view._stream_search(self._request(), 1, "tìm mẹ", 1, "k", stream_format)
+            body = b"".join(response.streaming_content).decode("utf-8")
+        release.assert_called_once_with(1)
+        return response, body
+
+    def test_ndjson_events_in_order(self):
+        def run_search(request, query, page, key, on_event):
+            on_event("candidates", [{"id": 3}, {"id": 7}])
+            on_event("results", [{"id": 7, "title": "Hồ sơ 7", "total_score": 0.8}])
+            return [{"id": 7}], None, None
+
+        response, body = self._stream(run_search, "ndjson")
+        self.assertTrue(response["Content-Type"].startswith("application/x-ndjson"))
+        events = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([e["event"] for e in events], ["queued", "candidates", "results", "done"])
+        self.assertEqual(events[2]["data"][0]["title"], "Hồ sơ 7")
+        self.assertEqual(events[3]["data"], {"page": 1, "count": 1, "has_more": False})
+
+    def test_sse_reports_errors(self):
+        def run_search(request, query, page, key, on_event):
+            raise RuntimeError("hỏng")
+
+        _, body = self._stream(run_search, "sse")
+        self.assertIn('event: error\ndata: {"error": "hỏng"}\n\n', body)
+
+
+class MatchByStoredVectorTests(TestCase):
+    def setUp(self):
+        from accounts.models import User
+        from profiles.models import Profile
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        user = User.objects.create(username="owner", email="owner@example.com")
+        self.profile, self.twin, self.other, self.keyword_only = [
+            Profile.objects.create(user=user, title=f"Hồ sơ {i}", full_name=name, description="Tìm người thân",
+                                   search_keywords=["Nguyễn Thị Lan"] if i == 0 else [])
+            for i, name in enumerate(["Nguyễn Thị Lan", "Nguyễn Thị Lan", "Trần Bình", "Nguyễn Thị Lan"])
+        ]
+        vectors = np.random.default_rng(2).normal(size=(3, 8)).astype(np.float32)
+        vectors[1] = vectors[0] + 0.05
+        self.index = LocalVectorIndex(tmp.name, dtype="float32", hnsw_threshold=10 ** 9)
+        self.index.write_base([self.profile.id, self.twin.id, self.other.id], vectors)
+        self.empty = LocalVectorIndex(f"{tmp.name}/empty", dtype="float32")
+        for patcher in (mock.patch("vector_search.config.USE_QDRANT", False),
+                        mock.patch("vector_search.config.USE_PGVECTOR", False),
+                        mock.patch("vector_search.fallback_encoder.get_fallback_index", return_value=self.empty),
+                        mock.patch.object(search, "_notify_progress")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_profile_keywords(self):
+        self.assertEqual(search._profile_keywords(self.profile), ["Nguyễn Thị Lan"])
+        profile = SimpleNamespace(search_keywords=[], full_name="Lê Văn Tư", name_of_father="", name_of_mother=None,
+                                  born_year=1970, losing_year="", siblings="Hoa, Hùng ,")
+        self.assertEqual(search._profile_keywords(profile), ["Lê Văn Tư", "1970", "Hoa", "Hùng"])
+
+    def test_uses_stored_vector_and_loads_only_candidates(self):
+        with mock.patch("vector_search.local_index.get_local_index", return_value=self.index), \
+                mock.patch.object(search, "fetch_profiles_from_db", wraps=search.fetch_profiles_from_db) as fetch, \
+                mock.patch.object(search, "get_embedding") as embed, \
+                mock.patch.object(search, "_rank_and_verify", return_value=[str(self.twin.id)]) as rank:
+            self.assertEqual(search.search_similar_to_profile(self.profile), [str(self.twin.id)])
+        embed.assert_not_called()
+        self.assertEqual(set(fetch.call_args.kwargs["ids"]), {self.twin.id, self.other.id, self.keyword_only.id})
+        _, _, vector_distances, keyword_counts = rank.call_args.args[:4]
+        self.assertEqual(sorted(vector_distances), [self.twin.id, self.other.id])
+        self.assertGreater(vector_distances[self.twin.id], vector_distances[self.other.id])
+        self.assertEqual(keyword_counts, {self.twin.id: 1, self.keyword_only.id: 1})
+
+    def test_keyword_hits_outside_top_k_are_rescored(self):
+        with mock.patch("vector_search.local_index.get_local_index", return_value=self.index):
+            scores = search._stored_vector_scores(self.profile.id, [self.other.id], top_k=2)
+        self.assertEqual(sorted(scores), sorted([self.profile.id, self.twin.id, self.other.id]))
+
+    def test_qdrant_query_by_id(self):
+        client = mock.Mock()
+        client.query_points.side_effect = [SimpleNamespace(points=[_hit(self.twin.id, 0.9)]),
+                                           SimpleNamespace(points=[_hit(self.keyword_only.id, 0.3)])]
+        with mock.patch("vector_search.config.USE_QDRANT", True), \
+                mock.patch.object(search, "get_qdrant_collection", return_value="profiles"), \
+                mock.patch.object(search, "get_qdrant_client", return_value=client):
+            scores = search._stored_vector_scores(self.profile.id, [self.keyword_only.id, self.twin.id], top_k=5)
+        self.assertEqual(scores, {self.twin.id: 0.9, self.keyword_only.id: 0.3})
+        self.assertEqual(client.query_points.call_args_list[0].kwargs["query"], self.profile.id)
+
+    def test_pgvector_uses_stored_embedding(self):
+        rows = [{"id": pid, "title": "", "vector_score": score, "keyword_count": 1, "total_score": score + 0.05}
+                for pid, score in ((self.profile.id, 1.0), (self.twin.id, 0.75))]
+        with mock.patch("vector_search.config.USE_PGVECTOR", True), \
+                mock.patch("vector_search.pgvector_store.get_profile_embedding", return_value=[0.1, 0.2]), \
+                mock.patch("vector_search.pgvector_store.search_profiles", return_value=rows) as search_profiles, \
+                mock.patch("vector_search.local_index.get_local_index") as local_index, \
+                mock.patch.object(search, "_rank_and_verify", return_value=[]) as rank:
+            search.search_similar_to_profile(self.profile)
+        local_index.assert_not_called()
+        self.assertEqual(search_profiles.call_args.args[:2], ([0.1, 0.2], ["Nguyễn Thị Lan"]))
+        self.assertEqual(rank.call_args.kwargs["combined_scores"], {self.twin.id: 0.8})
+
+    def test_no_stored_vector(self):
+        with mock.patch("vector_search.local_index.get_local_index", return_value=None), \
+                mock.patch.object(search, "_rank_and_verify") as rank:
+            self.assertIsNone(search.search_similar_to_profile(self.profile))
+        rank.assert_not_called()
+
+
+def _hit(db_id, score):
+    return SimpleNamespace(id=db_id, payload={"id": str(db_id)}, score=score)
+
+
+class SparseVectorTests(SimpleTestCase):
+    def test_tokenize_folds_diacritics_and_adds_bigrams(self):
+        self.assertEqual(fold_diacritics("Nguyễn Văn Đức"), "nguyen van duc")
+        self.assertEqual(tokenize("Văn A, Hà Nội"), ["van", "a", "ha", "noi", "van_a", "a_ha", "ha_noi"])
+        self.assertEqual(tokenize("Văn A", with_bigrams=False), ["van", "a"])
+
+    def test_sparse_vectors(self):
+        indices, values = query_sparse_vector("Nguyễn Nguyễn Lan")
+        self.assertEqual(indices, sorted(indices))
+        self.assertEqual(len(indices), 4)  # nguyen, lan, nguyen_nguyen, nguyen_lan
+        self.assertTrue(all(v == 1.0 for v in values))
+        doc_indices, doc_values = document_sparse_vector("Lan Lan Lan Hoa")
+        weights = dict(zip(doc_indices, doc_values))
+        self.assertGreater(weights[token_index("lan")], weights[token_index("hoa")])
+        self.assertLess(weights[token_index("lan")], 3 * weights[token_index("hoa")])  # tần suất bão hòa
+        self.assertEqual(document_sparse_vector("..."), ([], []))
+
+    def test_hybrid_query_prefetches_dense_and_sparse(self):
+        client = mock.Mock()
+        client.query_points.return_value = SimpleNamespace(points=[_hit(11, 0.03), _hit(99, 0.02)])
+        scores = search._qdrant_hybrid_scores(client, "c", [0.1, 0.2], "Nguyễn Thị Lan", {11: 0, 12: 1}, limit=10)
+        self.assertEqual(scores, {0: 0.03})
+        prefetch = client.query_points.call_args.kwargs["prefetch"]
+        self.assertEqual(len(prefetch), 2)
+        self.assertEqual(prefetch[1].using, search.SPARSE_VECTOR_NAME)
+
+        client.query_points.reset_mock()
+        search._qdrant_hybrid_scores(client, "c", None, "Nguyễn Thị Lan", {11: 0}, limit=10)
+        self.assertEqual(len(client.query_points.call_args.kwargs["prefetch"]), 1)
+
+
+class QdrantTopKTests(SimpleTestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({"id": ["11", "12", "13", "14"]}, index=[0, 1, 2, 3], dtype=object)
+        self.client = mock.Mock()
+        self.client.search.side_effect = [[_hit(11, 0.9), _hit(12, 0.8)], [_hit(13, 0.2)]]
+
+    def test_keyword_matches_outside_top_k_are_rescored(self):
+        scores = search._qdrant_vector_scores(self.client, "c", [0.1], self.df, search._db_id_to_df_index(self.df),
+                                              {0: 1, 2: 2, 3: 0}, top_k=2)
+        self.assertEqual(scores, {0: 0.9, 1: 0.8, 2: 0.2})
+        first, second = self.client.search.call_args_list
+        self.assertEqual((first.kwargs["limit"], first.kwargs["with_payload"]), (2, ["id"]))
+        self.assertEqual(second.kwargs["limit"], 1)
+        self.assertEqual(second.kwargs["query_filter"].should[0].has_id, [13])
+
+    def test_no_rescoring_when_keyword_matches_are_in_top_k(self):
+        search._qdrant_vector_scores(self.client, "c", [0.1], self.df, search._db_id_to_df_index(self.df),
+                                     {0: 3, 1: 1}, top_k=2)
+        self.assertEqual(self.client.search.call_count, 1)
+
+    def test_query_by_point_id(self):
+        self.client.query_points.return_value = SimpleNamespace(points=[_hit(12, 0.7)])
+        scores = search._qdrant_vector_scores(self.client, "c", 11, self.df, search._db_id_to_df_index(self.df), {},
+                                              top_k=5)
+        self.assertEqual(scores, {1: 0.7})
+        self.assertEqual(self.client.query_points.call_args.kwargs["query"], 11)
+        self.client.search.assert_not_called()
+
+
+class QdrantStorageOptionsTests(SimpleTestCase):
+    def test_quantization_config(self):
+        self.assertEqual(qdrant_helper.quantization_config("scalar").scalar.type.value, "int8")
+        self.assertTrue(qdrant_helper.quantization_config("binary").binary.always_ram)
+        self.assertIsNone(qdrant_helper.quantization_config("none"))
+
+    def test_search_params_rescore_with_quantization(self):
+        with mock.patch("vector_search.config.QDRANT_QUANTIZATION", "none"), \
+                mock.patch("vector_search.config.QDRANT_HNSW_EF", None):
+            self.assertIsNone(qdrant_helper.search_params())
+        with mock.patch("vector_search.config.QDRANT_QUANTIZATION", "scalar"), \
+                mock.patch("vector_search.config.QDRANT_QUANTIZATION_RESCORE", True), \
+                mock.patch("vector_search.config.QDRANT_QUANTIZATION_OVERSAMPLING", 2.0):
+            params = qdrant_helper.search_params()
+        self.assertEqual((params.quantization.rescore, params.quantization.oversampling), (True, 2.0))
+        exact = qdrant_helper.search_params(exact=True)
+        self.assertTrue(exact.exact and exact.quantization.ignore)
+
+    def test_create_collection_options(self):
+        client = mock.Mock()
+        qdrant_helper.create_profile_collection(client, "c", dimension=256, quantization="scalar", on_disk=True,
+                                                hnsw_m=32, with_sparse=False)
+        kwargs = client.create_collection.call_args.kwargs
+        self.assertEqual((kwargs["vectors_config"].size, kwargs["vectors_config"].on_disk), (256, True))
+        self.assertEqual(kwargs["hnsw_config"].m, 32)
+        self.assertIsNone(kwargs["sparse_vectors_config"])
+        self.assertIsNotNone(kwargs["quantization_config"].scalar)
+
+    def test_dimension_benchmark_and_memory_estimate(self):
+        corpus = np.random.default_rng(3).normal(size=(50, 16)).astype(np.float32)
+        results = qdrant_tuning.benchmark_dimensions(corpus, [0, 1, 2], ks=[5], dimensions=[15, 16, 64])
+        self.assertEqual(list(results), [15])
+        self.assertGreater(results[15][5], 0.5)
+        self.assertEqual(qdrant_tuning._recall([1, 2, 3], [3, 9, 1], k=3), 2 / 3)
+        estimate = qdrant_tuning.memory_estimate(1024 * 1024, 768)
+        self.assertEqual((estimate["float32"], estimate["int8 (scalar)"], estimate["binary"]), (3072, 768, 96))
+
+
+class QdrantImportTests(SimpleTestCase):
+    RECORDS = [{"id": str(i), "values": [0.1 * i, 0.2], "metadata": {"Năm sinh": "khoảng 1970", "Năm thất lạc": ""},
+                "document": f"Hồ sơ {i}"} for i in range(1, 6)]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = f"{tmp.name}/export.jsonl"
+        with open(self.path, "w", encoding="utf-8") as f:
+            for i, record in enumerate(self.RECORDS):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if i == 2:
+                    f.write("\n")
+
+    def test_record_to_point(self):
+        with mock.patch.object(import_to_qdrant, "USE_QDRANT_HYBRID", False):
+            point = import_to_qdrant.record_to_point(self.RECORDS[0])
+        self.assertEqual(point.id, 1)
+        self.assertEqual(point.payload["id"], "1")
+        self.assertEqual(point.payload["born_year_int"], 1970)
+        self.assertNotIn("losing_year_int", point.payload)
+        with mock.patch.object(import_to_qdrant, "USE_QDRANT_HYBRID", True):
+            point = import_to_qdrant.record_to_point(self.RECORDS[0])
+        self.assertEqual(set(point.vector), {"", import_to_qdrant.SPARSE_VECTOR_NAME})
+
+    def test_batches_resume_from_byte_offset(self):
+        with mock.patch.object(import_to_qdrant, "USE_QDRANT_HYBRID", False), open(self.path, "rb") as f:
+            batches = list(import_to_qdrant._iter_batches(f, 0, batch_bytes=10 ** 6, max_points=2))
+            self.assertEqual([[p.id for p in points] for points, _ in batches], [[1, 2], [3, 4], [5]])
+            resumed = list(import_to_qdrant._iter_batches(f, batches[0][1], batch_bytes=10 ** 6, max_points=10))
+        self.assertEqual([p.id for p in resumed[0][0]], [3, 4, 5])
+        self.assertEqual(resumed[0][1], os.path.getsize(self.path))
+
+    def test_progress_commits_only_contiguous_batches(self):
+        progress = import_to_qdrant._Progress(offset=0, imported=0)
+        progress.done(1, 200, 2, 100)
+        self.assertEqual((progress.committed_offset, progress.imported), (0, 0))
+        progress.done(0, 100, 2, 100)
+        self.assertEqual((progress.committed_offset, progress.imported), (200, 4))
+
+    def test_checkpoint_round_trip(self):
+        checkpoint = f"{self.path}.checkpoint.json"
+        self.assertIsNone(import_to_qdrant._load_checkpoint(checkpoint))
+        import_to_qdrant._save_checkpoint(checkpoint, {"offset": 123})
+        self.assertEqual(import_to_qdrant._load_checkpoint(checkpoint), {"offset": 123})
+
+
+class _FakeAliasClient:
+    """Giả lập phần collection/alias của Qdrant client."""
+
+    def __init__(self, collections, aliases=None):
+        self.collections = set(collections)
+        self.aliases = dict(aliases or {})
+        self.deleted = []
+
+    def get_aliases(self):
+        return SimpleNamespace(aliases=[SimpleNamespace(alias_name=alias, collection_name=target)
+                                        for alias, target in self.aliases.items()])
+
+    def collection_exists(self, name):
+        return name in self.collections
+
+    def delete_collection(self, name):
+        self.deleted.append(name)
+        self.collections.discard(name)
+
+    def update_collection_aliases(self, change_aliases_operations):
+        for operation in change_aliases_operations:
+            if getattr(operation, "delete_alias", None):
+                del self.aliases[operation.delete_alias.alias_name]
+            else:
+                create = operation.create_alias
+                self.aliases[create.alias_name] = create.collection_name
+
+
+class SwitchAliasTests(SimpleTestCase):
+    def test_moves_existing_alias(self):
+        client = _FakeAliasClient(["profiles__v1", "profiles__v2"], {"profiles": "profiles__v1"})
+        self.assertEqual(qdrant_helper.switch_alias(client, "profiles", "profiles__v2"), "profiles__v1")
+        self.assertEqual(client.aliases, {"profiles": "profiles__v2"})
+
+    def test_creates_missing_alias(self):
+        client = _FakeAliasClient(["profiles__v2"])
+        self.assertIsNone(qdrant_helper.switch_alias(client, "profiles", "profiles__v2"))
+        self.assertEqual(client.aliases, {"profiles": "profiles__v2"})
+
+    def test_never_deletes_physical_collection(self):
+        client = _FakeAliasClient(["profiles", "profiles__v2"])
+        self.assertIsNone(qdrant_helper.switch_alias(client, "profiles", "profiles__v2"))
+        self.assertEqual((client.deleted, client.aliases), ([], {}))
+        self.assertIsNone(qdrant_helper.switch_alias(client, "profiles", "profiles"))
+        self.assertEqual((client.deleted, client.aliases), ([], {}))
+
+
+class EmbeddingVersionTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(embedding_versions._cache, {"loaded_at": 0.0, "active": None, "dual_write": []})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = mock.Mock()
+        for patcher in (mock.patch("vector_search.qdrant_helper.get_qdrant_client", return_value=self.client),
+                        mock.patch("vector_search.indexing.build_profile_point",
+                                   side_effect=lambda profile, emb: (profile.id, emb))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.profile = SimpleNamespace(id=7)
+
+    def _version(self, name, status, model="models/text-embedding-004", dimension=None):
+        return EmbeddingVersion.objects.create(name=name, model_name=model, dimension=dimension,
+                                               collection_name=f"profiles__{name}", status=status)
+
+    def test_defaults_without_versions(self):
+        self.assertEqual(embedding_versions.current_embedding_model(),
+                         (embedding_versions.EMBEDDING_MODEL_NAME, embedding_versions.EMBEDDING_DIMENSION))
+        self.assertIsNone(embedding_versions.active_collection_name())
+        self.assertEqual(embedding_versions.dual_write_targets(), [])
+
+    def test_model_and_collection_come_from_same_active_version(self):
+        self._version("v1", "active")
+        self._version("v2", "building", model="models/gemini-embedding-001", dimension=768)
+        self._version("v0", "deleted")
+        embedding_versions.invalidate_cache()
+        self.assertEqual(embedding_versions.current_embedding_model(), ("models/text-embedding-004", None))
+        self.assertEqual(embedding_versions.active_collection_name(), "profiles__v1")
+        self.assertEqual([v.name for v in embedding_versions.dual_write_targets()], ["v2"])
+
+    def test_cache_holds_until_invalidated(self):
+        self.assertIsNone(embedding_versions.active_collection_name())
+        self._version("v1", "active")
+        self.assertIsNone(embedding_versions.active_collection_name())
+        embedding_versions.invalidate_cache()
+        self.assertEqual(embedding_versions.active_collection_name(), "profiles__v1")
+
+    def test_dual_write_reuses_embedding_of_same_model(self):
+        self._version("v1", "active")
+        retired = self._version("v0", "retired")
+        embedding_versions.invalidate_cache()
+        with mock.patch.object(embedding_versions, "_embed_document") as embed:
+            embedding_versions.dual_write_profile(self.profile, "văn bản", active_embedding=[0.1, 0.2])
+        embed.assert_not_called()
+        self.client.upsert.assert_called_once_with(collection_name=retired.collection_name,
+                                                   points=[(7, [0.1, 0.2])])
+
+    def test_dual_write_embeds_again_for_other_model(self):
+        self._version("v1", "active")
+        building = self._version("v2", "building", model="models/gemini-embedding-001", dimension=768)
+        shadow = self._version("v3", "shadow", model="models/gemini-embedding-001", dimension=256)
+        embedding_versions.invalidate_cache()
+        with mock.patch.object(embedding_versions, "_embed_document", side_effect=[[0.5] * 3, None]) as embed:
+            embedding_versions.dual_write_profile(self.profile, "văn bản", active_embedding=[0.1, 0.2],
+                                                  targets=[building, shadow])
+        self.assertEqual([c.args[1].name for c in embed.call_args_list], ["v2", "v3"])
+        # Phiên bản không tạo được embedding thì bỏ qua, không upsert vector rỗng
+        self.client.upsert.assert_called_once_with(collection_name=building.collection_name,
+                                                   points=[(7, [0.5] * 3)])
+
+    def test_activate_keeps_registered_physical_collection(self):
+        name = embedding_versions.QDRANT_COLLECTION_NAME
+        client = _FakeAliasClient([name])
+        with mock.patch("vector_search.qdrant_helper.get_qdrant_client", return_value=client):
+            embedding_versions.register_current_version("v1")
+            client.collections.add(f"{name}__v2")
+            EmbeddingVersion.objects.create(name="v2", model_name="models/gemini-embedding-001",
+                                            collection_name=f"{name}__v2", status="shadow")
+            embedding_versions.activate_version("v2")
+            self.assertEqual((client.deleted, client.aliases), ([], {}))
+            self.assertEqual(EmbeddingVersion.objects.get(name="v1").status, "retired")
+            self.assertEqual(embedding_versions.active_collection_name(), f"{name}__v2")
+            # v1 vẫn giữ collection của nó để dual-write và rollback
+            self.assertEqual([v.collection_name for v in embedding_versions.dual_write_targets()], [name])
+
+            embedding_versions.activate_version("v1")
+        self.assertEqual((client.deleted, client.aliases), ([], {}))
+        self.assertEqual(embedding_versions.active_collection_name(), name)
+
+    def test_activate_moves_existing_alias(self):
+        name = embedding_versions.QDRANT_COLLECTION_NAME
+        client = _FakeAliasClient([f"{name}__v1", f"{name}__v2"], {name: f"{name}__v1"})
+        self._version("v1", "active")
+        EmbeddingVersion.objects.create(name="v2", model_name="models/gemini-embedding-001",
+                                        collection_name=f"{name}__v2", status="shadow")
+        with mock.patch("vector_search.qdrant_helper.get_qdrant_client", return_value=client):
+            embedding_versions.activate_version("v2")
+        self.assertEqual((client.deleted, client.aliases), ([], {name: f"{name}__v2"}))
+
+    def test_activate_refuses_unfinished_build(self):
+        self._version("v1", "active")
+        self._version("v2", "building")
+        with mock.patch("vector_search.qdrant_helper.switch_alias") as switch_alias:
+            self.assertIsNone(embedding_versions.activate_version("v2"))
+        switch_alias.assert_not_called()
+        self.assertEqual(EmbeddingVersion.objects.get(name="v1").status, "active")
+
+
+class PgvectorStoreTests(SimpleTestCase):
+    def test_vector_literal(self):
+        self.assertEqual(pgvector_store._vector_literal(np.array([0.5, -1, 2], dtype=np.float32)), "[0.5,-1.0,2.0]")
+        self.assertEqual(pgvector_store._vector_literal([]), "[]")
+
+    def test_get_profile_embedding_parses_vector_text(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        cursor.fetchone.side_effect = [("[0.5,-1,2]",), None]
+        fake_connection = mock.Mock()
+        fake_connection.cursor.return_value = cursor
+        with mock.patch.object(pgvector_store, "connection", fake_connection):
+            self.assertEqual(pgvector_store.get_profile_embedding(7), [0.5, -1.0, 2.0])
+            self.assertIsNone(pgvector_store.get_profile_embedding(8))
+        self.assertEqual(cursor.execute.call_args.args[1], [8])
+
+    def test_keyword_sql_has_one_param_per_keyword_and_column(self):
+        count_sql, any_sql, params = pgvector_store._keyword_sql(["Hà Nội", "1975"])
+        columns = len(pgvector_store.KEYWORD_COLUMNS)
+        self.assertEqual(params, ["Hà Nội"] * columns + ["1975"] * columns)
+        self.assertEqual(count_sql.count("%s"), len(params))
+        self.assertEqual(any_sql.count("%s"), len(params))
+        self.assertEqual(pgvector_store._keyword_sql([]), ("0", "false", []))
+
+    def test_constraint_sql(self):
+        where_sql, params = pgvector_store._constraint_sql(
+            {"born_year": (1973, 1977), "losing_year": (1979, 1979), "parent_names": ["Le Thi Hoa"]})
+        self.assertEqual(params, [1973, 1977, 1979, 1979, "le thi hoa"])
+        self.assertEqual(where_sql.count("%s"), len(params))
+        self.assertIn("IS NULL OR", where_sql)
+        self.assertEqual(pgvector_store._constraint_sql(None), ("true", []))
+        self.assertEqual(pgvector_store._constraint_sql({}), ("true", []))
+
+    def _run_search(self, query_embedding):
+        cursor = mock.MagicMock(description=[("id",), ("total_score",)])
+        cursor.fetchall.return_value = [(3, 0.9)]
+        cursor.__enter__.return_value = cursor
+        fake_connection = mock.Mock()
+        fake_connection.ops.quote_name.side_effect = lambda name: f'"{name}"'
+        fake_connection.cursor.return_value = cursor
+        with mock.patch.object(pgvector_store, "connection", fake_connection), \
+                mock.patch.object(pgvector_store.transaction, "atomic", mock.MagicMock()):
+            rows = pgvector_store.search_profiles(query_embedding, ["Hà Nội"], limit=5, top_k=50,
+                                                  constraints={"born_year": (1973, 1977)})
+        return rows, cursor.execute.call_args_list[-1].args
+
+    def test_search_params_line_up_with_placeholders(self):
+        for query_embedding in ([0.1, 0.2], None):
+            with self.subTest(vector=query_embedding is not None):
+                rows, (sql, params) = self._run_search(query_embedding)
+                self.assertEqual(rows, [{"id": 3, "total_score": 0.9}])
+                self.assertEqual(sql.count("%s"), len(params))
+                self.assertEqual(params[-2:], [0.05, 5])
+
+    def test_vector_search_filters_knn_candidates_first(self):
+        _, (sql, params) = self._run_search([0.1, 0.2])
+        self.assertEqual(params[:4], [1973, 1977, "[0.1,0.2]", 50])
+        self.assertEqual(params.count("[0.1,0.2]"), 2)
@@ -0,0 +1,67 @@
+"""
+Xử lý văn bản tiếng Việt cho tìm kiếm từ vựng (lexical):
+- Bỏ dấu (fold diacritics) để "Nguyễn" khớp "nguyen"
+- Tách từ theo âm tiết + ghép cặp âm tiết liền kề (bigram) để giữ được tên riêng như "van_a"
+- Sinh sparse vector kiểu BM25 (phần TF) với chỉ số được băm; phần IDF do Qdrant tính (Modifier.IDF)
+"""
+import re
+import unicodedata
+import zlib
+from collections import Counter
+
+# Tham số BM25 cho phần tần suất từ (TF)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Độ dài trung bình (số token) của một hồ sơ - chỉ dùng để chuẩn hóa độ dài, không cần chính xác
+BM25_AVG_DOC_LEN = 250
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fold_diacritics(text):
+    """Chuyển về chữ thường và bỏ dấu tiếng Việt: 'Nguyễn Văn Đức' -> 'nguyen van duc'."""
+    if not text:
+        return ""
+    text = str(text).lower().replace("đ", "d")
+    normalized = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in normalized if unicodedata.category(ch) != "Mn")
+
+
+def tokenize(text, with_bigrams=True):
+    """Tách văn bản thành token đã bỏ dấu; kèm bigram âm tiết (ví dụ 'van_a')."""
+    syllables = _TOKEN_RE.findall(fold_diacritics(text))
+    tokens = list(syllables)
+    if with_bigrams:
+        tokens.extend(f"{a}_{b}" for a, b in zip(syllables, syllables[1:]))
+    return tokens
+
+
+def token_index(token):
+    """Băm token thành chỉ số sparse (ổn định giữa các tiến trình, khác với hash())."""
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+def _to_sparse(weights):
+    merged = {}
+    for token, weight in weights.items():
+        idx = token_index(token)
+        merged[idx] = merged.get(idx, 0.0) + weight
+    indices = sorted(merged)
+    return indices, [float(merged[i]) for i in indices]
+
+
+def document_sparse_vector(text):
+    """Sparse vector cho tài liệu: trọng số BM25-TF (bão hòa theo tần suất và độ dài)."""
+    tokens = tokenize(text)
+    if not tokens:
+        return [], []
+    doc_len = len(tokens)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / BM25_AVG_DOC_LEN)
+    weights = {token: tf * (BM25_K1 + 1) / (tf + norm) for token, tf in Counter(tokens).items()}
+    return _to_sparse(weights)
+
+
+def query_sparse_vector(text):
+    """Sparse vector cho truy vấn: mỗi token xuất hiện có trọng số 1 (IDF do Qdrant nhân vào)."""
+    tokens = tokenize(text)
+    return _to_sparse({token: 1.0 for token in set(tokens)})
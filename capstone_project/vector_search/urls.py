@@ -1,7 +1,8 @@
 from django.urls import path
-from .views_api import ProfileSearchAPIView
+from .views_api import ProfileSearchAPIView, LLMMetricsAPIView
 from django.http import JsonResponse
 
 urlpatterns = [
     path('search-profiles/', ProfileSearchAPIView.as_view(), name='search-profiles'),
+    path('llm-metrics/', LLMMetricsAPIView.as_view(), name='llm-metrics'),
 ]
\ No newline at end of file
@@ -1,182 +1,237 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 
 from .embedding import initialize_vector_db
 from .db_utils import fetch_profiles_from_db
-from .search import search_combined_chroma, search_combined_qdrant, search_combined_pinecone
+from .search import search_combined_chroma, search_combined_qdrant, search_combined_pinecone, search_combined_local, search_combined_pgvector, verify_ranked_page
 from .qdrant_helper import get_qdrant_client, get_qdrant_collection
-from .config import USE_QDRANT, USE_PINECONE, USE_CHROMADB, QDRANT_COLLECTION_NAME
+from .config import USE_QDRANT, USE_PINECONE, USE_CHROMADB, USE_LOCAL_INDEX, USE_PGVECTOR, QDRANT_COLLECTION_NAME
+from .config import CONTENT_MODERATION_ENABLED
+from .moderation import moderate_text
+from .query_filters import filter_from_request, constraints_from_request, constraints_from_params
+from .ranked_pages import search_cache_key, page_count
+from . import llm_metrics
 # from .pinecone_client import get_pinecone_index  # Đã comment - không dùng Pinecone nữa
 import json
-import requests
+import queue
+import threading
 import time
-from .config import PRIMARY_GOOGLE_API_KEY, MAX_RETRIES_LLM, INITIAL_RETRY_DELAY_LLM
-import re
+from django.db import connection
+from django.http import StreamingHttpResponse
 from queue_list.queue import add_user_to_queue, remove_user_from_queue, is_user_turn
 
 class ProfileSearchAPIView(APIView):
     """
     API endpoint for searching profiles using a user query.
     POST body: { "query": "..." }
+    Tùy chọn lọc (đẩy xuống Qdrant): born_year_from, born_year_to, losing_year_from, losing_year_to,
+    father_name, mother_name, auto_filters (mặc định theo QDRANT_AUTO_FILTERS - tự trích từ query).
+    Phân trang: page (mặc định 1); các trang sau lấy từ danh sách đã xếp hạng của trang 1 (ranked_pages.py).
+    Stream: stream="sse" | "ndjson" (hoặc header Accept text/event-stream / application/x-ndjson) để nhận
+    ứng viên và từng lô kết quả đã xác minh ngay khi có (xem _stream_search).
     """
     def moderate_content(self, query):
         """
-        Kiểm duyệt nội dung tìm kiếm sử dụng Gemini API để đảm bảo nội dung phù hợp
+        Kiểm duyệt nội dung tìm kiếm (moderation.moderate_text: tầng cục bộ, chỉ nội dung cần xem xét mới hỏi Gemini).
         Trả về tuple (is_appropriate, feedback)
-        - is_appropriate: True nếu nội dung phù hợp, False nếu không
-        - feedback: Phản hồi từ hệ thống kiểm duyệt
         """
-        try:
-            # Kiểm tra API key
-            if not PRIMARY_GOOGLE_API_KEY:
-                print("Lỗi: PRIMARY_GOOGLE_API_KEY chưa được cấu hình trong config.py")
-                return True, "Không thể kiểm duyệt nội dung do thiếu API key, cho phép tìm kiếm tạm thời"
-                
-            # Cấu hình API endpoint và headers
-            api_endpoint = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-            headers = {
-                "Content-Type": "application/json",
-                "x-goog-api-key": PRIMARY_GOOGLE_API_KEY,
-            }
-            
-            # Tạo prompt kiểm duyệt
-            prompt = f"""
-            Tưởng tượng bạn là một nhà kiểm duyệt các nội dung tìm kiếm cho một chương trình tìm kiếm người thất lạc.
-            Hãy kiểm duyệt nội dung truy vấn tìm kiếm dưới đây và xác định xem nó có phù hợp để sử dụng trong hệ thống tìm kiếm người thất lạc hay không.
-            
-            Nội dung cần kiểm duyệt:
-            {query}
-            
-            Hãy kiểm tra các tiêu chí sau:
-            1. Không chứa nội dung bạo lực, phân biệt chủng tộc, tôn giáo, giới tính
-            2. Không chứa ngôn từ xúc phạm, thô tục
-            3. Không chứa thông tin cá nhân nhạy cảm không liên quan đến việc tìm kiếm người thất lạc
-            4. Không chứa nội dung quảng cáo, spam
-            5. Không chứa nội dung lừa đảo, giả mạo
-            
-            Trả về kết quả dưới dạng JSON với các trường sau:
-            {{
-                "is_appropriate": true/false,
-                "feedback": "Lý do tại sao nội dung (không) phù hợp"
-            }}
-            * Lưu ý: Không nên quá khắt khe trong nội dung kiểm duyệt. Nội dùng tìm kiếm khá là đa dạng nên không phải lúc nào xuất
-            hiện những từ ngữ liên quan đến tiêu chuẩn là bị cho là không phù hợp. Hãy phân tích nội dung thật kỹ để tránh đưa ra những kết luận quá 
-            khắt khe khiến cho việc xử lý tìm kiếm cho người dùng gặp thất bại.
-            Ví dụ: 
-            + Tìm kiếm con lai thì là nội dung bình thường, không phải là nội dung kì thị - phân biệt
-            + Những hồ sơ nào có liên quan đến đặc điểm nhận dạng trên cơ thể cũng là nội dung bình thường, không phải là nội dung thô tục, khiêu dâm, ...
-            """
-            
-            # Cấu hình payload với safety settings
-            payload = {
-                "contents": [{"parts": [{"text": prompt}]}],
-                "generationConfig": {
-                    "temperature": 0.5,
-                    "maxOutputTokens": 1024,
-                },
-            }
-            
-            # Gọi API với cơ chế retry
-            for attempt in range(MAX_RETRIES_LLM):
-                try:
-                    response = requests.post(api_endpoint, headers=headers, json=payload, timeout=60)
-                    
-                    # Xử lý các mã lỗi
-                    if response.status_code == 429:
-                        error_type = "Rate Limit (429)"
-                    elif response.status_code >= 500:
-                        error_type = f"Server Error ({response.status_code})"
-                        try:
-                            error_detail = response.json().get('error', {}).get('message', response.text)
-                            print(f"  Server error detail: {error_detail}")
-                        except json.JSONDecodeError:
-                            print(f"  Server error response (non-JSON): {response.text}")
-                    elif response.status_code != 200:
-                        error_type = f"HTTP Error {response.status_code}"
-                        error_detail = "Unknown error"
-                        try:
-                            error_json = response.json().get('error', {})
-                            error_detail = error_json.get('message', response.text)
-                            if "API key not valid" in error_detail:
-                                print(f"Lỗi API Key không hợp lệ (Key: ...{PRIMARY_GOOGLE_API_KEY[-4:]}). Ngừng thử lại.")
-                                return True, "Không thể kiểm duyệt nội dung do lỗi API key, cho phép tìm kiếm tạm thời"
-                        except json.JSONDecodeError:
-                            error_detail = response.text
-                        print(f"Lỗi không thể thử lại ({error_type}) khi gọi Gemini API: {error_detail}")
-                        return True, "Không thể kiểm duyệt nội dung do lỗi API, cho phép tìm kiếm tạm thời"
-                    
-                    # Xử lý lỗi có thể thử lại
-                    if response.status_code == 429 or response.status_code >= 500:
-                        if attempt < MAX_RETRIES_LLM - 1:
-                            wait_time = INITIAL_RETRY_DELAY_LLM * (2 ** attempt)
-                            print(f"Lỗi '{error_type}'. Thử lại sau {wait_time} giây... (Lần {attempt+1}/{MAX_RETRIES_LLM})")
-                            time.sleep(wait_time)
-                            continue
-                        else:
-                            print(f"Không thể kiểm duyệt nội dung sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}'.")
-                            return True, "Không thể kiểm duyệt nội dung do lỗi API, cho phép tìm kiếm tạm thời"
-                    
-                    # Xử lý phản hồi thành công
-                    if response.status_code == 200:
-                        response_data = response.json()
-                        
-                        # Kiểm tra xem có bị block do safety settings không
-                        if response_data.get('promptFeedback', {}).get('blockReason'):
-                            block_reason = response_data['promptFeedback']['blockReason']
-                            print(f"Cảnh báo: Yêu cầu bị chặn do safety settings: {block_reason}")
-                            return True, "Không thể kiểm duyệt nội dung do bị chặn bởi safety settings, cho phép tìm kiếm tạm thời"
-                        
-                        # Trích xuất text từ phản hồi
-                        try:
-                            generated_text = response_data['candidates'][0]['content']['parts'][0]['text']
-                            
-                            if generated_text:
-                                # Tìm và trích xuất phần JSON từ phản hồi
-                                try:
-                                    # Tìm chuỗi JSON trong phản hồi
-                                    json_match = re.search(r'({[\s\S]*})', generated_text)
-                                    if json_match:
-                                        json_str = json_match.group(1)
-                                        moderation_result = json.loads(json_str)
-                                        return moderation_result.get('is_appropriate', True), moderation_result.get('feedback', "Nội dung phù hợp")
-                                    else:
-                                        print("Không tìm thấy chuỗi JSON trong phản hồi của LLM")
-                                        return True, "Không thể phân tích kết quả kiểm duyệt, cho phép tìm kiếm tạm thời"
-                                except json.JSONDecodeError as e:
-                                    print(f"Không thể phân tích JSON từ phản hồi LLM: {e}")
-                                    print(f"Phản hồi gốc: {generated_text}")
-                                    return True, "Không thể phân tích kết quả kiểm duyệt, cho phép tìm kiếm tạm thời"
-                            else:
-                                print("Gemini API trả về phản hồi thành công nhưng text rỗng.")
-                                return True, "Không thể kiểm duyệt nội dung do phản hồi rỗng, cho phép tìm kiếm tạm thời"
-                        except (KeyError, IndexError, TypeError) as e:
-                            print(f"Lỗi khi phân tích response thành công từ Gemini API: {e}")
-                            print(f"Response data: {response_data}")
-                            return True, "Không thể kiểm duyệt nội dung do lỗi phân tích phản hồi, cho phép tìm kiếm tạm thời"
-                
-                except requests.exceptions.RequestException as e:
-                    # Xử lý lỗi mạng
-                    error_type = f"Network Error ({type(e).__name__})"
-                    if attempt < MAX_RETRIES_LLM - 1:
-                        wait_time = INITIAL_RETRY_DELAY_LLM * (2 ** attempt)
-                        print(f"Lỗi '{error_type}'. Thử lại sau {wait_time} giây... (Lần {attempt+1}/{MAX_RETRIES_LLM})")
-                        time.sleep(wait_time)
-                    else:
-                        print(f"Không thể kiểm duyệt nội dung sau {MAX_RETRIES_LLM} lần thử do lỗi '{error_type}'.")
-                        return True, "Không thể kiểm duyệt nội dung do lỗi mạng, cho phép tìm kiếm tạm thời"
-            
-            return True, "Không thể kiểm duyệt nội dung sau nhiều lần thử, cho phép tìm kiếm tạm thời"  # Trả về True nếu vòng lặp kết thúc mà không thành công
-                
-        except Exception as e:
-            print(f"Lỗi khi kiểm duyệt nội dung: {str(e)}")
-            return True, f"Không thể kiểm duyệt nội dung do lỗi: {str(e)}, cho phép tìm kiếm tạm thời"
-    
+        return moderate_text(query, kind="search")
+
+    @staticmethod
+    def _result_fields(result_dict):
+        return {
+            "id": result_dict.get('id', ''),
+            "title": result_dict.get('title', ''),
+            "full_name": result_dict.get('full_name', ''),
+            "losing_year": result_dict.get('losing_year', ''),
+            "born_year": result_dict.get('born_year', ''),
+            "name_of_father": result_dict.get('name_of_father', ''),
+            "name_of_mother": result_dict.get('name_of_mother', ''),
+            "siblings": result_dict.get('siblings', ''),
+            "detail": result_dict.get('detail', ''),
+        }
+
+    def _paged_response(self, results, page, page_cache_key):
+        """Body trả về kèm thông tin phân trang (has_more: còn ứng viên đã xếp hạng chưa xác minh)."""
+        results = [self._result_fields(r) if "total_score" in r else r for r in results or []]
+        return {"results": results, "page": page, "has_more": page < page_count(page_cache_key)}
+
+    def _run_search(self, request, user_query, page, page_cache_key, on_event=None):
+        """
+        Chạy pipeline tìm kiếm theo backend đang bật.
+        Trả về (id_list, df, error_response); on_event(event, data) nhận các sự kiện stream (xem search._verify_top_results).
+        """
+        # Các trang sau lấy từ danh sách đã xếp hạng của lần tìm kiếm đầu (ranked_pages.py)
+        rank_only = False
+        if page > 1:
+            id_list = verify_ranked_page(user_query, page_cache_key, page, return_json=True, user=self.request.user,
+                                         on_event=on_event)
+            if id_list is not None:
+                return id_list, None, None
+            # Cache đã hết hạn: chỉ xếp hạng lại (không xác minh trang 1, không gửi sự kiện) rồi xác minh trang được yêu cầu
+            rank_only = True
+
+        # Chỉ ràng buộc truyền tường minh mới được lọc sơ bộ dùng để loại hồ sơ (xem prefilter.py)
+        api_constraints = constraints_from_params(request.data)
+
+        # pgvector: vector + từ khóa + dữ liệu hồ sơ trong một truy vấn, không cần đọc toàn bộ bảng Profile
+        df = None if USE_PGVECTOR else fetch_profiles_from_db()
+        if df is not None and df.empty:
+            return None, df, Response({"error": "No profiles found in database."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Run the search - ưu tiên pgvector / chỉ mục cục bộ (nếu bật), sau đó Qdrant, Pinecone, cuối cùng ChromaDB
+        if USE_PGVECTOR:
+            id_list = search_combined_pgvector(
+                user_query, top_n_final=100, return_json=True, user=self.request.user,
+                constraints=constraints_from_request(request.data, user_query), page_cache_key=page_cache_key,
+                on_event=on_event, rank_only=rank_only, api_constraints=api_constraints
+            )
+        elif USE_LOCAL_INDEX:
+            # Sử dụng chỉ mục vector cục bộ (in-process)
+            id_list = search_combined_local(
+                df, user_query, top_n_final=100, return_json=True, user=self.request.user,
+                page_cache_key=page_cache_key, on_event=on_event, rank_only=rank_only,
+                api_constraints=api_constraints
+            )
+        elif USE_QDRANT:
+            # Sử dụng Qdrant
+            qdrant_client = get_qdrant_client()
+            collection_name = get_qdrant_collection()
+            if collection_name is None:
+                # Qdrant không khả dụng -> chuyển sang chỉ mục cục bộ
+                print("Qdrant collection không khả dụng, chuyển sang chỉ mục vector cục bộ.")
+                id_list = search_combined_local(
+                    df, user_query, top_n_final=100, return_json=True, user=self.request.user,
+                    page_cache_key=page_cache_key, on_event=on_event, rank_only=rank_only,
+                    api_constraints=api_constraints
+                )
+            else:
+                id_list = search_combined_qdrant(
+                    df, qdrant_client, collection_name, user_query, top_n_final=100, return_json=True, user=self.request.user,
+                    query_filter=filter_from_request(request.data, user_query), page_cache_key=page_cache_key,
+                    on_event=on_event, rank_only=rank_only, api_constraints=api_constraints
+                )
+        elif USE_PINECONE:
+            # Sử dụng Pinecone (đã comment - không dùng nữa)
+            # from .pinecone_client import get_pinecone_index
+            # index = get_pinecone_index()
+            # if index is None:
+            #     return Response({"error": "Pinecone index unavailable."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            # from .search import search_combined_pinecone
+            # id_list = search_combined_pinecone(
+            #     df, index, user_query, top_n_final=100, return_json=True, user=self.request.user
+            # )
+            return None, df, Response({"error": "Pinecone is disabled. Please use Qdrant."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        else:
+            # Sử dụng ChromaDB (đã comment - không dùng nữa)
+            # collection = initialize_vector_db()
+            # if collection is None:
+            #     return Response({"error": "Vector DB unavailable."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            # id_list = search_combined_chroma(
+            #     df, collection, user_query, top_n_final=100, return_json=True, user=self.request.user
+            # )
+            return None, df, Response({"error": "ChromaDB is disabled. Please use Qdrant."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if rank_only:
+            # Vừa xếp hạng lại: xác minh đúng trang được yêu cầu (không xếp hạng được -> không có kết quả)
+            id_list = verify_ranked_page(user_query, page_cache_key, page, return_json=True, user=self.request.user,
+                                         on_event=on_event) or []
+        return id_list, df, None
+
+    def perform_content_negotiation(self, request, force=False):
+        # Accept: text/event-stream / application/x-ndjson không có renderer DRF tương ứng -> vẫn cho qua
+        return super().perform_content_negotiation(request, force=True)
+
+    @staticmethod
+    def _stream_format(request):
+        """'sse' | 'ndjson' | None: chế độ stream theo tham số stream hoặc header Accept."""
+        stream = str(request.data.get("stream", request.query_params.get("stream", ""))).lower()
+        accept = request.META.get("HTTP_ACCEPT", "")
+        if stream == "sse" or "text/event-stream" in accept:
+            return "sse"
+        if stream in ("ndjson", "true", "1") or "application/x-ndjson" in accept:
+            return "ndjson"
+        return None
+
+    def _stream_search(self, request, user_id, user_query, page, page_cache_key, stream_format):
+        """
+        Stream kết quả (SSE hoặc NDJSON): 'candidates' (ứng viên đã xếp hạng, trước LLM), 'results' (mỗi lô
+        vừa được Gemini xác minh xong), cuối cùng 'done' (page, has_more) hoặc 'error'.
+        Pipeline chạy trong một luồng riêng; generator chuyển sự kiện từ hàng đợi ra response.
+        """
+        events = queue.Queue()
+        done = object()
+
+        def emit(event, data):
+            if event == "results":
+                data = [self._result_fields(r) for r in data]
+            events.put((event, data))
+
+        def worker():
+            try:
+                while not is_user_turn(user_id):
+                    time.sleep(0.1)  # Chờ 100ms rồi kiểm tra lại
+                id_list, _, error_response = self._run_search(request, user_query, page, page_cache_key, on_event=emit)
+                if error_response is not None:
+                    events.put(("error", error_response.data))
+                else:
+                    events.put(("done", {"page": page, "count": len(id_list or []),
+                                         "has_more": page < page_count(page_cache_key)}))
+            except Exception as e:
+                events.put(("error", {"error": str(e)}))
+            finally:
+                remove_user_from_queue(user_id)
+                connection.close()
+                events.put((done, None))
+
+        def serialize(event, data):
+            payload = json.dumps(data, ensure_ascii=False, default=str)
+            if stream_format == "sse":
+                return f"event: {event}\ndata: {payload}\n\n"
+            return json.dumps({"event": event, "data": data}, ensure_ascii=False, default=str) + "\n"
+
+        def generate():
+            yield serialize("queued", {"page": page})
+            while True:
+                event, data = events.get()
+                if event is done:
+                    break
+                yield serialize(event, data)
+
+        threading.Thread(target=worker, daemon=True).start()
+        content_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+        response = StreamingHttpResponse(generate(), content_type=f"{content_type}; charset=utf-8")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # Không để nginx gom buffer
+        return response
+
     def post(self, request):
         user_id = request.user.id
         # Thêm người dùng vào hàng đợi
         add_user_to_queue(user_id)
 
+        stream_format = self._stream_format(request)
+        if stream_format:
+            user_query = request.data.get("query", "").strip()
+            try:
+                page = max(1, int(request.data.get("page", 1) or 1))
+            except (TypeError, ValueError):
+                page = 0
+            if not user_query or not page:
+                remove_user_from_queue(user_id)
+                return Response({"error": "Missing or empty 'query' / invalid 'page'."}, status=status.HTTP_400_BAD_REQUEST)
+            if CONTENT_MODERATION_ENABLED:
+                is_appropriate, feedback = self.moderate_content(user_query)
+                if not is_appropriate:
+                    remove_user_from_queue(user_id)
+                    return Response({
+                        "error": f"Nội dung tìm kiếm không phù hợp: {feedback}"
+                    }, status=status.HTTP_400_BAD_REQUEST)
+            # Hàng đợi được giải phóng khi luồng tìm kiếm kết thúc
+            return self._stream_search(request, user_id, user_query, page,
+                                       search_cache_key(user_id, user_query, request.data), stream_format)
+
         # Chờ đến lượt của người dùng
         while not is_user_turn(user_id):
             time.sleep(0.1)  # Chờ 100ms rồi kiểm tra lại
@@ -188,51 +243,26 @@ class ProfileSearchAPIView(APIView):
                 return Response({"error": "Missing or empty 'query'."}, status=status.HTTP_400_BAD_REQUEST)
 
             # Kiểm duyệt nội dung trước khi xử lý
-            # is_appropriate, feedback = self.moderate_content(user_query)
-            # if not is_appropriate:
-            #     # Trả về lỗi nếu nội dung không phù hợp
-            #     return Response({
-            #         "error": f"Nội dung tìm kiếm không phù hợp: {feedback}"
-            #     }, status=status.HTTP_400_BAD_REQUEST)
+            if CONTENT_MODERATION_ENABLED:
+                is_appropriate, feedback = self.moderate_content(user_query)
+                if not is_appropriate:
+                    # Trả về lỗi nếu nội dung không phù hợp
+                    return Response({
+                        "error": f"Nội dung tìm kiếm không phù hợp: {feedback}"
+                    }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Initialize vector DB và fetch profiles
-            df = fetch_profiles_from_db()
-            if df.empty:
-                return Response({"error": "No profiles found in database."}, status=status.HTTP_404_NOT_FOUND)
+            try:
+                page = max(1, int(request.data.get("page", 1) or 1))
+            except (TypeError, ValueError):
+                return Response({"error": "'page' must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+            page_cache_key = search_cache_key(user_id, user_query, request.data)
 
-            # Run the search - ưu tiên Qdrant, sau đó Pinecone, cuối cùng ChromaDB
             try:
-                if USE_QDRANT:
-                    # Sử dụng Qdrant
-                    qdrant_client = get_qdrant_client()
-                    collection_name = get_qdrant_collection()
-                    if collection_name is None:
-                        return Response({"error": "Qdrant collection unavailable."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                    id_list = search_combined_qdrant(
-                        df, qdrant_client, collection_name, user_query, top_n_final=100, return_json=True, user=self.request.user
-                    )
-                elif USE_PINECONE:
-                    # Sử dụng Pinecone (đã comment - không dùng nữa)
-                    # from .pinecone_client import get_pinecone_index
-                    # index = get_pinecone_index()
-                    # if index is None:
-                    #     return Response({"error": "Pinecone index unavailable."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                    # from .search import search_combined_pinecone
-                    # id_list = search_combined_pinecone(
-                    #     df, index, user_query, top_n_final=100, return_json=True, user=self.request.user
-                    # )
-                    return Response({"error": "Pinecone is disabled. Please use Qdrant."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                else:
-                    # Sử dụng ChromaDB (đã comment - không dùng nữa)
-                    # collection = initialize_vector_db()
-                    # if collection is None:
-                    #     return Response({"error": "Vector DB unavailable."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                    # id_list = search_combined_chroma(
-                    #     df, collection, user_query, top_n_final=100, return_json=True, user=self.request.user
-                    # )
-                    return Response({"error": "ChromaDB is disabled. Please use Qdrant."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                id_list, df, error_response = self._run_search(request, user_query, page, page_cache_key)
+                if error_response is not None:
+                    return error_response
                 if not id_list:
-                    return Response({"results": []})
+                    return Response(self._paged_response([], page, page_cache_key))
 
                 # Kiểm tra xem id_list là list of dicts (từ return_json=True) hay list of IDs
                 if isinstance(id_list, list) and len(id_list) > 0 and isinstance(id_list[0], dict):
@@ -240,17 +270,7 @@ class ProfileSearchAPIView(APIView):
                     detailed_results = []
                     for result_dict in id_list:
                         # Lấy các field từ result_dict (đã có đầy đủ từ search function)
-                        detailed_results.append({
-                            "id": result_dict.get('id', ''),
-                            "title": result_dict.get('title', ''),
-                            "full_name": result_dict.get('full_name', ''),
-                            "losing_year": result_dict.get('losing_year', ''),
-                            "born_year": result_dict.get('born_year', ''),
-                            "name_of_father": result_dict.get('name_of_father', ''),
-                            "name_of_mother": result_dict.get('name_of_mother', ''),
-                            "siblings": result_dict.get('siblings', ''),
-                            "detail": result_dict.get('detail', ''),
-                        })
+                        detailed_results.append(self._result_fields(result_dict))
                 else:
                     # Là list of IDs, cần build detailed_results từ DataFrame
                     detailed_results = []
@@ -275,10 +295,24 @@ class ProfileSearchAPIView(APIView):
 
                 print("Tìm theo truy vấn detailed_results:", detailed_results)
 
-                return Response({"results": detailed_results})
+                return Response(self._paged_response(detailed_results, page, page_cache_key))
             except Exception as e:
                 return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
         finally:
             # Xóa người dùng khỏi hàng đợi sau khi tìm kiếm xong
-            remove_user_from_queue(user_id)
\ No newline at end of file
+            remove_user_from_queue(user_id)
+
+class LLMMetricsAPIView(APIView):
+    """
+    Bộ đếm độ trễ / token / chi phí ước tính của các lần gọi Gemini theo (tác vụ, model) - xem llm_metrics.py.
+    GET: số liệu của tiến trình hiện tại; DELETE: đặt lại bộ đếm. Chỉ dành cho admin.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(llm_metrics.snapshot())
+
+    def delete(self, request):
+        llm_metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)